@@ -1,5 +1,6 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import math
 import os
 import sys
 import traceback
@@ -7,12 +8,54 @@ import traceback
 # Añadir directorios al path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from app.query.rag_query import RAGQuerySystem
+from app.query.system_registry import rag_system_registry
 from app.config.settings import load_environment_variables
+from app.utils.performance_metrics import performance_tracker
+from app.utils.response_encoding import (
+    SOURCE_MODES,
+    compute_etag,
+    dumps,
+    encode_body,
+    etag_matches,
+    record_response_bytes,
+    shape_result,
+    shape_sources
+)
 
 class handler(BaseHTTPRequestHandler):
+    def _send_json(self, status, response, etag=None, retry_after=None):
+        """Envía una respuesta JSON comprimida según Accept-Encoding."""
+        body, encoding = encode_body(response, self.headers.get('Accept-Encoding'), 'query')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if retry_after is not None:
+            self.send_header('Retry-After', str(max(1, math.ceil(retry_after))))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'private, no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_rejection(self, result):
+        """Responde 429 o 503 con Retry-After a una consulta rechazada por saturación."""
+        metadata = result["metadata"]
+        self._send_json(metadata.get("status", 503), result, retry_after=metadata["retry_after"])
+    
+    def _send_not_modified(self, etag):
+        """Responde 304 cuando el cliente ya tiene la misma respuesta (If-None-Match)."""
+        performance_tracker.increment('responses_not_modified', endpoint='query')
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'private, no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+    
     def do_POST(self):
-        # Cargar variables de entorno
+        # Cargar variables de entorno (solo se leen una vez por proceso)
         load_environment_variables()
         
         # Obtener el cuerpo de la solicitud
@@ -24,32 +67,71 @@ class handler(BaseHTTPRequestHandler):
         query = data.get('query', '')
         
         if not query:
-            self.send_response(400)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = {'error': 'La consulta está vacía'}
-            self.wfile.write(json.dumps(response).encode())
+            self._send_json(400, {'error': 'La consulta está vacía'})
             return
         
+        # Formato de las fuentes: texto completo, fragmentos recortados o solo identificadores
+        source_mode = data.get('source_mode')
+        if source_mode is not None and source_mode not in SOURCE_MODES:
+            self._send_json(400, {'error': f'"source_mode" debe ser uno de: {", ".join(SOURCE_MODES)}'})
+            return
+        snippet_chars = data.get('snippet_chars')
+        snippet_chars = int(snippet_chars) if snippet_chars else None
+        debug = bool(data.get('debug'))
+        
+        # Subconjunto de shards a consultar (con VECTOR_SHARDS); por defecto, todos
+        shards = data.get('shards')
+        if shards is not None and (not isinstance(shards, list) or not all(isinstance(s, str) for s in shards)):
+            self._send_json(400, {'error': '"shards" debe ser una lista de nombres de shard'})
+            return
+        
+        # Modo streaming: solicitado en el cuerpo o mediante la cabecera Accept
+        stream = bool(data.get('stream')) or 'application/x-ndjson' in (self.headers.get('Accept') or '')
+        
         try:
-            # Inicializar el sistema RAG
-            rag_system = RAGQuerySystem()
-            
-            # Procesar la consulta
-            result = rag_system.query(query)
-            
-            # Enviar respuesta
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            # Tomar el sistema RAG (reutilizado entre invocaciones; no se cierra mientras dure la solicitud)
+            with rag_system_registry.acquire() as (rag_system, warm_start):
+                try:
+                    shards = rag_system.resolve_shards(shards)
+                except ValueError as e:
+                    self._send_json(400, {'error': str(e)})
+                    return
+                
+                # Rechazo inmediato si los servicios remotos están saturados (503 con Retry-After)
+                rejection = rag_system.check_admission()
+                if rejection is not None:
+                    self._send_rejection(shape_result(rejection, debug=debug))
+                    return
+                
+                if stream:
+                    self._send_stream(rag_system, query, warm_start, source_mode, snippet_chars, debug, shards)
+                    return
+                
+                # Procesar la consulta
+                result = shape_result(rag_system.query(query, shards=shards), source_mode, snippet_chars, debug)
+                result["metadata"] = dict(result.get("metadata") or {}, warm_start=warm_start)
+                if not warm_start:
+                    result["metadata"]["system_init_time"] = rag_system_registry.last_build_time
+                
+                # Consulta rechazada por saturación o por el límite de peticiones de OpenAI (503/429)
+                if result["metadata"].get("retry_after") is not None:
+                    self._send_rejection(result)
+                    return
+                
+                # Las respuestas correctas llevan ETag; si el cliente ya la tiene, basta con un 304
+                etag = None
+                if not result["metadata"].get("error"):
+                    etag = compute_etag(result)
+                    if etag_matches(self.headers.get('If-None-Match'), etag):
+                        self._send_not_modified(etag)
+                        return
+                
+                # Enviar respuesta
+                self._send_json(200, result, etag)
         except Exception as e:
             # Obtener el traceback completo
             error_traceback = traceback.format_exc()
             
-            self.send_response(500)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
             response = {
                 'error': str(e),
                 'traceback': error_traceback,
@@ -57,4 +139,44 @@ class handler(BaseHTTPRequestHandler):
                 'supabase_url_set': bool(os.getenv("SUPABASE_URL")),
                 'supabase_key_set': bool(os.getenv("SUPABASE_KEY"))
             }
-            self.wfile.write(json.dumps(response).encode()) 
\ No newline at end of file
+            self._send_json(500, response)
+    
+    def do_GET(self):
+        """Expone las métricas agregadas del proceso en formato de texto de Prometheus (/api/metrics)."""
+        body = performance_tracker.to_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_stream(self, rag_system, query, warm_start, source_mode=None, snippet_chars=None, debug=False, shards=None):
+        """Envía la respuesta como NDJSON: un evento JSON por línea a medida que se genera.
+        
+        Los eventos no se comprimen para no retrasar su entrega.
+        """
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+        
+        sent_bytes = 0
+        try:
+            for event in rag_system.query_stream(query, shards=shards):
+                if event['type'] == 'sources':
+                    event = dict(event, sources=shape_sources(event['sources'], source_mode, snippet_chars))
+                elif event['type'] in ('done', 'error'):
+                    event = shape_result(event, source_mode, snippet_chars, debug)
+                    event['metadata'] = dict(event['metadata'], warm_start=warm_start)
+                    if not warm_start:
+                        event['metadata']['system_init_time'] = rag_system_registry.last_build_time
+                line = dumps(event) + b'\n'
+                self.wfile.write(line)
+                self.wfile.flush()
+                sent_bytes += len(line)
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente cerró la conexión; las cabeceras ya se enviaron, no hay nada más que responder
+            pass
+        finally:
+            record_response_bytes('query_stream', sent_bytes, sent_bytes)
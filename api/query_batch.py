@@ -0,0 +1,105 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import math
+import os
+import sys
+import traceback
+
+# Añadir directorios al path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from app.query.system_registry import rag_system_registry
+from app.config import settings
+from app.config.settings import load_environment_variables
+from app.utils.response_encoding import SOURCE_MODES, encode_body, shape_result
+
+class handler(BaseHTTPRequestHandler):
+    def _send_json(self, status, response):
+        body, encoding = encode_body(response, self.headers.get('Accept-Encoding'), 'query_batch')
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        if isinstance(response, dict) and response.get('metadata', {}).get('retry_after') is not None:
+            self.send_header('Retry-After', str(max(1, math.ceil(response['metadata']['retry_after']))))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self):
+        # Cargar variables de entorno (solo se leen una vez por proceso)
+        load_environment_variables()
+        
+        # Obtener el cuerpo de la solicitud
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        data = json.loads(post_data)
+        
+        # Obtener las consultas
+        queries = data.get('queries', [])
+        
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) for q in queries):
+            self._send_json(400, {'error': 'Se requiere una lista no vacía de consultas en "queries"'})
+            return
+        
+        if len(queries) > settings.BATCH_MAX_QUERIES:
+            self._send_json(400, {'error': f'Se admiten como máximo {settings.BATCH_MAX_QUERIES} consultas por lote'})
+            return
+        
+        source_mode = data.get('source_mode')
+        if source_mode is not None and source_mode not in SOURCE_MODES:
+            self._send_json(400, {'error': f'"source_mode" debe ser uno de: {", ".join(SOURCE_MODES)}'})
+            return
+        snippet_chars = data.get('snippet_chars')
+        snippet_chars = int(snippet_chars) if snippet_chars else None
+        debug = bool(data.get('debug'))
+        
+        shards = data.get('shards')
+        if shards is not None and (not isinstance(shards, list) or not all(isinstance(s, str) for s in shards)):
+            self._send_json(400, {'error': '"shards" debe ser una lista de nombres de shard'})
+            return
+        
+        try:
+            # Tomar el sistema RAG (reutilizado entre invocaciones; no se cierra mientras dure la solicitud)
+            with rag_system_registry.acquire() as (rag_system, warm_start):
+                try:
+                    shards = rag_system.resolve_shards(shards)
+                except ValueError as e:
+                    self._send_json(400, {'error': str(e)})
+                    return
+                
+                # Rechazo inmediato si los servicios remotos están saturados (503 con Retry-After)
+                rejection = rag_system.check_admission()
+                if rejection is not None:
+                    rejection = shape_result(rejection, debug=debug)
+                    self._send_json(rejection['metadata'].get('status', 503), rejection)
+                    return
+                
+                # Procesar el lote
+                result = rag_system.query_batch(
+                    queries,
+                    similarity_threshold=float(data.get('similarity_threshold', 0.1)),
+                    max_sources=int(data.get('max_sources', 5)),
+                    concurrency=int(data.get('concurrency', settings.BATCH_CONCURRENCY)),
+                    shards=shards
+                )
+                result['results'] = [
+                    shape_result(item, source_mode, snippet_chars, debug) for item in result['results']
+                ]
+                result['metadata']['warm_start'] = warm_start
+                if not warm_start:
+                    result['metadata']['system_init_time'] = rag_system_registry.last_build_time
+                
+                self._send_json(200, result)
+        except Exception as e:
+            # Obtener el traceback completo
+            error_traceback = traceback.format_exc()
+            
+            self._send_json(500, {
+                'error': str(e),
+                'traceback': error_traceback,
+                'api_key_set': bool(os.getenv("OPENAI_API_KEY")),
+                'supabase_url_set': bool(os.getenv("SUPABASE_URL")),
+                'supabase_key_set': bool(os.getenv("SUPABASE_KEY"))
+            })
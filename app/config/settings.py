@@ -14,10 +14,148 @@ SUPABASE_COLLECTION_NAME = "documents"
 EMBEDDING_MODEL = "text-embedding-3-small"
 LLM_MODEL = "gpt-4o-mini"
 
-def load_environment_variables():
-    """Carga las variables de entorno desde .env o desde Vercel."""
+# Transporte de embeddings: dimensiones reducidas (0: las del modelo), codificación
+# de la respuesta de OpenAI ("base64" o "float") y función RPC de búsqueda de Supabase
+EMBEDDING_DIMENSIONS = 0
+EMBEDDING_ENCODING = "float"
+SUPABASE_MATCH_FUNCTION = "match_documents"
+
+# Caché de embeddings de consultas
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_SIZE = 1024
+EMBEDDING_CACHE_TTL = 3600.0
+EMBEDDING_CACHE_DIR = "/tmp/raglec_embedding_cache"
+EMBEDDING_CACHE_DISK_SIZE = 50000
+
+# Caché semántica de respuestas
+RESULT_CACHE_ENABLED = False
+RESULT_CACHE_SIZE = 512
+RESULT_CACHE_TTL = 3600.0
+RESULT_CACHE_SIMILARITY_THRESHOLD = 0.95
+
+# Consultas en lote
+BATCH_CONCURRENCY = 4
+BATCH_MAX_QUERIES = 100
+
+# Backend de búsqueda vectorial: "supabase" (RPC match_documents), "local" (instantánea en disco)
+# o "ann" (índice IVF aproximado sobre la instantánea)
+VECTOR_BACKEND = "supabase"
+LOCAL_INDEX_DIR = "data/index"
+ANN_NPROBE = 8
+ANN_RERANK = True
+
+# Búsqueda híbrida: índice BM25 local combinado con la búsqueda vectorial por rango recíproco
+LEXICAL_SEARCH_ENABLED = False
+LEXICAL_INDEX_DIR = ""
+HYBRID_CANDIDATES = 20
+
+# Búsqueda repartida entre varias colecciones o proyectos (lista JSON; vacía: una sola colección)
+VECTOR_SHARDS = ""
+SHARD_TIMEOUT = 2.0
+
+# Ingesta de documentos
+INGEST_BATCH_SIZE = 100
+INGEST_CONCURRENCY = 4
+INGEST_CHUNK_SIZE = 1000
+INGEST_CHUNK_OVERLAP = 200
+
+# Empaquetado del contexto del prompt
+CONTEXT_MAX_TOKENS = 3000
+CONTEXT_DEDUP_THRESHOLD = 0.8
+CONTEXT_SCORE_GAP = 0.15
+
+# Conexiones HTTP compartidas con OpenAI y Supabase
+HTTP_MAX_CONNECTIONS = 20
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = 60.0
+HTTP2_ENABLED = True
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_TIMEOUT = 60.0
+HTTP_PREWARM = False
+
+# Codificación de las respuestas de la API
+RESPONSE_COMPRESSION_MIN_BYTES = 1024
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 5
+RESPONSE_SOURCE_MODE = "full"
+RESPONSE_SNIPPET_CHARS = 300
+
+# Agrupación de consultas idénticas en curso
+SINGLE_FLIGHT_ENABLED = False
+
+# Control de admisión y reintentos frente a OpenAI y Supabase (0: sin límite)
+ADMISSION_ENABLED = False
+OPENAI_EMBEDDING_RPM = 3000
+OPENAI_EMBEDDING_TPM = 1000000
+OPENAI_CHAT_RPM = 500
+OPENAI_CHAT_TPM = 200000
+SUPABASE_RPM = 0
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_MAX_WAIT = 10.0
+UPSTREAM_MAX_RETRIES = 3
+UPSTREAM_RETRY_BASE_DELAY = 0.5
+UPSTREAM_RETRY_MAX_DELAY = 8.0
+
+# Registro de consultas (vacío: desactivado) e instantánea de precalentamiento de las cachés
+QUERY_LOG_PATH = ""
+QUERY_LOG_MAX_QUEUE = 10000
+QUERY_LOG_FLUSH_INTERVAL = 1.0
+WARM_CACHE_SNAPSHOT = ""
+
+# Peticiones de respaldo (hedging) para el embedding de la consulta y la búsqueda
+HEDGE_ENABLED = False
+HEDGE_PERCENTILE = 95.0
+HEDGE_MIN_DELAY = 0.02
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 200
+HEDGE_BUDGET = 0.05
+
+# Perfilado de consultas (CPU y memoria) bajo demanda o por muestreo
+PROFILE_ENABLED = False
+PROFILE_SAMPLE_RATE = 0.0
+PROFILE_DIR = "/tmp/raglec_profiles"
+PROFILE_MEMORY = True
+PROFILE_INTERVAL = 0.005
+
+# Indica si las variables de entorno ya se cargaron en este proceso
+_environment_loaded = False
+
+def load_environment_variables(force: bool = False):
+    """Carga las variables de entorno desde .env o desde Vercel.
+    
+    La carga se realiza una sola vez por proceso (al importar el módulo); las llamadas
+    posteriores no vuelven a leer ``.env`` salvo que se indique ``force``.
+    
+    Args:
+        force: Si se vuelven a leer las variables aunque ya estén cargadas.
+    """
+    global _environment_loaded
+    if _environment_loaded and not force:
+        return
+    
     global OPENAI_API_KEY, SUPABASE_URL, SUPABASE_KEY, SUPABASE_COLLECTION_NAME
     global EMBEDDING_MODEL, LLM_MODEL
+    global EMBEDDING_DIMENSIONS, EMBEDDING_ENCODING, SUPABASE_MATCH_FUNCTION
+    global EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_TTL
+    global EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_SIZE
+    global RESULT_CACHE_ENABLED, RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_SIMILARITY_THRESHOLD
+    global BATCH_CONCURRENCY, BATCH_MAX_QUERIES
+    global VECTOR_BACKEND, LOCAL_INDEX_DIR, ANN_NPROBE, ANN_RERANK
+    global LEXICAL_SEARCH_ENABLED, LEXICAL_INDEX_DIR, HYBRID_CANDIDATES
+    global VECTOR_SHARDS, SHARD_TIMEOUT
+    global INGEST_BATCH_SIZE, INGEST_CONCURRENCY, INGEST_CHUNK_SIZE, INGEST_CHUNK_OVERLAP
+    global CONTEXT_MAX_TOKENS, CONTEXT_DEDUP_THRESHOLD, CONTEXT_SCORE_GAP
+    global HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY
+    global HTTP2_ENABLED, HTTP_CONNECT_TIMEOUT, HTTP_TIMEOUT, HTTP_PREWARM
+    global RESPONSE_COMPRESSION_MIN_BYTES, RESPONSE_GZIP_LEVEL, RESPONSE_BROTLI_QUALITY
+    global RESPONSE_SOURCE_MODE, RESPONSE_SNIPPET_CHARS
+    global SINGLE_FLIGHT_ENABLED
+    global ADMISSION_ENABLED, OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM, OPENAI_CHAT_RPM, OPENAI_CHAT_TPM
+    global SUPABASE_RPM, ADMISSION_MAX_QUEUE, ADMISSION_MAX_WAIT
+    global UPSTREAM_MAX_RETRIES, UPSTREAM_RETRY_BASE_DELAY, UPSTREAM_RETRY_MAX_DELAY
+    global QUERY_LOG_PATH, QUERY_LOG_MAX_QUEUE, QUERY_LOG_FLUSH_INTERVAL, WARM_CACHE_SNAPSHOT
+    global HEDGE_ENABLED, HEDGE_PERCENTILE, HEDGE_MIN_DELAY, HEDGE_MIN_SAMPLES, HEDGE_WINDOW, HEDGE_BUDGET
+    global PROFILE_ENABLED, PROFILE_SAMPLE_RATE, PROFILE_DIR, PROFILE_MEMORY, PROFILE_INTERVAL
     
     # Intentar cargar desde .env si estamos en desarrollo
     try:
@@ -34,6 +172,77 @@ def load_environment_variables():
     SUPABASE_COLLECTION_NAME = os.getenv("SUPABASE_COLLECTION_NAME", SUPABASE_COLLECTION_NAME)
     EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", EMBEDDING_MODEL)
     LLM_MODEL = os.getenv("LLM_MODEL", LLM_MODEL)
+    EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", EMBEDDING_DIMENSIONS))
+    EMBEDDING_ENCODING = os.getenv("EMBEDDING_ENCODING", EMBEDDING_ENCODING).lower()
+    SUPABASE_MATCH_FUNCTION = os.getenv("SUPABASE_MATCH_FUNCTION", SUPABASE_MATCH_FUNCTION)
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", str(EMBEDDING_CACHE_ENABLED)).lower() in ("1", "true", "yes")
+    EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", EMBEDDING_CACHE_SIZE))
+    EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", EMBEDDING_CACHE_TTL))
+    EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", EMBEDDING_CACHE_DIR)
+    EMBEDDING_CACHE_DISK_SIZE = int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", EMBEDDING_CACHE_DISK_SIZE))
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", str(RESULT_CACHE_ENABLED)).lower() in ("1", "true", "yes")
+    RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", RESULT_CACHE_SIZE))
+    RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", RESULT_CACHE_TTL))
+    RESULT_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("RESULT_CACHE_SIMILARITY_THRESHOLD", RESULT_CACHE_SIMILARITY_THRESHOLD))
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", BATCH_CONCURRENCY))
+    BATCH_MAX_QUERIES = int(os.getenv("BATCH_MAX_QUERIES", BATCH_MAX_QUERIES))
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", VECTOR_BACKEND).lower()
+    LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", LOCAL_INDEX_DIR)
+    ANN_NPROBE = int(os.getenv("ANN_NPROBE", ANN_NPROBE))
+    ANN_RERANK = os.getenv("ANN_RERANK", str(ANN_RERANK)).lower() in ("1", "true", "yes")
+    LEXICAL_SEARCH_ENABLED = os.getenv("LEXICAL_SEARCH_ENABLED", str(LEXICAL_SEARCH_ENABLED)).lower() in ("1", "true", "yes")
+    LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", LEXICAL_INDEX_DIR)
+    HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", HYBRID_CANDIDATES))
+    VECTOR_SHARDS = os.getenv("VECTOR_SHARDS", VECTOR_SHARDS)
+    SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", SHARD_TIMEOUT))
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", INGEST_BATCH_SIZE))
+    INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", INGEST_CONCURRENCY))
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", INGEST_CHUNK_SIZE))
+    INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", INGEST_CHUNK_OVERLAP))
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", CONTEXT_MAX_TOKENS))
+    CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", CONTEXT_DEDUP_THRESHOLD))
+    CONTEXT_SCORE_GAP = float(os.getenv("CONTEXT_SCORE_GAP", CONTEXT_SCORE_GAP))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", HTTP_MAX_CONNECTIONS))
+    HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", HTTP_MAX_KEEPALIVE_CONNECTIONS))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", HTTP_KEEPALIVE_EXPIRY))
+    HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", str(HTTP2_ENABLED)).lower() in ("1", "true", "yes")
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", HTTP_CONNECT_TIMEOUT))
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", HTTP_TIMEOUT))
+    HTTP_PREWARM = os.getenv("HTTP_PREWARM", str(HTTP_PREWARM)).lower() in ("1", "true", "yes")
+    RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", RESPONSE_COMPRESSION_MIN_BYTES))
+    RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", RESPONSE_GZIP_LEVEL))
+    RESPONSE_BROTLI_QUALITY = int(os.getenv("RESPONSE_BROTLI_QUALITY", RESPONSE_BROTLI_QUALITY))
+    RESPONSE_SOURCE_MODE = os.getenv("RESPONSE_SOURCE_MODE", RESPONSE_SOURCE_MODE).lower()
+    RESPONSE_SNIPPET_CHARS = int(os.getenv("RESPONSE_SNIPPET_CHARS", RESPONSE_SNIPPET_CHARS))
+    SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", str(SINGLE_FLIGHT_ENABLED)).lower() in ("1", "true", "yes")
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", str(ADMISSION_ENABLED)).lower() in ("1", "true", "yes")
+    OPENAI_EMBEDDING_RPM = float(os.getenv("OPENAI_EMBEDDING_RPM", OPENAI_EMBEDDING_RPM))
+    OPENAI_EMBEDDING_TPM = float(os.getenv("OPENAI_EMBEDDING_TPM", OPENAI_EMBEDDING_TPM))
+    OPENAI_CHAT_RPM = float(os.getenv("OPENAI_CHAT_RPM", OPENAI_CHAT_RPM))
+    OPENAI_CHAT_TPM = float(os.getenv("OPENAI_CHAT_TPM", OPENAI_CHAT_TPM))
+    SUPABASE_RPM = float(os.getenv("SUPABASE_RPM", SUPABASE_RPM))
+    ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", ADMISSION_MAX_QUEUE))
+    ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", ADMISSION_MAX_WAIT))
+    UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", UPSTREAM_MAX_RETRIES))
+    UPSTREAM_RETRY_BASE_DELAY = float(os.getenv("UPSTREAM_RETRY_BASE_DELAY", UPSTREAM_RETRY_BASE_DELAY))
+    UPSTREAM_RETRY_MAX_DELAY = float(os.getenv("UPSTREAM_RETRY_MAX_DELAY", UPSTREAM_RETRY_MAX_DELAY))
+    QUERY_LOG_PATH = os.getenv("QUERY_LOG_PATH", QUERY_LOG_PATH)
+    QUERY_LOG_MAX_QUEUE = int(os.getenv("QUERY_LOG_MAX_QUEUE", QUERY_LOG_MAX_QUEUE))
+    QUERY_LOG_FLUSH_INTERVAL = float(os.getenv("QUERY_LOG_FLUSH_INTERVAL", QUERY_LOG_FLUSH_INTERVAL))
+    WARM_CACHE_SNAPSHOT = os.getenv("WARM_CACHE_SNAPSHOT", WARM_CACHE_SNAPSHOT)
+    HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", str(HEDGE_ENABLED)).lower() in ("1", "true", "yes")
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", HEDGE_PERCENTILE))
+    HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", HEDGE_MIN_DELAY))
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", HEDGE_MIN_SAMPLES))
+    HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", HEDGE_WINDOW))
+    HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", HEDGE_BUDGET))
+    PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", str(PROFILE_ENABLED)).lower() in ("1", "true", "yes")
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", PROFILE_SAMPLE_RATE))
+    PROFILE_DIR = os.getenv("PROFILE_DIR", PROFILE_DIR)
+    PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", str(PROFILE_MEMORY)).lower() in ("1", "true", "yes")
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", PROFILE_INTERVAL))
+    
+    _environment_loaded = True
 
 # Cargar variables de entorno al importar el módulo
 load_environment_variables() 
\ No newline at end of file
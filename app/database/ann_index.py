@@ -0,0 +1,473 @@
+"""
+Índice aproximado de vecinos más cercanos (IVF con cuantización int8).
+Este módulo construye, guarda y carga un índice de listas invertidas sobre los embeddings
+de una instantánea local. Cada vector se asigna al centroide más cercano y se almacena
+cuantizado a int8 con una escala por vector, lo que reduce la memoria a una cuarta parte;
+opcionalmente los mejores candidatos se reordenan con los vectores exactos.
+
+Ficheros del índice (en el mismo directorio que la instantánea):
+    - ``ivf_centroids.npy``: centroides float32 normalizados (listas, dimensiones).
+    - ``ivf_offsets.npy``: inicio de cada lista en los arrays siguientes (listas + 1).
+    - ``ivf_rows.npy``: fila original de cada vector, agrupada por lista.
+    - ``ivf_codes.npy``: códigos int8 (documentos, dimensiones), agrupados por lista.
+    - ``ivf_scales.npy``: escala float32 de cada código.
+    - ``ivf_manifest.json``: parámetros de construcción e instantánea de origen (documentos,
+      dimensiones e identificador de exportación).
+
+Uso:
+    python -m app.database.ann_index build --index-dir data/index --lists 256
+    python -m app.database.ann_index report --index-dir data/index --queries 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+CENTROIDS_FILE = "ivf_centroids.npy"
+OFFSETS_FILE = "ivf_offsets.npy"
+ROWS_FILE = "ivf_rows.npy"
+CODES_FILE = "ivf_codes.npy"
+SCALES_FILE = "ivf_scales.npy"
+MANIFEST_FILE = "ivf_manifest.json"
+
+# Tamaño de bloque para recorrer la matriz sin cargarla entera en memoria
+CHUNK_SIZE = 65536
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza las filas de una matriz a norma unitaria."""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Asigna cada vector al centroide de mayor similitud coseno, por bloques.
+
+    Args:
+        vectors: Matriz de vectores normalizados.
+        centroids: Matriz de centroides normalizados.
+
+    Returns:
+        np.ndarray: Índice del centroide de cada vector.
+    """
+    assignments = np.empty(vectors.shape[0], dtype=np.int32)
+    for start in range(0, vectors.shape[0], CHUNK_SIZE):
+        block = np.asarray(vectors[start:start + CHUNK_SIZE], dtype=np.float32)
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+def train_centroids(vectors: np.ndarray, n_lists: int, n_iter: int = 20, sample_size: int = 0, seed: int = 0) -> np.ndarray:
+    """Entrena centroides con k-means esférico sobre una muestra de los vectores.
+
+    Args:
+        vectors: Matriz de vectores normalizados (puede estar mapeada en memoria).
+        n_lists: Número de listas (centroides).
+        n_iter: Número de iteraciones de k-means.
+        sample_size: Tamaño de la muestra de entrenamiento (0 para 256 vectores por lista).
+        seed: Semilla aleatoria.
+
+    Returns:
+        np.ndarray: Centroides float32 normalizados.
+
+    Raises:
+        ValueError: Si no hay vectores con los que entrenar.
+    """
+    rng = np.random.default_rng(seed)
+    n_vectors = vectors.shape[0]
+    if n_vectors == 0:
+        raise ValueError("No hay vectores con los que entrenar los centroides del índice IVF")
+    n_lists = max(1, min(n_lists, n_vectors))
+    sample_size = min(n_vectors, sample_size or n_lists * 256)
+
+    sample_rows = np.sort(rng.choice(n_vectors, size=sample_size, replace=False))
+    sample = _normalize_rows(np.asarray(vectors[sample_rows], dtype=np.float32))
+    centroids = sample[rng.choice(sample_size, size=n_lists, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=n_lists)
+
+        # Reiniciar las listas vacías con vectores aleatorios de la muestra
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()), replace=False)]
+
+        centroids = _normalize_rows(sums)
+
+    return centroids.astype(np.float32)
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Cuantiza vectores a int8 con una escala por vector.
+
+    Args:
+        vectors: Matriz de vectores float32.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Códigos int8 y escalas float32 (``vector ≈ código * escala``).
+    """
+    max_abs = np.abs(vectors).max(axis=1)
+    scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+class IVFIndex:
+    """Índice IVF con códigos int8 para búsquedas aproximadas por similitud coseno."""
+
+    def __init__(
+        self,
+        centroids: np.ndarray,
+        offsets: np.ndarray,
+        rows: np.ndarray,
+        codes: np.ndarray,
+        scales: np.ndarray,
+        manifest: Optional[Dict[str, Any]] = None
+    ):
+        """Inicializa el índice a partir de sus arrays.
+
+        Args:
+            centroids: Centroides normalizados (listas, dimensiones).
+            offsets: Inicio de cada lista en ``rows``/``codes``/``scales``.
+            rows: Fila original de cada vector, agrupada por lista.
+            codes: Códigos int8 agrupados por lista.
+            scales: Escala de cada código.
+            manifest: Parámetros de construcción.
+        """
+        self.centroids = centroids
+        self.offsets = offsets
+        self.rows = rows
+        self.codes = codes
+        self.scales = scales
+        self.manifest = manifest or {}
+
+    @property
+    def n_lists(self) -> int:
+        return int(self.centroids.shape[0])
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        n_lists: int = 256,
+        n_iter: int = 20,
+        seed: int = 0,
+        snapshot: Optional[Dict[str, Any]] = None
+    ) -> "IVFIndex":
+        """Construye el índice a partir de una matriz de vectores.
+
+        Args:
+            vectors: Matriz de vectores (puede estar mapeada en memoria).
+            n_lists: Número de listas invertidas.
+            n_iter: Iteraciones de k-means.
+            seed: Semilla aleatoria.
+            snapshot: Manifiesto de la instantánea de los vectores; su identificador de
+                      exportación se guarda para detectar índices obsoletos.
+
+        Returns:
+            IVFIndex: Índice construido (sin listas si no hay vectores).
+        """
+        start_time = time.perf_counter()
+        n_vectors, dimensions = vectors.shape
+        if n_vectors == 0:
+            # Instantánea vacía: índice sin listas, cuyas búsquedas no devuelven resultados
+            centroids = np.zeros((0, dimensions), dtype=np.float32)
+        else:
+            centroids = train_centroids(vectors, n_lists, n_iter=n_iter, seed=seed)
+
+        assignments = np.empty(n_vectors, dtype=np.int32)
+        codes = np.empty((n_vectors, dimensions), dtype=np.int8)
+        scales = np.empty(n_vectors, dtype=np.float32)
+        for start in range(0, n_vectors, CHUNK_SIZE):
+            block = _normalize_rows(np.asarray(vectors[start:start + CHUNK_SIZE], dtype=np.float32))
+            end = start + block.shape[0]
+            assignments[start:end] = np.argmax(block @ centroids.T, axis=1)
+            codes[start:end], scales[start:end] = quantize(block)
+
+        # Agrupar los vectores por lista para que cada lista sea un rango contiguo
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=centroids.shape[0])
+        offsets = np.zeros(centroids.shape[0] + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        manifest = {
+            "documents": int(n_vectors),
+            "dimensions": int(dimensions),
+            "n_lists": int(centroids.shape[0]),
+            "n_iter": n_iter,
+            "quantization": "int8",
+            "snapshot_export_id": (snapshot or {}).get("export_id"),
+            "build_time": time.perf_counter() - start_time
+        }
+        logger.info(
+            f"Índice IVF construido: {n_vectors} vectores en {centroids.shape[0]} listas "
+            f"({manifest['build_time']:.2f} segundos)"
+        )
+        return cls(centroids, offsets, order.astype(np.int64), codes[order], scales[order], manifest)
+
+    def save(self, directory: str):
+        """Guarda el índice en ficheros .npy que pueden abrirse mapeados en memoria.
+
+        Todos los ficheros se escriben antes como temporales. El manifiesto anterior se borra
+        antes de sustituir los arrays y el nuevo se escribe el último, de modo que una
+        interrupción deja el directorio sin índice y nunca arrays nuevos con un manifiesto viejo.
+
+        Args:
+            directory: Directorio de destino.
+        """
+        os.makedirs(directory, exist_ok=True)
+        replacements = []
+        for filename, array in (
+            (CENTROIDS_FILE, self.centroids),
+            (OFFSETS_FILE, self.offsets),
+            (ROWS_FILE, self.rows),
+            (CODES_FILE, self.codes),
+            (SCALES_FILE, self.scales)
+        ):
+            tmp_path = os.path.join(directory, f"{filename}.tmp.npy")
+            np.save(tmp_path, np.asarray(array))
+            replacements.append((tmp_path, os.path.join(directory, filename)))
+
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        for tmp_path, path in replacements:
+            os.replace(tmp_path, path)
+        os.replace(f"{manifest_path}.tmp", manifest_path)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        """Indica si hay un índice guardado en el directorio."""
+        return os.path.exists(os.path.join(directory, MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFIndex":
+        """Carga un índice mapeando en memoria sus arrays grandes.
+
+        Args:
+            directory: Directorio del índice.
+
+        Returns:
+            IVFIndex: Índice cargado.
+        """
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+
+        return cls(
+            centroids=np.load(os.path.join(directory, CENTROIDS_FILE)),
+            offsets=np.load(os.path.join(directory, OFFSETS_FILE)),
+            rows=np.load(os.path.join(directory, ROWS_FILE), mmap_mode="r"),
+            codes=np.load(os.path.join(directory, CODES_FILE), mmap_mode="r"),
+            scales=np.load(os.path.join(directory, SCALES_FILE), mmap_mode="r"),
+            manifest=manifest
+        )
+
+    def snapshot_mismatch(self, snapshot: Dict[str, Any]) -> Optional[str]:
+        """Comprueba que el índice se construyó a partir de la instantánea indicada.
+
+        Args:
+            snapshot: Manifiesto de la instantánea (``documents``, ``dimensions``, ``export_id``).
+
+        Returns:
+            Optional[str]: Motivo por el que el índice no corresponde a la instantánea, o None.
+        """
+        documents = int(self.rows.shape[0])
+        if documents != snapshot.get("documents"):
+            return f"{documents} documentos en el índice y {snapshot.get('documents')} en la instantánea"
+        dimensions = int(self.centroids.shape[1])
+        if dimensions != snapshot.get("dimensions"):
+            return f"{dimensions} dimensiones en el índice y {snapshot.get('dimensions')} en la instantánea"
+        # Los índices y las instantáneas anteriores al identificador solo se comparan por tamaño
+        built_from = self.manifest.get("snapshot_export_id")
+        if built_from and snapshot.get("export_id") and built_from != snapshot["export_id"]:
+            return "construido a partir de una exportación anterior"
+        return None
+
+    def search(
+        self,
+        query_embedding,
+        k: int,
+        nprobe: int = 8,
+        exact_vectors: Optional[np.ndarray] = None,
+        rerank_factor: int = 4
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Busca los vectores más similares a la consulta.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            k: Número de resultados.
+            nprobe: Número de listas a explorar.
+            exact_vectors: Matriz de vectores exactos normalizados para reordenar los
+                           candidatos. Si es None, se devuelven las puntuaciones aproximadas.
+            rerank_factor: Candidatos aproximados por resultado que se reordenan.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Filas originales y similitudes, de mayor a menor.
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if k <= 0 or not norm or not self.n_lists or query.shape[0] != self.centroids.shape[1]:
+            return empty
+        query = query / norm
+
+        # Seleccionar las listas más cercanas a la consulta
+        nprobe = max(1, min(nprobe, self.n_lists))
+        centroid_scores = self.centroids @ query
+        probed = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        positions = []
+        scores = []
+        for list_id in probed:
+            start, end = int(self.offsets[list_id]), int(self.offsets[list_id + 1])
+            if start == end:
+                continue
+            codes = np.asarray(self.codes[start:end], dtype=np.float32)
+            scores.append((codes @ query) * self.scales[start:end])
+            positions.append(np.arange(start, end))
+
+        if not scores:
+            return empty
+
+        positions = np.concatenate(positions)
+        scores = np.concatenate(scores)
+
+        # Quedarse con los mejores candidatos aproximados
+        n_candidates = min(scores.shape[0], k * max(1, rerank_factor) if exact_vectors is not None else k)
+        if n_candidates < scores.shape[0]:
+            best = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        else:
+            best = np.arange(scores.shape[0])
+        rows = np.asarray(self.rows[positions[best]], dtype=np.int64)
+        scores = scores[best]
+
+        if exact_vectors is not None:
+            # Reordenar con los vectores exactos (acceso ordenado para favorecer el mmap)
+            order = np.argsort(rows)
+            rows = rows[order]
+            scores = np.asarray(exact_vectors[rows], dtype=np.float32) @ query
+
+        top = np.argsort(-scores, kind="stable")[:k]
+        return rows[top], scores[top].astype(np.float32)
+
+def rebuild_ivf_index(directory: str) -> Dict[str, Any]:
+    """Reconstruye el índice IVF de una instantánea con los parámetros del índice existente.
+
+    Args:
+        directory: Directorio de la instantánea y del índice.
+
+    Returns:
+        Dict[str, Any]: Manifiesto del nuevo índice.
+    """
+    from app.database.local_store import EMBEDDINGS_FILE, MANIFEST_FILE as SNAPSHOT_MANIFEST_FILE
+
+    with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    with open(os.path.join(directory, SNAPSHOT_MANIFEST_FILE), "r", encoding="utf-8") as f:
+        snapshot = json.load(f)
+
+    vectors = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+    index = IVFIndex.build(
+        vectors,
+        n_lists=previous.get("n_lists", 256),
+        n_iter=previous.get("n_iter", 20),
+        snapshot=snapshot
+    )
+    index.save(directory)
+    return index.manifest
+
+def exact_search(vectors: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """Obtiene las k filas exactas más similares (vectores normalizados)."""
+    scores = np.asarray(vectors, dtype=np.float32) @ (query / np.linalg.norm(query))
+    k = min(k, scores.shape[0])
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+def recall_report(
+    index: IVFIndex,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 5,
+    nprobes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+    rerank: bool = True
+) -> List[Dict[str, float]]:
+    """Compara el índice con la búsqueda exacta para distintos valores de nprobe.
+
+    Args:
+        index: Índice IVF.
+        vectors: Matriz de vectores exactos normalizados.
+        queries: Matriz de consultas.
+        k: Número de resultados por consulta.
+        nprobes: Valores de nprobe a evaluar.
+        rerank: Si se reordenan los candidatos con los vectores exactos.
+
+    Returns:
+        List[Dict[str, float]]: Recall@k y latencia media (ms) por nprobe, más la latencia exacta.
+    """
+    start_time = time.perf_counter()
+    truth = [set(exact_search(vectors, query, k).tolist()) for query in queries]
+    exact_latency = (time.perf_counter() - start_time) * 1000 / len(queries)
+
+    report = []
+    for nprobe in nprobes:
+        start_time = time.perf_counter()
+        found = [
+            index.search(query, k, nprobe=nprobe, exact_vectors=vectors if rerank else None)[0]
+            for query in queries
+        ]
+        latency = (time.perf_counter() - start_time) * 1000 / len(queries)
+        recall = sum(len(truth[i] & set(rows.tolist())) for i, rows in enumerate(found)) / (k * len(queries))
+        report.append({
+            "nprobe": nprobe,
+            "recall": recall,
+            "latency_ms": latency,
+            "exact_latency_ms": exact_latency,
+            "speedup": exact_latency / latency if latency else 0.0
+        })
+    return report
+
+def main():
+    from app.database.local_store import EMBEDDINGS_FILE, MANIFEST_FILE as SNAPSHOT_MANIFEST_FILE
+
+    parser = argparse.ArgumentParser(description="Construye y evalúa el índice IVF de una instantánea local")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--index-dir", default="data/index", help="Directorio de la instantánea")
+    parser.add_argument("--lists", type=int, default=256, help="Número de listas invertidas")
+    parser.add_argument("--iterations", type=int, default=20, help="Iteraciones de k-means")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas de evaluación (muestreadas del corpus)")
+    parser.add_argument("--k", type=int, default=5, help="Resultados por consulta")
+    parser.add_argument("--no-rerank", action="store_true", help="Evaluar sin reordenar con vectores exactos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    vectors = np.load(os.path.join(args.index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+
+    if args.command == "build":
+        with open(os.path.join(args.index_dir, SNAPSHOT_MANIFEST_FILE), "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        index = IVFIndex.build(vectors, n_lists=args.lists, n_iter=args.iterations, snapshot=snapshot)
+        index.save(args.index_dir)
+        print(json.dumps(index.manifest, indent=2))
+        return
+
+    index = IVFIndex.load(args.index_dir)
+    rng = np.random.default_rng(1)
+    sample = rng.choice(vectors.shape[0], size=min(args.queries, vectors.shape[0]), replace=False)
+    # Perturbar las consultas para no evaluar únicamente vectores presentes en el índice
+    queries = np.asarray(vectors[np.sort(sample)], dtype=np.float32)
+    queries = queries + rng.normal(scale=0.01, size=queries.shape).astype(np.float32)
+    for row in recall_report(index, vectors, queries, k=args.k, rerank=not args.no_rerank):
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    main()
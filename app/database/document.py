@@ -0,0 +1,43 @@
+"""
+Documento recuperado de la base de datos vectorial.
+Sustituye a ``langchain.schema.Document`` en el camino de consulta para no importar
+LangChain: expone los mismos atributos (``page_content`` y ``metadata``).
+"""
+
+from typing import Any, Dict, Optional
+
+class Document:
+    """Fragmento de documento con su contenido y metadatos."""
+
+    __slots__ = ("page_content", "metadata")
+
+    def __init__(self, page_content: str, metadata: Optional[Dict[str, Any]] = None):
+        """Inicializa el documento.
+
+        Args:
+            page_content: Contenido del fragmento.
+            metadata: Metadatos del fragmento.
+        """
+        self.page_content = page_content
+        self.metadata = metadata if metadata is not None else {}
+
+    def __repr__(self) -> str:
+        return f"Document(page_content={self.page_content[:50]!r}, metadata={self.metadata!r})"
+
+    def __eq__(self, other) -> bool:
+        return (
+            isinstance(other, Document)
+            and self.page_content == other.page_content
+            and self.metadata == other.metadata
+        )
+
+    def to_langchain(self):
+        """Convierte el documento en un ``langchain.schema.Document``.
+
+        LangChain es opcional: solo se importa al llamar a este método.
+
+        Returns:
+            langchain.schema.Document: Documento equivalente.
+        """
+        from langchain.schema import Document as LangChainDocument
+        return LangChainDocument(page_content=self.page_content, metadata=self.metadata)
@@ -0,0 +1,91 @@
+"""
+Exportación de la tabla de documentos a una instantánea local.
+Uso:
+    python -m app.database.export_snapshot --output data/index
+    python -m app.database.export_snapshot --output data/index --lexical
+"""
+
+import argparse
+import logging
+import time
+from typing import Any, Dict, Iterator
+
+from app.config.settings import SUPABASE_COLLECTION_NAME, LOCAL_INDEX_DIR
+from app.database.ann_index import IVFIndex, rebuild_ivf_index
+from app.database.lexical_index import build_lexical_index
+from app.database.local_store import write_snapshot
+from app.database.supabase_client import get_supabase_client
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def iter_documents(collection_name: str, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Recorre la tabla de documentos por páginas.
+
+    Args:
+        collection_name: Nombre de la tabla de documentos.
+        page_size: Número de filas por página.
+
+    Yields:
+        Dict[str, Any]: Filas con ``id``, ``content``, ``metadata`` y ``embedding``.
+    """
+    client = get_supabase_client().get_client()
+    start = 0
+    while True:
+        response = (
+            client.table(collection_name)
+            .select("id, content, metadata, embedding")
+            .order("id")
+            .range(start, start + page_size - 1)
+            .execute()
+        )
+        rows = response.data or []
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        start += page_size
+
+def export_snapshot(
+    output_dir: str = LOCAL_INDEX_DIR,
+    collection_name: str = SUPABASE_COLLECTION_NAME,
+    page_size: int = 500,
+    lexical: bool = False
+) -> Dict[str, Any]:
+    """Exporta la colección de Supabase a una instantánea local.
+
+    Args:
+        output_dir: Directorio de destino.
+        collection_name: Nombre de la tabla de documentos.
+        page_size: Número de filas por página.
+        lexical: Si se construye también el índice BM25 de la instantánea.
+
+    Si el directorio ya tenía un índice IVF, se reconstruye con los mismos parámetros.
+
+    Returns:
+        Dict[str, Any]: Manifiesto de la instantánea escrita.
+    """
+    start_time = time.perf_counter()
+    manifest = write_snapshot(output_dir, iter_documents(collection_name, page_size), collection_name)
+    if IVFIndex.exists(output_dir):
+        # El índice IVF anterior apunta a filas de la exportación previa
+        manifest["ivf"] = rebuild_ivf_index(output_dir)
+    if lexical:
+        manifest["lexical"] = build_lexical_index(output_dir)
+    logger.info(f"Exportación completada en {time.perf_counter() - start_time:.2f} segundos")
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta la tabla de documentos a una instantánea local")
+    parser.add_argument("--output", default=LOCAL_INDEX_DIR, help="Directorio de destino")
+    parser.add_argument("--collection", default=SUPABASE_COLLECTION_NAME, help="Tabla de documentos")
+    parser.add_argument("--page-size", type=int, default=500, help="Filas por página")
+    parser.add_argument("--lexical", action="store_true", help="Construye también el índice BM25")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    manifest = export_snapshot(args.output, args.collection, args.page_size, args.lexical)
+    print(f"{manifest['documents']} documentos exportados a {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,570 @@
+"""
+Índice léxico BM25 sobre el texto de los fragmentos.
+Complementa la búsqueda vectorial en las consultas con códigos de producto, nombres o
+identificadores exactos, que los embeddings recuperan mal. El índice se construye a partir
+de la misma instantánea que la búsqueda local (``records.bin``) y guarda las listas de
+apariciones en arrays contiguos (CSR), con la normalización por longitud de cada documento
+precalculada.
+
+Ficheros del índice (en el mismo directorio que la instantánea):
+    - ``bm25_terms.json``: términos, en el orden de sus identificadores.
+    - ``bm25_offsets.npy``: inicio de las apariciones de cada término (términos + 1).
+    - ``bm25_docs.npy``: fila del documento de cada aparición (int32), agrupadas por término.
+    - ``bm25_tfs.npy``: frecuencia del término en el documento (uint16).
+    - ``bm25_norms.npy``: ``k1 * (1 - b + b * longitud / longitud_media)`` de cada documento.
+    - ``bm25_manifest.json``: parámetros, tamaño y tiempo de construcción.
+    - ``bm25_delta.jsonl``: altas y bajas posteriores a la construcción (se aplican al cargar
+      y desaparecen al reconstruir el índice con una exportación nueva).
+
+Uso:
+    python -m app.database.lexical_index build --index-dir data/index
+    python -m app.database.lexical_index report --index-dir data/index --queries 200
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.database.local_store import SnapshotRecords
+from app.database.result_set import ResultSet
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+TERMS_FILE = "bm25_terms.json"
+OFFSETS_FILE = "bm25_offsets.npy"
+DOCS_FILE = "bm25_docs.npy"
+TFS_FILE = "bm25_tfs.npy"
+NORMS_FILE = "bm25_norms.npy"
+MANIFEST_FILE = "bm25_manifest.json"
+DELTA_FILE = "bm25_delta.jsonl"
+
+# Parámetros habituales de BM25
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+# Constante de la fusión por rango recíproco (valor del artículo original)
+RRF_K = 60
+
+# Palabras unidas por guiones, puntos o barras (códigos como "AB-1234" o "v2.1")
+_TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+_SEPARATOR_RE = re.compile(r"[-./]")
+
+def tokenize(text: str) -> List[str]:
+    """Divide un texto en términos: minúsculas, sin tildes y con los códigos enteros y por partes.
+
+    Args:
+        text: Texto a dividir.
+
+    Returns:
+        List[str]: Términos, con repeticiones.
+    """
+    text = text.casefold()
+    if not text.isascii():
+        text = "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+    tokens = []
+    for token in _TOKEN_RE.findall(text):
+        tokens.append(token)
+        if _SEPARATOR_RE.search(token):
+            tokens.extend(part for part in _SEPARATOR_RE.split(token) if part)
+    return tokens
+
+def result_key(result_set: ResultSet, index: int) -> Hashable:
+    """Clave de un fragmento para combinar resultados: su identificador o, si no lo tiene, su contenido."""
+    doc_id = result_set.ids[index]
+    return doc_id if doc_id is not None else result_set.contents[index]
+
+def reciprocal_rank_fusion(result_sets: Sequence[ResultSet], k: int, rrf_k: int = RRF_K) -> ResultSet:
+    """Combina varias listas ordenadas con la fusión por rango recíproco (RRF).
+
+    Cada fragmento puntúa ``sum(1 / (rrf_k + rango))`` sobre las listas en las que aparece,
+    sin necesidad de que las puntuaciones originales (similitud coseno y BM25) sean comparables.
+    Las puntuaciones RRF se guardan en ``fusion_scores``; ``scores`` conserva la puntuación de
+    la primera lista (la similitud coseno de la búsqueda vectorial), o None para los fragmentos
+    que no aparecen en ella.
+
+    Args:
+        result_sets: Resultados de cada búsqueda, de mayor a menor relevancia.
+        k: Número de fragmentos a devolver.
+        rrf_k: Constante que suaviza el peso de los primeros puestos.
+
+    Returns:
+        ResultSet: Fragmentos ordenados por su puntuación RRF, de mayor a menor.
+    """
+    scores: Dict[Hashable, float] = {}
+    similarities: Dict[Hashable, float] = {}
+    origin: Dict[Hashable, Tuple[ResultSet, int]] = {}
+    for position, result_set in enumerate(result_sets):
+        for rank in range(len(result_set)):
+            key = result_key(result_set, rank)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            origin.setdefault(key, (result_set, rank))
+            if position == 0:
+                similarities.setdefault(key, result_set.scores[rank])
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:max(0, k)]
+    fused = ResultSet([], [], [], [], fusion_scores=[])
+    for key, score in ranked:
+        source, index = origin[key]
+        fused.ids.append(source.ids[index])
+        fused.contents.append(source.contents[index])
+        fused.scores.append(similarities.get(key))
+        fused.fusion_scores.append(score)
+        # Los metadatos se copian sin decodificar
+        fused._metadata.append(source._metadata[index])
+        fused._decoded.append(source._decoded[index])
+    return fused
+
+class LexicalIndex:
+    """Índice BM25 con listas de apariciones en arrays y actualizaciones incrementales en memoria."""
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        norms: np.ndarray,
+        manifest: Dict[str, Any],
+        records: Optional[SnapshotRecords] = None
+    ):
+        """Inicializa el índice a partir de sus arrays.
+
+        Args:
+            terms: Términos, en el orden de sus identificadores.
+            offsets: Inicio de las apariciones de cada término en ``docs``/``tfs``.
+            docs: Fila del documento de cada aparición.
+            tfs: Frecuencia del término en cada aparición.
+            norms: Normalización por longitud precalculada de cada documento.
+            manifest: Parámetros de construcción (``k1``, ``b``, ``avg_length``...).
+            records: Registros de la instantánea, para devolver el contenido de los fragmentos.
+        """
+        self.terms = terms
+        self.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.norms = norms
+        self.manifest = manifest
+        self.records = records
+        self.k1 = float(manifest.get("k1", DEFAULT_K1))
+        self.b = float(manifest.get("b", DEFAULT_B))
+        self.avg_length = float(manifest.get("avg_length") or 1.0)
+
+        # Altas y bajas posteriores a la construcción
+        self.deleted = np.zeros(norms.shape[0], dtype=bool)
+        self._delta_records: List[Dict[str, Any]] = []
+        self._delta_norms: List[float] = []
+        self._delta_postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._delta_deleted = set()
+        self._row_by_id: Optional[Dict[Hashable, int]] = None
+        self._delta_by_id: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Número de documentos vigentes."""
+        return int(self.norms.shape[0] - self.deleted.sum()) + len(self._delta_records) - len(self._delta_deleted)
+
+    @property
+    def size_bytes(self) -> int:
+        """Memoria de los arrays de apariciones y normas (sin el vocabulario)."""
+        return int(self.offsets.nbytes + self.docs.nbytes + self.tfs.nbytes + self.norms.nbytes)
+
+    @classmethod
+    def build(
+        cls,
+        records: Iterable[Dict[str, Any]],
+        k1: float = DEFAULT_K1,
+        b: float = DEFAULT_B
+    ) -> "LexicalIndex":
+        """Construye el índice a partir de los registros de una instantánea, en orden de fila.
+
+        Args:
+            records: Registros con ``content``.
+            k1: Saturación de la frecuencia de los términos.
+            b: Peso de la normalización por longitud.
+
+        Returns:
+            LexicalIndex: Índice construido.
+        """
+        start_time = time.perf_counter()
+        vocabulary: Dict[str, int] = {}
+        term_ids = array("i")
+        doc_rows = array("i")
+        frequencies = array("H")
+        lengths = array("I")
+
+        for row, record in enumerate(records):
+            tokens = tokenize(record.get("content") or "")
+            lengths.append(len(tokens))
+            for term, frequency in Counter(tokens).items():
+                term_id = vocabulary.setdefault(term, len(vocabulary))
+                term_ids.append(term_id)
+                doc_rows.append(row)
+                frequencies.append(min(frequency, 65535))
+
+        # Agrupar las apariciones por término; el orden estable las mantiene ordenadas por fila
+        term_array = np.frombuffer(term_ids, dtype=np.int32) if term_ids else np.zeros(0, dtype=np.int32)
+        order = np.argsort(term_array, kind="stable")
+        counts = np.bincount(term_array, minlength=len(vocabulary))
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        docs = np.asarray(doc_rows, dtype=np.int32)[order]
+        tfs = np.asarray(frequencies, dtype=np.uint16)[order]
+
+        length_array = np.asarray(lengths, dtype=np.float32)
+        avg_length = float(length_array.mean()) if length_array.size else 1.0
+        norms = (k1 * (1 - b + b * length_array / max(avg_length, 1e-6))).astype(np.float32)
+
+        terms = [None] * len(vocabulary)
+        for term, term_id in vocabulary.items():
+            terms[term_id] = term
+
+        manifest = {
+            "documents": int(length_array.size),
+            "terms": len(terms),
+            "postings": int(docs.size),
+            "avg_length": avg_length,
+            "k1": k1,
+            "b": b,
+            "build_time": time.perf_counter() - start_time
+        }
+        index = cls(terms, offsets, docs, tfs, norms, manifest)
+        index.manifest["size_bytes"] = index.size_bytes
+        logger.info(
+            f"Índice BM25 construido: {manifest['documents']} documentos, {manifest['terms']} términos, "
+            f"{manifest['postings']} apariciones ({manifest['build_time']:.2f} segundos)"
+        )
+        return index
+
+    def save(self, directory: str):
+        """Guarda el índice y descarta las altas y bajas pendientes (ya incluidas en la exportación).
+
+        Args:
+            directory: Directorio de la instantánea.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for filename, array_data in (
+            (OFFSETS_FILE, self.offsets),
+            (DOCS_FILE, self.docs),
+            (TFS_FILE, self.tfs),
+            (NORMS_FILE, self.norms)
+        ):
+            tmp_path = os.path.join(directory, f"{filename}.tmp.npy")
+            np.save(tmp_path, np.asarray(array_data))
+            os.replace(tmp_path, os.path.join(directory, filename))
+
+        for filename, payload in ((TERMS_FILE, self.terms), (MANIFEST_FILE, self.manifest)):
+            tmp_path = os.path.join(directory, f"{filename}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(directory, filename))
+
+        delta_path = os.path.join(directory, DELTA_FILE)
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+
+    @classmethod
+    def exists(cls, directory: str) -> bool:
+        """Indica si hay un índice guardado en el directorio."""
+        return os.path.exists(os.path.join(directory, MANIFEST_FILE))
+
+    @classmethod
+    def load(cls, directory: str) -> "LexicalIndex":
+        """Carga un índice mapeando en memoria sus arrays y aplica las altas y bajas pendientes.
+
+        Args:
+            directory: Directorio de la instantánea.
+
+        Returns:
+            LexicalIndex: Índice cargado.
+        """
+        start_time = time.perf_counter()
+        with open(os.path.join(directory, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(directory, TERMS_FILE), "r", encoding="utf-8") as f:
+            terms = json.load(f)
+
+        index = cls(
+            terms,
+            offsets=np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r"),
+            docs=np.load(os.path.join(directory, DOCS_FILE), mmap_mode="r"),
+            tfs=np.load(os.path.join(directory, TFS_FILE), mmap_mode="r"),
+            norms=np.load(os.path.join(directory, NORMS_FILE)),
+            manifest=manifest,
+            records=SnapshotRecords(directory)
+        )
+
+        delta_path = os.path.join(directory, DELTA_FILE)
+        if os.path.exists(delta_path):
+            with open(delta_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        change = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Cambio del índice BM25 ignorado: {line[:80]!r}")
+                        continue
+                    if change.get("op") == "delete":
+                        index.remove([change.get("id")])
+                    else:
+                        index.add([change])
+
+        logger.info(
+            f"Índice BM25 cargado desde {directory}: {len(index)} documentos, {manifest.get('terms')} términos, "
+            f"{index.size_bytes / 1e6:.1f} MB ({time.perf_counter() - start_time:.2f} segundos)"
+        )
+        return index
+
+    def _base_row(self, doc_id: Hashable) -> Optional[int]:
+        """Fila de la instantánea de un identificador (el mapa se construye la primera vez)."""
+        if self._row_by_id is None:
+            self._row_by_id = {}
+            if self.records is not None:
+                for row, record in enumerate(self.records):
+                    if record.get("id") is not None:
+                        self._row_by_id[record["id"]] = row
+        return self._row_by_id.get(doc_id)
+
+    def remove(self, ids: Iterable[Hashable]):
+        """Da de baja documentos por su identificador.
+
+        Args:
+            ids: Identificadores de los documentos.
+        """
+        with self._lock:
+            for doc_id in ids:
+                row = self._base_row(doc_id)
+                if row is not None:
+                    self.deleted[row] = True
+                position = self._delta_by_id.pop(doc_id, None)
+                if position is not None:
+                    self._delta_deleted.add(position)
+
+    def add(self, records: Iterable[Dict[str, Any]]):
+        """Da de alta (o sustituye, si ya existe su identificador) documentos en memoria.
+
+        Args:
+            records: Registros con ``id``, ``content`` y ``metadata``.
+        """
+        records = list(records)
+        self.remove(record.get("id") for record in records if record.get("id") is not None)
+        with self._lock:
+            for record in records:
+                tokens = tokenize(record.get("content") or "")
+                position = len(self._delta_records)
+                self._delta_records.append(
+                    {"id": record.get("id"), "content": record.get("content") or "", "metadata": record.get("metadata")}
+                )
+                self._delta_norms.append(self.k1 * (1 - self.b + self.b * len(tokens) / max(self.avg_length, 1e-6)))
+                for term, frequency in Counter(tokens).items():
+                    self._delta_postings.setdefault(term, []).append((position, frequency))
+                if record.get("id") is not None:
+                    self._delta_by_id[record["id"]] = position
+
+    def _idf(self, document_frequency: int) -> float:
+        """Peso IDF de BM25 (siempre positivo)."""
+        total = self.norms.shape[0] + len(self._delta_records)
+        return math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query_text: str, k: int) -> ResultSet:
+        """Obtiene los fragmentos con mayor puntuación BM25 para una consulta.
+
+        Args:
+            query_text: Texto de la consulta.
+            k: Número máximo de fragmentos.
+
+        Returns:
+            ResultSet: Fragmentos con su puntuación BM25, de mayor a menor.
+        """
+        terms = set(tokenize(query_text))
+        if k <= 0 or not terms:
+            return ResultSet()
+
+        doc_blocks = []
+        weight_blocks = []
+        delta_scores: Dict[int, float] = {}
+        k1_plus_one = self.k1 + 1
+        for term in terms:
+            term_id = self.vocabulary.get(term)
+            delta = self._delta_postings.get(term, ())
+            start, end = (int(self.offsets[term_id]), int(self.offsets[term_id + 1])) if term_id is not None else (0, 0)
+            idf = self._idf(end - start + len(delta))
+            if end > start:
+                docs = np.asarray(self.docs[start:end])
+                tfs = np.asarray(self.tfs[start:end], dtype=np.float32)
+                doc_blocks.append(docs)
+                weight_blocks.append(idf * tfs * k1_plus_one / (tfs + self.norms[docs]))
+            for position, frequency in delta:
+                weight = idf * frequency * k1_plus_one / (frequency + self._delta_norms[position])
+                delta_scores[position] = delta_scores.get(position, 0.0) + weight
+
+        # Candidatos de la instantánea: suma de los pesos de cada documento
+        candidates: List[Tuple[float, int, int]] = []
+        if doc_blocks:
+            docs = np.concatenate(doc_blocks)
+            unique_docs, inverse = np.unique(docs, return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(weight_blocks)).astype(np.float32)
+            keep = ~self.deleted[unique_docs]
+            unique_docs, scores = unique_docs[keep], scores[keep]
+            if scores.size > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                unique_docs, scores = unique_docs[top], scores[top]
+            candidates.extend((float(score), 0, int(row)) for score, row in zip(scores, unique_docs))
+        candidates.extend(
+            (score, 1, position) for position, score in delta_scores.items() if position not in self._delta_deleted
+        )
+
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        results = ResultSet([], [], [], [])
+        for score, source, row in candidates[:k]:
+            record = self.records.get(row) if source == 0 else self._delta_records[row]
+            results.ids.append(record.get("id"))
+            results.contents.append(record.get("content") or "")
+            results.scores.append(score)
+            results._metadata.append(record.get("metadata"))
+            results._decoded.append(isinstance(record.get("metadata"), dict))
+        return results
+
+    def close(self):
+        """Libera los registros mapeados en memoria."""
+        if self.records is not None:
+            self.records.close()
+
+def build_lexical_index(directory: str, k1: float = DEFAULT_K1, b: float = DEFAULT_B) -> Dict[str, Any]:
+    """Construye y guarda el índice BM25 de una instantánea local.
+
+    Args:
+        directory: Directorio de la instantánea (``app.database.export_snapshot``).
+        k1: Saturación de la frecuencia de los términos.
+        b: Peso de la normalización por longitud.
+
+    Returns:
+        Dict[str, Any]: Manifiesto del índice (documentos, términos, tamaño y tiempo de construcción).
+    """
+    records = SnapshotRecords(directory)
+    try:
+        index = LexicalIndex.build(records, k1=k1, b=b)
+    finally:
+        records.close()
+    index.save(directory)
+    return index.manifest
+
+def append_delta(directory: str, records: Iterable[Dict[str, Any]] = (), deleted_ids: Iterable[Hashable] = ()) -> int:
+    """Registra altas y bajas para el índice BM25 sin reconstruirlo.
+
+    Se aplican la próxima vez que se cargue el índice; la siguiente exportación completa
+    las incorpora y vacía el registro.
+
+    Args:
+        directory: Directorio de la instantánea.
+        records: Documentos dados de alta o modificados (``id``, ``content``, ``metadata``).
+        deleted_ids: Identificadores de documentos eliminados.
+
+    Returns:
+        int: Número de cambios registrados.
+    """
+    lines = [
+        json.dumps(
+            {"op": "upsert", "id": record.get("id"), "content": record.get("content"), "metadata": record.get("metadata")},
+            ensure_ascii=False
+        )
+        for record in records
+    ]
+    lines.extend(json.dumps({"op": "delete", "id": doc_id}) for doc_id in deleted_ids)
+    if lines:
+        with open(os.path.join(directory, DELTA_FILE), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    return len(lines)
+
+_lexical_indexes: Dict[str, LexicalIndex] = {}
+_lexical_indexes_lock = threading.Lock()
+
+def get_lexical_index(directory: str) -> LexicalIndex:
+    """Obtiene el índice BM25 de un directorio, cargándolo una sola vez por proceso.
+
+    Args:
+        directory: Directorio de la instantánea.
+
+    Returns:
+        LexicalIndex: Índice cargado.
+
+    Raises:
+        FileNotFoundError: Si no hay un índice en el directorio.
+    """
+    with _lexical_indexes_lock:
+        index = _lexical_indexes.get(directory)
+        if index is None:
+            if not LexicalIndex.exists(directory):
+                logger.error(f"No existe un índice BM25 en {directory}")
+                raise FileNotFoundError(f"No existe un índice BM25 en {directory}")
+            index = _lexical_indexes[directory] = LexicalIndex.load(directory)
+        return index
+
+def latency_report(index: LexicalIndex, queries: Sequence[str], k: int = 10) -> Dict[str, float]:
+    """Mide la latencia de búsqueda del índice.
+
+    Args:
+        index: Índice BM25.
+        queries: Consultas de evaluación.
+        k: Resultados por consulta.
+
+    Returns:
+        Dict[str, float]: Latencias media, p50, p95 y p99 en milisegundos.
+    """
+    latencies = []
+    for query in queries:
+        start_time = time.perf_counter()
+        index.search(query, k)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    latencies.sort()
+
+    def rank(percentile: float) -> float:
+        return latencies[max(0, math.ceil(len(latencies) * percentile / 100) - 1)]
+
+    return {
+        "queries": len(latencies),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p50_ms": rank(50) if latencies else 0.0,
+        "p95_ms": rank(95) if latencies else 0.0,
+        "p99_ms": rank(99) if latencies else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye y evalúa el índice BM25 de una instantánea local")
+    parser.add_argument("command", choices=["build", "report"])
+    parser.add_argument("--index-dir", default="data/index", help="Directorio de la instantánea")
+    parser.add_argument("--k1", type=float, default=DEFAULT_K1, help="Parámetro k1 de BM25")
+    parser.add_argument("--b", type=float, default=DEFAULT_B, help="Parámetro b de BM25")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas de evaluación (muestreadas del corpus)")
+    parser.add_argument("--k", type=int, default=10, help="Resultados por consulta")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "build":
+        print(json.dumps(build_lexical_index(args.index_dir, k1=args.k1, b=args.b), indent=2))
+        return
+
+    index = LexicalIndex.load(args.index_dir)
+    # Consultas de tres palabras seguidas tomadas de fragmentos al azar
+    rng = np.random.default_rng(1)
+    queries = []
+    for row in rng.choice(len(index.records), size=min(args.queries, len(index.records)), replace=False):
+        words = (index.records.get(int(row)).get("content") or "").split()
+        start = int(rng.integers(0, max(1, len(words) - 3)))
+        queries.append(" ".join(words[start:start + 3]))
+    print(json.dumps({**index.manifest, "loaded_documents": len(index), **latency_report(index, queries, args.k)}, indent=2))
+    index.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Búsqueda vectorial local sobre una instantánea de la tabla de documentos.
+Este módulo permite responder a las búsquedas por similitud dentro del proceso, sin
+llamar a la función match_documents de Supabase, a partir de ficheros mapeados en memoria.
+
+Formato de la instantánea (un directorio):
+    - ``embeddings.npy``: matriz float32 (documentos, dimensiones) con filas normalizadas.
+    - ``records.bin``: registros JSON ``{"id", "content", "metadata"}`` concatenados en UTF-8.
+    - ``offsets.npy``: desplazamientos int64 (documentos + 1) de cada registro en ``records.bin``.
+    - ``manifest.json``: número de documentos, dimensiones, colección, fecha e identificador
+      de exportación (los índices derivados lo guardan para detectar que han quedado obsoletos).
+"""
+
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.database.ann_index import MANIFEST_FILE as IVF_MANIFEST_FILE, IVFIndex
+from app.database.document import Document
+from app.database.result_set import ResultSet
+from app.utils.vectors import Embedding
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.bin"
+OFFSETS_FILE = "offsets.npy"
+MANIFEST_FILE = "manifest.json"
+
+def parse_embedding(value: Any) -> List[float]:
+    """Convierte un embedding devuelto por PostgREST en una lista de floats.
+
+    Args:
+        value: Embedding como lista o como cadena en formato pgvector ("[0.1,0.2,...]").
+
+    Returns:
+        List[float]: Vector de embedding.
+    """
+    if isinstance(value, str):
+        return json.loads(value)
+    return list(value)
+
+def write_snapshot(directory: str, rows: Iterable[Dict[str, Any]], collection_name: str) -> Dict[str, Any]:
+    """Escribe una instantánea local a partir de filas de la tabla de documentos.
+
+    Args:
+        directory: Directorio de destino.
+        rows: Filas con ``id``, ``content``, ``metadata`` y ``embedding``.
+        collection_name: Nombre de la colección exportada.
+
+    Returns:
+        Dict[str, Any]: Manifiesto de la instantánea escrita.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    vectors = []
+    offsets = [0]
+    records_path = os.path.join(directory, RECORDS_FILE)
+    with open(f"{records_path}.tmp", "wb") as records_file:
+        for row in rows:
+            vector = np.asarray(parse_embedding(row["embedding"]), dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+
+            metadata = row.get("metadata") or {}
+            if isinstance(metadata, str):
+                try:
+                    metadata = json.loads(metadata)
+                except json.JSONDecodeError:
+                    logger.warning(f"Error al deserializar metadatos: {metadata}")
+                    metadata = {}
+
+            record = json.dumps(
+                {"id": row.get("id"), "content": row.get("content", ""), "metadata": metadata},
+                ensure_ascii=False
+            ).encode("utf-8")
+            records_file.write(record)
+            offsets.append(offsets[-1] + len(record))
+
+    dimensions = int(vectors[0].shape[0]) if vectors else 0
+    matrix = np.vstack(vectors) if vectors else np.zeros((0, dimensions), dtype=np.float32)
+
+    np.save(os.path.join(directory, f"{EMBEDDINGS_FILE}.tmp.npy"), matrix)
+    np.save(os.path.join(directory, f"{OFFSETS_FILE}.tmp.npy"), np.asarray(offsets, dtype=np.int64))
+
+    manifest = {
+        "documents": int(matrix.shape[0]),
+        "dimensions": dimensions,
+        "collection_name": collection_name,
+        "created_at": time.time(),
+        "export_id": uuid.uuid4().hex
+    }
+    with open(os.path.join(directory, f"{MANIFEST_FILE}.tmp"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+
+    # Sustituir los ficheros de forma atómica para no dejar instantáneas a medias
+    os.replace(os.path.join(directory, f"{EMBEDDINGS_FILE}.tmp.npy"), os.path.join(directory, EMBEDDINGS_FILE))
+    os.replace(os.path.join(directory, f"{OFFSETS_FILE}.tmp.npy"), os.path.join(directory, OFFSETS_FILE))
+    os.replace(f"{records_path}.tmp", records_path)
+    os.replace(os.path.join(directory, f"{MANIFEST_FILE}.tmp"), os.path.join(directory, MANIFEST_FILE))
+
+    logger.info(f"Instantánea local escrita en {directory}: {manifest['documents']} documentos")
+    return manifest
+
+class SnapshotRecords:
+    """Registros (``id``, ``content``, ``metadata``) de una instantánea, mapeados en memoria."""
+
+    def __init__(self, directory: str):
+        """Abre los registros de la instantánea.
+
+        Args:
+            directory: Directorio de la instantánea.
+        """
+        self.offsets = np.load(os.path.join(directory, OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(directory, RECORDS_FILE), "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b""
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0] - 1)
+
+    def get(self, row: int) -> Dict[str, Any]:
+        """Decodifica un registro.
+
+        Args:
+            row: Fila del documento.
+
+        Returns:
+            Dict[str, Any]: Registro con ``id``, ``content`` y ``metadata``.
+        """
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._data[start:end])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Recorre todos los registros en orden de fila."""
+        return (self.get(row) for row in range(len(self)))
+
+    def close(self):
+        """Libera el fichero mapeado en memoria."""
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+class LocalVectorStore:
+    """Clase para realizar búsquedas por similitud sobre una instantánea local."""
+
+    def __init__(self, directory: str, use_ann: bool = False, nprobe: int = 8, rerank: bool = True):
+        """Abre la instantánea mapeando en memoria sus ficheros.
+
+        Args:
+            directory: Directorio de la instantánea.
+            use_ann: Si se utiliza el índice aproximado IVF en lugar de la búsqueda exacta.
+            nprobe: Número de listas IVF a explorar por consulta.
+            rerank: Si se reordenan los candidatos del índice IVF con los vectores exactos.
+        """
+        self.directory = directory
+        self.nprobe = nprobe
+        self.rerank = rerank
+
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            logger.error(f"No existe una instantánea local en {directory}")
+            raise FileNotFoundError(f"No existe una instantánea local en {directory}")
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        # Los vectores exactos son opcionales con el índice IVF sin reordenación
+        embeddings_path = os.path.join(directory, EMBEDDINGS_FILE)
+        self.embeddings = np.load(embeddings_path, mmap_mode="r") if os.path.exists(embeddings_path) else None
+
+        self.ann_index = None
+        if use_ann:
+            if not IVFIndex.exists(directory):
+                logger.error(f"No existe un índice IVF en {directory}")
+                raise FileNotFoundError(f"No existe un índice IVF en {directory}")
+            self.ann_index = IVFIndex.load(directory)
+            mismatch = self.ann_index.snapshot_mismatch(self.manifest)
+            if mismatch is not None:
+                if self.embeddings is None:
+                    logger.error(f"El índice IVF de {directory} no corresponde a la instantánea: {mismatch}")
+                    raise ValueError(
+                        f"El índice IVF de {directory} no corresponde a la instantánea ({mismatch}); "
+                        f"reconstrúyalo con python -m app.database.ann_index build"
+                    )
+                logger.warning(
+                    f"El índice IVF de {directory} no corresponde a la instantánea ({mismatch}); "
+                    f"se usa la búsqueda exacta hasta que se reconstruya"
+                )
+                self.ann_index = None
+        elif self.embeddings is None:
+            logger.error(f"No existen los embeddings de la instantánea en {directory}")
+            raise FileNotFoundError(f"No existen los embeddings de la instantánea en {directory}")
+
+        self.records = SnapshotRecords(directory)
+
+        # Del manifiesto: los vectores exactos pueden no existir con el índice IVF
+        self.dimensions = int(self.manifest.get("dimensions") or 0)
+
+        logger.info(
+            f"Instantánea local cargada desde {directory}: "
+            f"{len(self)} documentos de {self.manifest.get('dimensions')} dimensiones"
+            f"{' (índice IVF)' if self.ann_index is not None else ''}"
+        )
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get_record(self, row: int) -> Dict[str, Any]:
+        """Decodifica un registro de la instantánea.
+
+        Args:
+            row: Fila del documento.
+
+        Returns:
+            Dict[str, Any]: Registro con ``id``, ``content`` y ``metadata``.
+        """
+        return self.records.get(row)
+
+    def search(self, query_embedding, similarity_threshold: float, max_documents: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Obtiene las filas más similares a la consulta.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud; solo se devuelven filas que lo superen.
+            max_documents: Número máximo de filas a devolver.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Filas y similitudes coseno, de mayor a menor similitud.
+
+        Raises:
+            ValueError: Si la dimensión de la consulta no coincide con la de la instantánea
+                        (por ejemplo, con EMBEDDING_DIMENSIONS distinto al de la ingesta).
+        """
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32))
+        if max_documents <= 0 or not len(self):
+            return empty
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape[0] != self.dimensions:
+            raise ValueError(
+                f"El embedding de la consulta tiene {query.shape[0]} dimensiones y la instantánea "
+                f"local {self.dimensions}; revise EMBEDDING_DIMENSIONS"
+            )
+
+        if self.ann_index is not None:
+            exact_vectors = self.embeddings if self.rerank else None
+            top, similarities = self.ann_index.search(
+                query, max_documents, nprobe=self.nprobe, exact_vectors=exact_vectors
+            )
+            keep = similarities > similarity_threshold
+            return top[keep], similarities[keep]
+
+        norm = np.linalg.norm(query)
+        if not norm:
+            return empty
+
+        # Las filas están normalizadas, así que el producto escalar es la similitud coseno
+        similarities = self.embeddings @ (query / norm)
+
+        k = min(max_documents, similarities.shape[0])
+        if k < similarities.shape[0]:
+            top = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            top = np.arange(similarities.shape[0])
+        top = top[np.argsort(-similarities[top], kind="stable")]
+
+        # Misma semántica que match_documents: similitud estrictamente mayor que el umbral
+        top = top[similarities[top] > similarity_threshold]
+        return top, similarities[top]
+
+    def search_results(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5
+    ) -> ResultSet:
+        """Realiza una búsqueda por similitud de vectores en la instantánea.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar.
+
+        Returns:
+            ResultSet: Fragmentos recuperados, de mayor a menor similitud.
+        """
+        rows, similarities = self.search(query_embedding, similarity_threshold, max_documents)
+        records = [self.get_record(row) for row in rows.tolist()]
+
+        if not records:
+            logger.info("No se encontraron documentos que coincidan con la consulta")
+
+        return ResultSet(
+            [record.get("id") for record in records],
+            [record.get("content") or "" for record in records],
+            similarities.tolist(),
+            [record.get("metadata") for record in records]
+        )
+
+    def similarity_search_with_score(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5
+    ) -> List[Tuple[Document, float]]:
+        """Realiza una búsqueda por similitud de vectores en la instantánea y devuelve documentos.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar.
+
+        Returns:
+            List[Tuple[Document, float]]: Lista de documentos con sus puntuaciones de similitud.
+        """
+        return self.search_results(query_embedding, similarity_threshold, max_documents).documents()
+
+    def close(self):
+        """Libera los ficheros mapeados en memoria."""
+        self.records.close()
+
+_local_stores: Dict[Tuple, Tuple[Optional[Tuple], LocalVectorStore]] = {}
+_local_stores_lock = threading.Lock()
+
+def _file_version(path: str) -> Optional[Tuple[int, int]]:
+    """Identifica la versión de un fichero en disco (inodo y fecha de modificación)."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+def snapshot_version(directory: str, use_ann: bool = False) -> Tuple:
+    """Identifica la versión de la instantánea (y de su índice IVF) que hay en disco.
+
+    Los manifiestos se escriben los últimos y se sustituyen con ``os.replace``, así que
+    cambian con cada exportación o reconstrucción del índice.
+
+    Args:
+        directory: Directorio de la instantánea.
+        use_ann: Si se tiene en cuenta también el índice IVF.
+
+    Returns:
+        Tuple: Versión de los manifiestos.
+    """
+    version = (_file_version(os.path.join(directory, MANIFEST_FILE)),)
+    if use_ann:
+        version += (_file_version(os.path.join(directory, IVF_MANIFEST_FILE)),)
+    return version
+
+def get_local_store(directory: str, use_ann: bool = False, nprobe: int = 8, rerank: bool = True) -> LocalVectorStore:
+    """Obtiene la instantánea local de un directorio, abriéndola de nuevo solo si ha cambiado.
+
+    Cada llamada comprueba los manifiestos en disco, de modo que una instancia caliente usa la
+    nueva exportación (o el índice IVF reconstruido) en cuanto se escribe. La instantánea
+    anterior no se cierra: sus ficheros mapeados se liberan cuando terminan las búsquedas
+    que la estaban usando. Si la nueva no puede abrirse (por ejemplo, a mitad de una
+    exportación), se sigue usando la anterior.
+
+    Args:
+        directory: Directorio de la instantánea.
+        use_ann: Si se utiliza el índice aproximado IVF.
+        nprobe: Número de listas IVF a explorar por consulta.
+        rerank: Si se reordenan los candidatos del índice IVF con los vectores exactos.
+
+    Returns:
+        LocalVectorStore: Instantánea abierta.
+    """
+    key = (directory, use_ann, nprobe, rerank)
+    version = snapshot_version(directory, use_ann)
+    with _local_stores_lock:
+        cached = _local_stores.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        try:
+            store = LocalVectorStore(directory, use_ann=use_ann, nprobe=nprobe, rerank=rerank)
+        except Exception as e:
+            if cached is None:
+                raise
+            logger.warning(f"No se pudo abrir la nueva instantánea de {directory}; se sigue usando la anterior: {e}")
+            return cached[1]
+
+        if cached is not None:
+            logger.info(f"La instantánea local de {directory} ha cambiado; se usa la nueva exportación")
+        _local_stores[key] = (version, store)
+        return store
@@ -0,0 +1,179 @@
+"""
+Resultados de una búsqueda por similitud en formato columnar.
+Las filas devueltas por ``match_documents`` (o por la instantánea local) se guardan como
+listas paralelas de identificadores, contenidos, similitudes y metadatos sin decodificar.
+Los metadatos en JSON solo se decodifican al acceder a ellos, de modo que los fragmentos
+que no entran en el contexto nunca se procesan, y las fuentes de la respuesta se
+construyen directamente a partir de las columnas.
+"""
+
+import json
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from app.database.document import Document
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+RawMetadata = Union[str, bytes, Dict[str, Any], None]
+
+def decode_metadata(raw: RawMetadata) -> Dict[str, Any]:
+    """Convierte los metadatos de una fila en un diccionario.
+
+    Args:
+        raw: Metadatos como diccionario o como cadena JSON.
+
+    Returns:
+        Dict[str, Any]: Metadatos decodificados (vacíos si no son válidos).
+    """
+    if raw is None:
+        return {}
+    if isinstance(raw, (str, bytes)):
+        try:
+            raw = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.warning(f"Error al deserializar metadatos: {raw!r}")
+            return {}
+    return raw if isinstance(raw, dict) else {}
+
+class ResultSet:
+    """Filas recuperadas, de mayor a menor similitud, en columnas paralelas."""
+
+    __slots__ = ("ids", "contents", "scores", "_metadata", "_decoded", "shards", "fanout", "fusion_scores")
+
+    def __init__(
+        self,
+        ids: Optional[List[Any]] = None,
+        contents: Optional[List[str]] = None,
+        scores: Optional[List[float]] = None,
+        metadata: Optional[List[RawMetadata]] = None,
+        shards: Optional[List[str]] = None,
+        fusion_scores: Optional[List[float]] = None
+    ):
+        """Inicializa el conjunto de resultados.
+
+        Args:
+            ids: Identificadores de las filas (pueden ser None).
+            contents: Contenido de cada fragmento.
+            scores: Similitud de cada fragmento (None si solo lo encontró la búsqueda léxica).
+            metadata: Metadatos de cada fragmento, decodificados o como cadena JSON.
+            shards: Fragmento (shard) de origen de cada fila, en búsquedas repartidas.
+            fusion_scores: Puntuación RRF de cada fila, en búsquedas híbridas.
+        """
+        self.contents = contents if contents is not None else []
+        self.scores = scores if scores is not None else []
+        self.ids = ids if ids is not None else [None] * len(self.contents)
+        self._metadata = metadata if metadata is not None else [None] * len(self.contents)
+        self._decoded = [isinstance(raw, dict) for raw in self._metadata]
+        self.shards = shards
+        self.fusion_scores = fusion_scores
+        # Estado de una búsqueda repartida entre shards (consultados, fallidos, parcial)
+        self.fanout: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_rows(cls, rows: Optional[Iterable[Dict[str, Any]]]) -> "ResultSet":
+        """Construye el conjunto a partir de las filas devueltas por la función RPC.
+
+        Args:
+            rows: Filas con ``id``, ``content``, ``metadata`` y ``similarity``.
+
+        Returns:
+            ResultSet: Resultados sin metadatos decodificados.
+        """
+        ids: List[Any] = []
+        contents: List[str] = []
+        scores: List[float] = []
+        metadata: List[RawMetadata] = []
+        for row in rows or ():
+            ids.append(row.get("id"))
+            contents.append(row.get("content") or "")
+            scores.append(row.get("similarity") or 0.0)
+            metadata.append(row.get("metadata"))
+        return cls(ids, contents, scores, metadata)
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+    def __repr__(self) -> str:
+        return f"ResultSet({len(self)} filas)"
+
+    def metadata(self, index: int) -> Dict[str, Any]:
+        """Obtiene los metadatos de una fila, decodificándolos en el primer acceso.
+
+        Args:
+            index: Posición de la fila.
+
+        Returns:
+            Dict[str, Any]: Metadatos de la fila.
+        """
+        if not self._decoded[index]:
+            self._metadata[index] = decode_metadata(self._metadata[index])
+            self._decoded[index] = True
+        return self._metadata[index]
+
+    def select(self, indices: Sequence[int]) -> "ResultSet":
+        """Obtiene un subconjunto de filas sin decodificar sus metadatos.
+
+        Args:
+            indices: Posiciones de las filas, en el orden deseado.
+
+        Returns:
+            ResultSet: Nuevo conjunto con las filas indicadas.
+        """
+        selected = ResultSet(
+            [self.ids[i] for i in indices],
+            [self.contents[i] for i in indices],
+            [self.scores[i] for i in indices],
+            [self._metadata[i] for i in indices],
+            [self.shards[i] for i in indices] if self.shards is not None else None,
+            [self.fusion_scores[i] for i in indices] if self.fusion_scores is not None else None
+        )
+        selected._decoded = [self._decoded[i] for i in indices]
+        selected.fanout = self.fanout
+        return selected
+
+    def to_sources(self) -> List[Dict[str, Any]]:
+        """Construye las fuentes de la respuesta de la API directamente desde las columnas.
+
+        Returns:
+            List[Dict[str, Any]]: Fuentes con ``content``, ``metadata`` y ``similarity`` (y
+                                  ``shard`` en las búsquedas repartidas o ``fusion_score``
+                                  en las híbridas).
+        """
+        sources = [
+            {"content": content, "metadata": self.metadata(i), "similarity": score}
+            for i, (content, score) in enumerate(zip(self.contents, self.scores))
+        ]
+        if self.shards is not None:
+            for source, shard in zip(sources, self.shards):
+                source["shard"] = shard
+        if self.fusion_scores is not None:
+            for source, fusion_score in zip(sources, self.fusion_scores):
+                source["fusion_score"] = fusion_score
+        return sources
+
+    def documents(self) -> List[Tuple[Document, float]]:
+        """Convierte los resultados en documentos con su similitud.
+
+        Returns:
+            List[Tuple[Document, float]]: Documentos con sus puntuaciones de similitud.
+        """
+        return [
+            (Document(page_content=content, metadata=self.metadata(i)), score)
+            for i, (content, score) in enumerate(zip(self.contents, self.scores))
+        ]
+
+    def to_langchain(self) -> List[Tuple[Any, float]]:
+        """Convierte los resultados en documentos de LangChain con su similitud.
+
+        LangChain es opcional: solo se importa al llamar a este método.
+
+        Returns:
+            List[Tuple[langchain.schema.Document, float]]: Documentos con sus puntuaciones.
+        """
+        return [(doc.to_langchain(), score) for doc, score in self.documents()]
+
+    def __iter__(self) -> Iterator[Tuple[Document, float]]:
+        """Recorre los resultados como pares (documento, similitud), por compatibilidad."""
+        return iter(self.documents())
@@ -0,0 +1,364 @@
+"""
+Búsqueda vectorial repartida entre varias colecciones (shards).
+Cada shard es una colección de Supabase (en el mismo proyecto o en otro) o una
+instantánea local. Las búsquedas se lanzan en paralelo con un tiempo máximo por shard y
+los resultados se combinan en un top-k global con un montículo. Si algún shard falla o no
+responde a tiempo, se devuelven los resultados del resto marcados como parciales.
+
+La búsqueda híbrida no se aplica a los shards: el índice BM25 corresponde a una sola
+instantánea, así que ``LEXICAL_SEARCH_ENABLED`` se ignora (con un aviso) si hay shards.
+
+Configuración (``VECTOR_SHARDS``), una lista JSON de shards::
+
+    [{"name": "es", "collection": "documents_es"},
+     {"name": "en", "collection": "documents", "url": "https://otro.supabase.co",
+      "key": "...", "match_function": "match_documents"},
+     {"name": "archivo", "backend": "local", "index_dir": "data/archivo"}]
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.config.settings import LEXICAL_SEARCH_ENABLED
+from app.database.document import Document
+from app.database.result_set import ResultSet
+from app.database.vector_store import VectorDatabase
+from app.utils.admission import find_overload
+from app.utils.performance_metrics import performance_tracker
+from app.utils.vectors import Embedding
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SHARD_FIELDS = ("name", "collection", "url", "key", "match_function", "backend", "index_dir")
+
+class ShardsUnavailableError(ConnectionError):
+    """Ningún shard respondió a tiempo o sin errores."""
+
+def parse_shards(spec: str) -> List[Dict[str, Any]]:
+    """Interpreta la configuración de shards.
+
+    Args:
+        spec: Lista JSON de shards (ver el docstring del módulo). Cadena vacía: sin shards.
+
+    Returns:
+        List[Dict[str, Any]]: Definición de cada shard.
+
+    Raises:
+        ValueError: Si la configuración no es válida o hay nombres repetidos.
+    """
+    if not spec or not spec.strip():
+        return []
+    try:
+        shards = json.loads(spec)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"VECTOR_SHARDS no es JSON válido: {e}") from e
+    if not isinstance(shards, list) or not all(isinstance(shard, dict) for shard in shards):
+        raise ValueError("VECTOR_SHARDS debe ser una lista de objetos")
+
+    names = set()
+    for shard in shards:
+        name = shard.get("name")
+        if not name or not isinstance(name, str):
+            raise ValueError("Cada shard de VECTOR_SHARDS necesita un nombre (\"name\")")
+        if name in names:
+            raise ValueError(f"Shard repetido en VECTOR_SHARDS: {name}")
+        unknown = set(shard) - set(SHARD_FIELDS)
+        if unknown:
+            raise ValueError(f"Campos desconocidos en el shard {name}: {', '.join(sorted(unknown))}")
+        names.add(name)
+    return shards
+
+def merge_results(results: Sequence[Tuple[str, ResultSet]], k: int) -> ResultSet:
+    """Combina los resultados de varios shards en un top-k global.
+
+    Cada lista ya viene ordenada de mayor a menor similitud, así que basta una mezcla
+    de k vías con un montículo que se detiene al llegar a ``k`` filas.
+
+    Args:
+        results: Pares (nombre del shard, resultados).
+        k: Número máximo de filas.
+
+    Returns:
+        ResultSet: Filas de mayor a menor similitud con su shard de origen.
+    """
+    # zip fija el índice del shard en cada flujo (un generador lo leería al consumirse)
+    streams = [
+        zip(result_set.scores, itertools.count(), itertools.repeat(shard_index))
+        for shard_index, (_, result_set) in enumerate(results)
+    ]
+    top = list(itertools.islice(heapq.merge(*streams, key=lambda item: item[0], reverse=True), max(k, 0)))
+
+    merged = ResultSet([], [], [], [], [])
+    merged._decoded = []
+    for _, position, shard_index in top:
+        name, result_set = results[shard_index]
+        merged.ids.append(result_set.ids[position])
+        merged.contents.append(result_set.contents[position])
+        merged.scores.append(result_set.scores[position])
+        # Se conservan los metadatos tal y como llegaron: se decodifican solo si se usan
+        merged._metadata.append(result_set._metadata[position])
+        merged._decoded.append(result_set._decoded[position])
+        merged.shards.append(name)
+    return merged
+
+class ShardedVectorDatabase:
+    """Base de datos vectorial formada por varios shards consultados en paralelo."""
+
+    backend = "sharded"
+
+    def __init__(
+        self,
+        shards: List[Dict[str, Any]],
+        timeout: float = 2.0,
+        url: str = None,
+        key: str = None,
+        backend: str = None,
+        http_pool=None
+    ):
+        """Inicializa los shards.
+
+        Args:
+            shards: Definición de cada shard (ver :func:`parse_shards`).
+            timeout: Tiempo máximo de respuesta de cada shard, en segundos (0: sin límite).
+            url: URL de Supabase por defecto para los shards que no indican la suya.
+            key: Clave de Supabase por defecto para los shards que no indican la suya.
+            backend: Backend por defecto de los shards (``supabase``, ``local`` o ``ann``).
+            http_pool: Pool de conexiones HTTP compartido por todos los shards.
+        """
+        if not shards:
+            raise ValueError("Se necesita al menos un shard")
+
+        self.timeout = timeout
+        self.shards: Dict[str, VectorDatabase] = {}
+        for shard in shards:
+            self.shards[shard["name"]] = VectorDatabase(
+                collection_name=shard.get("collection"),
+                url=shard.get("url") or url,
+                key=shard.get("key") or key,
+                backend=shard.get("backend") or backend,
+                local_index_dir=shard.get("index_dir"),
+                http_pool=http_pool,
+                match_function=shard.get("match_function"),
+                lexical=False
+            )
+
+        # Identifica el conjunto de shards en la caché de respuestas
+        self.collection_name = "shards:" + ",".join(
+            f"{name}={database.collection_name}" for name, database in self.shards.items()
+        )
+        self._executor: Optional[ThreadPoolExecutor] = None
+        logger.info(f"Búsqueda repartida entre {len(self.shards)} shards: {', '.join(self.shards)}")
+        if LEXICAL_SEARCH_ENABLED:
+            logger.warning("LEXICAL_SEARCH_ENABLED se ignora con VECTOR_SHARDS: los shards solo usan la búsqueda vectorial")
+
+    @property
+    def shard_names(self) -> List[str]:
+        """Nombres de los shards configurados."""
+        return list(self.shards)
+
+    def resolve(self, names: Optional[Sequence[str]] = None) -> Tuple[str, ...]:
+        """Valida un subconjunto de shards.
+
+        Args:
+            names: Shards solicitados. Si es None o vacío, todos.
+
+        Returns:
+            Tuple[str, ...]: Nombres de los shards, en el orden de la configuración.
+
+        Raises:
+            ValueError: Si algún shard no existe.
+        """
+        if not names:
+            return tuple(self.shards)
+        unknown = [name for name in names if name not in self.shards]
+        if unknown:
+            raise ValueError(f"Shards desconocidos: {', '.join(unknown)}. Disponibles: {', '.join(self.shards)}")
+        requested = set(names)
+        return tuple(name for name in self.shards if name in requested)
+
+    def upstream_urls(self) -> List[str]:
+        """URL de los proyectos de Supabase de los shards remotos, sin repetir."""
+        urls = []
+        for database in self.shards.values():
+            if database.backend == "supabase":
+                url = database.supabase_store._client_url()
+                if url not in urls:
+                    urls.append(url)
+        return urls
+
+    @staticmethod
+    def _failure_reason(name: str, error: BaseException) -> str:
+        """Motivo breve del fallo de un shard para los metadatos de la respuesta.
+
+        Args:
+            name: Nombre del shard.
+            error: Excepción de la búsqueda.
+
+        Returns:
+            str: ``overloaded`` si el servicio está saturado o ``error``.
+        """
+        logger.warning(f"El shard {name} falló: {error}")
+        return "overloaded" if find_overload(error) is not None else "error"
+
+    @staticmethod
+    def _finish(
+        names: Sequence[str],
+        results: List[Tuple[str, ResultSet]],
+        failures: Dict[str, str],
+        errors: List[BaseException],
+        max_documents: int
+    ) -> ResultSet:
+        """Combina los resultados de los shards y registra su estado.
+
+        Raises:
+            UpstreamOverloadedError: Si todos los shards fallaron por saturación.
+            ShardsUnavailableError: Si ningún shard respondió.
+        """
+        for name, reason in failures.items():
+            performance_tracker.increment("shard_failures", shard=name, reason=reason)
+
+        if not results:
+            overload = next((find_overload(error) for error in errors if find_overload(error) is not None), None)
+            if overload is not None:
+                raise overload
+            raise ShardsUnavailableError(
+                "Ningún shard respondió: " + "; ".join(f"{name} ({reason})" for name, reason in failures.items())
+            )
+
+        merged = merge_results(results, max_documents)
+        merged.fanout = {
+            "queried": list(names),
+            "failed": failures,
+            "partial": bool(failures)
+        }
+        if failures:
+            logger.warning(f"Resultados parciales: shards sin respuesta {failures}")
+        return merged
+
+    async def asearch_results(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5,
+        shards: Optional[Sequence[str]] = None,
+        call: Optional[Callable[[Callable[[], Awaitable[ResultSet]]], Awaitable[ResultSet]]] = None
+    ) -> ResultSet:
+        """Busca en los shards en paralelo y combina sus resultados.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar en total.
+            shards: Subconjunto de shards a consultar. Si es None, todos.
+            call: Envoltorio de las llamadas a los shards remotos (por ejemplo, el
+                  planificador de admisión); recibe la función que crea la búsqueda.
+
+        Returns:
+            ResultSet: Top-k global con el shard de cada fila y el estado de la búsqueda
+                       en ``fanout`` (``partial`` si algún shard falló o no respondió a tiempo).
+        """
+        names = self.resolve(shards)
+
+        async def search_shard(name: str) -> ResultSet:
+            database = self.shards[name]
+
+            def search():
+                return database.asearch_results(query_embedding, similarity_threshold, max_documents)
+
+            with performance_tracker.track(f"shard_search_{name}"):
+                if call is not None and database.backend == "supabase":
+                    return await call(search)
+                return await search()
+
+        tasks = {name: asyncio.ensure_future(search_shard(name)) for name in names}
+        done, pending = await asyncio.wait(tasks.values(), timeout=self.timeout or None)
+        for task in pending:
+            task.cancel()
+
+        results: List[Tuple[str, ResultSet]] = []
+        failures: Dict[str, str] = {}
+        errors: List[BaseException] = []
+        for name, task in tasks.items():
+            if task in pending:
+                failures[name] = "timeout"
+            elif task.exception() is not None:
+                errors.append(task.exception())
+                failures[name] = self._failure_reason(name, task.exception())
+            else:
+                results.append((name, task.result()))
+        return self._finish(names, results, failures, errors, max_documents)
+
+    def search_results(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5,
+        shards: Optional[Sequence[str]] = None
+    ) -> ResultSet:
+        """Busca en los shards en paralelo (con hilos) y combina sus resultados.
+
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar en total.
+            shards: Subconjunto de shards a consultar. Si es None, todos.
+
+        Returns:
+            ResultSet: Top-k global (ver :meth:`asearch_results`).
+        """
+        names = self.resolve(shards)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard-search")
+
+        futures = {
+            name: self._executor.submit(
+                self.shards[name].search_results, query_embedding, similarity_threshold, max_documents
+            )
+            for name in names
+        }
+        _, pending = wait_futures(futures.values(), timeout=self.timeout or None)
+
+        results: List[Tuple[str, ResultSet]] = []
+        failures: Dict[str, str] = {}
+        errors: List[BaseException] = []
+        for name, future in futures.items():
+            if future in pending:
+                # Las llamadas síncronas no se pueden interrumpir; su resultado se descarta
+                failures[name] = "timeout"
+            elif future.exception() is not None:
+                errors.append(future.exception())
+                failures[name] = self._failure_reason(name, future.exception())
+            else:
+                results.append((name, future.result()))
+        return self._finish(names, results, failures, errors, max_documents)
+
+    def similarity_search_with_score(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5
+    ) -> List[Tuple[Document, float]]:
+        """Adaptador de :meth:`search_results` que devuelve documentos con su similitud."""
+        return self.search_results(query_embedding, similarity_threshold, max_documents).documents()
+
+    async def asimilarity_search_with_score(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5
+    ) -> List[Tuple[Document, float]]:
+        """Adaptador de :meth:`asearch_results` que devuelve documentos con su similitud."""
+        results = await self.asearch_results(query_embedding, similarity_threshold, max_documents)
+        return results.documents()
+
+    def close(self):
+        """Libera los hilos de las búsquedas síncronas."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
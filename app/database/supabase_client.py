@@ -4,7 +4,7 @@ Cliente de Supabase para la aplicación.
 
 import logging
 import re
-from supabase import create_client, Client
+from supabase import acreate_client, create_client, AsyncClient, AsyncClientOptions, Client, ClientOptions
 from app.config.settings import SUPABASE_URL, SUPABASE_KEY
 
 # Configurar logging
@@ -13,15 +13,18 @@ logger = logging.getLogger(__name__)
 class SupabaseStore:
     """Clase para gestionar la conexión con Supabase."""
     
-    def __init__(self, url: str = None, key: str = None):
+    def __init__(self, url: str = None, key: str = None, http_pool=None):
         """Inicializa la conexión con Supabase.
         
         Args:
             url: URL de Supabase. Si no se proporciona, se utiliza el valor de SUPABASE_URL.
             key: Clave API de Supabase. Si no se proporciona, se utiliza el valor de SUPABASE_KEY.
+            http_pool: Pool de conexiones HTTP compartido (``HTTPPool``). Si no se proporciona,
+                       la biblioteca de Supabase crea sus propios clientes.
         """
         self.url = url or SUPABASE_URL
         self.key = key or SUPABASE_KEY
+        self.http_pool = http_pool
         
         if not self.url:
             logger.error("No se ha proporcionado la URL de Supabase")
@@ -35,6 +38,7 @@ class SupabaseStore:
         self._format_and_validate_supabase_url()
         
         self.client = None
+        self.async_client = None
         self._connect()
     
     def _format_and_validate_supabase_url(self):
@@ -42,6 +46,11 @@ class SupabaseStore:
         # Eliminar cualquier barra diagonal al final
         self.url = self.url.rstrip('/')
         
+        # Las instancias locales (supabase start o los servidores simulados de los benchmarks) se usan tal cual
+        if self._is_local_url(self.url):
+            logger.info(f"URL de Supabase local: {self.url}")
+            return
+        
         # Asegurarse de que la URL comienza con https://
         if not self.url.startswith('https://'):
             if self.url.startswith('http://'):
@@ -58,25 +67,40 @@ class SupabaseStore:
         # Log para depuración
         logger.info(f"URL de Supabase formateada: {self.url}")
     
+    @staticmethod
+    def _is_local_url(url: str) -> bool:
+        """Indica si la URL apunta a una instancia local de Supabase."""
+        return bool(re.match(r'https?://(localhost|127\.0\.0\.1)(:\d+)?$', url))
+    
+    def _client_url(self) -> str:
+        """Construye la URL del proyecto exactamente como la espera la biblioteca.
+        
+        Returns:
+            str: URL con el formato 'https://[proyecto-id].supabase.co'.
+        """
+        if self._is_local_url(self.url):
+            return self.url
+        
+        # Extraer el ID del proyecto de la URL (el dominio antes de .supabase.co)
+        project_id_match = re.search(r'https?://([^\.]+)\.supabase\.co', self.url)
+        
+        if not project_id_match:
+            logger.error(f"No se pudo extraer el ID del proyecto de la URL: {self.url}")
+            raise ValueError(f"URL de Supabase inválida. Debe tener el formato 'https://[proyecto-id].supabase.co'")
+        
+        project_id = project_id_match.group(1)
+        return f"https://{project_id}.supabase.co"
+    
     def _connect(self):
         """Establece la conexión con Supabase."""
         try:
-            # Extraer el ID del proyecto de la URL (el dominio antes de .supabase.co)
-            project_id_match = re.search(r'https?://([^\.]+)\.supabase\.co', self.url)
-            
-            if not project_id_match:
-                logger.error(f"No se pudo extraer el ID del proyecto de la URL: {self.url}")
-                raise ValueError(f"URL de Supabase inválida. Debe tener el formato 'https://[proyecto-id].supabase.co'")
-            
-            project_id = project_id_match.group(1)
-            
-            # Construir la URL exactamente como la espera la biblioteca
-            formatted_url = f"https://{project_id}.supabase.co"
+            formatted_url = self._client_url()
             
             logger.info(f"Intentando conectar a Supabase URL: {formatted_url}")
             
             # Usar la URL formateada para crear el cliente
-            self.client = create_client(formatted_url, self.key)
+            options = ClientOptions(httpx_client=self.http_pool.sync_client) if self.http_pool else None
+            self.client = create_client(formatted_url, self.key, options=options)
             logger.info("Conexión con Supabase establecida")
         except Exception as e:
             error_msg = f"Error al conectar con Supabase: {str(e)}"
@@ -96,15 +120,36 @@ class SupabaseStore:
             self._connect()
         
         return self.client
+    
+    async def get_async_client(self) -> AsyncClient:
+        """Obtiene el cliente asíncrono de Supabase, creándolo en el primer uso.
+        
+        El cliente queda ligado al bucle de eventos en el que se crea.
+        
+        Returns:
+            AsyncClient: Cliente asíncrono de Supabase.
+        """
+        if not self.async_client:
+            try:
+                options = AsyncClientOptions(httpx_client=self.http_pool.async_client) if self.http_pool else None
+                self.async_client = await acreate_client(self._client_url(), self.key, options=options)
+                logger.info("Conexión asíncrona con Supabase establecida")
+            except Exception as e:
+                error_msg = f"Error al conectar con Supabase: {str(e)}"
+                logger.error(error_msg)
+                raise ConnectionError(error_msg) from e
+        
+        return self.async_client
 
-def get_supabase_client(url: str = None, key: str = None) -> SupabaseStore:
+def get_supabase_client(url: str = None, key: str = None, http_pool=None) -> SupabaseStore:
     """Obtiene una instancia de SupabaseStore.
     
     Args:
         url: URL de Supabase. Si no se proporciona, se utiliza el valor de SUPABASE_URL.
         key: Clave API de Supabase. Si no se proporciona, se utiliza el valor de SUPABASE_KEY.
+        http_pool: Pool de conexiones HTTP compartido.
         
     Returns:
         SupabaseStore: Instancia de SupabaseStore.
     """
-    return SupabaseStore(url, key) 
\ No newline at end of file
+    return SupabaseStore(url, key, http_pool=http_pool) 
\ No newline at end of file
@@ -3,14 +3,25 @@ Gestión de la base de datos vectorial.
 Este módulo proporciona funciones para gestionar documentos y embeddings en la base de datos vectorial.
 """
 
+import asyncio
 import logging
 from typing import List, Dict, Any, Optional, Tuple
-import json  # Importando json para deserializar metadatos
 
-from langchain.schema import Document
-
-from app.config.settings import SUPABASE_COLLECTION_NAME
-from app.database.supabase_client import get_supabase_client
+from app.config.settings import (
+    SUPABASE_COLLECTION_NAME,
+    SUPABASE_MATCH_FUNCTION,
+    VECTOR_BACKEND,
+    LOCAL_INDEX_DIR,
+    ANN_NPROBE,
+    ANN_RERANK,
+    LEXICAL_SEARCH_ENABLED,
+    LEXICAL_INDEX_DIR,
+    HYBRID_CANDIDATES
+)
+from app.database.document import Document
+from app.database.result_set import ResultSet
+from app.utils.performance_metrics import performance_tracker
+from app.utils.vectors import Embedding, to_pgvector
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -18,73 +29,278 @@ logger = logging.getLogger(__name__)
 class VectorDatabase:
     """Clase para gestionar la base de datos vectorial."""
     
-    def __init__(self, collection_name: str = None):
+    def __init__(
+        self,
+        collection_name: str = None,
+        url: str = None,
+        key: str = None,
+        backend: str = None,
+        local_index_dir: str = None,
+        http_pool=None,
+        match_function: str = None,
+        lexical: Optional[bool] = None,
+        lexical_index_dir: str = None
+    ):
         """Inicializa la base de datos vectorial.
         
         Args:
             collection_name: Nombre de la colección a utilizar. Si no se proporciona,
                              se utiliza el valor de SUPABASE_COLLECTION_NAME.
+            url: URL de Supabase. Si no se proporciona, se utiliza el valor de SUPABASE_URL.
+            key: Clave API de Supabase. Si no se proporciona, se utiliza el valor de SUPABASE_KEY.
+            backend: Backend de búsqueda ("supabase", "local" o "ann"). Si no se proporciona,
+                     se utiliza el valor de VECTOR_BACKEND.
+            local_index_dir: Directorio de la instantánea local. Si no se proporciona,
+                             se utiliza el valor de LOCAL_INDEX_DIR.
+            http_pool: Pool de conexiones HTTP compartido con el resto de clientes.
+            match_function: Función RPC de búsqueda. Si no se proporciona, se utiliza el valor
+                            de SUPABASE_MATCH_FUNCTION.
+            lexical: Si se combina la búsqueda vectorial con el índice BM25 local. Si no se
+                     proporciona, se utiliza el valor de LEXICAL_SEARCH_ENABLED.
+            lexical_index_dir: Directorio del índice BM25. Si no se proporciona, se utiliza
+                               LEXICAL_INDEX_DIR (o, si está vacío, el de la instantánea local).
         """
         self.collection_name = collection_name or SUPABASE_COLLECTION_NAME
-        self.supabase_store = get_supabase_client()
-        self.supabase = self.supabase_store.get_client()
-        logger.info(f"Base de datos vectorial inicializada con colección: {self.collection_name}")
+        self.match_function = match_function or SUPABASE_MATCH_FUNCTION
+        self.backend = (backend or VECTOR_BACKEND).lower()
+        self._local_store_options: Optional[Dict[str, Any]] = None
+        self.supabase_store = None
+        self.supabase = None
+        
+        # Cada backend importa solo sus dependencias (NumPy o el cliente de Supabase)
+        if self.backend in ("local", "ann"):
+            self._local_store_options = {
+                "directory": local_index_dir or LOCAL_INDEX_DIR,
+                "use_ann": self.backend == "ann",
+                "nprobe": ANN_NPROBE,
+                "rerank": ANN_RERANK
+            }
+            # Abrir la instantánea ya, para que los errores aparezcan al crear el sistema
+            from app.database.local_store import get_local_store
+            get_local_store(**self._local_store_options)
+        elif self.backend == "supabase":
+            from app.database.supabase_client import get_supabase_client
+            self.supabase_store = get_supabase_client(url, key, http_pool=http_pool)
+            self.supabase = self.supabase_store.get_client()
+        else:
+            logger.error(f"Backend de búsqueda vectorial desconocido: {self.backend}")
+            raise ValueError(f"Backend de búsqueda vectorial desconocido: {self.backend}")
+        
+        self.lexical_index = None
+        if LEXICAL_SEARCH_ENABLED if lexical is None else lexical:
+            from app.database.lexical_index import get_lexical_index
+            self.lexical_index = get_lexical_index(lexical_index_dir or LEXICAL_INDEX_DIR or local_index_dir or LOCAL_INDEX_DIR)
+        
+        logger.info(f"Base de datos vectorial inicializada con colección: {self.collection_name} (backend: {self.backend})")
     
-    def similarity_search_with_score(
-        self, 
-        query_embedding: List[float], 
-        similarity_threshold: float = 0.1, 
-        max_documents: int = 5
-    ) -> List[Tuple[Document, float]]:
+    @property
+    def local_store(self):
+        """Instantánea local actual (se vuelve a abrir si se ha exportado de nuevo), o None."""
+        if self._local_store_options is None:
+            return None
+        from app.database.local_store import get_local_store
+        return get_local_store(**self._local_store_options)
+    
+    def search_results(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5,
+        query_text: Optional[str] = None
+    ) -> ResultSet:
         """Realiza una búsqueda por similitud de vectores.
         
+        Con el índice BM25 activo y el texto de la consulta, la búsqueda vectorial y la léxica
+        obtienen cada una ``HYBRID_CANDIDATES`` candidatos y se combinan por rango recíproco.
+        El orden es el de la fusión, pero ``scores`` conserva la similitud coseno (None en los
+        fragmentos que solo encontró la búsqueda léxica) y la puntuación RRF va en ``fusion_scores``.
+        
         Args:
             query_embedding: Embedding de la consulta.
             similarity_threshold: Umbral de similitud para incluir documentos.
             max_documents: Número máximo de documentos a recuperar.
+            query_text: Texto de la consulta, para la búsqueda léxica.
             
         Returns:
-            List[Tuple[Document, float]]: Lista de documentos con sus puntuaciones de similitud.
+            ResultSet: Fragmentos recuperados, de mayor a menor relevancia.
+        """
+        if self.lexical_index is None or not query_text:
+            return self._search_vectors(query_embedding, similarity_threshold, max_documents)
+        
+        candidates = max(max_documents, HYBRID_CANDIDATES)
+        vector_results = self._search_vectors(query_embedding, similarity_threshold, candidates)
+        return self._fuse(vector_results, self._search_lexical(query_text, candidates), max_documents)
+    
+    async def asearch_results(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float = 0.1,
+        max_documents: int = 5,
+        query_text: Optional[str] = None
+    ) -> ResultSet:
+        """Realiza una búsqueda por similitud de vectores de forma asíncrona.
+        
+        La búsqueda léxica (si está activa, ver :meth:`search_results`) se ejecuta en un hilo
+        mientras se espera la búsqueda vectorial.
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar.
+            query_text: Texto de la consulta, para la búsqueda léxica.
+            
+        Returns:
+            ResultSet: Fragmentos recuperados, de mayor a menor relevancia.
         """
+        if self.lexical_index is None or not query_text:
+            return await self._asearch_vectors(query_embedding, similarity_threshold, max_documents)
+        
+        candidates = max(max_documents, HYBRID_CANDIDATES)
+        lexical = asyncio.ensure_future(asyncio.to_thread(self._search_lexical, query_text, candidates))
         try:
-            # Llamar a la función match_documents en Supabase
+            vector_results = await self._asearch_vectors(query_embedding, similarity_threshold, candidates)
+        except BaseException:
+            lexical.cancel()
+            raise
+        return self._fuse(vector_results, await lexical, max_documents)
+    
+    def _search_lexical(self, query_text: str, k: int) -> ResultSet:
+        """Búsqueda en el índice BM25, registrada como ``lexical_search``."""
+        with performance_tracker.track("lexical_search"):
+            return self.lexical_index.search(query_text, k)
+    
+    @staticmethod
+    def _fuse(vector_results: ResultSet, lexical_results: ResultSet, max_documents: int) -> ResultSet:
+        """Combina los resultados vectoriales y léxicos por rango recíproco."""
+        from app.database.lexical_index import reciprocal_rank_fusion
+        
+        with performance_tracker.track("rank_fusion"):
+            return reciprocal_rank_fusion([vector_results, lexical_results], max_documents)
+    
+    def _search_vectors(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float,
+        max_documents: int
+    ) -> ResultSet:
+        """Búsqueda vectorial en el backend configurado (ver :meth:`search_results`)."""
+        local_store = self.local_store
+        if local_store is not None:
+            return local_store.search_results(query_embedding, similarity_threshold, max_documents)
+        
+        try:
+            # Llamar a la función de búsqueda (match_documents) en Supabase
             response = self.supabase.rpc(
-                "match_documents",
-                {
-                    "query_embedding": query_embedding,
-                    "match_threshold": similarity_threshold,
-                    "match_count": max_documents
-                }
+                self.match_function,
+                self._match_params(query_embedding, similarity_threshold, max_documents)
             ).execute()
             
-            if not response.data:
-                logger.info("No se encontraron documentos que coincidan con la consulta")
-                return []
+            return self._parse_matches(response.data)
             
-            # Convertir los resultados en objetos Document de LangChain
-            documents_with_scores = []
-            for item in response.data:
-                # Extraer el contenido y los metadatos
-                content = item.get("content", "")
-                metadata = item.get("metadata", {})
-                similarity = item.get("similarity", 0.0)
-                
-                # Convertir metadatos a diccionario si son una cadena JSON
-                if isinstance(metadata, str):
-                    try:
-                        metadata = json.loads(metadata)
-                    except json.JSONDecodeError:
-                        logger.warning(f"Error al deserializar metadatos: {metadata}")
-                        metadata = {}  # Si hay error, usar un diccionario vacío
-                
-                # Crear el documento
-                doc = Document(page_content=content, metadata=metadata)
-                
-                # Añadir a la lista
-                documents_with_scores.append((doc, similarity))
+        except Exception as e:
+            logger.error(f"Error al realizar búsqueda por similitud: {e}")
+            raise
+    
+    async def _asearch_vectors(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float,
+        max_documents: int
+    ) -> ResultSet:
+        """Búsqueda vectorial asíncrona en el backend configurado (ver :meth:`asearch_results`)."""
+        local_store = self.local_store
+        if local_store is not None:
+            # La búsqueda local es CPU pura y breve; no requiere E/S asíncrona
+            return local_store.search_results(query_embedding, similarity_threshold, max_documents)
+        
+        try:
+            client = await self.supabase_store.get_async_client()
+            response = await client.rpc(
+                self.match_function,
+                self._match_params(query_embedding, similarity_threshold, max_documents)
+            ).execute()
             
-            return documents_with_scores
+            return self._parse_matches(response.data)
             
         except Exception as e:
             logger.error(f"Error al realizar búsqueda por similitud: {e}")
-            raise 
\ No newline at end of file
+            raise
+    
+    def similarity_search_with_score(
+        self, 
+        query_embedding: Embedding, 
+        similarity_threshold: float = 0.1, 
+        max_documents: int = 5
+    ) -> List[Tuple[Document, float]]:
+        """Realiza una búsqueda por similitud de vectores y devuelve documentos.
+        
+        Adaptador de :meth:`search_results` para quien necesite objetos ``Document``
+        (``ResultSet.to_langchain`` los convierte en documentos de LangChain).
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar.
+            
+        Returns:
+            List[Tuple[Document, float]]: Lista de documentos con sus puntuaciones de similitud.
+        """
+        return self.search_results(query_embedding, similarity_threshold, max_documents).documents()
+    
+    async def asimilarity_search_with_score(
+        self, 
+        query_embedding: Embedding, 
+        similarity_threshold: float = 0.1, 
+        max_documents: int = 5
+    ) -> List[Tuple[Document, float]]:
+        """Realiza una búsqueda por similitud de vectores de forma asíncrona y devuelve documentos.
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar.
+            
+        Returns:
+            List[Tuple[Document, float]]: Lista de documentos con sus puntuaciones de similitud.
+        """
+        results = await self.asearch_results(query_embedding, similarity_threshold, max_documents)
+        return results.documents()
+    
+    @staticmethod
+    def _match_params(query_embedding: Embedding, similarity_threshold: float, max_documents: int) -> Dict[str, Any]:
+        """Construye los parámetros de la función match_documents.
+        
+        El embedding se envía como literal de pgvector, más compacto y rápido de
+        serializar que una lista JSON de floats.
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_documents: Número máximo de documentos a recuperar.
+            
+        Returns:
+            Dict[str, Any]: Parámetros de la llamada RPC.
+        """
+        with performance_tracker.track("rpc_encode"):
+            encoded = to_pgvector(query_embedding)
+        return {
+            "query_embedding": encoded,
+            "match_threshold": similarity_threshold,
+            "match_count": max_documents
+        }
+    
+    @staticmethod
+    def _parse_matches(rows: Optional[List[Dict[str, Any]]]) -> ResultSet:
+        """Convierte las filas devueltas por match_documents en un conjunto de resultados.
+        
+        Los metadatos no se decodifican hasta que se accede a ellos.
+        
+        Args:
+            rows: Filas devueltas por la función RPC.
+            
+        Returns:
+            ResultSet: Fragmentos recuperados.
+        """
+        if not rows:
+            logger.info("No se encontraron documentos que coincidan con la consulta")
+        return ResultSet.from_rows(rows)
@@ -0,0 +1,526 @@
+"""
+Caché de embeddings de consultas.
+Este módulo proporciona una caché de dos niveles (memoria LRU con TTL y disco con
+vectores float32 mapeados en memoria) para evitar llamadas repetidas a la API de embeddings.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: sin bloqueo entre procesos
+    fcntl = None
+
+from app.utils.vectors import Embedding
+
+from app.config.settings import (
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_SIZE,
+    EMBEDDING_CACHE_TTL,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_DISK_SIZE
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def make_cache_key(model_name: str, text: str) -> str:
+    """Construye la clave de caché para un modelo y un texto ya normalizado.
+
+    Args:
+        model_name: Nombre del modelo de embeddings.
+        text: Texto normalizado.
+
+    Returns:
+        str: Clave hexadecimal estable entre procesos.
+    """
+    return hashlib.sha256(f"{model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+class MemoryEmbeddingCache:
+    """Caché LRU en memoria con expiración por tiempo."""
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, ttl: float = EMBEDDING_CACHE_TTL):
+        """Inicializa la caché en memoria.
+
+        Args:
+            max_entries: Número máximo de embeddings almacenados.
+            ttl: Tiempo de vida de cada entrada en segundos (0 para no expirar).
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Obtiene un embedding de la caché.
+
+        Args:
+            key: Clave de caché.
+
+        Returns:
+            Optional[np.ndarray]: Embedding almacenado (float32, solo lectura) o None si no
+                                  existe o ha expirado.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, embedding = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, key: str, embedding: Embedding):
+        """Almacena un embedding en la caché, expulsando el menos usado si está llena.
+
+        Args:
+            key: Clave de caché.
+            embedding: Vector de embedding.
+        """
+        if self.max_entries <= 0:
+            return
+
+        # Los vectores se comparten entre consultas, así que se guardan como solo lectura
+        vector = np.array(embedding, dtype=np.float32)
+        vector.flags.writeable = False
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Obtiene los contadores de la caché.
+
+        Returns:
+            Dict[str, int]: Aciertos, fallos, expulsiones, expiraciones y tamaño actual.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries)
+            }
+
+class DiskEmbeddingCache:
+    """Caché persistente en disco con vectores float32 mapeados en memoria.
+
+    Cada modelo utiliza un subdirectorio con ``vectors.f32`` (filas contiguas de float32),
+    ``index.log`` (una línea ``clave fila`` por entrada, solo de anexado) y ``meta.json``
+    (dimensiones). Añadir una entrada escribe solo su vector y su línea del índice, sin
+    reescribir el índice completo. Varios procesos pueden compartir el directorio: las filas
+    se asignan con un bloqueo del fichero ``lock`` y cada proceso incorpora las entradas de los
+    demás al leer. Cuando se supera la capacidad se compacta conservando las más recientes.
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    INDEX_FILE = "index.log"
+    META_FILE = "meta.json"
+    LOCK_FILE = "lock"
+    # Índice completo de versiones anteriores, que se reescribía en cada entrada
+    LEGACY_INDEX_FILE = "index.json"
+
+    def __init__(self, directory: str, model_name: str, max_entries: int = EMBEDDING_CACHE_DISK_SIZE):
+        """Inicializa la caché en disco y carga el índice existente.
+
+        Args:
+            directory: Directorio base de la caché.
+            model_name: Nombre del modelo de embeddings.
+            max_entries: Número máximo de embeddings almacenados.
+        """
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.directory = os.path.join(directory, safe_model)
+        self.max_entries = max_entries
+        self.vectors_path = os.path.join(self.directory, self.VECTORS_FILE)
+        self.index_path = os.path.join(self.directory, self.INDEX_FILE)
+        self.meta_path = os.path.join(self.directory, self.META_FILE)
+        self.lock_path = os.path.join(self.directory, self.LOCK_FILE)
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, int] = {}
+        self._dimensions: Optional[int] = None
+        self._rows = 0
+        self._mmap: Optional[np.memmap] = None
+        # Posición leída del índice y su inodo (cambia cuando otro proceso compacta)
+        self._index_offset = 0
+        self._index_inode: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.writes = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock, self._file_lock():
+            self._discard_legacy()
+            try:
+                self._refresh()
+            except (ValueError, KeyError) as e:
+                logger.warning(f"No se pudo cargar el índice de la caché de embeddings: {e}")
+                self._reset()
+        if self._index:
+            logger.info(f"Caché de embeddings en disco cargada con {len(self._index)} entradas")
+
+    @contextmanager
+    def _file_lock(self):
+        """Bloqueo exclusivo entre procesos del directorio de la caché (sin efecto fuera de POSIX)."""
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _discard_legacy(self):
+        """Elimina una caché con el formato anterior, cuyas filas no se pueden reutilizar."""
+        legacy_path = os.path.join(self.directory, self.LEGACY_INDEX_FILE)
+        if os.path.exists(legacy_path) or (os.path.exists(self.vectors_path) and not os.path.exists(self.meta_path)):
+            for path in (legacy_path, self.vectors_path, self.index_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info("Caché de embeddings en disco con formato anterior descartada")
+
+    def _reset(self):
+        """Olvida el índice cargado (el fichero ha sido sustituido por una compactación)."""
+        self._index = {}
+        self._rows = 0
+        self._mmap = None
+        self._index_offset = 0
+        self._index_inode = None
+
+    def _refresh(self):
+        """Incorpora las entradas añadidas al índice desde la última lectura (también por otros procesos)."""
+        try:
+            stat = os.stat(self.index_path)
+        except FileNotFoundError:
+            if self._index_inode is not None:
+                self._reset()
+            return
+
+        if stat.st_ino != self._index_inode:
+            self._reset()
+            self._index_inode = stat.st_ino
+        if stat.st_size <= self._index_offset:
+            return
+
+        if self._dimensions is None:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self._dimensions = json.load(f)["dimensions"]
+
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_offset)
+            data = f.read()
+        # Solo se consumen líneas completas (una escritura interrumpida deja la última a medias)
+        complete = data.rfind(b"\n") + 1
+        self._index_offset += complete
+        for line in data[:complete].decode("utf-8", errors="replace").splitlines():
+            try:
+                key, row = line.split(" ")
+                self._index[key] = int(row)
+                self._rows = max(self._rows, int(row) + 1)
+            except ValueError:
+                continue
+
+    def _get_mmap(self, row: int) -> np.memmap:
+        """Obtiene el mapa en memoria de los vectores, reabriéndolo si ha crecido.
+
+        Args:
+            row: Fila que se necesita leer.
+
+        Returns:
+            np.memmap: Matriz (filas, dimensiones) de solo lectura.
+        """
+        if self._mmap is None or row >= self._mmap.shape[0]:
+            self._mmap = np.memmap(
+                self.vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._rows, self._dimensions)
+            )
+        return self._mmap
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """Obtiene un embedding del disco.
+
+        Args:
+            key: Clave de caché.
+
+        Returns:
+            Optional[np.ndarray]: Copia float32 del embedding almacenado o None si no existe.
+        """
+        with self._lock:
+            row = self._index.get(key)
+            if row is None:
+                # Puede haberla añadido otro proceso
+                try:
+                    self._refresh()
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Error al leer el índice de la caché de embeddings en disco: {e}")
+                row = self._index.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+
+            try:
+                embedding = np.array(self._get_mmap(row)[row])
+            except (OSError, ValueError, IndexError) as e:
+                logger.warning(f"Error al leer la caché de embeddings en disco: {e}")
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            return embedding
+
+    def put(self, key: str, embedding: Embedding):
+        """Añade un embedding al disco.
+
+        Solo se anexan el vector y una línea del índice; la fila se asigna con el fichero
+        bloqueado para que dos procesos no escriban en la misma.
+
+        Args:
+            key: Clave de caché.
+            embedding: Vector de embedding.
+        """
+        if self.max_entries <= 0:
+            return
+
+        vector = np.asarray(embedding, dtype=np.float32)
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            if key in self._index:
+                return
+
+            if self._dimensions is None:
+                self._dimensions = vector.shape[0]
+                tmp_path = f"{self.meta_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"dimensions": self._dimensions}, f)
+                os.replace(tmp_path, self.meta_path)
+            elif vector.shape[0] != self._dimensions:
+                logger.warning("Dimensión de embedding distinta a la de la caché en disco; no se almacena")
+                return
+
+            row_bytes = self._dimensions * 4
+            with open(self.vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                row = size // row_bytes
+                # Descartar un vector a medias de una escritura interrumpida
+                if size != row * row_bytes:
+                    f.truncate(row * row_bytes)
+                f.write(vector.tobytes())
+
+            line = f"{key} {row}\n".encode("utf-8")
+            with open(self.index_path, "ab") as f:
+                f.write(line)
+            if self._index_inode is None:
+                self._index_inode = os.stat(self.index_path).st_ino
+            self._index_offset += len(line)
+
+            self._index[key] = row
+            self._rows = max(self._rows, row + 1)
+            self.writes += 1
+
+            if len(self._index) > self.max_entries:
+                self._compact()
+
+    def _compact(self):
+        """Reescribe los vectores y el índice conservando las entradas más recientes."""
+        keep = max(self.max_entries // 2, 1)
+        # Las filas crecen con el tiempo, así que las más altas son las más recientes
+        recent = sorted(self._index.items(), key=lambda item: item[1])[-keep:]
+        old_vectors = self._get_mmap(self._rows - 1)
+        new_vectors = np.empty((len(recent), self._dimensions), dtype=np.float32)
+        new_index = {}
+        for new_row, (key, old_row) in enumerate(recent):
+            new_vectors[new_row] = old_vectors[old_row]
+            new_index[key] = new_row
+
+        tmp_vectors = f"{self.vectors_path}.tmp"
+        new_vectors.tofile(tmp_vectors)
+        lines = "".join(f"{key} {row}\n" for key, row in new_index.items()).encode("utf-8")
+        tmp_index = f"{self.index_path}.tmp"
+        with open(tmp_index, "wb") as f:
+            f.write(lines)
+
+        self._mmap = None
+        os.replace(tmp_vectors, self.vectors_path)
+        os.replace(tmp_index, self.index_path)
+
+        self.evictions += len(self._index) - len(new_index)
+        self._index = new_index
+        self._rows = len(new_index)
+        self._index_offset = len(lines)
+        self._index_inode = os.stat(self.index_path).st_ino
+        logger.info(f"Caché de embeddings en disco compactada a {self._rows} entradas")
+
+    def get_stats(self) -> Dict[str, int]:
+        """Obtiene los contadores de la caché.
+
+        Returns:
+            Dict[str, int]: Aciertos, fallos, expulsiones, escrituras y tamaño actual.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "writes": self.writes,
+                "size": len(self._index)
+            }
+
+class EmbeddingCache:
+    """Caché de dos niveles: memoria primero y disco como respaldo persistente."""
+
+    def __init__(
+        self,
+        max_entries: int = EMBEDDING_CACHE_SIZE,
+        ttl: float = EMBEDDING_CACHE_TTL,
+        directory: Optional[str] = EMBEDDING_CACHE_DIR,
+        disk_max_entries: int = EMBEDDING_CACHE_DISK_SIZE
+    ):
+        """Inicializa la caché de dos niveles.
+
+        Args:
+            max_entries: Capacidad de la caché en memoria.
+            ttl: Tiempo de vida de las entradas en memoria en segundos.
+            directory: Directorio de la caché en disco. Si es None, solo se usa memoria.
+            disk_max_entries: Capacidad de la caché en disco por modelo.
+        """
+        self.memory = MemoryEmbeddingCache(max_entries=max_entries, ttl=ttl)
+        self.directory = directory
+        self.disk_max_entries = disk_max_entries
+        self._disk_caches: Dict[str, Optional[DiskEmbeddingCache]] = {}
+        self._lock = threading.Lock()
+
+    def _get_disk_cache(self, model_name: str) -> Optional[DiskEmbeddingCache]:
+        """Obtiene la caché en disco de un modelo, desactivándola si el disco no es utilizable.
+
+        Args:
+            model_name: Nombre del modelo de embeddings.
+
+        Returns:
+            Optional[DiskEmbeddingCache]: Caché en disco o None si no está disponible.
+        """
+        if not self.directory:
+            return None
+
+        with self._lock:
+            if model_name not in self._disk_caches:
+                try:
+                    self._disk_caches[model_name] = DiskEmbeddingCache(
+                        self.directory, model_name, max_entries=self.disk_max_entries
+                    )
+                except OSError as e:
+                    logger.warning(f"Caché de embeddings en disco desactivada: {e}")
+                    self._disk_caches[model_name] = None
+            return self._disk_caches[model_name]
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """Busca un embedding en memoria y, si no está, en disco.
+
+        Args:
+            model_name: Nombre del modelo de embeddings.
+            text: Texto normalizado.
+
+        Returns:
+            Optional[np.ndarray]: Embedding almacenado (float32) o None.
+        """
+        key = make_cache_key(model_name, text)
+        embedding = self.memory.get(key)
+        if embedding is not None:
+            return embedding
+
+        disk_cache = self._get_disk_cache(model_name)
+        if disk_cache is None:
+            return None
+
+        embedding = disk_cache.get(key)
+        if embedding is not None:
+            # Promover a memoria para los siguientes accesos
+            self.memory.put(key, embedding)
+        return embedding
+
+    def put(self, model_name: str, text: str, embedding: Embedding):
+        """Almacena un embedding en ambos niveles.
+
+        Args:
+            model_name: Nombre del modelo de embeddings.
+            text: Texto normalizado.
+            embedding: Vector de embedding.
+        """
+        key = make_cache_key(model_name, text)
+        self.memory.put(key, embedding)
+
+        disk_cache = self._get_disk_cache(model_name)
+        if disk_cache is not None:
+            try:
+                disk_cache.put(key, embedding)
+            except OSError as e:
+                logger.warning(f"Error al escribir en la caché de embeddings en disco: {e}")
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Obtiene los contadores de ambos niveles.
+
+        Returns:
+            Dict: Estadísticas de memoria y de cada caché en disco por modelo.
+        """
+        with self._lock:
+            disk_caches = dict(self._disk_caches)
+
+        return {
+            "memory": self.memory.get_stats(),
+            "disk": {
+                model_name: cache.get_stats()
+                for model_name, cache in disk_caches.items()
+                if cache is not None
+            }
+        }
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Obtiene la caché de embeddings compartida por el proceso.
+
+    Returns:
+        Optional[EmbeddingCache]: Caché compartida o None si está desactivada.
+    """
+    global _embedding_cache
+
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache()
+        return _embedding_cache
@@ -4,10 +4,15 @@ Generación de embeddings para documentos.
 
 import logging
 import traceback
-from typing import List, Union
+from typing import Any, Dict, List, Optional, Union
 
-from openai import OpenAI
-from app.config.settings import OPENAI_API_KEY, EMBEDDING_MODEL
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+from app.config.settings import OPENAI_API_KEY, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, EMBEDDING_ENCODING
+from app.document_processing.embedding_cache import EmbeddingCache, get_embedding_cache
+from app.utils.performance_metrics import performance_tracker
+from app.utils.tokens import count_tokens
+from app.utils.vectors import decode_embedding, zero_embedding
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -15,59 +20,269 @@ logger = logging.getLogger(__name__)
 class EmbeddingGenerator:
     """Clase para generar embeddings de documentos."""
     
-    def __init__(self, model_name: str = EMBEDDING_MODEL, api_key: str = OPENAI_API_KEY):
+    def __init__(
+        self,
+        model_name: str = EMBEDDING_MODEL,
+        api_key: str = OPENAI_API_KEY,
+        cache: Optional[EmbeddingCache] = None,
+        http_pool=None,
+        admission=None,
+        hedger=None,
+        dimensions: Optional[int] = None,
+        encoding_format: Optional[str] = None
+    ):
         """Inicializa el generador de embeddings.
         
+        Los embeddings se devuelven como arrays float32 de NumPy.
+        
         Args:
             model_name: Nombre del modelo de embeddings.
             api_key: Clave API de OpenAI.
+            cache: Caché de embeddings. Si no se proporciona, se utiliza la caché compartida del proceso.
+            http_pool: Pool de conexiones HTTP compartido (``HTTPPool``). Si no se proporciona,
+                       los clientes de OpenAI usan sus propias conexiones.
+            admission: Planificador de llamadas (``AdmissionController``). Si se proporciona,
+                       limita el ritmo de las llamadas asíncronas y gestiona sus reintentos.
+            hedger: Planificador de copias de respaldo (``Hedger``). Si se proporciona, las
+                    llamadas asíncronas de un solo texto lentas se duplican.
+            dimensions: Dimensiones reducidas a solicitar (modelos text-embedding-3). Si no se
+                        proporciona, se utiliza EMBEDDING_DIMENSIONS (0: las del modelo).
+            encoding_format: ``"base64"`` o ``"float"``. Si no se proporciona, se utiliza EMBEDDING_ENCODING.
         """
         if not api_key:
             logger.error("No se ha proporcionado la clave API de OpenAI")
             raise ValueError("No se ha proporcionado la clave API de OpenAI para el generador de embeddings")
             
         self.model_name = model_name
+        self.dimensions = EMBEDDING_DIMENSIONS if dimensions is None else dimensions
+        self.encoding_format = encoding_format or EMBEDDING_ENCODING
+        # Los embeddings reducidos no son intercambiables con los completos en la caché
+        self.cache_model_name = f"{model_name}-{self.dimensions}d" if self.dimensions else model_name
+        self.cache = cache if cache is not None else get_embedding_cache()
+        self.admission = admission
+        self.hedger = hedger
+        
+        # Con el planificador, los reintentos los gestiona él y no el cliente de OpenAI
+        client_options = {"max_retries": 0} if admission is not None else {}
         
         try:
-            self.client = OpenAI(api_key=api_key)
+            if http_pool is not None:
+                self.client = OpenAI(api_key=api_key, http_client=http_pool.sync_client, timeout=http_pool.timeout)
+                self.async_client = AsyncOpenAI(
+                    api_key=api_key,
+                    http_client=http_pool.async_client,
+                    timeout=http_pool.timeout,
+                    **client_options
+                )
+            else:
+                self.client = OpenAI(api_key=api_key)
+                self.async_client = AsyncOpenAI(api_key=api_key, **client_options)
             logger.info(f"Generador de embeddings inicializado con modelo: {model_name}")
         except Exception as e:
             logger.error(f"Error al inicializar el cliente de OpenAI: {e}")
             raise ConnectionError(f"Error al conectar con OpenAI para embeddings: {str(e)}") from e
     
-    def generate_embedding(self, text: str) -> List[float]:
+    async def _acreate_embeddings(self, inputs: Union[str, List[str]]):
+        """Llama a la API de embeddings, a través del planificador si lo hay.
+        
+        Args:
+            inputs: Texto o textos de entrada.
+            
+        Returns:
+            Respuesta de la API de embeddings.
+        """
+        def create():
+            return self.async_client.embeddings.create(model=self.model_name, input=inputs, **self._request_options())
+        
+        if self.admission is None:
+            admitted = create
+        else:
+            texts = [inputs] if isinstance(inputs, str) else inputs
+            tokens = sum(count_tokens(text, self.model_name) for text in texts)
+            
+            def admitted():
+                return self.admission.call("embeddings", create, tokens=tokens)
+        
+        # Solo se duplican los embeddings de una consulta; los lotes son más caros y no son interactivos.
+        # Cada copia pasa por el planificador y consume sus propios tokens
+        if self.hedger is not None and isinstance(inputs, str):
+            return await self.hedger.call("embeddings", admitted)
+        return await admitted()
+    
+    def _request_options(self) -> Dict[str, Any]:
+        """Parámetros de formato de la petición de embeddings (dimensiones y codificación)."""
+        options: Dict[str, Any] = {"encoding_format": self.encoding_format}
+        if self.dimensions:
+            options["dimensions"] = self.dimensions
+        return options
+    
+    @staticmethod
+    def _decode(response) -> List[np.ndarray]:
+        """Convierte los embeddings de la respuesta en arrays float32, en el orden de la entrada.
+        
+        El tiempo de decodificación (CPU, sin esperas) se registra como ``embedding_decode``.
+        
+        Args:
+            response: Respuesta de la API de embeddings.
+            
+        Returns:
+            List[np.ndarray]: Un vector por entrada.
+        """
+        with performance_tracker.track("embedding_decode"):
+            items = sorted(response.data, key=lambda item: item.index)
+            return [decode_embedding(item.embedding) for item in items]
+    
+    @staticmethod
+    def _normalize_text(text: str) -> str:
+        """Normaliza el texto antes de generar su embedding.
+        
+        Args:
+            text: Texto original.
+            
+        Returns:
+            str: Texto sin saltos de línea ni espacios en los extremos.
+        """
+        return text.replace("\n", " ").strip()
+    
+    def generate_embedding(self, text: str) -> np.ndarray:
         """Genera un embedding para un texto.
         
         Args:
             text: Texto para el que generar el embedding.
             
         Returns:
-            List[float]: Vector de embedding.
+            np.ndarray: Vector de embedding.
         """
         if not text or not text.strip():
             logger.warning("Se intentó generar un embedding para un texto vacío")
-            return [0.0] * 1536  # Dimensión predeterminada para compatibilidad
+            return zero_embedding(self.dimensions)
+        
+        # Limpiar y preparar el texto
+        text = self._normalize_text(text)
+        
+        if self.cache is not None:
+            cached_embedding = self.cache.get(self.cache_model_name, text)
+            if cached_embedding is not None:
+                logger.info(f"Embedding obtenido de la caché para el modelo {self.model_name}")
+                return cached_embedding
         
         try:
-            # Limpiar y preparar el texto
-            text = text.replace("\n", " ").strip()
-            
             logger.info(f"Generando embedding con modelo {self.model_name}")
             
             # Llamar a la API de OpenAI
             response = self.client.embeddings.create(
                 model=self.model_name,
-                input=text
+                input=text,
+                **self._request_options()
             )
             
             # Extraer el embedding
-            embedding = response.data[0].embedding
+            embedding = self._decode(response)[0]
             
             logger.info(f"Embedding generado correctamente. Dimensiones: {len(embedding)}")
+            
+            if self.cache is not None:
+                self.cache.put(self.cache_model_name, text, embedding)
+            
             return embedding
             
         except Exception as e:
             error_msg = f"Error al generar embedding: {str(e)}"
             error_stack = traceback.format_exc()
             logger.error(f"{error_msg}\n{error_stack}")
-            raise ValueError(error_msg) from e 
\ No newline at end of file
+            raise ValueError(error_msg) from e
+    
+    async def agenerate_embedding(self, text: str) -> np.ndarray:
+        """Genera un embedding para un texto de forma asíncrona.
+        
+        Args:
+            text: Texto para el que generar el embedding.
+            
+        Returns:
+            np.ndarray: Vector de embedding.
+        """
+        if not text or not text.strip():
+            logger.warning("Se intentó generar un embedding para un texto vacío")
+            return zero_embedding(self.dimensions)
+        
+        # Limpiar y preparar el texto
+        text = self._normalize_text(text)
+        
+        if self.cache is not None:
+            cached_embedding = self.cache.get(self.cache_model_name, text)
+            if cached_embedding is not None:
+                logger.info(f"Embedding obtenido de la caché para el modelo {self.model_name}")
+                return cached_embedding
+        
+        try:
+            logger.info(f"Generando embedding con modelo {self.model_name}")
+            
+            # Llamar a la API de OpenAI sin bloquear el bucle de eventos
+            response = await self._acreate_embeddings(text)
+            
+            embedding = self._decode(response)[0]
+            
+            logger.info(f"Embedding generado correctamente. Dimensiones: {len(embedding)}")
+            
+            if self.cache is not None:
+                self.cache.put(self.cache_model_name, text, embedding)
+            
+            return embedding
+            
+        except Exception as e:
+            error_msg = f"Error al generar embedding: {str(e)}"
+            error_stack = traceback.format_exc()
+            logger.error(f"{error_msg}\n{error_stack}")
+            raise ValueError(error_msg) from e
+    
+    async def agenerate_embeddings(self, texts: List[str], use_cache: bool = True) -> List[np.ndarray]:
+        """Genera embeddings para varios textos con una única llamada a la API.
+        
+        Los textos ya presentes en la caché y los duplicados no se envían a OpenAI.
+        
+        Args:
+            texts: Textos para los que generar los embeddings.
+            use_cache: Si se consulta y actualiza la caché de embeddings (desactivar en la ingesta
+                       de documentos para no desplazar los embeddings de consultas).
+            
+        Returns:
+            List[np.ndarray]: Vectores de embedding en el mismo orden que los textos.
+        """
+        embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+        pending: Dict[str, List[int]] = {}
+        
+        for i, text in enumerate(texts):
+            if not text or not text.strip():
+                logger.warning("Se intentó generar un embedding para un texto vacío")
+                embeddings[i] = zero_embedding(self.dimensions)
+                continue
+            
+            normalized = self._normalize_text(text)
+            if use_cache and self.cache is not None:
+                cached_embedding = self.cache.get(self.cache_model_name, normalized)
+                if cached_embedding is not None:
+                    embeddings[i] = cached_embedding
+                    continue
+            
+            pending.setdefault(normalized, []).append(i)
+        
+        if pending:
+            inputs = list(pending)
+            try:
+                logger.info(f"Generando {len(inputs)} embeddings en lote con modelo {self.model_name}")
+                
+                response = await self._acreate_embeddings(inputs)
+            except Exception as e:
+                error_msg = f"Error al generar embeddings en lote: {str(e)}"
+                error_stack = traceback.format_exc()
+                logger.error(f"{error_msg}\n{error_stack}")
+                raise ValueError(error_msg) from e
+            
+            # La API devuelve un elemento por entrada con su índice original
+            for text, embedding in zip(inputs, self._decode(response)):
+                if use_cache and self.cache is not None:
+                    self.cache.put(self.cache_model_name, text, embedding)
+                for i in pending[text]:
+                    embeddings[i] = embedding
+        
+        return embeddings
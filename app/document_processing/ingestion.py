@@ -0,0 +1,523 @@
+"""
+Pipeline de ingesta de documentos.
+Este módulo lee ficheros de texto en streaming, los divide en fragmentos, descarta los
+fragmentos ya ingestados por su hash de contenido, genera los embeddings en lotes y los
+inserta en la colección de Supabase, también en lotes.
+
+Cada fragmento tiene un identificador determinista (UUID derivado del fichero de origen y
+del hash de su contenido), de modo que volver a ingerir un fichero sobrescribe sus filas en
+lugar de duplicarlas aunque se pierda el manifiesto. Cuando un fichero cambia, sus
+fragmentos que ya no existen se borran de la colección.
+
+La ingesta es reanudable: un manifiesto de control guarda los fragmentos ya insertados y los
+ficheros completados, de modo que una ejecución interrumpida continúa donde lo dejó sin
+volver a generar embeddings.
+
+Uso:
+    python -m app.document_processing.ingestion docs/ --manifest data/ingest_manifest.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.config.settings import (
+    SUPABASE_COLLECTION_NAME,
+    EMBEDDING_MODEL,
+    EMBEDDING_DIMENSIONS,
+    INGEST_BATCH_SIZE,
+    INGEST_CONCURRENCY,
+    INGEST_CHUNK_SIZE,
+    INGEST_CHUNK_OVERLAP
+)
+from app.database.lexical_index import append_delta
+from app.database.supabase_client import SupabaseStore, get_supabase_client
+from app.document_processing.embeddings import EmbeddingGenerator
+from app.utils.tokens import count_tokens
+from app.utils.vectors import to_pgvector
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Extensiones de ficheros de texto admitidas
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst", ".csv", ".json", ".html")
+
+# Tamaño de los bloques leídos de disco
+READ_BLOCK_SIZE = 64 * 1024
+
+# Espacio de nombres de los identificadores de los fragmentos (no debe cambiar)
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1d3c2e-8a4b-4f5e-9c7d-2b1a0e9f8d7c")
+
+# Filas por página al buscar los fragmentos existentes de un fichero
+STALE_PAGE_SIZE = 1000
+
+def content_hash(text: str) -> str:
+    """Calcula el hash de contenido de un fragmento.
+
+    Args:
+        text: Texto del fragmento.
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal.
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def chunk_id(source: str, chunk_hash: str) -> str:
+    """Calcula el identificador determinista de un fragmento.
+
+    Args:
+        source: Ruta del fichero de origen.
+        chunk_hash: Hash de contenido del fragmento.
+
+    Returns:
+        str: UUID del fragmento, igual en todas las ingestas del mismo contenido y fichero.
+    """
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{source}\n{chunk_hash}"))
+
+class IngestionManifest:
+    """Manifiesto de control para reanudar la ingesta.
+
+    Los identificadores de los fragmentos insertados se añaden a ``<ruta>.chunks`` (una
+    línea por fragmento, solo anexar; las bajas se anotan como ``-<id>``) para que guardar el
+    progreso de cada lote no dependa del tamaño del corpus; los ficheros completados se
+    guardan en ``<ruta>`` como JSON.
+    """
+
+    def __init__(self, path: Optional[str]):
+        """Carga el manifiesto si existe.
+
+        Args:
+            path: Ruta del fichero JSON. Si es None, el manifiesto solo vive en memoria.
+        """
+        self.path = path
+        self.chunks_path = f"{path}.chunks" if path else None
+        self.chunk_ids = set()
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.files = json.load(f).get("files", {})
+
+        if self.chunks_path and os.path.exists(self.chunks_path):
+            with open(self.chunks_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.startswith("-"):
+                        self.chunk_ids.discard(line[1:])
+                    elif line:
+                        self.chunk_ids.add(line)
+
+        if path:
+            logger.info(f"Manifiesto de ingesta cargado: {len(self.chunk_ids)} fragmentos, {len(self.files)} ficheros")
+
+    def _append(self, lines: List[str]):
+        """Añade líneas al fichero de fragmentos y las lleva a disco."""
+        if not self.chunks_path or not lines:
+            return
+        directory = os.path.dirname(self.chunks_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.chunks_path, "a", encoding="utf-8") as f:
+            f.write("".join(f"{line}\n" for line in lines))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def add_chunks(self, chunk_ids: Iterable[str]):
+        """Registra fragmentos ya insertados en la colección.
+
+        Args:
+            chunk_ids: Identificadores de los fragmentos.
+        """
+        chunk_ids = list(chunk_ids)
+        self.chunk_ids.update(chunk_ids)
+        self._append(chunk_ids)
+
+    def remove_chunks(self, chunk_ids: Iterable[str]):
+        """Registra fragmentos borrados de la colección.
+
+        Args:
+            chunk_ids: Identificadores de los fragmentos.
+        """
+        chunk_ids = list(chunk_ids)
+        self.chunk_ids.difference_update(chunk_ids)
+        self._append([f"-{chunk_id}" for chunk_id in chunk_ids])
+
+    def is_file_complete(self, path: str) -> bool:
+        """Indica si un fichero ya se ingirió completo y no ha cambiado desde entonces."""
+        entry = self.files.get(path)
+        if not entry:
+            return False
+        stat = os.stat(path)
+        return entry.get("size") == stat.st_size and entry.get("mtime") == stat.st_mtime
+
+    def mark_file_complete(self, path: str):
+        """Marca un fichero como ingerido completamente."""
+        stat = os.stat(path)
+        self.files[path] = {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def save(self):
+        """Guarda los ficheros completados de forma atómica."""
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+class IngestionPipeline:
+    """Clase para ingerir documentos en la colección de Supabase."""
+
+    def __init__(
+        self,
+        collection_name: str = SUPABASE_COLLECTION_NAME,
+        batch_size: int = INGEST_BATCH_SIZE,
+        concurrency: int = INGEST_CONCURRENCY,
+        chunk_size: int = INGEST_CHUNK_SIZE,
+        chunk_overlap: int = INGEST_CHUNK_OVERLAP,
+        manifest_path: Optional[str] = None,
+        embedding_generator: Optional[EmbeddingGenerator] = None,
+        supabase_store: Optional[SupabaseStore] = None,
+        lexical_index_dir: Optional[str] = None
+    ):
+        """Inicializa el pipeline de ingesta.
+
+        Args:
+            collection_name: Tabla de documentos de destino.
+            batch_size: Fragmentos por llamada de embeddings y por inserción.
+            concurrency: Número máximo de lotes procesándose a la vez.
+            chunk_size: Tamaño máximo de cada fragmento en caracteres.
+            chunk_overlap: Solapamiento entre fragmentos consecutivos en caracteres.
+            manifest_path: Ruta del manifiesto de control para reanudar la ingesta.
+            embedding_generator: Generador de embeddings. Si no se proporciona, se crea uno.
+            supabase_store: Conexión con Supabase. Si no se proporciona, se crea una.
+            lexical_index_dir: Instantánea local cuyo índice BM25 recibe los fragmentos insertados
+                               como cambios incrementales. Si es None, no se actualiza.
+        """
+        if chunk_overlap * 2 >= chunk_size:
+            raise ValueError("El solapamiento debe ser menor que la mitad del tamaño de fragmento")
+
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.manifest = IngestionManifest(manifest_path)
+        self.embedding_generator = embedding_generator or EmbeddingGenerator()
+        self.supabase_store = supabase_store or get_supabase_client()
+        self.lexical_index_dir = lexical_index_dir
+
+    @staticmethod
+    def iter_files(paths: Iterable[str]) -> Iterator[str]:
+        """Recorre los ficheros de texto de las rutas indicadas.
+
+        Args:
+            paths: Ficheros o directorios.
+
+        Yields:
+            str: Rutas de ficheros de texto, en orden estable.
+        """
+        for path in paths:
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    for filename in sorted(files):
+                        if filename.lower().endswith(TEXT_EXTENSIONS):
+                            yield os.path.join(root, filename)
+            elif os.path.isfile(path):
+                yield path
+            else:
+                logger.warning(f"Ruta no encontrada: {path}")
+
+    @staticmethod
+    def read_file(path: str) -> Iterator[str]:
+        """Lee un fichero en bloques sin cargarlo entero en memoria.
+
+        Args:
+            path: Ruta del fichero.
+
+        Yields:
+            str: Bloques de texto.
+        """
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            while True:
+                block = f.read(READ_BLOCK_SIZE)
+                if not block:
+                    return
+                yield block
+
+    def _find_cut(self, text: str) -> int:
+        """Busca un punto de corte natural (párrafo, línea, frase o palabra) antes del tamaño máximo."""
+        window_start = self.chunk_size // 2
+        for separator in ("\n\n", "\n", ". ", " "):
+            position = text.rfind(separator, window_start, self.chunk_size)
+            if position != -1:
+                return position + len(separator)
+        return self.chunk_size
+
+    def chunk_text(self, blocks: Iterable[str]) -> Iterator[str]:
+        """Divide un flujo de texto en fragmentos solapados.
+
+        Args:
+            blocks: Bloques de texto consecutivos.
+
+        Yields:
+            str: Fragmentos no vacíos.
+        """
+        buffer = ""
+        for block in blocks:
+            buffer += block
+            while len(buffer) >= self.chunk_size:
+                cut = self._find_cut(buffer)
+                chunk = buffer[:cut].strip()
+                if chunk:
+                    yield chunk
+                buffer = buffer[cut - self.chunk_overlap:]
+
+        chunk = buffer.strip()
+        if chunk:
+            yield chunk
+
+    async def _process_batch(self, batch: List[Dict[str, Any]], stats: Dict[str, Any], failed_files: set):
+        """Genera los embeddings de un lote y lo inserta (o sobrescribe) en la colección.
+
+        Args:
+            batch: Fragmentos con ``id``, ``content``, ``metadata`` y ``hash``.
+            stats: Estadísticas acumuladas de la ingesta.
+            failed_files: Ficheros con algún lote fallido.
+        """
+        try:
+            embeddings = await self.embedding_generator.agenerate_embeddings(
+                [chunk["content"] for chunk in batch],
+                use_cache=False
+            )
+
+            rows = [
+                {
+                    "id": chunk["id"],
+                    "content": chunk["content"],
+                    "metadata": chunk["metadata"],
+                    "embedding": to_pgvector(embedding)
+                }
+                for chunk, embedding in zip(batch, embeddings)
+            ]
+            client = await self.supabase_store.get_async_client()
+            table = client.table(self.collection_name)
+            # El identificador determinista convierte la inserción en una sobrescritura idempotente
+            await table.upsert(rows, returning="minimal").execute()
+            if self.lexical_index_dir:
+                append_delta(
+                    self.lexical_index_dir,
+                    [{"id": row["id"], "content": row["content"], "metadata": row["metadata"]} for row in rows]
+                )
+
+            self.manifest.add_chunks(chunk["id"] for chunk in batch)
+            stats["chunks_embedded"] += len(batch)
+            stats["tokens"] += sum(chunk["tokens"] for chunk in batch)
+            stats["batches"] += 1
+        except Exception as e:
+            logger.error(f"Error al procesar un lote de {len(batch)} fragmentos: {e}")
+            stats["failed_batches"] += 1
+            failed_files.update(chunk["metadata"]["source"] for chunk in batch)
+
+    async def _delete_stale_chunks(self, source: str, keep: set) -> int:
+        """Borra de la colección los fragmentos de un fichero que ya no forman parte de él.
+
+        Args:
+            source: Ruta del fichero de origen (``metadata.source``).
+            keep: Identificadores de los fragmentos actuales del fichero.
+
+        Returns:
+            int: Número de fragmentos borrados.
+        """
+        client = await self.supabase_store.get_async_client()
+        stale: List[str] = []
+        start = 0
+        while True:
+            response = await (
+                client.table(self.collection_name)
+                .select("id")
+                .eq("metadata->>source", source)
+                .order("id")
+                .range(start, start + STALE_PAGE_SIZE - 1)
+                .execute()
+            )
+            rows = response.data or []
+            stale.extend(str(row["id"]) for row in rows if str(row["id"]) not in keep)
+            if len(rows) < STALE_PAGE_SIZE:
+                break
+            start += STALE_PAGE_SIZE
+
+        for start in range(0, len(stale), self.batch_size):
+            await client.table(self.collection_name).delete(returning="minimal").in_(
+                "id", stale[start:start + self.batch_size]
+            ).execute()
+
+        if stale:
+            self.manifest.remove_chunks(stale)
+            if self.lexical_index_dir:
+                append_delta(self.lexical_index_dir, deleted_ids=stale)
+            logger.info(f"{len(stale)} fragmentos obsoletos de {source} borrados de la colección")
+        return len(stale)
+
+    async def arun(self, paths: Iterable[str]) -> Dict[str, Any]:
+        """Ejecuta la ingesta de forma asíncrona.
+
+        Args:
+            paths: Ficheros o directorios a ingerir.
+
+        Returns:
+            Dict[str, Any]: Estadísticas de la ingesta, incluidos fragmentos y tokens por segundo.
+        """
+        start_time = time.perf_counter()
+        stats = {
+            "files": 0,
+            "files_skipped": 0,
+            "chunks": 0,
+            "chunks_skipped": 0,
+            "chunks_embedded": 0,
+            "tokens": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "chunks_deleted": 0
+        }
+        failed_files = set()
+        processed_files = []
+        # Fragmentos actuales de cada fichero procesado, para borrar los que ya no existen
+        file_chunks: Dict[str, set] = {}
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        tasks = []
+        seen = set(self.manifest.chunk_ids)
+        batch: List[Dict[str, Any]] = []
+
+        async def run_batch(current_batch):
+            try:
+                await self._process_batch(current_batch, stats, failed_files)
+            finally:
+                semaphore.release()
+
+        async def submit(current_batch):
+            # Limitar los lotes en curso para no acumular fragmentos en memoria
+            await semaphore.acquire()
+            tasks.append(asyncio.create_task(run_batch(current_batch)))
+
+        for path in self.iter_files(paths):
+            if self.manifest.is_file_complete(path):
+                stats["files_skipped"] += 1
+                continue
+
+            stats["files"] += 1
+            processed_files.append(path)
+            filename = os.path.basename(path)
+            current_chunks = file_chunks[path] = set()
+
+            for chunk_index, chunk in enumerate(self.chunk_text(self.read_file(path))):
+                stats["chunks"] += 1
+                chunk_hash = content_hash(chunk)
+                current_id = chunk_id(path, chunk_hash)
+                current_chunks.add(current_id)
+                if current_id in seen:
+                    stats["chunks_skipped"] += 1
+                    continue
+                seen.add(current_id)
+
+                batch.append({
+                    "id": current_id,
+                    "content": chunk,
+                    "hash": chunk_hash,
+                    "tokens": count_tokens(chunk, self.embedding_generator.model_name),
+                    "metadata": {
+                        "filename": filename,
+                        "source": path,
+                        "chunk_index": chunk_index,
+                        "content_hash": chunk_hash
+                    }
+                })
+                if len(batch) >= self.batch_size:
+                    await submit(batch)
+                    batch = []
+
+        if batch:
+            await submit(batch)
+
+        await asyncio.gather(*tasks)
+
+        async def clean_file(path):
+            async with semaphore:
+                try:
+                    stats["chunks_deleted"] += await self._delete_stale_chunks(path, file_chunks[path])
+                except Exception as e:
+                    logger.error(f"Error al borrar los fragmentos obsoletos de {path}: {e}")
+                    failed_files.add(path)
+
+        # Solo se limpian los ficheros insertados por completo; los fallidos se reintentan
+        await asyncio.gather(*(clean_file(path) for path in processed_files if path not in failed_files))
+
+        for path in processed_files:
+            if path not in failed_files:
+                self.manifest.mark_file_complete(path)
+        self.manifest.save()
+
+        elapsed = time.perf_counter() - start_time
+        stats["elapsed"] = elapsed
+        stats["chunks_per_second"] = stats["chunks_embedded"] / elapsed if elapsed else 0.0
+        stats["tokens_per_second"] = stats["tokens"] / elapsed if elapsed else 0.0
+        logger.info(
+            f"Ingesta completada: {stats['chunks_embedded']} fragmentos en {elapsed:.2f} segundos "
+            f"({stats['chunks_per_second']:.1f} fragmentos/s, {stats['tokens_per_second']:.1f} tokens/s)"
+        )
+        return stats
+
+    def run(self, paths: Iterable[str]) -> Dict[str, Any]:
+        """Ejecuta la ingesta.
+
+        Args:
+            paths: Ficheros o directorios a ingerir.
+
+        Returns:
+            Dict[str, Any]: Estadísticas de la ingesta.
+        """
+        return asyncio.run(self.arun(paths))
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingiere documentos de texto en la colección de Supabase")
+    parser.add_argument("paths", nargs="+", help="Ficheros o directorios a ingerir")
+    parser.add_argument("--collection", default=SUPABASE_COLLECTION_NAME, help="Tabla de documentos")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Fragmentos por lote")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY, help="Lotes en paralelo")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="Caracteres por fragmento")
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP, help="Solapamiento en caracteres")
+    parser.add_argument("--manifest", default="data/ingest_manifest.json", help="Manifiesto de control")
+    parser.add_argument("--model", default=EMBEDDING_MODEL, help="Modelo de embeddings")
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=EMBEDDING_DIMENSIONS,
+        help="Dimensiones reducidas de los embeddings (0: las del modelo)"
+    )
+    parser.add_argument("--lexical-index", help="Instantánea local cuyo índice BM25 se actualiza con los fragmentos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    pipeline = IngestionPipeline(
+        collection_name=args.collection,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        manifest_path=args.manifest,
+        embedding_generator=EmbeddingGenerator(model_name=args.model, dimensions=args.dimensions),
+        lexical_index_dir=args.lexical_index
+    )
+    print(json.dumps(pipeline.run(args.paths), indent=2))
+
+if __name__ == "__main__":
+    main()
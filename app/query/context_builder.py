@@ -0,0 +1,140 @@
+"""
+Construcción del contexto para el LLM.
+Este módulo selecciona los fragmentos recuperados que entran en el prompt: respeta un
+presupuesto de tokens, descarta fragmentos casi duplicados y corta la lista cuando las
+puntuaciones de similitud caen bruscamente.
+"""
+
+import logging
+import re
+from typing import Dict, FrozenSet, List, Tuple
+
+from app.config.settings import (
+    LLM_MODEL,
+    CONTEXT_MAX_TOKENS,
+    CONTEXT_DEDUP_THRESHOLD,
+    CONTEXT_SCORE_GAP
+)
+from app.database.result_set import ResultSet
+from app.utils.tokens import count_tokens, get_encoding, truncate_to_tokens
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Número de palabras por shingle para detectar duplicados
+SHINGLE_SIZE = 5
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> FrozenSet[int]:
+    """Obtiene los shingles de palabras de un texto como hashes.
+
+    Args:
+        text: Texto del fragmento.
+        size: Número de palabras por shingle.
+
+    Returns:
+        FrozenSet[int]: Conjunto de hashes de shingles.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return frozenset([hash(tuple(words))]) if words else frozenset()
+    return frozenset(hash(tuple(words[i:i + size])) for i in range(len(words) - size + 1))
+
+def overlap(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    """Proporción del conjunto menor contenida en el otro (coeficiente de solapamiento)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+class ContextBuilder:
+    """Clase para empaquetar los fragmentos recuperados en el contexto del prompt."""
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD,
+        score_gap: float = CONTEXT_SCORE_GAP,
+        model_name: str = LLM_MODEL
+    ):
+        """Inicializa el constructor de contexto.
+
+        Args:
+            max_tokens: Presupuesto de tokens del contexto.
+            dedup_threshold: Solapamiento de shingles a partir del cual un fragmento se
+                             considera duplicado de otro ya incluido.
+            score_gap: Caída de similitud entre fragmentos consecutivos que corta la lista
+                       (0 para desactivar el corte; no se aplica a resultados híbridos).
+            model_name: Modelo cuya codificación se usa para contar tokens.
+        """
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.score_gap = score_gap
+        self.model_name = model_name
+        # Empezar a cargar la codificación en segundo plano al crear el sistema
+        get_encoding(model_name)
+
+    @staticmethod
+    def format_document(index: int, content: str) -> str:
+        """Formatea un fragmento tal y como aparece en el contexto."""
+        return f"Documento: {index}\n{content}"
+
+    def build(self, documents: ResultSet) -> Tuple[str, ResultSet, Dict[str, int]]:
+        """Construye el texto de contexto a partir de los documentos recuperados.
+
+        Solo se leen el contenido y la similitud; los metadatos no se decodifican.
+
+        Args:
+            documents: Fragmentos recuperados, de mayor a menor similitud.
+
+        Returns:
+            Tuple[str, ResultSet, Dict[str, int]]: Texto de contexto, fragmentos incluidos y
+                                                   estadísticas (tokens y fragmentos descartados).
+        """
+        selected: List[int] = []
+        parts: List[str] = []
+        selected_shingles: List[FrozenSet[int]] = []
+        stats = {"context_tokens": 0, "duplicates_dropped": 0, "score_cutoff_dropped": 0, "budget_dropped": 0}
+        separator_tokens = count_tokens("\n\n", self.model_name)
+        previous_score = None
+
+        # En la búsqueda híbrida los fragmentos llegan en el orden de la fusión y sus similitudes
+        # no son decrecientes: una caída no indica que el resto sea poco relevante
+        score_gap = self.score_gap if documents.fusion_scores is None else 0.0
+
+        for position, (content, score) in enumerate(zip(documents.contents, documents.scores)):
+            # Corte adaptativo: una caída brusca de similitud indica que el resto es poco relevante
+            if selected and previous_score is not None and score_gap and previous_score - score > score_gap:
+                stats["score_cutoff_dropped"] += len(documents) - position
+                break
+            previous_score = score
+
+            doc_shingles = shingles(content)
+            if any(overlap(doc_shingles, other) >= self.dedup_threshold for other in selected_shingles):
+                stats["duplicates_dropped"] += 1
+                continue
+
+            part = self.format_document(len(selected) + 1, content)
+            part_tokens = count_tokens(part, self.model_name) + (separator_tokens if parts else 0)
+            remaining = self.max_tokens - stats["context_tokens"]
+
+            if part_tokens > remaining:
+                if selected:
+                    stats["budget_dropped"] += 1
+                    continue
+                # El primer fragmento siempre se incluye, recortado al presupuesto
+                part = truncate_to_tokens(part, remaining, self.model_name)
+                part_tokens = count_tokens(part, self.model_name)
+
+            selected.append(position)
+            selected_shingles.append(doc_shingles)
+            parts.append(part)
+            stats["context_tokens"] += part_tokens
+
+        if stats["duplicates_dropped"] or stats["score_cutoff_dropped"] or stats["budget_dropped"]:
+            logger.info(
+                f"Contexto empaquetado: {len(selected)} de {len(documents)} fragmentos, "
+                f"{stats['context_tokens']} tokens"
+            )
+
+        return "\n\n".join(parts), documents.select(selected), stats
@@ -0,0 +1,214 @@
+"""
+Precalentamiento de las cachés a partir del registro de consultas.
+Las consultas más frecuentes (o más costosas) del registro se vuelven a ejecutar para llenar
+las cachés de embeddings y de respuestas, y opcionalmente se guardan en una instantánea que
+el sistema RAG carga al arrancar (WARM_CACHE_SNAPSHOT), de modo que tras un despliegue o un
+arranque en frío las preguntas habituales se sirven desde la caché.
+Uso:
+    python -m app.query.prewarm top --log /tmp/raglec_queries.jsonl --top 20 --by cost
+    python -m app.query.prewarm warm --log /tmp/raglec_queries.jsonl --top 50 --snapshot data/warm_cache.npz
+"""
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.config.settings import BATCH_CONCURRENCY, QUERY_LOG_PATH
+from app.query.query_log import RANKINGS, aggregate_queries, read_query_log
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Metadatos propios de cada ejecución que no se guardan en la instantánea
+_VOLATILE_METADATA = ("trace", "cached", "cache_similarity", "coalesced", "query_time")
+
+_loaded_snapshots = set()
+_loaded_lock = threading.Lock()
+
+def save_warm_snapshot(
+    path: str,
+    embedding_model: str,
+    entries: Sequence[Tuple[str, np.ndarray, tuple, Dict[str, Any]]]
+) -> int:
+    """Guarda los embeddings y las respuestas de las consultas precalentadas.
+
+    Args:
+        path: Fichero ``.npz`` de destino.
+        embedding_model: Modelo (con dimensiones) con el que se generaron los embeddings.
+        entries: Por consulta, su texto, embedding, ámbito en la caché de respuestas y resultado.
+
+    Returns:
+        int: Número de consultas guardadas.
+    """
+    payload = {
+        "version": SNAPSHOT_VERSION,
+        "created_at": time.time(),
+        "embedding_model": embedding_model,
+        "entries": [
+            {
+                "text": text,
+                "scope": [scope[0], scope[1], scope[2], list(scope[3]) if scope[3] else None],
+                "result": {
+                    **result,
+                    "metadata": {
+                        key: value for key, value in result["metadata"].items() if key not in _VOLATILE_METADATA
+                    }
+                }
+            }
+            for text, _, scope, result in entries
+        ]
+    }
+    embeddings = (
+        np.vstack([np.asarray(embedding, dtype=np.float32) for _, embedding, _, _ in entries])
+        if entries else np.zeros((0, 0), dtype=np.float32)
+    )
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp.npz"
+    np.savez(
+        temporary,
+        embeddings=embeddings,
+        payload=np.frombuffer(json.dumps(payload, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+    )
+    os.replace(temporary, path)
+    return len(entries)
+
+def load_warm_snapshot(path: str, embedding_generator, result_cache) -> int:
+    """Carga una instantánea de precalentamiento en las cachés del proceso (una vez por fichero).
+
+    Args:
+        path: Fichero ``.npz`` generado por :func:`save_warm_snapshot`.
+        embedding_generator: Generador de embeddings del sistema (su caché y su modelo).
+        result_cache: Caché semántica de respuestas, o None si está desactivada.
+
+    Returns:
+        int: Número de consultas cargadas.
+    """
+    with _loaded_lock:
+        if path in _loaded_snapshots:
+            return 0
+        _loaded_snapshots.add(path)
+
+    try:
+        with np.load(path, allow_pickle=False) as snapshot:
+            embeddings = snapshot["embeddings"]
+            payload = json.loads(snapshot["payload"].tobytes().decode("utf-8"))
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"No se pudo cargar la instantánea de precalentamiento {path}: {e}")
+        return 0
+
+    if payload.get("version") != SNAPSHOT_VERSION or payload.get("embedding_model") != embedding_generator.cache_model_name:
+        logger.warning(
+            f"Instantánea de precalentamiento {path} ignorada: generada con "
+            f"{payload.get('embedding_model')} y el sistema usa {embedding_generator.cache_model_name}"
+        )
+        return 0
+
+    for entry, embedding in zip(payload["entries"], embeddings):
+        if embedding_generator.cache is not None:
+            embedding_generator.cache.put(embedding_generator.cache_model_name, entry["text"], embedding)
+        if result_cache is not None:
+            collection, threshold, max_sources, shards = entry["scope"]
+            result_cache.put(embedding, (collection, threshold, max_sources, tuple(shards) if shards else None), entry["result"])
+
+    logger.info(f"Instantánea de precalentamiento cargada: {len(payload['entries'])} consultas de {path}")
+    return len(payload["entries"])
+
+def prewarm(
+    summary: List[Dict[str, Any]],
+    concurrency: int = BATCH_CONCURRENCY,
+    snapshot: Optional[str] = None
+) -> Dict[str, Any]:
+    """Ejecuta las consultas indicadas para llenar las cachés y, opcionalmente, guarda la instantánea.
+
+    Args:
+        summary: Consultas agregadas (ver :func:`app.query.query_log.aggregate_queries`).
+        concurrency: Consultas ejecutándose a la vez.
+        snapshot: Fichero ``.npz`` en el que guardar la instantánea. Si es None, solo se
+                  llenan las cachés de este proceso (y la caché de embeddings en disco).
+
+    Returns:
+        Dict[str, Any]: Consultas ejecutadas, fallidas, guardadas y tiempo total.
+    """
+    # Importación diferida: el sistema RAG carga la instantánea desde este módulo
+    from app.query.rag_query import RAGQuerySystem
+
+    start_time = time.time()
+    groups: Dict[tuple, List[str]] = {}
+    for item in summary:
+        params = (item["threshold"], item["max_sources"], tuple(item["shards"]) if item.get("shards") else None)
+        groups.setdefault(params, []).append(item["query"])
+
+    rag_system = RAGQuerySystem()
+    entries = []
+    failed = 0
+    try:
+        for (threshold, max_sources, shards), queries in groups.items():
+            batch = rag_system.query_batch(queries, threshold, max_sources, concurrency, list(shards) if shards else None)
+            # Con la caché de embeddings activa, no se vuelven a pedir a OpenAI
+            embeddings = rag_system.event_loop.run(rag_system.embedding_generator.agenerate_embeddings(queries))
+            scope = (rag_system.vector_db.collection_name, threshold, max_sources, rag_system.resolve_shards(shards))
+            for query_text, embedding, result in zip(queries, embeddings, batch["results"]):
+                metadata = result["metadata"]
+                if "error" in metadata:
+                    failed += 1
+                    continue
+                # Solo se guarda lo que la caché de respuestas habría guardado
+                if result["sources"] and not metadata.get("partial"):
+                    entries.append((rag_system.embedding_generator._normalize_text(query_text), embedding, scope, result))
+
+        saved = 0
+        if snapshot:
+            saved = save_warm_snapshot(snapshot, rag_system.embedding_generator.cache_model_name, entries)
+    finally:
+        rag_system.close()
+
+    return {
+        "queries": len(summary),
+        "failed": failed,
+        "saved": saved,
+        "total_time": time.time() - start_time
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Consultas frecuentes y precalentamiento de las cachés")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, description in (("top", "Muestra las consultas principales del registro"),
+                              ("warm", "Ejecuta las consultas principales para llenar las cachés")):
+        subparser = subparsers.add_parser(name, help=description)
+        subparser.add_argument("--log", action="append", help="Fichero de registro (se puede repetir)")
+        subparser.add_argument("--top", type=int, default=20, help="Número de consultas")
+        subparser.add_argument("--by", choices=RANKINGS, default="count", help="Frecuencia o coste total")
+    warm_parser = subparsers.choices["warm"]
+    warm_parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Consultas a la vez")
+    warm_parser.add_argument("--snapshot", help="Instantánea .npz a generar para WARM_CACHE_SNAPSHOT")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    paths = args.log or ([QUERY_LOG_PATH] if QUERY_LOG_PATH else [])
+    if not paths:
+        parser.error("Indica el registro con --log o QUERY_LOG_PATH")
+
+    summary = aggregate_queries(read_query_log(paths), args.top, args.by)
+    if args.command == "top":
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+
+    report = prewarm(summary, args.concurrency, args.snapshot)
+    print(
+        f"{report['queries']} consultas precalentadas en {report['total_time']:.1f} s "
+        f"({report['failed']} fallidas, {report['saved']} guardadas en la instantánea)"
+    )
+
+if __name__ == "__main__":
+    main()
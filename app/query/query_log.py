@@ -0,0 +1,272 @@
+"""
+Registro de las consultas realizadas.
+Cada consulta se añade como una línea JSON (texto normalizado, parámetros de búsqueda,
+si se sirvió desde la caché y duración de sus etapas) a un fichero de solo anexado. La
+escritura se hace en un hilo propio a partir de una cola acotada: la consulta nunca espera
+al disco y, si la cola se llena, las entradas sobrantes se descartan y se cuentan.
+
+El módulo incluye además la agregación del registro (consultas más frecuentes y más costosas)
+que usa el precalentamiento de las cachés (``app.query.prewarm``).
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from app.config.settings import QUERY_LOG_PATH, QUERY_LOG_MAX_QUEUE, QUERY_LOG_FLUSH_INTERVAL
+from app.query.single_flight import normalize_query
+from app.utils.performance_metrics import performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Criterios de ordenación de la agregación
+RANKINGS = ("count", "cost")
+
+_STOP = object()
+
+class QueryLog:
+    """Escritor asíncrono del registro de consultas en un fichero JSONL."""
+
+    def __init__(
+        self,
+        path: str,
+        max_queue: int = QUERY_LOG_MAX_QUEUE,
+        flush_interval: float = QUERY_LOG_FLUSH_INTERVAL
+    ):
+        """Inicializa el registro; el hilo de escritura se arranca con la primera entrada.
+
+        Args:
+            path: Fichero de registro (se crea si no existe; las entradas se añaden al final).
+            max_queue: Entradas pendientes de escribir por encima de las cuales se descartan.
+            flush_interval: Segundos máximos que una entrada espera en la cola antes de escribirse.
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        """Arranca el hilo de escritura si aún no está en marcha."""
+        with self._lock:
+            if self._thread is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._thread = threading.Thread(target=self._run, name="query-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def record(self, entry: Dict[str, Any]):
+        """Añade una entrada al registro sin bloquear.
+
+        Args:
+            entry: Entrada serializable en JSON.
+        """
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            performance_tracker.increment("query_log_dropped")
+
+    def _run(self):
+        """Bucle del hilo de escritura: agrupa las entradas pendientes en una sola escritura."""
+        stopping = False
+        while not stopping:
+            try:
+                entries = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if any(entry is _STOP for entry in entries):
+                stopping = True
+                entries = [entry for entry in entries if entry is not _STOP]
+            if entries:
+                self._write(entries)
+
+    def _write(self, entries: List[Dict[str, Any]]):
+        """Escribe un grupo de entradas al final del fichero."""
+        lines = "".join(json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries)
+        try:
+            with open(self.path, "a", encoding="utf-8") as handle:
+                handle.write(lines)
+            self.written += len(entries)
+        except OSError as e:
+            self.dropped += len(entries)
+            performance_tracker.increment("query_log_dropped", len(entries))
+            logger.warning(f"No se pudo escribir el registro de consultas en {self.path}: {e}")
+
+    def close(self, timeout: float = 5.0):
+        """Escribe las entradas pendientes y detiene el hilo de escritura.
+
+        Args:
+            timeout: Segundos máximos de espera.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Entradas escritas, descartadas y pendientes."""
+        return {"written": self.written, "dropped": self.dropped, "pending": self._queue.qsize()}
+
+def make_entry(
+    query_text: str,
+    similarity_threshold: float,
+    max_sources: int,
+    shards: Optional[Iterable[str]],
+    metadata: Dict[str, Any],
+    mode: str = "query"
+) -> Dict[str, Any]:
+    """Construye la entrada del registro de una consulta a partir de los metadatos de su resultado.
+
+    Args:
+        query_text: Texto de la consulta.
+        similarity_threshold: Umbral de similitud de la búsqueda.
+        max_sources: Número máximo de fuentes.
+        shards: Shards consultados, o None para todos.
+        metadata: Metadatos del resultado (``query_time``, ``cached``, ``trace``...).
+        mode: ``query``, ``stream`` o ``batch``.
+
+    Returns:
+        Dict[str, Any]: Entrada serializable en JSON.
+    """
+    stages: Dict[str, float] = {}
+    for stage in (metadata.get("trace") or {}).get("stages", ()):
+        stages[stage["name"]] = round(stages.get(stage["name"], 0.0) + stage["duration"], 6)
+    return {
+        "ts": round(time.time(), 3),
+        # Solo se colapsan los espacios: la variante más habitual se reutiliza en el precalentamiento
+        "query": " ".join(query_text.split()),
+        "threshold": similarity_threshold,
+        "max_sources": max_sources,
+        "shards": list(shards) if shards else None,
+        "mode": mode,
+        "cached": bool(metadata.get("cached")),
+        "coalesced": bool(metadata.get("coalesced")),
+        "error": "error" in metadata,
+        "query_time": round(metadata.get("query_time") or 0.0, 6),
+        "stages": stages
+    }
+
+def read_query_log(paths: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Recorre las entradas de uno o varios ficheros de registro, ignorando las líneas corruptas.
+
+    Args:
+        paths: Ficheros de registro.
+
+    Yields:
+        Dict[str, Any]: Entradas del registro.
+    """
+    for path in paths:
+        with open(path, encoding="utf-8") as handle:
+            for line_number, line in enumerate(handle, 1):
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Línea {line_number} de {path} ignorada: no es JSON válido")
+                    continue
+                if isinstance(entry, dict) and entry.get("query"):
+                    yield entry
+
+def aggregate_queries(entries: Iterable[Dict[str, Any]], top: int = 20, by: str = "count") -> List[Dict[str, Any]]:
+    """Agrupa las entradas por consulta normalizada y parámetros y devuelve las principales.
+
+    Args:
+        entries: Entradas del registro.
+        top: Número de consultas a devolver.
+        by: ``count`` (más frecuentes) o ``cost`` (más tiempo total de pipeline sin caché).
+
+    Returns:
+        List[Dict[str, Any]]: Por consulta, su variante más habitual, parámetros, recuento,
+                              aciertos de caché, errores, tiempos y duración media por etapa.
+
+    Raises:
+        ValueError: Si el criterio de ordenación no es válido.
+    """
+    if by not in RANKINGS:
+        raise ValueError(f"Criterio de ordenación desconocido: {by}. Disponibles: {', '.join(RANKINGS)}")
+
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for entry in entries:
+        shards = tuple(entry["shards"]) if entry.get("shards") else None
+        key = (normalize_query(entry["query"]), entry.get("threshold"), entry.get("max_sources"), shards)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {
+                "variants": {},
+                "count": 0,
+                "cached": 0,
+                "errors": 0,
+                "times": [],
+                "cost": 0.0,
+                "stages": {}
+            }
+        group["variants"][entry["query"]] = group["variants"].get(entry["query"], 0) + 1
+        group["count"] += 1
+        group["errors"] += bool(entry.get("error"))
+        query_time = float(entry.get("query_time") or 0.0)
+        group["times"].append(query_time)
+        if entry.get("cached") or entry.get("coalesced"):
+            group["cached"] += 1
+        else:
+            # El coste es el tiempo de las consultas que ejecutaron el pipeline completo
+            group["cost"] += query_time
+        for name, duration in (entry.get("stages") or {}).items():
+            group["stages"][name] = group["stages"].get(name, 0.0) + duration
+
+    ranked = sorted(groups.items(), key=lambda item: item[1][by], reverse=True)[:max(0, top)]
+    summary = []
+    for (_, threshold, max_sources, shards), group in ranked:
+        times = sorted(group["times"])
+        summary.append({
+            "query": max(group["variants"].items(), key=lambda variant: variant[1])[0],
+            "threshold": threshold,
+            "max_sources": max_sources,
+            "shards": list(shards) if shards else None,
+            "count": group["count"],
+            "cached": group["cached"],
+            "errors": group["errors"],
+            "cost": round(group["cost"], 6),
+            "mean_time": round(sum(times) / len(times), 6),
+            "p95_time": round(times[max(0, math.ceil(len(times) * 0.95) - 1)], 6),
+            "stages": {name: round(total / group["count"], 6) for name, total in sorted(group["stages"].items())}
+        })
+    return summary
+
+_query_log: Optional[QueryLog] = None
+_query_log_lock = threading.Lock()
+
+def get_query_log() -> Optional[QueryLog]:
+    """Obtiene el registro de consultas compartido por el proceso.
+
+    Returns:
+        Optional[QueryLog]: Registro compartido o None si QUERY_LOG_PATH está vacío.
+    """
+    global _query_log
+
+    if not QUERY_LOG_PATH:
+        return None
+
+    with _query_log_lock:
+        if _query_log is None:
+            _query_log = QueryLog(QUERY_LOG_PATH)
+        return _query_log
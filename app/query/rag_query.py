@@ -3,53 +3,173 @@ Sistema de consultas RAG.
 Este módulo proporciona funciones para realizar consultas RAG utilizando la base de datos vectorial.
 """
 
+import asyncio
 import logging
 import json
 import time
 import traceback
-from typing import List, Dict, Any, Optional
+from contextlib import nullcontext
+from typing import List, Dict, Any, AsyncIterator, Iterator, Optional
 
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema import Document
+from openai import AsyncOpenAI
 
 from app.document_processing.embeddings import EmbeddingGenerator
+from app.database.result_set import ResultSet
+from app.database.sharded_store import ShardedVectorDatabase, ShardsUnavailableError, parse_shards
 from app.database.vector_store import VectorDatabase
-from app.config.settings import LLM_MODEL, OPENAI_API_KEY
-from app.utils.performance_metrics import performance_tracker
+from app.query.context_builder import ContextBuilder
+from app.query.prewarm import load_warm_snapshot
+from app.query.query_log import get_query_log, make_entry
+from app.query.result_cache import get_result_cache
+from app.query.single_flight import SingleFlight
+from app.config.settings import (
+    LLM_MODEL,
+    OPENAI_API_KEY,
+    BATCH_CONCURRENCY,
+    HTTP_PREWARM,
+    SINGLE_FLIGHT_ENABLED,
+    ADMISSION_ENABLED,
+    VECTOR_SHARDS,
+    SHARD_TIMEOUT,
+    HEDGE_ENABLED,
+    WARM_CACHE_SNAPSHOT
+)
+from app.utils.admission import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    AdmissionController,
+    UpstreamOverloadedError,
+    find_overload,
+    request_priority,
+    upstream_error_info
+)
+from app.utils.async_loop import BackgroundEventLoop
+from app.utils.hedging import Hedger
+from app.utils.http_pool import HTTPPool
+from app.utils.performance_metrics import RequestTrace, performance_tracker
+from app.utils.profiling import get_request_profiler
+from app.utils.tokens import count_tokens
+from app.utils.vectors import Embedding
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Tokens de respuesta que se reservan en el límite de tokens por minuto del chat
+COMPLETION_TOKENS_ESTIMATE = 512
+
+# Plantilla para el prompt de RAG
+RAG_PROMPT_TEMPLATE = """Eres un asistente útil que responde preguntas basándose únicamente en el contexto proporcionado.
+            
+            Contexto:
+            {context}
+            
+            Pregunta: {question}
+            
+            Instrucciones importantes:
+            1. Responde solo con información que esté presente en el contexto proporcionado.
+            2. Si el contexto no contiene la información necesaria para responder, di "No tengo suficiente información para responder a esta pregunta."
+            3. No uses conocimiento externo o general que no esté en el contexto.
+            4. Proporciona respuestas detalladas y precisas basadas únicamente en el contexto.
+            5. Cita las fuentes de información cuando sea posible, refiriéndote al nombre del documento y número de fragmento.
+            6. Si hay información contradictoria en el contexto, señálala y explica las diferentes perspectivas.
+            
+            Respuesta:"""
+
 class RAGQuerySystem:
     """Clase para realizar consultas RAG utilizando la base de datos vectorial."""
     
-    def __init__(self, model_name: str = LLM_MODEL, api_key: str = OPENAI_API_KEY):
+    def __init__(
+        self,
+        model_name: str = LLM_MODEL,
+        api_key: str = OPENAI_API_KEY,
+        embedding_model: Optional[str] = None,
+        collection_name: Optional[str] = None,
+        supabase_url: Optional[str] = None,
+        supabase_key: Optional[str] = None,
+        vector_backend: Optional[str] = None,
+        local_index_dir: Optional[str] = None,
+        vector_shards: Optional[str] = None
+    ):
         """Inicializa el sistema de consultas RAG.
         
         Args:
             model_name: Nombre del modelo de lenguaje.
             api_key: Clave API de OpenAI.
+            embedding_model: Modelo de embeddings. Si no se proporciona, se utiliza EMBEDDING_MODEL.
+            collection_name: Colección de documentos. Si no se proporciona, se utiliza SUPABASE_COLLECTION_NAME.
+            supabase_url: URL de Supabase. Si no se proporciona, se utiliza SUPABASE_URL.
+            supabase_key: Clave API de Supabase. Si no se proporciona, se utiliza SUPABASE_KEY.
+            vector_backend: Backend de búsqueda vectorial. Si no se proporciona, se utiliza VECTOR_BACKEND.
+            local_index_dir: Directorio de la instantánea local. Si no se proporciona, se utiliza LOCAL_INDEX_DIR.
+            vector_shards: Lista JSON de shards en los que repartir la búsqueda. Si no se
+                           proporciona, se utiliza VECTOR_SHARDS (vacío: una sola colección).
         """
         # Validar API key de OpenAI
         if not api_key:
             logger.error("No se ha proporcionado la clave API de OpenAI")
             raise ValueError("No se ha proporcionado la clave API de OpenAI")
-            
-        self.embedding_generator = EmbeddingGenerator()
+        
+        # Indica si los clientes siguen siendo utilizables; se desactiva ante errores de conexión
+        self.healthy = True
+        
+        # Pool de conexiones HTTP compartido por OpenAI (embeddings y chat) y Supabase
+        self.http_pool = HTTPPool()
+        
+        # Planificador de las llamadas a OpenAI y Supabase (límites de ritmo, cola y reintentos)
+        self.admission = AdmissionController() if ADMISSION_ENABLED else None
+        
+        # Copias de respaldo de las llamadas idempotentes lentas (embedding de la consulta y búsqueda)
+        self.hedger = Hedger() if HEDGE_ENABLED else None
+        
+        if embedding_model:
+            self.embedding_generator = EmbeddingGenerator(
+                model_name=embedding_model,
+                api_key=api_key,
+                http_pool=self.http_pool,
+                admission=self.admission,
+                hedger=self.hedger
+            )
+        else:
+            self.embedding_generator = EmbeddingGenerator(
+                api_key=api_key, http_pool=self.http_pool, admission=self.admission, hedger=self.hedger
+            )
         
         try:
-            self.vector_db = VectorDatabase()
+            shard_config = parse_shards(VECTOR_SHARDS if vector_shards is None else vector_shards)
+            if shard_config:
+                self.vector_db = ShardedVectorDatabase(
+                    shard_config,
+                    timeout=SHARD_TIMEOUT,
+                    url=supabase_url,
+                    key=supabase_key,
+                    backend=vector_backend,
+                    http_pool=self.http_pool
+                )
+            else:
+                self.vector_db = VectorDatabase(
+                    collection_name=collection_name,
+                    url=supabase_url,
+                    key=supabase_key,
+                    backend=vector_backend,
+                    local_index_dir=local_index_dir,
+                    http_pool=self.http_pool
+                )
         except Exception as e:
             logger.error(f"Error al inicializar la base de datos vectorial: {e}")
             raise ConnectionError(f"Error al conectar con la base de datos vectorial: {str(e)}") from e
             
+        # Cliente de chat de OpenAI usado directamente, sin la capa de LangChain
+        self.model_name = model_name
+        self.temperature = 0.1
         try:
-            self.llm = ChatOpenAI(
-                model=model_name,
-                openai_api_key=api_key,
-                temperature=0.1
+            # Con el planificador, los reintentos los gestiona él y no el cliente de OpenAI
+            client_options = {"max_retries": 0} if self.admission is not None else {}
+            self.llm_client = AsyncOpenAI(
+                api_key=api_key,
+                http_client=self.http_pool.async_client,
+                timeout=self.http_pool.timeout,
+                **client_options
             )
         except Exception as e:
             logger.error(f"Error al inicializar el modelo de lenguaje: {e}")
@@ -58,121 +178,860 @@ class RAGQuerySystem:
         # Asignar el rastreador de rendimiento
         self.performance_tracker = performance_tracker
         
-        # Plantilla para el prompt de RAG
-        self.prompt_template = ChatPromptTemplate.from_template(
-            """Eres un asistente útil que responde preguntas basándose únicamente en el contexto proporcionado.
+        # Bucle de eventos propio para ejecutar el pipeline asíncrono desde código síncrono;
+        # los clientes asíncronos quedan ligados a él y se reutilizan entre consultas
+        self.event_loop = BackgroundEventLoop()
+        self.event_loop.add_shutdown_callback(self.http_pool.aclose)
+        
+        # Abrir las conexiones con OpenAI y Supabase sin bloquear la creación del sistema
+        self.prewarm_future = None
+        if HTTP_PREWARM:
+            self.prewarm_future = self.event_loop.submit(self.http_pool.aprewarm(self._upstream_urls()))
+        
+        # Caché semántica de respuestas compartida por el proceso
+        self.result_cache = get_result_cache()
+        
+        # Respuestas de las preguntas más habituales guardadas por ``app.query.prewarm``
+        if WARM_CACHE_SNAPSHOT:
+            load_warm_snapshot(WARM_CACHE_SNAPSHOT, self.embedding_generator, self.result_cache)
+        
+        # Registro de las consultas (texto normalizado y duración de las etapas)
+        self.query_log = get_query_log()
+        
+        # Perfilado de CPU y memoria de las consultas (desactivado por defecto)
+        self.profiler = get_request_profiler()
+        
+        # Agrupación de consultas idénticas en curso
+        self.single_flight = SingleFlight() if SINGLE_FLIGHT_ENABLED else None
+        
+        # Constructor del contexto (presupuesto de tokens y eliminación de duplicados)
+        self.context_builder = ContextBuilder(model_name=model_name)
+        
+        self._template_tokens = None
+    
+    def _upstream_urls(self) -> List[str]:
+        """Devuelve las URL de los servidores remotos que usa el sistema.
+        
+        Returns:
+            List[str]: URL de OpenAI y, con el backend de Supabase, la de Supabase (o las
+                       de los proyectos de los shards).
+        """
+        urls = [str(self.llm_client.base_url)]
+        if self.vector_db.backend == "supabase":
+            urls.append(self.vector_db.supabase_store._client_url())
+        elif self.vector_db.backend == "sharded":
+            urls.extend(self.vector_db.upstream_urls())
+        return urls
+    
+    @property
+    def shard_names(self) -> Optional[List[str]]:
+        """Nombres de los shards configurados, o None si la búsqueda usa una sola colección."""
+        if self.vector_db.backend != "sharded":
+            return None
+        return self.vector_db.shard_names
+    
+    def resolve_shards(self, shards: Optional[List[str]]) -> Optional[tuple]:
+        """Valida el subconjunto de shards solicitado.
+        
+        Args:
+            shards: Nombres de los shards, o None para todos.
             
-            Contexto:
-            {context}
+        Returns:
+            Optional[tuple]: Nombres normalizados (orden de la configuración) o None para todos.
             
-            Pregunta: {question}
+        Raises:
+            ValueError: Si no hay shards configurados o alguno no existe.
+        """
+        if not shards:
+            return None
+        if self.vector_db.backend != "sharded":
+            raise ValueError("No hay shards configurados (VECTOR_SHARDS)")
+        return self.vector_db.resolve(shards)
+    
+    def check_admission(self) -> Optional[Dict[str, Any]]:
+        """Comprueba, antes de empezar una consulta, si algún servicio remoto está saturado.
+        
+        Permite rechazar el trabajo nuevo de inmediato en lugar de encolarlo.
+        
+        Returns:
+            Optional[Dict]: Resultado de error (con ``status`` y ``retry_after`` en los
+                            metadatos) si la consulta debe rechazarse, o None.
+        """
+        if self.admission is None:
+            return None
+        try:
+            self.admission.check()
+        except UpstreamOverloadedError as e:
+            return self._error_result(e, time.time())
+        return None
+    
+    async def _acall_upstream(
+        self,
+        upstream: str,
+        factory,
+        tokens: float = 1,
+        priority: Optional[int] = None,
+        hedge: bool = False
+    ):
+        """Ejecuta una llamada remota a través del planificador, si está activado.
+        
+        Args:
+            upstream: Servicio remoto (``chat`` o ``retrieval``).
+            factory: Función que crea la corrutina de la llamada.
+            tokens: Tokens estimados de la llamada.
+            priority: Prioridad de la llamada. Si no se proporciona, se usa la del contexto.
+            hedge: Si la llamada es idempotente y puede duplicarse cuando tarda demasiado
+                   (solo con HEDGE_ENABLED).
             
-            Instrucciones importantes:
-            1. Responde solo con información que esté presente en el contexto proporcionado.
-            2. Si el contexto no contiene la información necesaria para responder, di "No tengo suficiente información para responder a esta pregunta."
-            3. No uses conocimiento externo o general que no esté en el contexto.
-            4. Proporciona respuestas detalladas y precisas basadas únicamente en el contexto.
-            5. Cita las fuentes de información cuando sea posible, refiriéndote al nombre del documento y número de fragmento.
-            6. Si hay información contradictoria en el contexto, señálala y explica las diferentes perspectivas.
+        Returns:
+            Any: Resultado de la llamada.
+        """
+        def admitted():
+            if self.admission is None:
+                return factory()
+            return self.admission.call(upstream, factory, tokens=tokens, priority=priority)
+        
+        # Cada copia de respaldo pasa por el planificador y consume sus propios tokens
+        if hedge and self.hedger is not None:
+            return await self.hedger.call(upstream, admitted)
+        return await admitted()
+    
+    def _check_connection_error(self, error: BaseException) -> None:
+        """Marca el sistema como no saludable si el error (o su causa) es de conexión.
+        
+        Se reconocen los errores de conexión de OpenAI y los de transporte de httpx (los que
+        producen Supabase/PostgREST al perder el pool), igual que en el control de admisión.
+        
+        Args:
+            error: Excepción capturada durante la consulta.
+        """
+        current = error
+        while current is not None and not isinstance(current, ConnectionError):
+            current = current.__cause__
+        if current is not None or upstream_error_info(error)[0] == 0:
+            logger.warning("Se detectó un error de conexión; el sistema se reconstruirá en la próxima consulta")
+            self.healthy = False
+    
+    async def _aembed_query(self, query_text: str) -> Embedding:
+        """Genera el embedding de la consulta.
+        
+        Args:
+            query_text: Texto de la consulta.
             
-            Respuesta:"""
+        Returns:
+            Embedding: Embedding de la consulta (array float32).
+        """
+        with self.performance_tracker.track("generate_query_embedding"):
+            try:
+                return await self.embedding_generator.agenerate_embedding(query_text)
+            except Exception as e:
+                logger.error(f"Error al generar embedding para la consulta: {e}")
+                self._check_connection_error(e)
+                raise ValueError(f"Error al generar embedding para la consulta: {str(e)}")
+    
+    def _get_cached_result(self, query_embedding: Embedding, cache_scope: tuple, start_time: float) -> Optional[Dict[str, Any]]:
+        """Busca en la caché semántica la respuesta de una pregunta casi idéntica.
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            cache_scope: Ámbito de validez (colección y parámetros de búsqueda).
+            start_time: Instante de inicio de la consulta.
+            
+        Returns:
+            Optional[Dict]: Resultado almacenado o None si no hay acierto.
+        """
+        if self.result_cache is None:
+            return None
+        
+        cached = self.result_cache.get(query_embedding, cache_scope)
+        if cached is None:
+            return None
+        
+        cached_result, cache_similarity = cached
+        logger.info(f"Respuesta servida desde la caché semántica (similitud {cache_similarity:.4f})")
+        cached_result["metadata"]["query_time"] = time.time() - start_time
+        cached_result["metadata"]["cached"] = True
+        cached_result["metadata"]["cache_similarity"] = cache_similarity
+        return cached_result
+    
+    async def _aretrieve_documents(
+        self,
+        query_embedding: Embedding,
+        similarity_threshold: float,
+        max_sources: int,
+        shards: Optional[tuple] = None,
+        query_text: Optional[str] = None
+    ) -> ResultSet:
+        """Busca los documentos relevantes para la consulta.
+        
+        Args:
+            query_embedding: Embedding de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar.
+            shards: Subconjunto de shards a consultar, o None para todos.
+            query_text: Texto de la consulta, para la búsqueda híbrida con el índice BM25.
+            
+        Returns:
+            ResultSet: Fragmentos recuperados, de mayor a menor relevancia.
+        """
+        def search():
+            return self.vector_db.asearch_results(
+                query_embedding=query_embedding,
+                similarity_threshold=similarity_threshold,
+                max_documents=max_sources,
+                query_text=query_text
+            )
+        
+        with self.performance_tracker.track("retrieve_documents"):
+            try:
+                # Cada shard remoto pasa por el planificador por separado, con su propio tiempo máximo
+                if self.vector_db.backend == "sharded":
+                    return await self.vector_db.asearch_results(
+                        query_embedding,
+                        similarity_threshold,
+                        max_sources,
+                        shards=shards,
+                        call=lambda factory: self._acall_upstream("retrieval", factory)
+                    )
+                # Solo la búsqueda en Supabase es remota; los backends locales no pasan por el planificador
+                if self.vector_db.backend == "supabase":
+                    return await self._acall_upstream("retrieval", search, hedge=True)
+                return await search()
+            except (UpstreamOverloadedError, ShardsUnavailableError):
+                # Saturación o shards lentos: los clientes siguen siendo válidos
+                raise
+            except Exception as e:
+                logger.error(f"Error al buscar documentos relevantes: {e}")
+                # Solo los errores de conexión invalidan los clientes; un error de la consulta no
+                self._check_connection_error(e)
+                error_stack = traceback.format_exc()
+                logger.error(f"Stack trace: {error_stack}")
+                raise ConnectionError(f"Error al buscar documentos en la base de datos: {str(e)}") from e
+    
+    def _prepare_context(self, documents: ResultSet, query_text: str) -> tuple:
+        """Prepara el texto de contexto para el LLM dentro del presupuesto de tokens.
+        
+        Args:
+            documents: Fragmentos recuperados.
+            query_text: Texto de la consulta.
+            
+        Returns:
+            tuple: Texto de contexto, documentos incluidos y metadatos del contexto
+                   (``prompt_tokens``, ``documents_used`` y fragmentos descartados).
+        """
+        with self.performance_tracker.track("prepare_context"):
+            context_text, context_docs, stats = self.context_builder.build(documents)
+            
+            if self._template_tokens is None:
+                self._template_tokens = count_tokens(RAG_PROMPT_TEMPLATE, self.context_builder.model_name)
+            
+            context_metadata = {
+                "prompt_tokens": self._template_tokens + stats["context_tokens"] + count_tokens(query_text, self.context_builder.model_name),
+                "context_tokens": stats["context_tokens"],
+                "documents_used": len(context_docs),
+                "duplicates_dropped": stats["duplicates_dropped"],
+                "score_cutoff_dropped": stats["score_cutoff_dropped"],
+                "budget_dropped": stats["budget_dropped"]
+            }
+            return context_text, context_docs, context_metadata
+    
+    @staticmethod
+    def _render_prompt(context_text: str, query_text: str) -> List[Dict[str, str]]:
+        """Construye los mensajes del chat con la plantilla de RAG.
+        
+        Args:
+            context_text: Texto de contexto.
+            query_text: Texto de la consulta.
+            
+        Returns:
+            List[Dict[str, str]]: Mensajes para la API de chat completions.
+        """
+        return [{"role": "user", "content": RAG_PROMPT_TEMPLATE.format(context=context_text, question=query_text)}]
+    
+    async def _agenerate(self, context_text: str, query_text: str, prompt_tokens: int = 0) -> str:
+        """Genera la respuesta completa con el LLM.
+        
+        Args:
+            context_text: Texto de contexto.
+            query_text: Texto de la consulta.
+            prompt_tokens: Tokens del prompt, para el límite de tokens por minuto.
+            
+        Returns:
+            str: Respuesta generada.
+        """
+        def create():
+            return self.llm_client.chat.completions.create(
+                model=self.model_name,
+                messages=self._render_prompt(context_text, query_text),
+                temperature=self.temperature
+            )
+        
+        response = await self._acall_upstream("chat", create, tokens=prompt_tokens + COMPLETION_TOKENS_ESTIMATE)
+        return response.choices[0].message.content or ""
+    
+    async def _astream(
+        self,
+        context_text: str,
+        query_text: str,
+        prompt_tokens: int = 0,
+        priority: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """Genera la respuesta con el LLM fragmento a fragmento.
+        
+        Solo la apertura del flujo se reintenta; un error a mitad de la respuesta se propaga.
+        
+        Args:
+            context_text: Texto de contexto.
+            query_text: Texto de la consulta.
+            prompt_tokens: Tokens del prompt, para el límite de tokens por minuto.
+            priority: Prioridad de la llamada.
+            
+        Yields:
+            str: Fragmentos de la respuesta.
+        """
+        def create():
+            return self.llm_client.chat.completions.create(
+                model=self.model_name,
+                messages=self._render_prompt(context_text, query_text),
+                temperature=self.temperature,
+                stream=True
+            )
+        
+        stream = await self._acall_upstream(
+            "chat", create, tokens=prompt_tokens + COMPLETION_TOKENS_ESTIMATE, priority=priority
         )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
     
-    def query(self, query_text: str, similarity_threshold: float = 0.1, max_sources: int = 5) -> Dict[str, Any]:
-        """Realiza una consulta al sistema RAG.
+    @staticmethod
+    def _build_sources(documents: ResultSet) -> List[Dict[str, Any]]:
+        """Construye la lista de fuentes de la respuesta.
+        
+        Solo se decodifican los metadatos de los fragmentos incluidos en el contexto.
+        
+        Args:
+            documents: Fragmentos incluidos en el contexto.
+            
+        Returns:
+            List[Dict]: Fuentes con contenido, metadatos y similitud.
+        """
+        return documents.to_sources()
+    
+    @staticmethod
+    def _retrieval_metadata(documents: ResultSet) -> Dict[str, Any]:
+        """Metadatos de una búsqueda repartida: shards consultados, fallidos y si es parcial.
+        
+        Args:
+            documents: Fragmentos recuperados.
+            
+        Returns:
+            Dict: ``shards`` y ``partial``, o vacío si la búsqueda usa una sola colección.
+        """
+        if documents.fanout is None:
+            return {}
+        return {"shards": documents.fanout, "partial": documents.fanout["partial"]}
+    
+    @staticmethod
+    def _no_documents_result(start_time: float) -> Dict[str, Any]:
+        """Construye el resultado cuando no hay documentos relevantes.
+        
+        Args:
+            start_time: Instante de inicio de la consulta.
+            
+        Returns:
+            Dict: Resultado sin fuentes.
+        """
+        logger.info("No se encontraron documentos relevantes para la consulta.")
+        return {
+            "answer": "No encontré información relevante para responder a tu pregunta. Por favor, intenta reformularla o consulta sobre otro tema.",
+            "sources": [],
+            "metadata": {
+                "query_time": time.time() - start_time,
+                "documents_retrieved": 0
+            }
+        }
+    
+    @staticmethod
+    def _error_result(error: Exception, start_time: float) -> Dict[str, Any]:
+        """Construye el resultado de una consulta fallida.
+        
+        Args:
+            error: Excepción que interrumpió la consulta.
+            start_time: Instante de inicio de la consulta.
+            
+        Returns:
+            Dict: Resultado con el mensaje de error.
+        """
+        logger.error(f"Error al procesar la consulta: {error}")
+        error_stack = traceback.format_exc()
+        logger.error(f"Stack trace: {error_stack}")
+        result = {
+            "answer": f"Lo siento, ha ocurrido un error al procesar tu consulta: {str(error)}",
+            "sources": [],
+            "metadata": {
+                "error": str(error),
+                "error_stack": error_stack,
+                "query_time": time.time() - start_time
+            }
+        }
+        
+        # Saturación: la API responde 429/503 con Retry-After en lugar de 200
+        overload = find_overload(error)
+        if overload is not None:
+            result["metadata"].update({
+                "status": overload.status,
+                "retry_after": overload.retry_after,
+                "upstream": overload.upstream
+            })
+        return result
+    
+    async def aquery(
+        self,
+        query_text: str,
+        similarity_threshold: float = 0.1,
+        max_sources: int = 5,
+        shards: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Realiza una consulta al sistema RAG de forma asíncrona.
+        
+        Todas las etapas con red (embedding, búsqueda y generación) se esperan sin
+        bloquear, de modo que un mismo proceso puede atender muchas consultas a la vez.
+        Si ya hay en curso una consulta idéntica, se espera y se comparte su resultado
+        (``metadata["coalesced"]``).
+        
+        Args:
+            query_text: Texto de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar.
+            shards: Subconjunto de shards a consultar (con VECTOR_SHARDS). Si es None, todos.
+            
+        Returns:
+            Dict: Resultado de la consulta, incluyendo la respuesta, las fuentes y la traza
+                  de etapas en ``metadata["trace"]``.
+            
+        Raises:
+            ValueError: Si se solicitan shards que no existen.
+        """
+        shards = self.resolve_shards(shards)
+        if self.single_flight is None:
+            result = await self._aquery(query_text, similarity_threshold, max_sources, shards)
+        else:
+            key = self.single_flight.key(query_text, similarity_threshold, max_sources, shards)
+            result, coalesced = await self.single_flight.run(
+                key, lambda: self._aquery(query_text, similarity_threshold, max_sources, shards)
+            )
+            if coalesced:
+                result["metadata"]["coalesced"] = True
+        
+        if self.query_log is not None:
+            self.query_log.record(make_entry(query_text, similarity_threshold, max_sources, shards, result["metadata"]))
+        return result
+    
+    async def _aquery(
+        self,
+        query_text: str,
+        similarity_threshold: float,
+        max_sources: int,
+        shards: Optional[tuple] = None
+    ) -> Dict[str, Any]:
+        """Ejecuta el pipeline completo de una consulta (ver :meth:`aquery`)."""
+        start_time = time.time()
+        
+        with self.performance_tracker.trace() as trace, self._profile(trace, query_text) as profile:
+            try:
+                # Generar embedding para la consulta
+                query_embedding = await self._aembed_query(query_text)
+                
+                result = await self._aanswer(
+                    query_text, query_embedding, similarity_threshold, max_sources, start_time, shards
+                )
+                
+            except Exception as e:
+                result = self._error_result(e, start_time)
+        
+        result["metadata"]["trace"] = trace.to_dict()
+        if profile is not None:
+            result["metadata"]["profile"] = profile.artifacts
+        return result
+    
+    def _profile(self, trace: RequestTrace, query_text: str):
+        """Contexto de perfilado de una consulta si el perfilador la selecciona.
+        
+        Args:
+            trace: Traza de la consulta.
+            query_text: Texto de la consulta.
+            
+        Returns:
+            Gestor de contexto que entrega el perfil en curso o None.
+        """
+        if self.profiler is None or not self.profiler.should_profile():
+            return nullcontext()
+        return self.profiler.profile(trace, query_text)
+    
+    async def _aanswer(
+        self,
+        query_text: str,
+        query_embedding: Embedding,
+        similarity_threshold: float,
+        max_sources: int,
+        start_time: float,
+        shards: Optional[tuple] = None
+    ) -> Dict[str, Any]:
+        """Completa una consulta a partir de su embedding: caché, búsqueda y generación.
         
         Args:
             query_text: Texto de la consulta.
+            query_embedding: Embedding de la consulta.
             similarity_threshold: Umbral de similitud para incluir documentos.
             max_sources: Número máximo de fuentes a recuperar.
+            start_time: Instante de inicio de la consulta.
+            shards: Subconjunto de shards a consultar, o None para todos.
             
         Returns:
             Dict: Resultado de la consulta, incluyendo la respuesta y las fuentes.
         """
+        # Reutilizar la respuesta de una pregunta casi idéntica si está en caché
+        cache_scope = (self.vector_db.collection_name, similarity_threshold, max_sources, shards)
+        cached_result = self._get_cached_result(query_embedding, cache_scope, start_time)
+        if cached_result is not None:
+            return cached_result
+        
+        # Buscar documentos relevantes
+        documents = await self._aretrieve_documents(
+            query_embedding, similarity_threshold, max_sources, shards, query_text
+        )
+        
+        if not documents:
+            result = self._no_documents_result(start_time)
+            result["metadata"].update(self._retrieval_metadata(documents))
+            return result
+        
+        # Preparar contexto para el LLM
+        context_text, context_docs, context_metadata = self._prepare_context(documents, query_text)
+        
+        # Generar respuesta con el LLM
+        with self.performance_tracker.track("generate_response"):
+            try:
+                answer = await self._agenerate(context_text, query_text, context_metadata["prompt_tokens"])
+            except Exception as e:
+                logger.error(f"Error al generar respuesta con el LLM: {e}")
+                self._check_connection_error(e)
+                raise ValueError(f"Error al generar respuesta: {str(e)}")
+        
+        # Preparar el resultado
+        result = {
+            "answer": answer,
+            "sources": self._build_sources(context_docs),
+            "metadata": {
+                "query_time": time.time() - start_time,
+                "documents_retrieved": len(documents),
+                "cached": False,
+                **context_metadata,
+                **self._retrieval_metadata(documents)
+            }
+        }
+        
+        # Las respuestas parciales (algún shard sin respuesta) no se reutilizan
+        if self.result_cache is not None and not result["metadata"].get("partial"):
+            self.result_cache.put(query_embedding, cache_scope, result)
+        
+        return result
+    
+    async def aquery_batch(
+        self,
+        queries: List[str],
+        similarity_threshold: float = 0.1,
+        max_sources: int = 5,
+        concurrency: int = BATCH_CONCURRENCY,
+        shards: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Realiza varias consultas compartiendo una única llamada de embeddings.
+        
+        Los embeddings de todas las consultas se generan en una sola petición; la búsqueda
+        y la generación se ejecutan en paralelo con un límite de concurrencia. El fallo de
+        una consulta no afecta al resto: su resultado contiene el error correspondiente.
+        Cada consulta se anota en el registro de consultas con el modo ``batch``.
+        
+        Args:
+            queries: Textos de las consultas.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar por consulta.
+            concurrency: Número máximo de consultas procesándose a la vez.
+            shards: Subconjunto de shards a consultar (con VECTOR_SHARDS). Si es None, todos.
+            
+        Returns:
+            Dict: Resultados por consulta (en el mismo orden) y tiempos agregados.
+            
+        Raises:
+            ValueError: Si se solicitan shards que no existen.
+        """
+        shards = self.resolve_shards(shards)
         start_time = time.time()
         
-        try:
-            # Generar embedding para la consulta
-            with self.performance_tracker.track("generate_query_embedding"):
-                try:
-                    query_embedding = self.embedding_generator.generate_embedding(query_text)
-                except Exception as e:
-                    logger.error(f"Error al generar embedding para la consulta: {e}")
-                    raise ValueError(f"Error al generar embedding para la consulta: {str(e)}")
+        # Generar todos los embeddings en una sola llamada; si falla, cada consulta lo intentará por separado
+        embeddings: List[Optional[Embedding]] = [None] * len(queries)
+        batch_embedding_error = None
+        batch_trace = RequestTrace()
+        with self.performance_tracker.track("generate_batch_embeddings", trace=batch_trace), request_priority(PRIORITY_BATCH):
+            try:
+                embeddings = await self.embedding_generator.agenerate_embeddings(queries)
+            except Exception as e:
+                logger.error(f"Error al generar embeddings en lote: {e}")
+                self._check_connection_error(e)
+                batch_embedding_error = str(e)
+        embedding_time = time.time() - start_time
+        
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        
+        async def run_one(query_text: str, query_embedding: Optional[Embedding]) -> Dict[str, Any]:
+            async with semaphore:
+                query_start = time.time()
+                # Los lotes ceden el paso a las consultas interactivas en la cola de los servicios remotos
+                with self.performance_tracker.trace() as trace, request_priority(PRIORITY_BATCH):
+                    try:
+                        if query_embedding is None:
+                            query_embedding = await self._aembed_query(query_text)
+                        result = await self._aanswer(
+                            query_text, query_embedding, similarity_threshold, max_sources, query_start, shards
+                        )
+                    except Exception as e:
+                        result = self._error_result(e, query_start)
+                result["metadata"]["trace"] = trace.to_dict()
+                if self.query_log is not None:
+                    self.query_log.record(
+                        make_entry(query_text, similarity_threshold, max_sources, shards, result["metadata"], mode="batch")
+                    )
+                return result
+        
+        results = await asyncio.gather(*[
+            run_one(query_text, query_embedding)
+            for query_text, query_embedding in zip(queries, embeddings)
+        ])
+        
+        query_times = [result["metadata"]["query_time"] for result in results]
+        metadata = {
+            "total_time": time.time() - start_time,
+            "embedding_time": embedding_time,
+            "queries": len(queries),
+            "failed": sum(1 for result in results if "error" in result["metadata"]),
+            "concurrency": concurrency,
+            "max_query_time": max(query_times) if query_times else 0,
+            "sum_query_time": sum(query_times),
+            "trace": batch_trace.to_dict()
+        }
+        if batch_embedding_error:
+            metadata["batch_embedding_error"] = batch_embedding_error
+        
+        return {"results": results, "metadata": metadata}
+    
+    async def aquery_stream(
+        self,
+        query_text: str,
+        similarity_threshold: float = 0.1,
+        max_sources: int = 5,
+        shards: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Realiza una consulta al sistema RAG devolviendo la respuesta de forma incremental.
+        
+        Los eventos generados son, en orden: un evento ``sources`` con las fuentes
+        recuperadas, varios eventos ``token`` con fragmentos de la respuesta y un evento
+        final ``done`` con los metadatos (incluidos ``time_to_first_token``, ``query_time`` y
+        la traza de etapas). Si ocurre un error se emite un evento ``error`` en lugar de ``done``.
+        Las consultas idénticas simultáneas comparten una única generación.
+        
+        Args:
+            query_text: Texto de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar.
+            shards: Subconjunto de shards a consultar (con VECTOR_SHARDS). Si es None, todos.
             
-            # Buscar documentos relevantes
-            with self.performance_tracker.track("retrieve_documents"):
-                try:
-                    documents = self.vector_db.similarity_search_with_score(
-                        query_embedding=query_embedding,
-                        similarity_threshold=similarity_threshold,
-                        max_documents=max_sources
+        Yields:
+            Dict: Eventos de la respuesta con la clave ``type``.
+            
+        Raises:
+            ValueError: Si se solicitan shards que no existen.
+        """
+        shards = self.resolve_shards(shards)
+        if self.single_flight is None:
+            events = self._aquery_stream(query_text, similarity_threshold, max_sources, shards)
+        else:
+            key = self.single_flight.key(query_text, similarity_threshold, max_sources, shards)
+            events = self.single_flight.stream(
+                key, lambda: self._aquery_stream(query_text, similarity_threshold, max_sources, shards)
+            )
+        try:
+            async for event in events:
+                if self.query_log is not None and event["type"] in ("done", "error"):
+                    self.query_log.record(
+                        make_entry(query_text, similarity_threshold, max_sources, shards, event["metadata"], mode="stream")
                     )
-                except Exception as e:
-                    logger.error(f"Error al buscar documentos relevantes: {e}")
-                    error_stack = traceback.format_exc()
-                    logger.error(f"Stack trace: {error_stack}")
-                    raise ConnectionError(f"Error al buscar documentos en la base de datos: {str(e)}")
+                yield event
+        finally:
+            await events.aclose()
+    
+    async def _aquery_stream(
+        self,
+        query_text: str,
+        similarity_threshold: float,
+        max_sources: int,
+        shards: Optional[tuple] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Ejecuta el pipeline de una consulta en streaming (ver :meth:`aquery_stream`)."""
+        start_time = time.time()
+        # Cada paso del generador puede ejecutarse en un contexto distinto, así que la traza
+        # se activa solo alrededor de las etapas que no ceden el control al consumidor
+        trace = RequestTrace()
+        
+        try:
+            with self.performance_tracker.trace(trace), request_priority(PRIORITY_INTERACTIVE):
+                query_embedding = await self._aembed_query(query_text)
+            
+            cache_scope = (self.vector_db.collection_name, similarity_threshold, max_sources, shards)
+            cached_result = self._get_cached_result(query_embedding, cache_scope, start_time)
+            if cached_result is not None:
+                yield {"type": "sources", "sources": cached_result["sources"]}
+                yield {"type": "token", "content": cached_result["answer"]}
+                cached_result["metadata"]["time_to_first_token"] = time.time() - start_time
+                cached_result["metadata"]["trace"] = trace.to_dict()
+                yield {"type": "done", "metadata": cached_result["metadata"]}
+                return
+            
+            with self.performance_tracker.trace(trace), request_priority(PRIORITY_INTERACTIVE):
+                documents = await self._aretrieve_documents(
+                    query_embedding, similarity_threshold, max_sources, shards, query_text
+                )
             
             if not documents:
-                logger.info("No se encontraron documentos relevantes para la consulta.")
-                return {
-                    "answer": "No encontré información relevante para responder a tu pregunta. Por favor, intenta reformularla o consulta sobre otro tema.",
-                    "sources": [],
-                    "metadata": {
-                        "query_time": time.time() - start_time,
-                        "documents_retrieved": 0
-                    }
-                }
+                result = self._no_documents_result(start_time)
+                result["metadata"].update(self._retrieval_metadata(documents))
+                yield {"type": "sources", "sources": []}
+                yield {"type": "token", "content": result["answer"]}
+                result["metadata"]["time_to_first_token"] = time.time() - start_time
+                result["metadata"]["trace"] = trace.to_dict()
+                yield {"type": "done", "metadata": result["metadata"]}
+                return
             
-            # Preparar contexto para el LLM
-            with self.performance_tracker.track("prepare_context"):
-                context_docs = []
-                for doc, score in documents:
-                    context_docs.append(doc)
-                
-                # Crear texto de contexto
-                context_text = "\n\n".join([f"Documento: {i+1}\n{doc.page_content}" for i, doc in enumerate(context_docs)])
+            with self.performance_tracker.trace(trace):
+                context_text, context_docs, context_metadata = self._prepare_context(documents, query_text)
             
-            # Generar respuesta con el LLM
-            with self.performance_tracker.track("generate_response"):
+            sources = self._build_sources(context_docs)
+            yield {"type": "sources", "sources": sources}
+            
+            answer_parts = []
+            time_to_first_token = None
+            with self.performance_tracker.track("generate_response", trace=trace):
                 try:
-                    chain = self.prompt_template | self.llm
-                    response = chain.invoke({"context": context_text, "question": query_text})
-                    answer = response.content
+                    async for content in self._astream(
+                        context_text, query_text, context_metadata["prompt_tokens"], priority=PRIORITY_INTERACTIVE
+                    ):
+                        if time_to_first_token is None:
+                            time_to_first_token = time.time() - start_time
+                        answer_parts.append(content)
+                        yield {"type": "token", "content": content}
                 except Exception as e:
                     logger.error(f"Error al generar respuesta con el LLM: {e}")
+                    self._check_connection_error(e)
                     raise ValueError(f"Error al generar respuesta: {str(e)}")
             
-            # Preparar el resultado
-            result = {
-                "answer": answer,
-                "sources": [
+            metadata = {
+                "query_time": time.time() - start_time,
+                "time_to_first_token": time_to_first_token,
+                "documents_retrieved": len(documents),
+                "cached": False,
+                **context_metadata,
+                **self._retrieval_metadata(documents)
+            }
+            
+            if self.result_cache is not None and not metadata.get("partial"):
+                self.result_cache.put(
+                    query_embedding,
+                    cache_scope,
                     {
-                        "content": doc.page_content,
-                        "metadata": doc.metadata,
-                        "similarity": score
+                        "answer": "".join(answer_parts),
+                        "sources": sources,
+                        "metadata": {key: value for key, value in metadata.items() if key != "time_to_first_token"}
                     }
-                    for doc, score in documents
-                ],
-                "metadata": {
-                    "query_time": time.time() - start_time,
-                    "documents_retrieved": len(documents)
-                }
-            }
+                )
             
-            return result
+            metadata["trace"] = trace.to_dict()
+            yield {"type": "done", "metadata": metadata}
             
         except Exception as e:
-            logger.error(f"Error al procesar la consulta: {e}")
-            error_stack = traceback.format_exc()
-            logger.error(f"Stack trace: {error_stack}")
-            return {
-                "answer": f"Lo siento, ha ocurrido un error al procesar tu consulta: {str(e)}",
-                "sources": [],
-                "metadata": {
-                    "error": str(e),
-                    "error_stack": error_stack,
-                    "query_time": time.time() - start_time
-                }
-            } 
\ No newline at end of file
+            result = self._error_result(e, start_time)
+            result["metadata"]["trace"] = trace.to_dict()
+            yield {"type": "error", "error": str(e), "metadata": result["metadata"]}
+    
+    def query(
+        self,
+        query_text: str,
+        similarity_threshold: float = 0.1,
+        max_sources: int = 5,
+        shards: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Realiza una consulta al sistema RAG.
+        
+        Envoltorio síncrono de :meth:`aquery` que se ejecuta en el bucle de eventos del sistema.
+        
+        Args:
+            query_text: Texto de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar.
+            shards: Subconjunto de shards a consultar (con VECTOR_SHARDS). Si es None, todos.
+            
+        Returns:
+            Dict: Resultado de la consulta, incluyendo la respuesta y las fuentes.
+        """
+        return self.event_loop.run(self.aquery(query_text, similarity_threshold, max_sources, shards))
+    
+    def query_stream(
+        self,
+        query_text: str,
+        similarity_threshold: float = 0.1,
+        max_sources: int = 5,
+        shards: Optional[List[str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Realiza una consulta al sistema RAG devolviendo la respuesta de forma incremental.
+        
+        Envoltorio síncrono de :meth:`aquery_stream`.
+        
+        Args:
+            query_text: Texto de la consulta.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar.
+            shards: Subconjunto de shards a consultar (con VECTOR_SHARDS). Si es None, todos.
+            
+        Yields:
+            Dict: Eventos de la respuesta con la clave ``type``.
+        """
+        return self.event_loop.iterate(self.aquery_stream(query_text, similarity_threshold, max_sources, shards))
+    
+    def query_batch(
+        self,
+        queries: List[str],
+        similarity_threshold: float = 0.1,
+        max_sources: int = 5,
+        concurrency: int = BATCH_CONCURRENCY,
+        shards: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Realiza varias consultas al sistema RAG.
+        
+        Envoltorio síncrono de :meth:`aquery_batch`.
+        
+        Args:
+            queries: Textos de las consultas.
+            similarity_threshold: Umbral de similitud para incluir documentos.
+            max_sources: Número máximo de fuentes a recuperar por consulta.
+            concurrency: Número máximo de consultas procesándose a la vez.
+            shards: Subconjunto de shards a consultar (con VECTOR_SHARDS). Si es None, todos.
+            
+        Returns:
+            Dict: Resultados por consulta y tiempos agregados.
+        """
+        return self.event_loop.run(self.aquery_batch(queries, similarity_threshold, max_sources, concurrency, shards))
+    
+    def close(self):
+        """Detiene el bucle de eventos del sistema y libera los recursos de la búsqueda repartida."""
+        self.event_loop.close()
+        if self.vector_db.backend == "sharded":
+            self.vector_db.close()
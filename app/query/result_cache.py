@@ -0,0 +1,217 @@
+"""
+Caché semántica de resultados de consultas.
+Este módulo permite reutilizar respuestas de preguntas casi idénticas comparando los
+embeddings de las consultas con una matriz float32 en memoria.
+"""
+
+import copy
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config.settings import (
+    RESULT_CACHE_ENABLED,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+    RESULT_CACHE_SIMILARITY_THRESHOLD
+)
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class SemanticResultCache:
+    """Caché de resultados indexada por similitud coseno entre embeddings de consultas.
+
+    Los embeddings se guardan normalizados en una matriz de capacidad fija, de modo que
+    la búsqueda del vecino más cercano es un único producto matriz-vector.
+    """
+
+    def __init__(
+        self,
+        capacity: int = RESULT_CACHE_SIZE,
+        similarity_threshold: float = RESULT_CACHE_SIMILARITY_THRESHOLD,
+        ttl: float = RESULT_CACHE_TTL
+    ):
+        """Inicializa la caché semántica.
+
+        Args:
+            capacity: Número máximo de resultados almacenados.
+            similarity_threshold: Similitud coseno mínima para considerar un acierto.
+            ttl: Tiempo de vida de cada entrada en segundos (0 para no expirar).
+        """
+        self.capacity = capacity
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._valid = np.zeros(capacity, dtype=bool)
+        self._stored_at = np.zeros(capacity, dtype=np.float64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._scopes: List[Optional[Tuple]] = [None] * capacity
+        self._results: List[Optional[Dict[str, Any]]] = [None] * capacity
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(embedding) -> Optional[np.ndarray]:
+        """Convierte un embedding en un vector float32 de norma unitaria.
+
+        Args:
+            embedding: Vector de embedding.
+
+        Returns:
+            Optional[np.ndarray]: Vector normalizado o None si su norma es cero.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        return vector / norm
+
+    def _expire(self, now: float):
+        """Invalida las entradas cuyo tiempo de vida ha vencido."""
+        if not self.ttl:
+            return
+        expired = self._valid & (now - self._stored_at > self.ttl)
+        count = int(expired.sum())
+        if count:
+            self._valid[expired] = False
+            for slot in np.flatnonzero(expired):
+                self._results[slot] = None
+                self._scopes[slot] = None
+            self.expirations += count
+
+    def get(self, embedding, scope: Tuple) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Busca el resultado de la consulta más parecida.
+
+        Args:
+            embedding: Embedding de la consulta.
+            scope: Ámbito de validez (colección y parámetros de búsqueda).
+
+        Returns:
+            Optional[Tuple[Dict, float]]: Copia del resultado almacenado y su similitud,
+                                          o None si no hay ninguna entrada suficientemente parecida.
+        """
+        query = self._normalize(embedding)
+
+        with self._lock:
+            if query is None or self._matrix is None or query.shape[0] != self._matrix.shape[1]:
+                self.misses += 1
+                return None
+
+            now = time.monotonic()
+            self._expire(now)
+
+            candidates = self._valid.copy()
+            for slot in np.flatnonzero(candidates):
+                if self._scopes[slot] != scope:
+                    candidates[slot] = False
+
+            if not candidates.any():
+                self.misses += 1
+                return None
+
+            similarities = self._matrix @ query
+            similarities[~candidates] = -np.inf
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+
+            if similarity < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            self._last_used[best] = now
+            self.hits += 1
+            return copy.deepcopy(self._results[best]), similarity
+
+    def put(self, embedding, scope: Tuple, result: Dict[str, Any]):
+        """Almacena un resultado, expulsando la entrada menos usada si la caché está llena.
+
+        Args:
+            embedding: Embedding de la consulta.
+            scope: Ámbito de validez (colección y parámetros de búsqueda).
+            result: Resultado de la consulta.
+        """
+        if self.capacity <= 0:
+            return
+
+        vector = self._normalize(embedding)
+        if vector is None:
+            return
+
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                self._matrix = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._valid[:] = False
+
+            now = time.monotonic()
+            self._expire(now)
+
+            free_slots = np.flatnonzero(~self._valid)
+            if free_slots.size:
+                slot = int(free_slots[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self.evictions += 1
+
+            self._matrix[slot] = vector
+            self._valid[slot] = True
+            self._stored_at[slot] = now
+            self._last_used[slot] = now
+            self._scopes[slot] = scope
+            self._results[slot] = copy.deepcopy(result)
+
+    def invalidate(self, collection_name: Optional[str] = None):
+        """Invalida las entradas de una colección o toda la caché.
+
+        Args:
+            collection_name: Colección cuyas entradas se descartan. Si es None, se vacía la caché.
+        """
+        with self._lock:
+            for slot in np.flatnonzero(self._valid):
+                scope = self._scopes[slot]
+                if collection_name is None or (scope and scope[0] == collection_name):
+                    self._valid[slot] = False
+                    self._results[slot] = None
+                    self._scopes[slot] = None
+
+    def get_stats(self) -> Dict[str, int]:
+        """Obtiene los contadores de la caché.
+
+        Returns:
+            Dict[str, int]: Aciertos, fallos, expulsiones, expiraciones y tamaño actual.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": int(self._valid.sum())
+            }
+
+_result_cache: Optional[SemanticResultCache] = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache() -> Optional[SemanticResultCache]:
+    """Obtiene la caché semántica de resultados compartida por el proceso.
+
+    Returns:
+        Optional[SemanticResultCache]: Caché compartida o None si está desactivada.
+    """
+    global _result_cache
+
+    if not RESULT_CACHE_ENABLED:
+        return None
+
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = SemanticResultCache()
+        return _result_cache
@@ -0,0 +1,201 @@
+"""
+Agrupación de consultas idénticas en curso (single-flight).
+Cuando llegan a la vez varias consultas iguales, solo la primera ejecuta el pipeline
+(embedding, búsqueda y generación); el resto espera y comparte su resultado. Funciona
+tanto para consultas completas como para respuestas en streaming, en cuyo caso los
+eventos se reenvían a todos los consumidores a medida que se generan.
+
+Todas las operaciones deben ejecutarse en el mismo bucle de eventos (el del sistema RAG).
+"""
+
+import asyncio
+import copy
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.utils.performance_metrics import performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def normalize_query(query_text: str) -> str:
+    """Normaliza el texto de una consulta para compararla con otras (espacios y mayúsculas).
+
+    Args:
+        query_text: Texto de la consulta.
+
+    Returns:
+        str: Texto con los espacios colapsados y en minúsculas.
+    """
+    return " ".join(query_text.split()).casefold()
+
+def _copy_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia un evento para un consumidor: los tokens son pequeños, el resto se copia en profundidad."""
+    return dict(event) if event.get("type") == "token" else copy.deepcopy(event)
+
+class _Call:
+    """Consulta completa en curso."""
+
+    __slots__ = ("task", "followers")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.followers = 0
+
+class _StreamFlight:
+    """Respuesta en streaming en curso, con los eventos ya producidos para los consumidores tardíos."""
+
+    def __init__(self, source: AsyncIterator[Dict[str, Any]], on_finish: Callable[["_StreamFlight"], None]):
+        """Arranca la tarea que consume el generador original.
+
+        Args:
+            source: Generador de eventos de la consulta.
+            on_finish: Función a llamar cuando el flujo termina o se cancela.
+        """
+        self.events: List[Dict[str, Any]] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._on_finish = on_finish
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._produce(source))
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _produce(self, source: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for event in source:
+                self.events.append(event)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            self._on_finish(self)
+
+    async def subscribe(self, follower: bool) -> AsyncIterator[Dict[str, Any]]:
+        """Reproduce los eventos ya producidos y los siguientes a medida que llegan.
+
+        Si todos los consumidores abandonan la respuesta antes de que termine, la
+        generación se cancela.
+
+        Args:
+            follower: Si el consumidor se ha unido a una consulta ya en curso.
+
+        Yields:
+            Dict[str, Any]: Copia de cada evento de la respuesta.
+        """
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.events):
+                    event = _copy_event(self.events[index])
+                    index += 1
+                    if follower and event.get("type") in ("done", "error"):
+                        event.setdefault("metadata", {})["coalesced"] = True
+                    yield event
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                logger.debug("Todos los consumidores abandonaron la respuesta; se cancela la generación")
+                self.task.cancel()
+                self._on_finish(self)
+
+class SingleFlight:
+    """Agrupa las consultas idénticas que se solapan en el tiempo."""
+
+    def __init__(self):
+        """Inicializa los registros de consultas en curso."""
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _StreamFlight] = {}
+
+    @staticmethod
+    def key(query_text: str, *parameters: Hashable) -> Tuple:
+        """Construye la clave de una consulta: texto normalizado y parámetros de búsqueda.
+
+        Args:
+            query_text: Texto de la consulta.
+            *parameters: Parámetros que cambian el resultado (umbral, número de fuentes...).
+
+        Returns:
+            Tuple: Clave de agrupación.
+        """
+        return (normalize_query(query_text),) + parameters
+
+    def in_flight(self) -> int:
+        """Número de consultas distintas en curso."""
+        return len(self._calls) + len(self._streams)
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Ejecuta la consulta o, si ya hay una idéntica en curso, espera su resultado.
+
+        La consulta se ejecuta en una tarea propia, de modo que cancelar a quien la inició
+        no afecta a los que esperan.
+
+        Args:
+            key: Clave de agrupación (ver :meth:`key`).
+            factory: Función que crea la corrutina de la consulta.
+
+        Returns:
+            Tuple[Any, bool]: Resultado (una copia propia si se comparte) e indicador de si
+                              se ha reutilizado una consulta en curso.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            call.followers += 1
+            performance_tracker.increment("requests_coalesced", mode="query")
+            result = await asyncio.shield(call.task)
+            return copy.deepcopy(result), True
+
+        call = _Call(asyncio.ensure_future(factory()))
+        self._calls[key] = call
+
+        def finish(_):
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+        call.task.add_done_callback(finish)
+        result = await asyncio.shield(call.task)
+        # Quien inició la consulta también recibe una copia si otros la comparten
+        return (copy.deepcopy(result) if call.followers else result), False
+
+    async def stream(self, key: Hashable, factory: Callable[[], AsyncIterator[Dict[str, Any]]]) -> AsyncIterator[Dict[str, Any]]:
+        """Consume una respuesta en streaming compartida con las consultas idénticas en curso.
+
+        Args:
+            key: Clave de agrupación (ver :meth:`key`).
+            factory: Función que crea el generador de eventos de la consulta.
+
+        Yields:
+            Dict[str, Any]: Eventos de la respuesta; el evento final de los consumidores
+                            agrupados lleva ``metadata["coalesced"] = True``.
+        """
+        flight = self._streams.get(key)
+        follower = flight is not None
+        if follower:
+            performance_tracker.increment("requests_coalesced", mode="stream")
+        else:
+            def finish(finished: _StreamFlight):
+                if self._streams.get(key) is finished:
+                    del self._streams[key]
+
+            flight = _StreamFlight(factory(), finish)
+            self._streams[key] = flight
+
+        subscription = flight.subscribe(follower)
+        try:
+            async for event in subscription:
+                yield event
+        finally:
+            await subscription.aclose()
@@ -0,0 +1,144 @@
+"""
+Registro de instancias del sistema RAG.
+Este módulo mantiene una instancia de RAGQuerySystem por proceso para reutilizarla
+entre invocaciones "calientes" de la función serverless.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, Optional, Tuple
+
+from app.config import settings
+
+if TYPE_CHECKING:
+    from app.query.rag_query import RAGQuerySystem
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+class RAGSystemRegistry:
+    """Clase para reutilizar una instancia de RAGQuerySystem entre solicitudes.
+
+    Las solicitudes toman el sistema con :meth:`acquire`, que lleva la cuenta de las que lo
+    están usando. Cuando el sistema se reconstruye (tras un error de conexión) o se descarta,
+    el anterior se retira y solo se cierra cuando termina la última solicitud que lo usaba.
+    """
+
+    def __init__(self):
+        """Inicializa el registro vacío; el sistema se construye en la primera solicitud."""
+        self._lock = threading.Lock()
+        self._system: Optional["RAGQuerySystem"] = None
+        # Solicitudes en curso por sistema (clave: id del sistema) y sistemas retirados pendientes de cierre
+        self._leases: Dict[int, int] = {}
+        self._retired: Dict[int, "RAGQuerySystem"] = {}
+        self.builds = 0
+        self.last_build_time = 0.0
+
+    def _build(self) -> "RAGQuerySystem":
+        """Construye el sistema RAG con la configuración cargada al iniciar el proceso."""
+        start_time = time.perf_counter()
+        # Importación diferida: el endpoint no carga OpenAI, NumPy ni Supabase hasta la primera consulta
+        from app.query.rag_query import RAGQuerySystem
+        system = RAGQuerySystem(
+            model_name=settings.LLM_MODEL,
+            api_key=settings.OPENAI_API_KEY,
+            embedding_model=settings.EMBEDDING_MODEL,
+            collection_name=settings.SUPABASE_COLLECTION_NAME,
+            supabase_url=settings.SUPABASE_URL,
+            supabase_key=settings.SUPABASE_KEY,
+            vector_backend=settings.VECTOR_BACKEND,
+            local_index_dir=settings.LOCAL_INDEX_DIR,
+            vector_shards=settings.VECTOR_SHARDS
+        )
+        self.last_build_time = time.perf_counter() - start_time
+        self.builds += 1
+        logger.info(f"Sistema RAG construido en {self.last_build_time:.4f} segundos")
+        return system
+
+    def _retire(self, system: "RAGQuerySystem") -> Optional["RAGQuerySystem"]:
+        """Retira un sistema sustituido; debe llamarse con el candado tomado.
+
+        Returns:
+            Optional[RAGQuerySystem]: El sistema, si ya no lo usa ninguna solicitud y debe
+                                      cerrarse; None si se cerrará al terminar la última.
+        """
+        if self._leases.get(id(system)):
+            self._retired[id(system)] = system
+            return None
+        return system
+
+    def _get(self, lease: bool) -> Tuple["RAGQuerySystem", bool]:
+        """Obtiene el sistema actual, reconstruyéndolo si no existe o no está saludable."""
+        previous_system = None
+        with self._lock:
+            system = self._system
+            warm_start = system is not None and system.healthy
+            if not warm_start:
+                if system is not None:
+                    logger.info("Reconstruyendo el sistema RAG tras un error de conexión")
+                    previous_system = self._retire(system)
+                system = self._system = self._build()
+            if lease:
+                self._leases[id(system)] = self._leases.get(id(system), 0) + 1
+
+        # El cierre puede esperar a la limpieza del bucle de eventos: fuera del candado
+        if previous_system is not None:
+            previous_system.close()
+        return system, warm_start
+
+    def _release(self, system: "RAGQuerySystem"):
+        """Marca el fin de una solicitud y cierra el sistema si estaba retirado y era la última."""
+        with self._lock:
+            remaining = self._leases.get(id(system), 0) - 1
+            if remaining > 0:
+                self._leases[id(system)] = remaining
+                return
+            self._leases.pop(id(system), None)
+            retired = self._retired.pop(id(system), None)
+        if retired is not None:
+            retired.close()
+
+    @contextmanager
+    def acquire(self) -> Iterator[Tuple["RAGQuerySystem", bool]]:
+        """Toma el sistema RAG durante una solicitud, construyéndolo solo si es necesario.
+
+        El sistema se reconstruye si se marcó como no saludable tras un error de conexión;
+        el anterior no se cierra mientras alguna solicitud lo siga usando.
+
+        Yields:
+            Tuple[RAGQuerySystem, bool]: Sistema RAG e indicador de si se reutilizó
+                                         una instancia existente (arranque en caliente).
+        """
+        system, warm_start = self._get(lease=True)
+        try:
+            yield system, warm_start
+        finally:
+            self._release(system)
+
+    def get_system(self) -> Tuple["RAGQuerySystem", bool]:
+        """Obtiene el sistema RAG sin registrar su uso.
+
+        Pensado para scripts con un solo usuario (benchmarks); los manejadores de la API deben
+        usar :meth:`acquire` para que el sistema no se cierre mientras atienden la solicitud.
+
+        Returns:
+            Tuple[RAGQuerySystem, bool]: Sistema RAG e indicador de si se reutilizó
+                                         una instancia existente (arranque en caliente).
+        """
+        return self._get(lease=False)
+
+    def invalidate(self):
+        """Descarta la instancia actual para forzar su reconstrucción.
+
+        Si alguna solicitud la está usando, se cierra cuando termine la última.
+        """
+        with self._lock:
+            previous_system = self._retire(self._system) if self._system is not None else None
+            self._system = None
+        if previous_system is not None:
+            previous_system.close()
+
+# Instancia global del registro de sistemas RAG
+rag_system_registry = RAGSystemRegistry()
@@ -0,0 +1,425 @@
+"""
+Control de admisión frente a los servicios remotos.
+Este módulo limita el ritmo de las llamadas a OpenAI (embeddings y chat) y a Supabase con
+cubetas de tokens (peticiones y tokens por minuto), ordena las esperas en una cola acotada
+con prioridades, reintenta los errores transitorios con esperas aleatorias que respetan
+``Retry-After`` y rechaza de inmediato el trabajo que no cabe, para que la API pueda
+responder 429/503 en lugar de acumular peticiones que acabarían fallando.
+
+Los limitadores están ligados al bucle de eventos del sistema RAG que los crea.
+"""
+
+import asyncio
+import contextvars
+import email.utils
+import heapq
+import itertools
+import logging
+import math
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+from openai import APIConnectionError, APIStatusError
+
+from app.config.settings import (
+    OPENAI_EMBEDDING_RPM,
+    OPENAI_EMBEDDING_TPM,
+    OPENAI_CHAT_RPM,
+    OPENAI_CHAT_TPM,
+    SUPABASE_RPM,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MAX_WAIT,
+    UPSTREAM_MAX_RETRIES,
+    UPSTREAM_RETRY_BASE_DELAY,
+    UPSTREAM_RETRY_MAX_DELAY
+)
+from app.utils.performance_metrics import performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Prioridades (menor valor, antes se atiende)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BATCH = 2
+
+# Códigos HTTP que justifican un reintento (0: error de conexión o tiempo agotado)
+RETRYABLE_STATUS = {0, 408, 409, 429, 500, 502, 503, 504}
+
+_request_priority: contextvars.ContextVar = contextvars.ContextVar("request_priority", default=PRIORITY_NORMAL)
+
+@contextmanager
+def request_priority(priority: int):
+    """Fija la prioridad de las llamadas remotas realizadas dentro del bloque.
+
+    Como la traza de rendimiento, no debe envolver un ``yield`` de un generador asíncrono.
+
+    Args:
+        priority: ``PRIORITY_INTERACTIVE``, ``PRIORITY_NORMAL`` o ``PRIORITY_BATCH``.
+    """
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+class UpstreamOverloadedError(Exception):
+    """El trabajo se rechaza porque el servicio remoto (o la cola local) está saturado."""
+
+    def __init__(self, message: str, upstream: str, retry_after: float, status: int = 503):
+        """Inicializa el error.
+
+        Args:
+            message: Descripción del error.
+            upstream: Servicio remoto afectado.
+            retry_after: Segundos recomendados antes de reintentar.
+            status: Código HTTP con el que responder (503 por cola llena, 429 por límite remoto).
+        """
+        super().__init__(message)
+        self.upstream = upstream
+        self.retry_after = retry_after
+        self.status = status
+
+    @property
+    def retry_after_header(self) -> str:
+        """Valor de la cabecera ``Retry-After`` (segundos enteros)."""
+        return str(max(1, math.ceil(self.retry_after)))
+
+def find_overload(error: Optional[BaseException]) -> Optional[UpstreamOverloadedError]:
+    """Busca un :class:`UpstreamOverloadedError` en la cadena de causas de una excepción.
+
+    Args:
+        error: Excepción capturada.
+
+    Returns:
+        Optional[UpstreamOverloadedError]: Error de saturación o None.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, UpstreamOverloadedError):
+            return error
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return None
+
+def parse_retry_after(headers) -> Optional[float]:
+    """Obtiene la espera indicada por el servidor (``retry-after-ms`` o ``Retry-After``).
+
+    Args:
+        headers: Cabeceras de la respuesta.
+
+    Returns:
+        Optional[float]: Segundos de espera o None si no se indican.
+    """
+    if headers is None:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def upstream_error_info(error: BaseException) -> Tuple[Optional[int], Optional[float]]:
+    """Identifica si un error (o su causa) es transitorio.
+
+    Args:
+        error: Excepción capturada.
+
+    Returns:
+        Tuple[Optional[int], Optional[float]]: Código HTTP (0 para errores de conexión, None si
+                                               no es un error remoto) y espera indicada por el servidor.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, APIStatusError):
+            return error.status_code, parse_retry_after(error.response.headers)
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code, parse_retry_after(error.response.headers)
+        if isinstance(error, (APIConnectionError, httpx.TransportError)):
+            return 0, None
+        error = error.__cause__ or error.__context__
+    return None, None
+
+class TokenBucket:
+    """Cubeta de tokens con reposición continua."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        """Inicializa la cubeta llena.
+
+        Args:
+            per_minute: Unidades repuestas por minuto.
+            burst_seconds: Segundos de reposición que caben en la cubeta (ráfaga máxima).
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Segundos hasta que haya ``amount`` unidades disponibles (0 si ya las hay)."""
+        self._refill(now)
+        # Una petición mayor que la ráfaga se limita a la capacidad para que no espere siempre
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        """Descuenta unidades (puede dejar la cubeta en negativo si la petición supera la ráfaga)."""
+        self.tokens -= amount
+
+class UpstreamLimiter:
+    """Limitador de un servicio remoto: cubetas de peticiones y tokens y cola con prioridades."""
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        max_wait: float = ADMISSION_MAX_WAIT
+    ):
+        """Inicializa el limitador.
+
+        Args:
+            name: Nombre del servicio remoto (para métricas y errores).
+            requests_per_minute: Peticiones por minuto (0 sin límite).
+            tokens_per_minute: Tokens por minuto (0 sin límite).
+            max_queue: Peticiones que pueden esperar a la vez; las siguientes se rechazan.
+            max_wait: Espera máxima en la cola antes de rechazar la petición.
+        """
+        self.name = name
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.paused_until = 0.0
+        self.waiting = 0
+        self._queue: list = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        wait = self.paused_until - now
+        if self.request_bucket is not None:
+            wait = max(wait, self.request_bucket.wait_time(1, now))
+        if self.token_bucket is not None:
+            wait = max(wait, self.token_bucket.wait_time(tokens, now))
+        return max(0.0, wait)
+
+    def _dispatch(self):
+        """Da paso a las peticiones de la cola por orden de prioridad mientras haya capacidad."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queue:
+            _, _, tokens, future = self._queue[0]
+            if future.done():
+                # La petición dejó de esperar (tiempo agotado o cancelación)
+                heapq.heappop(self._queue)
+                continue
+            now = time.monotonic()
+            wait = self._wait_time(tokens, now)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._queue)
+            if self.request_bucket is not None:
+                self.request_bucket.consume(1)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(tokens)
+            future.set_result(None)
+
+    def saturated(self) -> bool:
+        """Indica si la cola está llena."""
+        return self.waiting >= self.max_queue
+
+    def estimate_wait(self) -> float:
+        """Estimación de la espera de una petición nueva, para la cabecera ``Retry-After``."""
+        wait = max(0.0, self.paused_until - time.monotonic())
+        if self.request_bucket is not None:
+            wait += (self.waiting + 1) / self.request_bucket.rate
+        return min(max(wait, 1.0), 60.0)
+
+    def pause(self, seconds: float):
+        """Detiene las llamadas durante el tiempo indicado por el servicio (``Retry-After``).
+
+        Args:
+            seconds: Segundos de pausa.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logger.warning(f"Llamadas a '{self.name}' en pausa durante {seconds:.1f} segundos")
+
+    def _overloaded(self, reason: str) -> UpstreamOverloadedError:
+        performance_tracker.increment("admission_rejected", upstream=self.name, reason=reason)
+        return UpstreamOverloadedError(
+            f"Servicio '{self.name}' saturado ({reason}); inténtalo de nuevo más tarde",
+            upstream=self.name,
+            retry_after=self.estimate_wait()
+        )
+
+    async def acquire(self, tokens: float = 1, priority: int = PRIORITY_NORMAL):
+        """Espera turno para una llamada.
+
+        Args:
+            tokens: Tokens estimados de la llamada.
+            priority: Prioridad de la llamada.
+
+        Raises:
+            UpstreamOverloadedError: Si la cola está llena o la espera supera ``max_wait``.
+        """
+        now = time.monotonic()
+        if not self._queue and self._wait_time(tokens, now) == 0:
+            # Camino rápido: hay capacidad y nadie esperando
+            if self.request_bucket is not None:
+                self.request_bucket.consume(1)
+            if self.token_bucket is not None:
+                self.token_bucket.consume(tokens)
+            return
+
+        if self.saturated():
+            raise self._overloaded("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (priority, next(self._sequence), tokens, future))
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            self._dispatch()
+            await asyncio.wait_for(future, self.max_wait)
+        except asyncio.TimeoutError:
+            raise self._overloaded("wait_timeout") from None
+        finally:
+            self.waiting -= 1
+            performance_tracker.record(f"admission_wait_{self.name}", time.perf_counter() - start, start=start)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estado del limitador."""
+        return {
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+            "paused_for": max(0.0, self.paused_until - time.monotonic())
+        }
+
+class AdmissionController:
+    """Planificador de las llamadas a los servicios remotos de un sistema RAG."""
+
+    def __init__(
+        self,
+        limiters: Optional[Dict[str, UpstreamLimiter]] = None,
+        max_retries: int = UPSTREAM_MAX_RETRIES,
+        base_delay: float = UPSTREAM_RETRY_BASE_DELAY,
+        max_delay: float = UPSTREAM_RETRY_MAX_DELAY
+    ):
+        """Inicializa el planificador.
+
+        Args:
+            limiters: Limitador por servicio. Si no se proporciona, se crean los de
+                      ``embeddings``, ``chat`` y ``retrieval`` a partir de la configuración.
+            max_retries: Reintentos por llamada ante errores transitorios.
+            base_delay: Espera base del primer reintento (se duplica en cada intento).
+            max_delay: Espera máxima entre reintentos.
+        """
+        self.limiters = limiters if limiters is not None else {
+            "embeddings": UpstreamLimiter("embeddings", OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM),
+            "chat": UpstreamLimiter("chat", OPENAI_CHAT_RPM, OPENAI_CHAT_TPM),
+            "retrieval": UpstreamLimiter("retrieval", SUPABASE_RPM)
+        }
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def check(self):
+        """Rechaza de inmediato el trabajo nuevo si alguna cola está llena.
+
+        Raises:
+            UpstreamOverloadedError: Si algún servicio está saturado.
+        """
+        for limiter in self.limiters.values():
+            if limiter.saturated():
+                raise limiter._overloaded("shed")
+
+    def _backoff(self, attempt: int) -> float:
+        """Espera aleatoria del reintento (jitter completo sobre un crecimiento exponencial)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(
+        self,
+        upstream: str,
+        factory: Callable[[], Awaitable[Any]],
+        tokens: float = 1,
+        priority: Optional[int] = None
+    ) -> Any:
+        """Ejecuta una llamada remota respetando los límites y reintentando los errores transitorios.
+
+        Args:
+            upstream: Servicio remoto (``embeddings``, ``chat`` o ``retrieval``).
+            factory: Función que crea la corrutina de la llamada (una nueva por intento).
+            tokens: Tokens estimados de la llamada.
+            priority: Prioridad. Si no se proporciona, se usa la fijada con :func:`request_priority`.
+
+        Returns:
+            Any: Resultado de la llamada.
+
+        Raises:
+            UpstreamOverloadedError: Si no hay capacidad o el servicio sigue limitando tras los reintentos.
+        """
+        limiter = self.limiters.get(upstream)
+        priority = _request_priority.get() if priority is None else priority
+        attempt = 0
+        while True:
+            if limiter is not None:
+                await limiter.acquire(tokens, priority)
+            try:
+                return await factory()
+            except Exception as e:
+                status, retry_after = upstream_error_info(e)
+                if status not in RETRYABLE_STATUS:
+                    raise
+                if status == 429 and limiter is not None:
+                    limiter.pause(retry_after if retry_after is not None else self._backoff(attempt))
+
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                max_wait = limiter.max_wait if limiter is not None else ADMISSION_MAX_WAIT
+                if attempt >= self.max_retries or delay > max_wait:
+                    if status == 429:
+                        performance_tracker.increment("admission_rejected", upstream=upstream, reason="rate_limited")
+                        raise UpstreamOverloadedError(
+                            f"Límite de peticiones de '{upstream}' alcanzado; inténtalo de nuevo más tarde",
+                            upstream=upstream,
+                            retry_after=delay,
+                            status=429
+                        ) from e
+                    raise
+
+                attempt += 1
+                performance_tracker.increment("upstream_retries", upstream=upstream, status=str(status))
+                logger.warning(
+                    f"Error transitorio en '{upstream}' (estado {status}); reintento {attempt} "
+                    f"de {self.max_retries} en {delay:.2f} segundos"
+                )
+                await asyncio.sleep(delay)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de los limitadores."""
+        return {name: limiter.get_stats() for name, limiter in self.limiters.items()}
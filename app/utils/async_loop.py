@@ -0,0 +1,148 @@
+"""
+Bucle de eventos en segundo plano.
+Este módulo permite ejecutar corrutinas desde código síncrono manteniendo un único
+bucle de eventos persistente, de modo que los clientes asíncronos (OpenAI, Supabase)
+se reutilizan entre llamadas.
+"""
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class BackgroundEventLoop:
+    """Clase para ejecutar corrutinas en un bucle de eventos que vive en un hilo propio."""
+
+    def __init__(self, name: str = "raglec-event-loop"):
+        """Inicializa el bucle; el hilo se arranca en el primer uso.
+
+        Args:
+            name: Nombre del hilo del bucle de eventos.
+        """
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._active_calls = 0
+        self._closing = False
+        self._shutdown_callbacks: List[Callable[[], Awaitable[Any]]] = []
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        """Arranca el hilo del bucle si todavía no está en marcha.
+
+        Returns:
+            asyncio.AbstractEventLoop: Bucle de eventos en ejecución.
+        """
+        with self._lock:
+            self._active_calls += 1
+            if self._loop is None or self._loop.is_closed():
+                self._closing = False
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name=self.name, daemon=True)
+                self._thread.start()
+                logger.debug(f"Bucle de eventos '{self.name}' iniciado")
+            return self._loop
+
+    def _release(self):
+        """Marca el fin de una llamada y detiene el bucle si estaba pendiente de cierre."""
+        with self._lock:
+            self._active_calls -= 1
+            should_stop = self._closing and self._active_calls == 0
+        if should_stop:
+            self._stop()
+
+    def run(self, coroutine: Awaitable[Any]) -> Any:
+        """Ejecuta una corrutina en el bucle y espera su resultado.
+
+        Args:
+            coroutine: Corrutina a ejecutar.
+
+        Returns:
+            Any: Resultado de la corrutina.
+        """
+        loop = self._ensure_started()
+        try:
+            return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+        finally:
+            self._release()
+
+    def submit(self, coroutine: Awaitable[Any]) -> Future:
+        """Lanza una corrutina en el bucle sin esperar su resultado.
+
+        El bucle no se detiene mientras la corrutina siga en curso.
+
+        Args:
+            coroutine: Corrutina a ejecutar.
+
+        Returns:
+            Future: Futuro con el resultado de la corrutina.
+        """
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(coroutine, loop)
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def add_shutdown_callback(self, callback: Callable[[], Awaitable[Any]]):
+        """Registra una corrutina de limpieza que se ejecuta en el bucle antes de detenerlo.
+
+        Args:
+            callback: Función que devuelve la corrutina de limpieza (por ejemplo, cerrar clientes).
+        """
+        self._shutdown_callbacks.append(callback)
+
+    def iterate(self, async_iterator: AsyncIterator[Any]) -> Iterator[Any]:
+        """Consume un iterador asíncrono desde código síncrono.
+
+        Args:
+            async_iterator: Generador asíncrono a consumir.
+
+        Yields:
+            Any: Elementos producidos por el generador asíncrono.
+        """
+        loop = self._ensure_started()
+        try:
+            while True:
+                try:
+                    item = asyncio.run_coroutine_threadsafe(async_iterator.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            # Cerrar el generador asíncrono si el consumidor abandona la iteración
+            aclose = getattr(async_iterator, "aclose", None)
+            if aclose is not None and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(aclose(), loop).result()
+            self._release()
+
+    def close(self):
+        """Detiene el bucle de eventos y su hilo en cuanto terminen las llamadas en curso."""
+        with self._lock:
+            self._closing = True
+            if self._active_calls:
+                return
+        self._stop()
+
+    def _stop(self):
+        """Detiene el bucle de eventos y su hilo."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+
+        if loop is None:
+            return
+
+        if thread is not threading.current_thread():
+            for callback in self._shutdown_callbacks:
+                try:
+                    asyncio.run_coroutine_threadsafe(callback(), loop).result(timeout=5)
+                except Exception as e:
+                    logger.warning(f"Error en la limpieza del bucle de eventos '{self.name}': {e}")
+
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        loop.close()
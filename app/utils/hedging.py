@@ -0,0 +1,231 @@
+"""
+Peticiones de respaldo (hedging) para las llamadas idempotentes.
+Si una llamada a un servicio remoto no ha terminado tras un retardo adaptativo (un percentil
+alto de las latencias recientes de ese servicio), se lanza una copia y se usa la respuesta
+que llegue antes; la otra se cancela. Un presupuesto global limita las copias a una fracción
+de las llamadas para no multiplicar la carga cuando el servicio entero va lento.
+
+Cada copia pasa por separado por el planificador de admisión (consume sus propios tokens
+de RPM/TPM), y las latencias se miden desde el inicio de la llamada, de modo que una copia
+ganadora no acorta artificialmente el retardo. La tasa de copias, el retardo actual y las
+latencias de las llamadas con y sin copia se publican en /api/metrics.
+
+Como los limitadores de admisión, el planificador está ligado al bucle de eventos del
+sistema RAG que lo crea.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from app.config.settings import (
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_DELAY,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_WINDOW,
+    HEDGE_BUDGET
+)
+from app.utils.performance_metrics import performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Copias que el presupuesto puede acumular para absorber ráfagas de llamadas lentas
+HEDGE_BUDGET_BURST = 10.0
+
+class LatencyWindow:
+    """Latencias recientes de un servicio y retardo de respaldo derivado de ellas."""
+
+    def __init__(self, size: int, percentile: float):
+        """Inicializa la ventana.
+
+        Args:
+            size: Número de latencias recientes que se conservan.
+            percentile: Percentil (0-100) que determina el retardo de respaldo.
+        """
+        self.samples: Deque[float] = deque(maxlen=size)
+        self.percentile = percentile
+        # El percentil se recalcula cada cierto número de muestras, no en cada llamada
+        self._refresh_every = max(1, size // 10)
+        self._pending = 0
+        self._delay: Optional[float] = None
+
+    def record(self, duration: float):
+        """Registra la latencia de una llamada completada.
+
+        Args:
+            duration: Duración en segundos.
+        """
+        self.samples.append(duration)
+        self._pending += 1
+        if self._delay is None or self._pending >= self._refresh_every:
+            ordered = sorted(self.samples)
+            index = max(0, math.ceil(len(ordered) * self.percentile / 100) - 1)
+            self._delay = ordered[index]
+            self._pending = 0
+
+    def delay(self, min_samples: int) -> Optional[float]:
+        """Retardo de respaldo actual, o None si aún no hay muestras suficientes."""
+        if len(self.samples) < min_samples:
+            return None
+        return self._delay
+
+class Hedger:
+    """Planificador de peticiones de respaldo por servicio con un presupuesto compartido."""
+
+    def __init__(
+        self,
+        percentile: float = HEDGE_PERCENTILE,
+        min_delay: float = HEDGE_MIN_DELAY,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        window: int = HEDGE_WINDOW,
+        budget: float = HEDGE_BUDGET
+    ):
+        """Inicializa el planificador.
+
+        Args:
+            percentile: Percentil de las latencias recientes tras el que se lanza la copia.
+            min_delay: Retardo mínimo en segundos antes de lanzar una copia.
+            min_samples: Llamadas observadas por servicio antes de empezar a lanzar copias.
+            window: Latencias recientes que se conservan por servicio.
+            budget: Copias permitidas por cada llamada (por ejemplo 0.05: como mucho un 5% más
+                    de peticiones), compartidas entre todos los servicios.
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = budget
+        self.credits = 0.0
+        self.windows: Dict[str, LatencyWindow] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _window(self, upstream: str) -> LatencyWindow:
+        """Obtiene (o crea) la ventana de latencias de un servicio."""
+        window = self.windows.get(upstream)
+        if window is None:
+            window = self.windows[upstream] = LatencyWindow(self.window, self.percentile)
+            self.stats[upstream] = {"calls": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0}
+        return window
+
+    def delay(self, upstream: str) -> Optional[float]:
+        """Retardo tras el que se lanzaría la copia de una llamada a un servicio.
+
+        Args:
+            upstream: Servicio remoto.
+
+        Returns:
+            Optional[float]: Segundos de espera, o None si aún no hay muestras suficientes.
+        """
+        delay = self._window(upstream).delay(self.min_samples)
+        return None if delay is None else max(delay, self.min_delay)
+
+    def _take_credit(self) -> bool:
+        """Consume una copia del presupuesto, si queda alguna."""
+        if self.credits >= 1:
+            self.credits -= 1
+            return True
+        return False
+
+    def _record(self, upstream: str, start: float, hedged: bool):
+        """Registra la latencia de una llamada completada, medida desde su inicio.
+
+        Args:
+            upstream: Servicio remoto.
+            start: Inicio de la llamada (``time.perf_counter``), antes de la primera copia.
+            hedged: Si se lanzó una copia de respaldo.
+        """
+        duration = time.perf_counter() - start
+        self._window(upstream).record(duration)
+        performance_tracker.record(f"{'hedged' if hedged else 'unhedged'}_{upstream}", duration, traced=False)
+
+        stats = self.stats[upstream]
+        performance_tracker.set_gauge("hedge_rate", stats["hedged"] / stats["calls"], upstream=upstream)
+        delay = self.delay(upstream)
+        if delay is not None:
+            performance_tracker.set_gauge("hedge_delay_seconds", delay, upstream=upstream)
+
+    async def call(self, upstream: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecuta una llamada idempotente, con una copia de respaldo si tarda demasiado.
+
+        Args:
+            upstream: Servicio remoto (``embeddings`` o ``retrieval``).
+            factory: Función que crea la corrutina de la llamada (se invoca una vez por copia,
+                     e incluye el paso por el planificador de admisión).
+
+        Returns:
+            Any: Resultado de la primera llamada que termine correctamente.
+        """
+        self._window(upstream)
+        stats = self.stats[upstream]
+        stats["calls"] += 1
+        self.credits = min(HEDGE_BUDGET_BURST, self.credits + self.budget)
+
+        delay = self.delay(upstream)
+        start = time.perf_counter()
+        primary = asyncio.ensure_future(factory())
+        if delay is None:
+            result = await primary
+            self._record(upstream, start, hedged=False)
+            return result
+
+        tasks = {primary}
+        hedged = False
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if not self._take_credit():
+                    stats["budget_exhausted"] += 1
+                    performance_tracker.increment("hedge_budget_exhausted", upstream=upstream)
+                    result = await primary
+                    self._record(upstream, start, hedged=False)
+                    return result
+
+                stats["hedged"] += 1
+                performance_tracker.increment("hedge_requests", upstream=upstream)
+                trace = performance_tracker.current_trace()
+                if trace is not None:
+                    trace.count(f"hedged_{upstream}")
+                logger.debug(f"Llamada a '{upstream}' sin respuesta tras {delay:.3f} s; se lanza una copia")
+                tasks.add(asyncio.ensure_future(factory()))
+                hedged = True
+
+            # La primera copia que termine bien gana; si falla, se espera a la otra
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    result = task.result()
+                    self._record(upstream, start, hedged=hedged)
+                    if task is not primary:
+                        stats["hedge_wins"] += 1
+                        performance_tracker.increment("hedge_wins", upstream=upstream)
+                    return result
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de las copias de respaldo por servicio.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Llamadas, copias lanzadas y ganadas, proporción de
+                                       copias y retardo actual por servicio.
+        """
+        return {
+            upstream: {
+                **stats,
+                "hedge_rate": stats["hedged"] / stats["calls"] if stats["calls"] else 0.0,
+                "delay": self.delay(upstream),
+                "credits": self.credits
+            }
+            for upstream, stats in self.stats.items()
+        }
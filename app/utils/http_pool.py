@@ -0,0 +1,208 @@
+"""
+Pool de conexiones HTTP compartido.
+Este módulo crea los clientes httpx que comparten OpenAI (embeddings y chat) y Supabase,
+de modo que una consulta reutiliza las conexiones ya abiertas (keep-alive o HTTP/2) en
+lugar de pagar un handshake TLS por cliente. También cuenta las conexiones nuevas y
+reutilizadas y los bytes enviados y recibidos por host, y puede abrir las conexiones antes
+de la primera consulta.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Iterable, Optional
+
+import httpx
+
+from app.config.settings import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP2_ENABLED,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_TIMEOUT
+)
+from app.utils.performance_metrics import performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+def http2_available() -> bool:
+    """Indica si está instalado el paquete ``h2`` que necesita httpx para HTTP/2."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+class HTTPPool:
+    """Clientes httpx síncrono y asíncrono con límites, tiempos y contadores comunes."""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        http2: bool = HTTP2_ENABLED,
+        connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+        timeout: float = HTTP_TIMEOUT
+    ):
+        """Inicializa el pool. El cliente asíncrono queda ligado al bucle de eventos en el que se use.
+
+        Args:
+            max_connections: Conexiones simultáneas máximas.
+            max_keepalive_connections: Conexiones inactivas que se conservan abiertas.
+            keepalive_expiry: Segundos que se conserva una conexión inactiva.
+            http2: Si se negocia HTTP/2 con los servidores que lo admiten.
+            connect_timeout: Tiempo máximo para establecer una conexión.
+            timeout: Tiempo máximo de lectura, escritura y espera de una conexión libre.
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logger.warning("HTTP/2 no disponible (falta el paquete h2); se utilizará HTTP/1.1")
+
+        self.async_client = httpx.AsyncClient(
+            limits=self.limits,
+            timeout=self.timeout,
+            http2=self.http2,
+            event_hooks={"request": [self._on_async_request], "response": [self._on_async_response]}
+        )
+        self._sync_client: Optional[httpx.Client] = None
+        self._sync_lock = threading.Lock()
+
+    @property
+    def sync_client(self) -> httpx.Client:
+        """Cliente síncrono, creado en el primer uso."""
+        with self._sync_lock:
+            if self._sync_client is None:
+                self._sync_client = httpx.Client(
+                    limits=self.limits,
+                    timeout=self.timeout,
+                    http2=self.http2,
+                    event_hooks={"request": [self._on_sync_request], "response": [self._on_sync_response]}
+                )
+            return self._sync_client
+
+    @staticmethod
+    def _record_event(host: str, event_name: str, state: dict, trace):
+        """Cuenta los eventos de httpcore que indican si la petición abrió o reutilizó una conexión.
+
+        Args:
+            host: Host de la petición.
+            event_name: Evento de httpcore (``connection.connect_tcp.complete``, etc.).
+            state: Estado de la petición (si ya abrió una conexión).
+            trace: Traza de la solicitud activa, si la hay.
+        """
+        if event_name == "connection.connect_tcp.complete":
+            state["connected"] = True
+            counter = "http_connections_opened"
+        elif event_name == "connection.start_tls.complete":
+            counter = "http_tls_handshakes"
+        elif event_name.endswith(".send_request_headers.started") and not state["connected"]:
+            counter = "http_connections_reused"
+        else:
+            return
+        performance_tracker.increment(counter, host=host)
+        if trace is not None:
+            trace.count(counter)
+
+    @staticmethod
+    def _count_bytes(counter: str, message, trace):
+        """Cuenta los bytes del cuerpo de una petición o respuesta según su Content-Length.
+
+        Las respuestas en streaming (sin Content-Length) no se cuentan.
+
+        Args:
+            counter: ``http_request_bytes`` o ``http_response_bytes``.
+            message: Petición o respuesta de httpx.
+            trace: Traza de la solicitud activa, si la hay.
+        """
+        length = message.headers.get("content-length")
+        if not length or not length.isdigit():
+            return
+        url = message.url if isinstance(message, httpx.Request) else message.request.url
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1] or "/"
+        performance_tracker.increment(counter, int(length), host=url.host, endpoint=endpoint)
+        if trace is not None:
+            trace.count(counter, int(length))
+
+    def _on_request_counters(self, request: httpx.Request):
+        """Cuenta la petición y sus bytes y devuelve el host y la traza activa."""
+        host = request.url.host
+        trace = performance_tracker.current_trace()
+        performance_tracker.increment("http_requests", host=host)
+        if trace is not None:
+            trace.count("http_requests")
+        self._count_bytes("http_request_bytes", request, trace)
+        return host, trace
+
+    async def _on_async_response(self, response: httpx.Response):
+        self._count_bytes("http_response_bytes", response, performance_tracker.current_trace())
+
+    def _on_sync_response(self, response: httpx.Response):
+        self._count_bytes("http_response_bytes", response, performance_tracker.current_trace())
+
+    async def _on_async_request(self, request: httpx.Request):
+        host, trace = self._on_request_counters(request)
+        state = {"connected": False}
+
+        async def on_event(event_name: str, info: dict):
+            self._record_event(host, event_name, state, trace)
+
+        request.extensions["trace"] = on_event
+
+    def _on_sync_request(self, request: httpx.Request):
+        host, trace = self._on_request_counters(request)
+        state = {"connected": False}
+
+        def on_event(event_name: str, info: dict):
+            self._record_event(host, event_name, state, trace)
+
+        request.extensions["trace"] = on_event
+
+    async def aprewarm(self, urls: Iterable[str], connections: int = 1) -> int:
+        """Abre conexiones con los servidores indicados antes de la primera consulta.
+
+        Se envía una petición HEAD ligera a cada origen; la respuesta se descarta y la
+        conexión queda en el pool. Los errores solo se registran.
+
+        Args:
+            urls: URL cuyos orígenes se precalientan.
+            connections: Conexiones a abrir por origen (con HTTP/2 basta una).
+
+        Returns:
+            int: Número de conexiones precalentadas con éxito.
+        """
+        origins = set()
+        for url in urls:
+            if url:
+                parsed = httpx.URL(url)
+                origins.add(f"{parsed.scheme}://{parsed.netloc.decode('ascii')}/")
+
+        async def warm(origin: str) -> bool:
+            try:
+                response = await self.async_client.head(origin)
+                await response.aclose()
+                return True
+            except Exception as e:
+                logger.warning(f"No se pudo precalentar la conexión con {origin}: {e}")
+                return False
+
+        results = await asyncio.gather(*[warm(origin) for origin in origins for _ in range(max(1, connections))])
+        warmed = sum(results)
+        logger.info(f"Conexiones precalentadas: {warmed} de {len(results)}")
+        return warmed
+
+    async def aclose(self):
+        """Cierra las conexiones de ambos clientes."""
+        await self.async_client.aclose()
+        with self._sync_lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
@@ -1,61 +1,366 @@
 """
 Módulo para rastrear métricas de rendimiento.
+Las duraciones se acumulan en histogramas de cubetas fijas (memoria constante) y cada
+solicitud puede registrar además una traza con el tiempo de cada una de sus etapas (y,
+en las solicitudes perfiladas, también su tiempo de CPU).
 """
-import time
+import contextvars
 import logging
+import math
+import threading
+import time
 from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+def _format_value(value: float) -> str:
+    """Formatea el valor de un contador o indicador sin perder precisión (enteros exactos, floats con repr)."""
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class LatencyHistogram:
+    """Histograma de latencias con cubetas logarítmicas fijas (estilo HDR).
+
+    Las cubetas crecen geométricamente desde ``min_value`` hasta ``max_value`` con
+    ``buckets_per_octave`` cubetas por cada duplicación, lo que acota el error relativo
+    de los percentiles (~4% con 16 cubetas por octava) con memoria constante.
+    """
+
+    def __init__(self, min_value: float = 1e-4, max_value: float = 600.0, buckets_per_octave: int = 16):
+        """Inicializa el histograma.
+
+        Args:
+            min_value: Límite inferior en segundos (los valores menores caen en la primera cubeta).
+            max_value: Límite superior en segundos (los valores mayores caen en la última cubeta).
+            buckets_per_octave: Cubetas por cada duplicación del valor.
+        """
+        self.min_value = min_value
+        self.buckets_per_octave = buckets_per_octave
+        self._log_min = math.log2(min_value)
+        n_buckets = int(math.ceil(math.log2(max_value / min_value) * buckets_per_octave)) + 1
+        self.counts = [0] * n_buckets
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _bucket(self, value: float) -> int:
+        """Obtiene la cubeta de un valor."""
+        if value <= self.min_value:
+            return 0
+        index = int((math.log2(value) - self._log_min) * self.buckets_per_octave) + 1
+        return min(index, len(self.counts) - 1)
+
+    def _upper_bound(self, index: int) -> float:
+        """Límite superior de una cubeta."""
+        return self.min_value * 2 ** (index / self.buckets_per_octave)
+
+    def record(self, value: float):
+        """Registra un valor.
+
+        Args:
+            value: Duración en segundos.
+        """
+        self.counts[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def percentile(self, percentile: float) -> float:
+        """Calcula un percentil aproximado.
+
+        Args:
+            percentile: Percentil entre 0 y 100.
+
+        Returns:
+            float: Valor del percentil (límite superior de su cubeta, acotado por el máximo observado).
+        """
+        if not self.count:
+            return 0.0
+        target = max(1, math.ceil(self.count * percentile / 100))
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(max(self._upper_bound(index), self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> Dict[str, float]:
+        """Resume el histograma.
+
+        Returns:
+            Dict[str, float]: Recuento, tiempos total, medio, mínimo y máximo, y percentiles.
+        """
+        return {
+            "count": self.count,
+            "total_time": self.total,
+            "average_time": self.total / self.count if self.count else 0,
+            "min_time": self.min if self.count else 0,
+            "max_time": self.max,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99)
+        }
+
+class RequestTrace:
+    """Traza de una solicitud: etapas con su inicio relativo y su duración."""
+
+    def __init__(self):
+        """Inicializa la traza en el instante actual."""
+        self.start = time.perf_counter()
+        self.stages: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        # Si las etapas miden también el tiempo de CPU del hilo (lo activa el perfilado)
+        self.measure_cpu = False
+        self._lock = threading.Lock()
+
+    def add(self, operation_name: str, start: float, duration: float, cpu_time: Optional[float] = None):
+        """Añade una etapa a la traza.
+
+        Args:
+            operation_name: Nombre de la etapa.
+            start: Instante de inicio (``time.perf_counter``).
+            duration: Duración en segundos.
+            cpu_time: Tiempo de CPU del hilo durante la etapa, si se ha medido.
+        """
+        stage = {
+            "name": operation_name,
+            "start": start - self.start,
+            "duration": duration
+        }
+        if cpu_time is not None:
+            stage["cpu_time"] = cpu_time
+        with self._lock:
+            self.stages.append(stage)
+
+    def count(self, name: str, value: int = 1):
+        """Incrementa un contador de la solicitud (por ejemplo, conexiones abiertas).
+
+        Args:
+            name: Nombre del contador.
+            value: Incremento.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte la traza en un diccionario serializable.
+
+        Returns:
+            Dict[str, Any]: Tiempo total, etapas ordenadas por inicio y contadores (si los hay).
+        """
+        with self._lock:
+            stages = sorted(self.stages, key=lambda stage: stage["start"])
+            counters = dict(self.counters)
+        trace = {
+            "total_time": time.perf_counter() - self.start,
+            "stages": stages
+        }
+        if counters:
+            trace["counters"] = counters
+        return trace
+
 class PerformanceTracker:
     """Clase para rastrear métricas de rendimiento."""
-    
+
     def __init__(self):
         """Inicializa el rastreador de rendimiento."""
-        self.metrics = {}
-    
+        self.metrics: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self.gauges: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+        self._lock = threading.Lock()
+        self._current_trace: contextvars.ContextVar = contextvars.ContextVar("performance_trace", default=None)
+
+    def record(
+        self,
+        operation_name: str,
+        duration: float,
+        start: Optional[float] = None,
+        trace: Optional[RequestTrace] = None,
+        cpu_time: Optional[float] = None,
+        traced: bool = True
+    ):
+        """Registra la duración de una operación.
+
+        Args:
+            operation_name: Nombre de la operación.
+            duration: Duración en segundos.
+            start: Instante de inicio (``time.perf_counter``) para la traza.
+            trace: Traza de la solicitud. Si no se proporciona, se usa la traza activa.
+            cpu_time: Tiempo de CPU de la operación, para la traza.
+            traced: Si la operación se añade a la traza (False: solo al histograma del proceso).
+        """
+        with self._lock:
+            histogram = self.metrics.get(operation_name)
+            if histogram is None:
+                histogram = self.metrics[operation_name] = LatencyHistogram()
+            histogram.record(duration)
+
+        if not traced:
+            return
+        trace = trace or self._current_trace.get()
+        if trace is not None:
+            trace.add(operation_name, start if start is not None else time.perf_counter() - duration, duration, cpu_time)
+
+    def increment(self, counter_name: str, value: float = 1, **labels: str):
+        """Incrementa un contador del proceso.
+
+        Args:
+            counter_name: Nombre del contador.
+            value: Incremento.
+            **labels: Etiquetas del contador (por ejemplo ``host``).
+        """
+        key = (counter_name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, gauge_name: str, value: float, **labels: str):
+        """Fija el valor actual de un indicador del proceso.
+
+        Args:
+            gauge_name: Nombre del indicador.
+            value: Valor actual.
+            **labels: Etiquetas del indicador (por ejemplo ``upstream``).
+        """
+        key = (gauge_name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.gauges[key] = value
+
+    def get_gauges(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Obtiene los indicadores del proceso.
+
+        Returns:
+            Dict[str, List[Dict[str, Any]]]: Por indicador, sus valores con las etiquetas correspondientes.
+        """
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for (gauge_name, labels), value in sorted(self.gauges.items()):
+                result.setdefault(gauge_name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def get_counters(self) -> Dict[str, List[Dict[str, Any]]]:
+        """Obtiene los contadores del proceso.
+
+        Returns:
+            Dict[str, List[Dict[str, Any]]]: Por contador, sus valores con las etiquetas correspondientes.
+        """
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        with self._lock:
+            for (counter_name, labels), value in sorted(self.counters.items()):
+                result.setdefault(counter_name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def current_trace(self) -> Optional[RequestTrace]:
+        """Obtiene la traza de solicitud activa en el contexto actual, si la hay."""
+        return self._current_trace.get()
+
     @contextmanager
-    def track(self, operation_name):
+    def track(self, operation_name, trace: Optional[RequestTrace] = None):
         """Rastrea el tiempo de ejecución de una operación.
-        
+
+        Si la traza mide el tiempo de CPU, se registra el del hilo durante la operación. En
+        el bucle de eventos incluye el de las demás corrutinas que se ejecuten entretanto,
+        por lo que solo es exacto sin consultas concurrentes.
+
         Args:
             operation_name: Nombre de la operación a rastrear.
+            trace: Traza de la solicitud. Si no se proporciona, se usa la traza activa al entrar.
         """
-        start_time = time.time()
+        trace = trace or self._current_trace.get()
+        cpu_start = time.thread_time() if trace is not None and trace.measure_cpu else None
+        start_time = time.perf_counter()
         try:
             yield
         finally:
-            end_time = time.time()
-            duration = end_time - start_time
-            
-            if operation_name not in self.metrics:
-                self.metrics[operation_name] = []
-            
-            self.metrics[operation_name].append(duration)
+            duration = time.perf_counter() - start_time
+            cpu_time = time.thread_time() - cpu_start if cpu_start is not None else None
+            self.record(operation_name, duration, start=start_time, trace=trace, cpu_time=cpu_time)
             logger.debug(f"Operación '{operation_name}' completada en {duration:.4f} segundos")
-    
+
+    @contextmanager
+    def trace(self, trace: Optional[RequestTrace] = None):
+        """Activa una traza de solicitud para las operaciones rastreadas dentro del bloque.
+
+        El bloque no debe contener ``yield`` de un generador asíncrono: para esos casos
+        se debe pasar la traza explícitamente a :meth:`track`.
+
+        Args:
+            trace: Traza a activar. Si no se proporciona, se crea una nueva.
+
+        Yields:
+            RequestTrace: Traza activa.
+        """
+        trace = trace or RequestTrace()
+        token = self._current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            self._current_trace.reset(token)
+
     def get_metrics(self):
         """Obtiene las métricas de rendimiento.
-        
+
         Returns:
-            dict: Métricas de rendimiento.
-        """
-        result = {}
-        
-        for operation, times in self.metrics.items():
-            result[operation] = {
-                "count": len(times),
-                "total_time": sum(times),
-                "average_time": sum(times) / len(times) if times else 0,
-                "min_time": min(times) if times else 0,
-                "max_time": max(times) if times else 0
-            }
-        
-        return result
-    
+            dict: Métricas de rendimiento, incluidos los percentiles p50, p95 y p99.
+        """
+        with self._lock:
+            return {operation: histogram.to_dict() for operation, histogram in self.metrics.items()}
+
+    def to_prometheus(self, prefix: str = "raglec") -> str:
+        """Exporta las métricas en el formato de texto de Prometheus.
+
+        Args:
+            prefix: Prefijo de los nombres de las métricas.
+
+        Returns:
+            str: Métricas como ``summary`` con cuantiles 0.5, 0.95 y 0.99 por operación,
+                 seguidas de los contadores y los indicadores del proceso.
+        """
+        name = f"{prefix}_operation_duration_seconds"
+        lines = [
+            f"# HELP {name} Duración de las operaciones del pipeline RAG.",
+            f"# TYPE {name} summary"
+        ]
+        for operation, metrics in sorted(self.get_metrics().items()):
+            label = f'operation="{operation}"'
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                lines.append(f'{name}{{{label},quantile="{quantile}"}} {metrics[key]:.6f}')
+            lines.append(f"{name}_sum{{{label}}} {metrics['total_time']:.6f}")
+            lines.append(f"{name}_count{{{label}}} {metrics['count']}")
+
+        max_name = f"{prefix}_operation_duration_max_seconds"
+        lines.append(f"# HELP {max_name} Duración máxima observada de cada operación.")
+        lines.append(f"# TYPE {max_name} gauge")
+        for operation, metrics in sorted(self.get_metrics().items()):
+            lines.append(f'{max_name}{{operation="{operation}"}} {metrics["max_time"]:.6f}')
+
+        for counter_name, values in self.get_counters().items():
+            counter = f"{prefix}_{counter_name}_total"
+            lines.append(f"# TYPE {counter} counter")
+            for entry in values:
+                label = ",".join(f'{key}="{value}"' for key, value in entry["labels"].items())
+                value = _format_value(entry["value"])
+                lines.append(f"{counter}{{{label}}} {value}" if label else f"{counter} {value}")
+
+        for gauge_name, values in self.get_gauges().items():
+            gauge = f"{prefix}_{gauge_name}"
+            lines.append(f"# TYPE {gauge} gauge")
+            for entry in values:
+                label = ",".join(f'{key}="{value}"' for key, value in entry["labels"].items())
+                value = _format_value(entry["value"])
+                lines.append(f"{gauge}{{{label}}} {value}" if label else f"{gauge} {value}")
+
+        return "\n".join(lines) + "\n"
+
     def reset(self):
-        """Reinicia las métricas de rendimiento."""
-        self.metrics = {}
+        """Reinicia las métricas de rendimiento, los contadores y los indicadores."""
+        with self._lock:
+            self.metrics = {}
+            self.counters = {}
+            self.gauges = {}
 
 # Instancia global del rastreador de rendimiento
-performance_tracker = PerformanceTracker() 
\ No newline at end of file
+performance_tracker = PerformanceTracker()
@@ -0,0 +1,311 @@
+"""
+Perfilado de consultas bajo demanda o por muestreo.
+Para las consultas seleccionadas (todas con PROFILE_ENABLED, o una fracción con
+PROFILE_SAMPLE_RATE) se capturan un perfil determinista con cProfile, un muestreo periódico
+de la pila del hilo del bucle de eventos y, opcionalmente, las asignaciones de memoria con
+tracemalloc. La traza de la consulta registra además el tiempo de CPU de cada etapa junto a
+su duración, lo que separa el trabajo en Python de la espera a OpenAI y Supabase.
+
+Por consulta perfilada se escriben en PROFILE_DIR:
+
+- ``<prefijo>.json``: duración y CPU por etapa, funciones más costosas y mayores asignaciones.
+- ``<prefijo>.collapsed``: pilas muestreadas en formato colapsado (``flamegraph.pl``,
+  speedscope). Las pilas que terminan en ``select`` son esperas de red.
+- ``<prefijo>.pstats``: perfil de cProfile (``python -m pstats``, snakeviz).
+
+cProfile y tracemalloc son globales, así que se perfila una sola consulta a la vez; el
+perfil incluye también el trabajo de las consultas concurrentes en el mismo bucle. Con el
+perfilado desactivado no hay ningún coste por consulta.
+"""
+
+import cProfile
+import io
+import itertools
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.config.settings import (
+    PROFILE_ENABLED,
+    PROFILE_SAMPLE_RATE,
+    PROFILE_DIR,
+    PROFILE_MEMORY,
+    PROFILE_INTERVAL
+)
+from app.utils.performance_metrics import RequestTrace, performance_tracker
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Entradas de las listas de funciones y de asignaciones del informe
+PROFILE_TOP = 25
+
+# Marcos de la pila conservados por muestra
+MAX_STACK_DEPTH = 128
+
+class StackSampler:
+    """Muestreo periódico de la pila de un hilo en formato colapsado."""
+
+    def __init__(self, thread_id: int, interval: float):
+        """Inicializa el muestreador.
+
+        Args:
+            thread_id: Identificador del hilo a muestrear.
+            interval: Segundos entre muestras.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        """Nombre de un marco como ``fichero:función`` (sin espacios ni ``;``)."""
+        code = frame.f_code
+        name = getattr(code, "co_qualname", code.co_name)
+        return f"{os.path.basename(code.co_filename)}:{name}".replace(";", ",").replace(" ", "_")
+
+    def _run(self):
+        """Bucle del hilo de muestreo."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack: List[str] = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        """Arranca el muestreo."""
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detiene el muestreo."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Pilas muestreadas en formato colapsado (``raíz;...;hoja recuento``)."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class RequestProfile:
+    """Perfil de una consulta en curso."""
+
+    def __init__(self, prefix: str, label: str):
+        """Inicializa el perfil.
+
+        Args:
+            prefix: Ruta de los ficheros del perfil sin extensión.
+            label: Texto de la consulta.
+        """
+        self.prefix = prefix
+        self.label = label
+        self.profiler: Optional[cProfile.Profile] = None
+        self.sampler: Optional[StackSampler] = None
+        self.memory_start: Optional[tracemalloc.Snapshot] = None
+        self.started_tracemalloc = False
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.thread_time()
+
+    @property
+    def artifacts(self) -> Dict[str, str]:
+        """Ficheros del perfil por tipo."""
+        files = {"report": f"{self.prefix}.json", "collapsed": f"{self.prefix}.collapsed"}
+        if self.profiler is not None:
+            files["pstats"] = f"{self.prefix}.pstats"
+        return files
+
+class RequestProfiler:
+    """Selección y perfilado de consultas con escritura de los resultados en disco."""
+
+    def __init__(
+        self,
+        directory: str = PROFILE_DIR,
+        sample_rate: float = 1.0,
+        memory: bool = PROFILE_MEMORY,
+        interval: float = PROFILE_INTERVAL
+    ):
+        """Inicializa el perfilador.
+
+        Args:
+            directory: Directorio en el que se escriben los perfiles.
+            sample_rate: Fracción de las consultas que se perfilan (1.0: todas).
+            memory: Si se registran las asignaciones de memoria con tracemalloc.
+            interval: Segundos entre muestras de la pila.
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.memory = memory
+        self.interval = interval
+        self.profiled = 0
+        self.skipped = 0
+        self._active = threading.Lock()
+        self._sequence = itertools.count(1)
+
+    def should_profile(self) -> bool:
+        """Decide si se perfila la consulta que empieza (según la tasa de muestreo)."""
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self, trace: RequestTrace, label: str) -> Iterator[Optional[RequestProfile]]:
+        """Perfila el bloque, que debe ejecutarse en el hilo del bucle de eventos de la consulta.
+
+        Args:
+            trace: Traza de la consulta; sus etapas medirán también el tiempo de CPU.
+            label: Texto de la consulta (se guarda en el informe).
+
+        Yields:
+            Optional[RequestProfile]: Perfil en curso, o None si ya se está perfilando otra consulta.
+        """
+        if not self._active.acquire(blocking=False):
+            self.skipped += 1
+            performance_tracker.increment("profile_skipped")
+            yield None
+            return
+
+        try:
+            profile = self._start(trace, label)
+        except Exception:
+            self._active.release()
+            raise
+        try:
+            yield profile
+        finally:
+            try:
+                self._finish(profile, trace)
+            except Exception as e:
+                logger.warning(f"No se pudo guardar el perfil {profile.prefix}: {e}")
+            finally:
+                self._active.release()
+
+    def _start(self, trace: RequestTrace, label: str) -> RequestProfile:
+        """Activa la medición de CPU por etapa, cProfile, el muestreo y tracemalloc."""
+        slug = re.sub(r"[^a-z0-9]+", "_", label.casefold())[:40].strip("_") or "query"
+        prefix = os.path.join(
+            self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._sequence):04d}-{slug}"
+        )
+        profile = RequestProfile(prefix, label)
+        trace.measure_cpu = True
+
+        if self.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                profile.started_tracemalloc = True
+            profile.memory_start = tracemalloc.take_snapshot()
+
+        profile.sampler = StackSampler(threading.get_ident(), self.interval)
+        profile.sampler.start()
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            profile.profiler = profiler
+        except ValueError as e:
+            # Otro perfilador activo en el proceso (por ejemplo, ``python -m cProfile``)
+            logger.debug(f"cProfile no disponible para la consulta: {e}")
+        return profile
+
+    def _finish(self, profile: RequestProfile, trace: RequestTrace):
+        """Detiene la captura y escribe los ficheros del perfil."""
+        wall_time = time.perf_counter() - profile.wall_start
+        cpu_time = time.thread_time() - profile.cpu_start
+        if profile.profiler is not None:
+            profile.profiler.disable()
+        profile.sampler.stop()
+
+        allocations = []
+        if profile.memory_start is not None:
+            snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+            if profile.started_tracemalloc:
+                tracemalloc.stop()
+            for stat in snapshot.compare_to(profile.memory_start, "lineno")[:PROFILE_TOP]:
+                frame = stat.traceback[0]
+                allocations.append({
+                    "location": f"{frame.filename}:{frame.lineno}",
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff
+                })
+
+        functions = []
+        if profile.profiler is not None:
+            stats = pstats.Stats(profile.profiler, stream=io.StringIO())
+            ranked = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:PROFILE_TOP]
+            for (filename, line, name), (_, calls, own_time, cumulative_time, _) in ranked:
+                functions.append({
+                    "function": f"{filename}:{line}({name})",
+                    "calls": calls,
+                    "own_time": own_time,
+                    "cumulative_time": cumulative_time
+                })
+
+        trace_data = trace.to_dict()
+        report = {
+            "query": profile.label,
+            "wall_time": wall_time,
+            "cpu_time": cpu_time,
+            "samples": sum(profile.sampler.stacks.values()),
+            "sample_interval": self.interval,
+            "stages": trace_data["stages"],
+            "counters": trace_data.get("counters", {}),
+            "functions": functions,
+            "allocations": allocations
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{profile.prefix}.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        with open(f"{profile.prefix}.collapsed", "w", encoding="utf-8") as f:
+            f.write(profile.sampler.collapsed())
+        if profile.profiler is not None:
+            profile.profiler.dump_stats(f"{profile.prefix}.pstats")
+
+        self.profiled += 1
+        performance_tracker.increment("profiled_requests")
+        logger.info(
+            f"Consulta perfilada: {wall_time * 1000:.1f} ms de duración, {cpu_time * 1000:.1f} ms de CPU "
+            f"({profile.prefix}.json)"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Consultas perfiladas y omitidas, tasa de muestreo y directorio de los perfiles."""
+        return {
+            "profiled": self.profiled,
+            "skipped": self.skipped,
+            "sample_rate": self.sample_rate,
+            "directory": self.directory
+        }
+
+_request_profiler: Optional[RequestProfiler] = None
+_request_profiler_lock = threading.Lock()
+
+def get_request_profiler() -> Optional[RequestProfiler]:
+    """Obtiene el perfilador de consultas compartido por el proceso.
+
+    Returns:
+        Optional[RequestProfiler]: Perfilador compartido, o None si PROFILE_ENABLED está
+                                   desactivado y PROFILE_SAMPLE_RATE es 0.
+    """
+    global _request_profiler
+
+    sample_rate = 1.0 if PROFILE_ENABLED else PROFILE_SAMPLE_RATE
+    if sample_rate <= 0:
+        return None
+
+    with _request_profiler_lock:
+        if _request_profiler is None:
+            _request_profiler = RequestProfiler(sample_rate=sample_rate)
+        return _request_profiler
@@ -0,0 +1,256 @@
+"""
+Codificación de las respuestas HTTP.
+Este módulo serializa las respuestas de la API (con orjson si está instalado), negocia
+la compresión gzip o brotli según ``Accept-Encoding``, reduce las fuentes a fragmentos
+o identificadores cuando el cliente no necesita el texto completo y calcula el ETag que
+permite responder 304 a consultas repetidas.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.config.settings import (
+    RESPONSE_COMPRESSION_MIN_BYTES,
+    RESPONSE_GZIP_LEVEL,
+    RESPONSE_BROTLI_QUALITY,
+    RESPONSE_SOURCE_MODE,
+    RESPONSE_SNIPPET_CHARS
+)
+from app.utils.performance_metrics import performance_tracker
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+SOURCE_MODES = ("full", "snippet", "ids")
+
+def dumps(payload: Any) -> bytes:
+    """Serializa una respuesta en JSON (UTF-8).
+
+    Args:
+        payload: Objeto a serializar.
+
+    Returns:
+        bytes: JSON compacto.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+        except TypeError as e:
+            logger.debug(f"orjson no pudo serializar la respuesta, se usa json: {e}")
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def available_encodings() -> List[str]:
+    """Codificaciones admitidas, en orden de preferencia del servidor."""
+    return (["br"] if brotli is not None else []) + ["gzip"]
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Elige la compresión a partir de la cabecera ``Accept-Encoding``.
+
+    Args:
+        accept_encoding: Valor de la cabecera (por ejemplo ``"gzip, br;q=0.9"``).
+
+    Returns:
+        Optional[str]: ``"br"``, ``"gzip"`` o None si no se debe comprimir.
+    """
+    if not accept_encoding:
+        return None
+
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding] = weight
+
+    best, best_weight = None, 0.0
+    for coding in available_encodings():
+        weight = weights.get(coding, weights.get("*", 0.0))
+        # En caso de empate se mantiene la preferencia del servidor
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+def compress(body: bytes, encoding: Optional[str]) -> bytes:
+    """Comprime el cuerpo con la codificación indicada.
+
+    Args:
+        body: Cuerpo sin comprimir.
+        encoding: ``"br"``, ``"gzip"`` o None.
+
+    Returns:
+        bytes: Cuerpo comprimido (o el original si ``encoding`` es None).
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0)
+    return body
+
+def encode_body(payload: Any, accept_encoding: Optional[str], endpoint: str) -> Tuple[bytes, Optional[str]]:
+    """Serializa y, si compensa, comprime una respuesta; registra los bytes en las métricas.
+
+    Args:
+        payload: Respuesta a enviar.
+        accept_encoding: Cabecera ``Accept-Encoding`` de la solicitud.
+        endpoint: Nombre del endpoint para las etiquetas de las métricas.
+
+    Returns:
+        Tuple[bytes, Optional[str]]: Cuerpo a enviar y codificación aplicada (None si no se comprime).
+    """
+    with performance_tracker.track("response_encoding"):
+        body = dumps(payload)
+        encoding = negotiate_encoding(accept_encoding) if len(body) >= RESPONSE_COMPRESSION_MIN_BYTES else None
+        encoded = compress(body, encoding)
+    record_response_bytes(endpoint, len(body), len(encoded), encoding)
+    return encoded, encoding
+
+def record_response_bytes(endpoint: str, raw_bytes: int, sent_bytes: int, encoding: Optional[str] = None):
+    """Registra el tamaño de una respuesta antes y después de comprimirla.
+
+    Args:
+        endpoint: Nombre del endpoint.
+        raw_bytes: Bytes del JSON sin comprimir.
+        sent_bytes: Bytes enviados.
+        encoding: Codificación aplicada.
+    """
+    encoding = encoding or "identity"
+    performance_tracker.increment("response_bytes_raw", raw_bytes, endpoint=endpoint, encoding=encoding)
+    performance_tracker.increment("response_bytes_sent", sent_bytes, endpoint=endpoint, encoding=encoding)
+
+def source_id(source: Dict[str, Any]) -> str:
+    """Identificador estable de una fuente: su hash de contenido o, si no lo tiene, uno calculado.
+
+    Args:
+        source: Fuente con ``content`` y ``metadata``.
+
+    Returns:
+        str: Identificador de la fuente.
+    """
+    metadata = source.get("metadata") or {}
+    if metadata.get("content_hash"):
+        return str(metadata["content_hash"])
+    return hashlib.blake2b((source.get("content") or "").encode("utf-8"), digest_size=16).hexdigest()
+
+def shape_sources(
+    sources: Iterable[Dict[str, Any]],
+    mode: Optional[str] = None,
+    snippet_chars: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """Reduce las fuentes según el modo solicitado por el cliente.
+
+    Args:
+        sources: Fuentes completas (``content``, ``metadata`` y ``similarity``).
+        mode: ``"full"`` (sin cambios), ``"snippet"`` (contenido recortado) o ``"ids"``
+              (solo identificador y similitud). Si no se proporciona, se utiliza RESPONSE_SOURCE_MODE.
+        snippet_chars: Longitud máxima de los fragmentos. Si no se proporciona, se utiliza RESPONSE_SNIPPET_CHARS.
+
+    Returns:
+        List[Dict[str, Any]]: Fuentes en el formato solicitado.
+    """
+    mode = mode or RESPONSE_SOURCE_MODE
+    if mode == "full":
+        return list(sources)
+    snippet_chars = snippet_chars or RESPONSE_SNIPPET_CHARS
+    shaped = []
+    for source in sources:
+        if mode == "ids":
+            shaped_source = {"id": source_id(source), "similarity": source.get("similarity")}
+        else:
+            content = source.get("content") or ""
+            shaped_source = {
+                "id": source_id(source),
+                "content": content[:snippet_chars],
+                "truncated": len(content) > snippet_chars,
+                "metadata": source.get("metadata") or {},
+                "similarity": source.get("similarity")
+            }
+        # La puntuación de la búsqueda híbrida se conserva en todos los modos
+        if "fusion_score" in source:
+            shaped_source["fusion_score"] = source["fusion_score"]
+        shaped.append(shaped_source)
+    return shaped
+
+def shape_result(
+    result: Dict[str, Any],
+    mode: Optional[str] = None,
+    snippet_chars: Optional[int] = None,
+    debug: bool = False
+) -> Dict[str, Any]:
+    """Prepara el resultado de una consulta para enviarlo al cliente.
+
+    No modifica el resultado original (que puede estar en la caché de respuestas).
+
+    Args:
+        result: Resultado de ``RAGQuerySystem.query``.
+        mode: Modo de las fuentes (ver :func:`shape_sources`).
+        snippet_chars: Longitud máxima de los fragmentos.
+        debug: Si se conserva la traza de pila de los errores (``metadata.error_stack``).
+
+    Returns:
+        Dict[str, Any]: Resultado listo para serializar.
+    """
+    shaped = dict(result)
+    if "sources" in shaped:
+        shaped["sources"] = shape_sources(shaped["sources"], mode, snippet_chars)
+    metadata = shaped.get("metadata")
+    if metadata and "error_stack" in metadata and not debug:
+        shaped["metadata"] = {key: value for key, value in metadata.items() if key != "error_stack"}
+    return shaped
+
+def compute_etag(result: Dict[str, Any]) -> str:
+    """Calcula el ETag de un resultado a partir de la respuesta y las fuentes.
+
+    Los metadatos (tiempos, traza) cambian en cada ejecución y no forman parte del ETag,
+    de modo que una consulta repetida con la misma respuesta produce el mismo valor.
+
+    Args:
+        result: Resultado ya preparado con :func:`shape_result`.
+
+    Returns:
+        str: ETag entre comillas.
+    """
+    digest = hashlib.blake2b(dumps([result.get("answer"), result.get("sources")]), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Indica si la cabecera ``If-None-Match`` contiene el ETag (comparación débil).
+
+    Args:
+        if_none_match: Valor de la cabecera.
+        etag: ETag de la respuesta.
+
+    Returns:
+        bool: True si el cliente ya tiene esta respuesta.
+    """
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
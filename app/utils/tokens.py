@@ -0,0 +1,106 @@
+"""
+Conteo de tokens.
+Este módulo obtiene la codificación de tiktoken de un modelo una sola vez por proceso y
+ofrece una estimación mientras no está disponible.
+
+La primera carga de tiktoken descarga el fichero BPE de la codificación si no está en su
+caché (``TIKTOKEN_CACHE_DIR``), así que se hace en un hilo en segundo plano: las solicitudes
+nunca esperan a la red y estiman los tokens hasta que la codificación está lista. Para
+contar con exactitud desde el arranque, incluya el fichero en el despliegue y apunte
+``TIKTOKEN_CACHE_DIR`` a su directorio.
+"""
+
+import logging
+import threading
+from typing import Dict, Optional, Set
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+_encodings: Dict[str, Optional[object]] = {}
+_loading: Set[str] = set()
+_encodings_lock = threading.Lock()
+
+def load_encoding(model_name: str):
+    """Carga la codificación de tiktoken de un modelo, esperando a la descarga si hace falta.
+
+    Args:
+        model_name: Nombre del modelo de OpenAI.
+
+    Returns:
+        Codificación de tiktoken, o None si no está disponible.
+    """
+    with _encodings_lock:
+        if model_name in _encodings:
+            return _encodings[model_name]
+
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"No se pudo cargar la codificación de tiktoken; se estiman los tokens: {e}")
+        encoding = None
+
+    with _encodings_lock:
+        _encodings[model_name] = encoding
+        _loading.discard(model_name)
+    return encoding
+
+def get_encoding(model_name: str):
+    """Obtiene la codificación de tiktoken de un modelo sin bloquear.
+
+    La primera llamada lanza la carga en segundo plano y devuelve None.
+
+    Args:
+        model_name: Nombre del modelo de OpenAI.
+
+    Returns:
+        Codificación de tiktoken, o None si todavía no está cargada o no está disponible.
+    """
+    with _encodings_lock:
+        if model_name in _encodings:
+            return _encodings[model_name]
+        if model_name in _loading:
+            return None
+        _loading.add(model_name)
+
+    threading.Thread(
+        target=load_encoding, args=(model_name,), name=f"tiktoken-{model_name}", daemon=True
+    ).start()
+    return None
+
+def count_tokens(text: str, model_name: str) -> int:
+    """Cuenta los tokens de un texto.
+
+    Args:
+        text: Texto a contar.
+        model_name: Nombre del modelo cuya codificación se utiliza.
+
+    Returns:
+        int: Número de tokens (estimado a cuatro caracteres por token si la codificación
+             todavía no está cargada o no está disponible).
+    """
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+def truncate_to_tokens(text: str, max_tokens: int, model_name: str) -> str:
+    """Recorta un texto a un número máximo de tokens.
+
+    Args:
+        text: Texto a recortar.
+        max_tokens: Número máximo de tokens.
+        model_name: Nombre del modelo cuya codificación se utiliza.
+
+    Returns:
+        str: Texto recortado.
+    """
+    encoding = get_encoding(model_name)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens])
@@ -0,0 +1,70 @@
+"""
+Transporte compacto de embeddings.
+Este módulo mantiene los embeddings como arrays float32 de NumPy desde la respuesta de
+OpenAI (en base64) hasta la llamada RPC a Supabase, donde se envían como literal de
+pgvector (``"[0.1,0.2,...]"``) con la representación más corta de cada float32.
+"""
+
+import base64
+import logging
+from typing import Any, Sequence, Union
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dependencia opcional
+    orjson = None
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Dimensiones de los modelos text-embedding-3-small y ada-002 cuando no se reducen
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+
+Embedding = Union[np.ndarray, Sequence[float]]
+
+def decode_embedding(value: Any) -> np.ndarray:
+    """Convierte un embedding de la API de OpenAI en un array float32.
+
+    Args:
+        value: Embedding en base64 (float32 little-endian) o como lista de floats.
+
+    Returns:
+        np.ndarray: Vector float32 de solo lectura.
+    """
+    if isinstance(value, str):
+        vector = np.frombuffer(base64.b64decode(value), dtype="<f4")
+    else:
+        vector = np.asarray(value, dtype=np.float32)
+        vector.flags.writeable = False
+    return vector
+
+def zero_embedding(dimensions: int = 0) -> np.ndarray:
+    """Embedding nulo para textos vacíos.
+
+    Args:
+        dimensions: Dimensiones del vector (0 para las del modelo por defecto).
+
+    Returns:
+        np.ndarray: Vector float32 de ceros.
+    """
+    return np.zeros(dimensions or DEFAULT_EMBEDDING_DIMENSIONS, dtype=np.float32)
+
+def to_pgvector(embedding: Embedding) -> str:
+    """Formatea un embedding como literal de pgvector para enviarlo en el cuerpo JSON.
+
+    Es unas diez veces más rápido y casi la mitad de grande que serializar la lista de
+    floats de Python como array JSON.
+
+    Args:
+        embedding: Vector de embedding.
+
+    Returns:
+        str: Literal ``"[x1,x2,...]"``.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    if orjson is not None:
+        return orjson.dumps(vector, option=orjson.OPT_SERIALIZE_NUMPY).decode("ascii")
+    # float32 necesita como mucho 9 dígitos significativos para representarse sin pérdida
+    return "[" + ",".join(format(value, ".9g") for value in vector.tolist()) + "]"
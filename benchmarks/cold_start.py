@@ -0,0 +1,101 @@
+"""
+Medición del arranque en frío del endpoint de consultas.
+Este módulo se ejecuta en un proceso nuevo y solo importa la biblioteca estándar, de modo
+que todo lo que mide (tiempos e importaciones) corresponde a la aplicación:
+
+    python -m benchmarks.cold_start             # tiempos en JSON
+    python -X importtime -m benchmarks.cold_start  # además, informe de importaciones en stderr
+"""
+
+import importlib.util
+import json
+import os
+import re
+import resource
+import sys
+import time
+from typing import Any, Dict, List
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+def peak_rss_mb() -> float:
+    """Memoria residente máxima del proceso actual en MB."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa en KB y macOS en bytes
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+def load_query_handler():
+    """Importa ``api/query.py`` como lo hace el runtime de Vercel (por ruta de fichero)."""
+    spec = importlib.util.spec_from_file_location("api_query", os.path.join(ROOT_DIR, "api", "query.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def cold_start_probe() -> Dict[str, Any]:
+    """Mide el arranque en frío en el proceso actual (que debe ser nuevo).
+
+    Returns:
+        Dict[str, Any]: Tiempos de importación, creación del sistema y primera consulta,
+                        y memoria máxima.
+    """
+    start = time.perf_counter()
+    module = load_query_handler()
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rag_system, _ = module.rag_system_registry.get_system()
+    init_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = rag_system.query("Pregunta de arranque en frío")
+    first_query_time = time.perf_counter() - start
+
+    return {
+        "import_time": import_time,
+        "init_time": init_time,
+        "first_query_time": first_query_time,
+        "total_time": import_time + init_time + first_query_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "error": result["metadata"].get("error")
+    }
+
+def parse_importtime(output: str, top: int = 20) -> Dict[str, Any]:
+    """Resume la salida de ``python -X importtime``.
+
+    Args:
+        output: Salida de error del proceso con las líneas ``import time:``.
+        top: Número de módulos a incluir en la lista de los más costosos.
+
+    Returns:
+        Dict[str, Any]: Tiempo total de importación, tiempo propio por paquete raíz y
+                        los módulos de primer nivel más costosos (en segundos).
+    """
+    top_level: List[Dict[str, Any]] = []
+    packages: Dict[str, float] = {}
+    modules = 0
+
+    for line in output.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        modules += 1
+        self_us, cumulative_us, indent, name = match.groups()
+        # El tiempo propio se atribuye al paquete raíz del módulo, a cualquier profundidad
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0.0) + int(self_us) / 1e6
+        # Solo las importaciones de primer nivel: su tiempo acumulado incluye el de sus dependencias
+        if len(indent) <= 1:
+            top_level.append({"module": name, "cumulative": int(cumulative_us) / 1e6, "self": int(self_us) / 1e6})
+
+    top_level.sort(key=lambda entry: entry["cumulative"], reverse=True)
+    return {
+        "total_time": sum(entry["cumulative"] for entry in top_level),
+        "modules": modules,
+        "packages": dict(sorted(packages.items(), key=lambda item: item[1], reverse=True)),
+        "top": top_level[:top]
+    }
+
+if __name__ == "__main__":
+    print(json.dumps(cold_start_probe()))
@@ -0,0 +1,465 @@
+"""
+Servidores simulados de OpenAI y Supabase para los benchmarks.
+Este módulo levanta, sin dependencias externas, un servidor compatible con la API de
+OpenAI (embeddings y chat completions, con y sin streaming) y un servidor PostgREST
+con la función ``rpc/match_documents``. La latencia y el tamaño de las respuestas se
+configuran para reproducir distintos escenarios sin llamar a servicios de pago.
+
+Uso:
+    python -m benchmarks.fake_services --embedding-latency lognormal:0.08:0.3 --documents 5
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+# Vocabulario para generar contenidos y respuestas con texto variado
+WORDS = (
+    "sistema datos consulta modelo documento fragmento vector red servidor cliente "
+    "memoria proceso tiempo respuesta contexto búsqueda índice tabla función valor "
+    "análisis resultado método estructura archivo usuario pregunta tema capítulo sección"
+).split()
+
+class LatencyModel:
+    """Distribución de latencias de un servicio simulado.
+
+    Se describe con una cadena ``tipo:parámetros``:
+        - ``fixed:0.05``: latencia constante en segundos.
+        - ``uniform:0.02:0.08``: uniforme entre un mínimo y un máximo.
+        - ``lognormal:0.05:0.4``: log-normal con mediana y sigma (cola larga).
+    """
+
+    def __init__(self, kind: str = "fixed", params: Tuple[float, ...] = (0.0,)):
+        """Inicializa la distribución.
+
+        Args:
+            kind: Tipo de distribución ("fixed", "uniform" o "lognormal").
+            params: Parámetros de la distribución.
+        """
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Distribución de latencia desconocida: {kind}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """Crea una distribución a partir de su descripción textual.
+
+        Args:
+            spec: Descripción ``tipo:parámetros`` (por ejemplo ``lognormal:0.05:0.4``).
+
+        Returns:
+            LatencyModel: Distribución descrita.
+        """
+        kind, *params = spec.split(":")
+        return cls(kind, tuple(float(param) for param in params) or (0.0,))
+
+    def sample(self) -> float:
+        """Obtiene una latencia en segundos."""
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return random.uniform(self.params[0], self.params[1])
+        median, sigma = self.params[0], self.params[1] if len(self.params) > 1 else 0.5
+        return median * float(np.exp(random.gauss(0.0, sigma)))
+
+    def __str__(self) -> str:
+        return ":".join([self.kind, *(str(param) for param in self.params)])
+
+class FakeServiceConfig:
+    """Configuración de los servidores simulados."""
+
+    def __init__(
+        self,
+        embedding_latency: str = "lognormal:0.08:0.3",
+        chat_latency: str = "lognormal:0.4:0.3",
+        token_latency: str = "fixed:0.005",
+        rpc_latency: str = "lognormal:0.05:0.3",
+        dimensions: int = 1536,
+        documents: int = 5,
+        content_size: int = 1000,
+        answer_tokens: int = 150,
+        rate_limit_fraction: float = 0.0,
+        rate_limit_retry_after: float = 0.2,
+        seed: int = 0
+    ):
+        """Inicializa la configuración.
+
+        Args:
+            embedding_latency: Latencia de ``/v1/embeddings``.
+            chat_latency: Latencia hasta el primer token de ``/v1/chat/completions``.
+            token_latency: Latencia entre tokens en las respuestas en streaming.
+            rpc_latency: Latencia de ``rpc/match_documents``.
+            dimensions: Dimensiones de los embeddings devueltos.
+            documents: Número de documentos devueltos por ``match_documents`` (como máximo ``match_count``).
+            content_size: Caracteres de contenido de cada documento.
+            answer_tokens: Palabras de cada respuesta del chat.
+            rate_limit_fraction: Fracción de peticiones a OpenAI respondidas con 429.
+            rate_limit_retry_after: Espera indicada en ``Retry-After`` de las respuestas 429 (segundos).
+            seed: Semilla del generador de latencias.
+        """
+        self.embedding_latency = LatencyModel.parse(embedding_latency)
+        self.chat_latency = LatencyModel.parse(chat_latency)
+        self.token_latency = LatencyModel.parse(token_latency)
+        self.rpc_latency = LatencyModel.parse(rpc_latency)
+        self.dimensions = dimensions
+        self.documents = documents
+        self.content_size = content_size
+        self.answer_tokens = answer_tokens
+        self.rate_limit_fraction = rate_limit_fraction
+        self.rate_limit_retry_after = rate_limit_retry_after
+        self.seed = seed
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte la configuración en un diccionario serializable."""
+        return {
+            key: str(value) if isinstance(value, LatencyModel) else value
+            for key, value in vars(self).items()
+        }
+
+def fake_embedding(text: str, dimensions: int) -> np.ndarray:
+    """Genera un embedding determinista y normalizado para un texto.
+
+    Args:
+        text: Texto de entrada.
+        dimensions: Dimensiones del vector.
+
+    Returns:
+        np.ndarray: Vector float32 de norma 1.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def fake_text(words: int, seed: int) -> str:
+    """Genera un texto pseudoaleatorio determinista.
+
+    Args:
+        words: Número de palabras.
+        seed: Semilla del texto.
+
+    Returns:
+        str: Texto generado.
+    """
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+class FakeServiceStats:
+    """Contadores de peticiones y bytes enviados por ruta."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.bytes_sent: Dict[str, int] = {}
+
+    def record(self, route: str, size: int):
+        """Registra una respuesta enviada."""
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.bytes_sent[route] = self.bytes_sent.get(route, 0) + size
+
+    def to_dict(self) -> Dict[str, Dict[str, int]]:
+        """Obtiene los contadores."""
+        with self._lock:
+            return {"requests": dict(self.requests), "bytes_sent": dict(self.bytes_sent)}
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    """Manejador común: conexiones persistentes, cuerpos JSON y estadísticas."""
+
+    protocol_version = "HTTP/1.1"
+    config: FakeServiceConfig = None
+    stats: FakeServiceStats = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente canceló la petición (por ejemplo, la copia de respaldo que perdió)
+            self.close_connection = True
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send_json(self, route: str, payload: Any, status: int = 200, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.stats.record(route, len(body))
+
+    def do_GET(self):
+        if self.path.endswith("/stats"):
+            self._send_json("/stats", self.stats.to_dict())
+        else:
+            self._send_json(self.path, {"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        # Peticiones de precalentamiento de conexiones
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+        self.stats.record("HEAD", 0)
+
+class OpenAIHandler(_FakeHandler):
+    """Servidor compatible con los endpoints de OpenAI que usa la aplicación."""
+
+    def do_POST(self):
+        data = self._read_json()
+        if self.config.rate_limit_fraction and random.random() < self.config.rate_limit_fraction:
+            self._send_json(
+                "429",
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429,
+                headers={"retry-after-ms": str(int(self.config.rate_limit_retry_after * 1000))}
+            )
+            return
+        if self.path.endswith("/embeddings"):
+            self._embeddings(data)
+        elif self.path.endswith("/chat/completions"):
+            if data.get("stream"):
+                self._chat_stream(data)
+            else:
+                self._chat(data)
+        else:
+            self._send_json(self.path, {"error": {"message": "not found"}}, status=404)
+
+    def _embeddings(self, data: Dict[str, Any]):
+        inputs = data.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dimensions = int(data.get("dimensions") or self.config.dimensions)
+
+        time.sleep(self.config.embedding_latency.sample())
+
+        items = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(str(text), dimensions)
+            if data.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+            else:
+                embedding = vector.tolist()
+            items.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self._send_json("/v1/embeddings", {
+            "object": "list",
+            "data": items,
+            "model": data.get("model", "fake-embedding"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    def _answer(self, data: Dict[str, Any]) -> List[str]:
+        prompt = json.dumps(data.get("messages", []))
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "little")
+        return fake_text(self.config.answer_tokens, seed).split(" ")
+
+    def _completion(self, data: Dict[str, Any], object_type: str, **choice) -> Dict[str, Any]:
+        return {
+            "id": "chatcmpl-fake",
+            "object": object_type,
+            "created": int(time.time()),
+            "model": data.get("model", "fake-chat"),
+            "choices": [{"index": 0, **choice}]
+        }
+
+    def _chat(self, data: Dict[str, Any]):
+        words = self._answer(data)
+        time.sleep(self.config.chat_latency.sample())
+        payload = self._completion(
+            data,
+            "chat.completion",
+            message={"role": "assistant", "content": " ".join(words)},
+            finish_reason="stop"
+        )
+        payload["usage"] = {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)}
+        self._send_json("/v1/chat/completions", payload)
+
+    def _chat_stream(self, data: Dict[str, Any]):
+        words = self._answer(data)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        sent = 0
+
+        def write_event(payload: Any):
+            nonlocal sent
+            event = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode()
+            self.wfile.write(f"{len(event):x}\r\n".encode() + event + b"\r\n")
+            self.wfile.flush()
+            sent += len(event)
+
+        time.sleep(self.config.chat_latency.sample())
+        try:
+            for index, word in enumerate(words):
+                if index:
+                    time.sleep(self.config.token_latency.sample())
+                delta = {"role": "assistant", "content": word} if not index else {"content": " " + word}
+                write_event(self._completion(data, "chat.completion.chunk", delta=delta, finish_reason=None))
+
+            write_event(self._completion(data, "chat.completion.chunk", delta={}, finish_reason="stop"))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # El cliente canceló la generación
+            self.close_connection = True
+            self.stats.record("/v1/chat/completions:stream_cancelled", sent)
+            return
+        self.stats.record("/v1/chat/completions:stream", sent)
+
+class PostgRESTHandler(_FakeHandler):
+    """Servidor PostgREST con la función ``match_documents``."""
+
+    def do_POST(self):
+        if not self.path.startswith("/rest/v1/rpc/match_documents"):
+            self._send_json(self.path, {"message": "not found"}, status=404)
+            return
+
+        params = self._read_json()
+        match_count = int(params.get("match_count") or self.config.documents)
+        threshold = float(params.get("match_threshold") or 0.0)
+
+        # Elegir los documentos a partir de la consulta para que las respuestas varíen entre consultas
+        embedding = params.get("query_embedding") or []
+        if isinstance(embedding, str):
+            # Literal de pgvector ("[0.1,0.2,...]")
+            embedding = json.loads(embedding)
+        seed = int.from_bytes(hashlib.sha256(json.dumps(embedding[:8]).encode()).digest()[:8], "little")
+        rng = random.Random(seed)
+
+        time.sleep(self.config.rpc_latency.sample())
+
+        rows = []
+        similarity = 0.9
+        for position in range(min(match_count, self.config.documents)):
+            similarity -= rng.uniform(0.0, 0.05)
+            if similarity <= threshold:
+                break
+            doc_id = rng.randrange(1_000_000)
+            rows.append({
+                "id": doc_id,
+                "content": fake_text(max(1, self.config.content_size // 7), doc_id)[:self.config.content_size],
+                "metadata": {"filename": f"documento_{doc_id % 100}.txt", "chunk": position},
+                "similarity": similarity
+            })
+        self._send_json("/rest/v1/rpc/match_documents", rows)
+
+class FakeServices:
+    """Servidores simulados de OpenAI y Supabase ejecutándose en hilos."""
+
+    def __init__(self, config: Optional[FakeServiceConfig] = None, host: str = "127.0.0.1"):
+        """Inicializa los servidores sin arrancarlos.
+
+        Args:
+            config: Configuración de latencias y tamaños.
+            host: Dirección en la que escuchan los servidores (puertos efímeros).
+        """
+        self.config = config or FakeServiceConfig()
+        self.stats = FakeServiceStats()
+        random.seed(self.config.seed)
+
+        attributes = {"config": self.config, "stats": self.stats}
+        self.openai_server = ThreadingHTTPServer((host, 0), type("OpenAI", (OpenAIHandler,), attributes))
+        self.postgrest_server = ThreadingHTTPServer((host, 0), type("PostgREST", (PostgRESTHandler,), attributes))
+        self.openai_server.daemon_threads = True
+        self.postgrest_server.daemon_threads = True
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def openai_url(self) -> str:
+        """URL base compatible con OPENAI_BASE_URL."""
+        host, port = self.openai_server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def supabase_url(self) -> str:
+        """URL del proyecto compatible con SUPABASE_URL."""
+        host, port = self.postgrest_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServices":
+        """Arranca los servidores en hilos en segundo plano."""
+        for server in (self.openai_server, self.postgrest_server):
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        """Detiene los servidores."""
+        for server in (self.openai_server, self.postgrest_server):
+            server.shutdown()
+            server.server_close()
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    """Añade a un parser los argumentos de :class:`FakeServiceConfig`."""
+    defaults = FakeServiceConfig()
+    parser.add_argument("--embedding-latency", default=str(defaults.embedding_latency), help="Latencia de embeddings")
+    parser.add_argument("--chat-latency", default=str(defaults.chat_latency), help="Latencia hasta el primer token")
+    parser.add_argument("--token-latency", default=str(defaults.token_latency), help="Latencia entre tokens")
+    parser.add_argument("--rpc-latency", default=str(defaults.rpc_latency), help="Latencia de match_documents")
+    parser.add_argument("--dimensions", type=int, default=defaults.dimensions, help="Dimensiones de los embeddings")
+    parser.add_argument("--documents", type=int, default=defaults.documents, help="Documentos por búsqueda")
+    parser.add_argument("--content-size", type=int, default=defaults.content_size, help="Caracteres por documento")
+    parser.add_argument("--answer-tokens", type=int, default=defaults.answer_tokens, help="Palabras por respuesta")
+    parser.add_argument("--rate-limit-fraction", type=float, default=defaults.rate_limit_fraction,
+                        help="Fracción de peticiones a OpenAI respondidas con 429")
+    parser.add_argument("--rate-limit-retry-after", type=float, default=defaults.rate_limit_retry_after,
+                        help="Retry-After de las respuestas 429 (segundos)")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Semilla de las latencias")
+
+def config_from_arguments(args: argparse.Namespace) -> FakeServiceConfig:
+    """Construye la configuración a partir de los argumentos de :func:`add_config_arguments`."""
+    return FakeServiceConfig(
+        embedding_latency=args.embedding_latency,
+        chat_latency=args.chat_latency,
+        token_latency=args.token_latency,
+        rpc_latency=args.rpc_latency,
+        dimensions=args.dimensions,
+        documents=args.documents,
+        content_size=args.content_size,
+        answer_tokens=args.answer_tokens,
+        rate_limit_fraction=args.rate_limit_fraction,
+        rate_limit_retry_after=args.rate_limit_retry_after,
+        seed=args.seed
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidores simulados de OpenAI y Supabase")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    services = FakeServices(config_from_arguments(args)).start()
+    # La primera línea de la salida indica las URL a las que apuntar la aplicación
+    print(json.dumps({"openai_url": services.openai_url, "supabase_url": services.supabase_url}), flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        services.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Benchmark de carga del sistema RAG sin servicios externos.
+El arnés levanta los servidores simulados de :mod:`benchmarks.fake_services` en un
+proceso aparte, apunta la aplicación hacia ellos y mide:
+
+    - el arranque en frío (importación del endpoint, creación del sistema y primera consulta)
+      en procesos nuevos;
+    - la API de la biblioteca (``RAGQuerySystem.query``) y el manejador de ``api/query.py``
+      (servido por HTTP, con y sin streaming) con niveles de concurrencia crecientes;
+    - percentiles de latencia de extremo a extremo y por etapa, rendimiento y memoria máxima.
+
+Los resultados se guardan en JSON para compararlos entre ejecuciones:
+
+    python -m benchmarks.harness run --concurrency 1,4,16 --requests 64 --output results/base.json
+    python -m benchmarks.harness compare results/base.json results/nuevo.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.cold_start import load_query_handler, parse_importtime, peak_rss_mb
+from benchmarks.fake_services import add_config_arguments, config_from_arguments
+
+# Configurar logging
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ("library", "handler", "stream")
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Calcula percentiles exactos de una lista de latencias.
+
+    Args:
+        values: Latencias en segundos.
+
+    Returns:
+        Dict[str, float]: Media, máximo y percentiles p50, p95 y p99.
+    """
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    ordered = sorted(values)
+
+    def rank(percentile: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(percentile / 100 * len(ordered))) - 1))]
+
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "max": ordered[-1]
+    }
+
+def benchmark_environment(services: Dict[str, str], with_caches: bool) -> Dict[str, str]:
+    """Variables de entorno que apuntan la aplicación a los servidores simulados.
+
+    Args:
+        services: URL de los servidores simulados.
+        with_caches: Si se mantienen activas las cachés de embeddings y de respuestas.
+
+    Returns:
+        Dict[str, str]: Variables de entorno a aplicar.
+    """
+    environment = {
+        "OPENAI_API_KEY": "sk-benchmark",
+        "OPENAI_BASE_URL": services["openai_url"],
+        "OPENAI_API_BASE": services["openai_url"],
+        "SUPABASE_URL": services["supabase_url"],
+        "SUPABASE_KEY": "benchmark-key",
+        "VECTOR_BACKEND": "supabase",
+        # Los servidores simulados no limitan el ritmo: se mide la aplicación, no los límites de OpenAI
+        "OPENAI_EMBEDDING_RPM": "0",
+        "OPENAI_EMBEDDING_TPM": "0",
+        "OPENAI_CHAT_RPM": "0",
+        "OPENAI_CHAT_TPM": "0",
+        # Optimizaciones desactivadas por defecto que se miden en los benchmarks
+        "HTTP_PREWARM": "true",
+        "SINGLE_FLIGHT_ENABLED": "true",
+        "ADMISSION_ENABLED": "true",
+        "EMBEDDING_ENCODING": "base64"
+    }
+    # Con las cachés activas solo se mediría la primera consulta de cada texto
+    environment["EMBEDDING_CACHE_ENABLED"] = "true" if with_caches else "false"
+    environment["RESULT_CACHE_ENABLED"] = "true" if with_caches else "false"
+    return environment
+
+def start_fake_services(args: argparse.Namespace) -> Tuple[subprocess.Popen, Dict[str, str]]:
+    """Arranca los servidores simulados en otro proceso para no competir por el GIL.
+
+    Args:
+        args: Argumentos de configuración de los servidores.
+
+    Returns:
+        Tuple[subprocess.Popen, Dict[str, str]]: Proceso y URL de los servidores.
+    """
+    command = [sys.executable, "-m", "benchmarks.fake_services"]
+    for name, value in config_from_arguments(args).to_dict().items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    process = subprocess.Popen(command, cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True)
+    services = json.loads(process.stdout.readline())
+    logger.info(f"Servidores simulados: {services}")
+    return process, services
+
+def measure_cold_start(environment: Dict[str, str], runs: int) -> Dict[str, Any]:
+    """Mide el arranque en frío en procesos nuevos.
+
+    Además de los procesos cronometrados, lanza uno con ``-X importtime`` para obtener
+    el informe de importaciones (su sobrecarga no afecta a las demás mediciones).
+
+    Args:
+        environment: Variables de entorno de la aplicación.
+        runs: Número de procesos a lanzar.
+
+    Returns:
+        Dict[str, Any]: Mediciones de cada proceso, medianas e informe de importaciones.
+    """
+    def probe(*options: str) -> subprocess.CompletedProcess:
+        return subprocess.run(
+            [sys.executable, *options, "-m", "benchmarks.cold_start"],
+            cwd=ROOT_DIR,
+            env={**os.environ, **environment},
+            capture_output=True,
+            text=True,
+            check=True
+        )
+
+    samples = [json.loads(probe().stdout.strip().splitlines()[-1]) for _ in range(runs)]
+
+    summary = {}
+    for key in ("import_time", "init_time", "first_query_time", "total_time", "peak_rss_mb"):
+        values = sorted(sample[key] for sample in samples)
+        summary[key] = values[len(values) // 2]
+
+    imports = parse_importtime(probe("-X", "importtime").stderr)
+    return {"runs": samples, "median": summary, "imports": imports}
+
+class HandlerServer:
+    """Servidor HTTP local que sirve el manejador de ``api/query.py``."""
+
+    def __init__(self, handler_class):
+        # Silenciar el log de acceso para no medir la escritura en stderr
+        quiet_handler = type("QuietHandler", (handler_class,), {"log_message": lambda self, *args: None})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), quiet_handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.server.server_address[1]
+
+    def __enter__(self) -> "HandlerServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def post_query(port: int, query: str, stream: bool) -> Tuple[float, Optional[float], bool]:
+    """Envía una consulta al manejador.
+
+    Args:
+        port: Puerto del servidor del manejador.
+        query: Texto de la consulta.
+        stream: Si se solicita la respuesta en streaming (NDJSON).
+
+    Returns:
+        Tuple[float, Optional[float], bool]: Latencia total, tiempo hasta el primer token
+                                             (solo en streaming) y si hubo error.
+    """
+    body = json.dumps({"query": query, "stream": stream})
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    try:
+        connection.request("POST", "/api/query", body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if not stream:
+            payload = json.loads(response.read())
+            failed = response.status != 200 or "error" in payload.get("metadata", {})
+            return time.perf_counter() - start, None, failed
+
+        first_token = None
+        failed = response.status != 200
+        for line in response:
+            event = json.loads(line)
+            if event["type"] == "token" and first_token is None:
+                first_token = time.perf_counter() - start
+            elif event["type"] == "error":
+                failed = True
+        return time.perf_counter() - start, first_token, failed
+    finally:
+        connection.close()
+
+def run_level(call: Callable[[str], Tuple[float, Optional[float], bool]], concurrency: int, requests: int, offset: int) -> Dict[str, Any]:
+    """Ejecuta un nivel de concurrencia.
+
+    Args:
+        call: Función que realiza una consulta y devuelve latencia, primer token y error.
+        concurrency: Consultas simultáneas.
+        requests: Número total de consultas.
+        offset: Desplazamiento para que los textos de las consultas no se repitan entre niveles.
+
+    Returns:
+        Dict[str, Any]: Latencias, rendimiento, etapas, contadores y memoria del nivel.
+    """
+    from app.utils.performance_metrics import performance_tracker
+
+    queries = [f"Pregunta de prueba {offset + i} sobre el tema {(offset + i) % 17}" for i in range(requests)]
+    performance_tracker.reset()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(call, queries))
+    wall_time = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in outcomes]
+    first_tokens = [first_token for _, first_token, _ in outcomes if first_token is not None]
+    level = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for _, _, failed in outcomes if failed),
+        "wall_time": wall_time,
+        "throughput": requests / wall_time if wall_time else 0.0,
+        "latency": percentiles(latencies),
+        "stages": performance_tracker.get_metrics(),
+        "counters": performance_tracker.get_counters(),
+        "peak_rss_mb": peak_rss_mb()
+    }
+    if first_tokens:
+        level["time_to_first_token"] = percentiles(first_tokens)
+    return level
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Ejecuta el benchmark completo.
+
+    Args:
+        args: Argumentos de la línea de comandos.
+
+    Returns:
+        Dict[str, Any]: Resultados serializables.
+    """
+    process, services = start_fake_services(args)
+    try:
+        environment = benchmark_environment(services, args.with_caches)
+        os.environ.update(environment)
+
+        results: Dict[str, Any] = {
+            "created_at": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fake_services": config_from_arguments(args).to_dict(),
+            "with_caches": args.with_caches,
+            "runs": []
+        }
+
+        if args.cold_runs:
+            logger.info("Midiendo el arranque en frío")
+            results["cold_start"] = measure_cold_start(environment, args.cold_runs)
+            cold_start = results["cold_start"]
+            print(
+                f"arranque en frío: importación {cold_start['median']['import_time'] * 1000:.0f} ms, "
+                f"sistema {cold_start['median']['init_time'] * 1000:.0f} ms, "
+                f"primera consulta {cold_start['median']['first_query_time'] * 1000:.0f} ms",
+                file=sys.stderr
+            )
+            for package, seconds in list(cold_start["imports"]["packages"].items())[:10]:
+                print(f"  importación de {package:<24} {seconds * 1000:8.1f} ms", file=sys.stderr)
+
+        module = load_query_handler()
+        logging.getLogger().setLevel(getattr(logging, args.log_level))
+        rag_system, _ = module.rag_system_registry.get_system()
+
+        def library_call(query: str) -> Tuple[float, Optional[float], bool]:
+            start = time.perf_counter()
+            result = rag_system.query(query)
+            return time.perf_counter() - start, None, "error" in result["metadata"]
+
+        concurrency_levels = [int(level) for level in args.concurrency.split(",")]
+        modes = [mode for mode in args.modes.split(",") if mode]
+
+        with HandlerServer(module.handler) as server:
+            calls = {
+                "library": library_call,
+                "handler": lambda query: post_query(server.port, query, stream=False),
+                "stream": lambda query: post_query(server.port, query, stream=True)
+            }
+            offset = 0
+            for mode in modes:
+                # Calentamiento: conexiones y cachés de importación fuera de la medición
+                for _ in range(args.warmup):
+                    calls[mode]("Pregunta de calentamiento")
+                for concurrency in concurrency_levels:
+                    logger.info(f"Modo {mode}, concurrencia {concurrency}")
+                    level = run_level(calls[mode], concurrency, args.requests, offset)
+                    level["mode"] = mode
+                    results["runs"].append(level)
+                    offset += args.requests
+                    print(
+                        f"{mode:>8} c={concurrency:<3} {level['throughput']:8.2f} req/s  "
+                        f"p50={level['latency']['p50'] * 1000:8.1f} ms  "
+                        f"p95={level['latency']['p95'] * 1000:8.1f} ms  "
+                        f"errores={level['errors']}  rss={level['peak_rss_mb']:.0f} MB",
+                        file=sys.stderr
+                    )
+
+        results["peak_rss_mb"] = peak_rss_mb()
+        # Ambos servidores comparten los contadores de peticiones y bytes
+        results["fake_services_stats"] = json.loads(urllib.request.urlopen(f"{services['supabase_url']}/stats").read())
+        return results
+    finally:
+        process.terminate()
+        process.wait()
+
+def compare_results(baseline: Dict[str, Any], candidate: Dict[str, Any], tolerance: float) -> List[str]:
+    """Compara dos ejecuciones y muestra las diferencias por modo y concurrencia.
+
+    Args:
+        baseline: Resultados de referencia.
+        candidate: Resultados a evaluar.
+        tolerance: Empeoramiento relativo a partir del cual se considera una regresión.
+
+    Returns:
+        List[str]: Descripción de las regresiones detectadas.
+    """
+    regressions = []
+    baseline_runs = {(run["mode"], run["concurrency"]): run for run in baseline.get("runs", [])}
+
+    print(f"{'modo':>8} {'c':>4} {'req/s':>18} {'p50 (ms)':>22} {'p95 (ms)':>22}")
+    for run in candidate.get("runs", []):
+        key = (run["mode"], run["concurrency"])
+        reference = baseline_runs.get(key)
+        if reference is None:
+            continue
+
+        def delta(new: float, old: float) -> float:
+            return (new - old) / old if old else 0.0
+
+        throughput = delta(run["throughput"], reference["throughput"])
+        p50 = delta(run["latency"]["p50"], reference["latency"]["p50"])
+        p95 = delta(run["latency"]["p95"], reference["latency"]["p95"])
+        print(
+            f"{key[0]:>8} {key[1]:>4} "
+            f"{run['throughput']:9.2f} ({throughput:+6.1%}) "
+            f"{run['latency']['p50'] * 1000:11.1f} ({p50:+6.1%}) "
+            f"{run['latency']['p95'] * 1000:11.1f} ({p95:+6.1%})"
+        )
+        if throughput < -tolerance:
+            regressions.append(f"{key}: rendimiento {throughput:+.1%}")
+        if p95 > tolerance:
+            regressions.append(f"{key}: p95 {p95:+.1%}")
+
+    if "cold_start" in baseline and "cold_start" in candidate:
+        old = baseline["cold_start"]["median"]["total_time"]
+        new = candidate["cold_start"]["median"]["total_time"]
+        change = (new - old) / old if old else 0.0
+        print(f"arranque en frío: {new * 1000:.1f} ms ({change:+.1%})")
+        if change > tolerance:
+            regressions.append(f"arranque en frío {change:+.1%}")
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del sistema RAG con servicios simulados")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Ejecuta el benchmark")
+    run_parser.add_argument("--concurrency", default="1,2,4,8,16", help="Niveles de concurrencia separados por comas")
+    run_parser.add_argument("--requests", type=int, default=64, help="Consultas por nivel")
+    run_parser.add_argument("--modes", default=",".join(MODES), help=f"Modos a medir ({', '.join(MODES)})")
+    run_parser.add_argument("--warmup", type=int, default=2, help="Consultas de calentamiento por modo")
+    run_parser.add_argument("--cold-runs", type=int, default=3, help="Procesos para medir el arranque en frío (0 para omitirlo)")
+    run_parser.add_argument("--with-caches", action="store_true", help="Mantener activas las cachés de la aplicación")
+    run_parser.add_argument("--log-level", default="WARNING", help="Nivel de logging durante la medición")
+    run_parser.add_argument("--output", help="Fichero JSON de resultados")
+    add_config_arguments(run_parser)
+
+    compare_parser = subparsers.add_parser("compare", help="Compara dos ficheros de resultados")
+    compare_parser.add_argument("baseline", help="Resultados de referencia")
+    compare_parser.add_argument("candidate", help="Resultados a evaluar")
+    compare_parser.add_argument("--tolerance", type=float, default=0.1, help="Empeoramiento relativo tolerado")
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.candidate, "r", encoding="utf-8") as f:
+            candidate = json.load(f)
+        regressions = compare_results(baseline, candidate, args.tolerance)
+        for regression in regressions:
+            print(f"Regresión: {regression}")
+        sys.exit(1 if regressions else 0)
+
+    logging.basicConfig(level=logging.INFO)
+    results = run_benchmark(args)
+    output = json.dumps(results, indent=2)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        logger.info(f"Resultados guardados en {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -8,6 +8,135 @@ document.addEventListener('DOMContentLoaded', function() {
     // Asegurar que el indicador de carga esté oculto inicialmente
     loadingIndicator.classList.add('hidden');
     
+    // Mostrar la respuesta, convirtiendo los saltos de línea en <br> y aplicando formato a los párrafos
+    function renderAnswer(answer) {
+        const formattedAnswer = answer || 'No se obtuvo respuesta';
+        const paragraphs = formattedAnswer.split('\n\n').filter(p => p.trim());
+        
+        responseContent.innerHTML = `
+            <div class="answer-container">
+                ${paragraphs.map(p => `<p>${p.replace(/\n/g, '<br>')}</p>`).join('')}
+            </div>
+        `;
+    }
+    
+    // Mostrar fuentes con mejor formato
+    function renderSources(sources) {
+        if (!sources || sources.length === 0) {
+            sourcesContent.innerHTML = '<p class="info-message">No hay fuentes disponibles para esta consulta</p>';
+            return;
+        }
+        
+        const sourcesList = document.createElement('div');
+        sourcesList.className = 'sources-list';
+        
+        sources.forEach((source, index) => {
+            const similarity = source.similarity ? Math.round(source.similarity * 100) : null;
+            const sourceItem = document.createElement('div');
+            sourceItem.className = 'source-item';
+            
+            // Formatear el contenido de la fuente para eliminar espacios innecesarios y saltos de línea
+            let formattedContent = '';
+            if (source.content) {
+                formattedContent = source.content
+                    .substring(0, 300) 
+                    .trim()
+                    .replace(/\s+/g, ' ');
+                    
+                if (source.content.length > 300 || source.truncated) {
+                    formattedContent += '...';
+                }
+            } else {
+                formattedContent = 'Sin contenido';
+            }
+            
+            sourceItem.innerHTML = `
+                <div class="source-header">
+                    <h4>Fuente ${index + 1}${similarity ? ` <span class="similarity">(${similarity}% similitud)</span>` : ''}</h4>
+                    <div class="source-meta">
+                        ${source.metadata?.filename ? `<span class="filename">${source.metadata.filename}</span>` : ''}
+                        ${source.metadata?.chunk_index ? `<span class="chunk">Fragmento ${source.metadata.chunk_index}</span>` : ''}
+                    </div>
+                </div>
+                <div class="source-content">
+                    ${formattedContent}
+                </div>
+            `;
+            sourcesList.appendChild(sourceItem);
+        });
+        
+        // Limpiar el contenido existente y agregar el nuevo
+        sourcesContent.innerHTML = '<h3>Fuentes consultadas</h3>';
+        sourcesContent.appendChild(sourcesList);
+    }
+    
+    // Mostrar los detalles completos de un error del servidor
+    function renderServerError(status, data) {
+        let errorMessage = `<p class="error">Error del servidor (${status}):</p>`;
+        
+        if (data.error) {
+            errorMessage += `<p>${data.error}</p>`;
+        }
+        
+        if (data.traceback) {
+            errorMessage += `<details>
+                <summary>Detalles técnicos</summary>
+                <pre>${data.traceback}</pre>
+            </details>`;
+        }
+        
+        // Mostrar estado de las variables de entorno
+        if (data.api_key_set !== undefined) {
+            errorMessage += `<p>Estado de configuración:</p>
+            <ul>
+                <li>API Key de OpenAI: ${data.api_key_set ? '✅ Configurada' : '❌ No configurada'}</li>
+                <li>URL de Supabase: ${data.supabase_url_set ? '✅ Configurada' : '❌ No configurada'}</li>
+                <li>Key de Supabase: ${data.supabase_key_set ? '✅ Configurada' : '❌ No configurada'}</li>
+            </ul>`;
+        }
+        
+        responseContent.innerHTML = errorMessage;
+    }
+    
+    // Leer una respuesta NDJSON y mostrarla a medida que llegan los eventos
+    async function readStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        
+        const handleEvent = (event) => {
+            if (event.type === 'sources') {
+                renderSources(event.sources);
+            } else if (event.type === 'token') {
+                // Ocultar el indicador de carga en cuanto llega el primer fragmento
+                loadingIndicator.classList.add('hidden');
+                answer += event.content;
+                renderAnswer(answer);
+            } else if (event.type === 'done') {
+                console.debug('Metadatos de la consulta:', event.metadata);
+            } else if (event.type === 'error') {
+                renderAnswer(`Lo siento, ha ocurrido un error al procesar tu consulta: ${event.error}`);
+            }
+        };
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                break;
+            }
+            
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
+        }
+        
+        if (buffer.trim()) {
+            handleEvent(JSON.parse(buffer));
+        }
+    }
+    
     // Función para enviar la consulta
     async function sendQuery() {
         const query = queryInput.value.trim();
@@ -26,11 +155,20 @@ document.addEventListener('DOMContentLoaded', function() {
             const response = await fetch('/api/query', {
                 method: 'POST',
                 headers: {
-                    'Content-Type': 'application/json'
+                    'Content-Type': 'application/json',
+                    'Accept': 'application/x-ndjson, application/json'
                 },
-                body: JSON.stringify({ query })
+                // La interfaz solo muestra el inicio de cada fuente: basta con pedir fragmentos
+                body: JSON.stringify({ query, stream: true, source_mode: 'snippet', snippet_chars: 300 })
             });
             
+            // Respuesta en streaming: mostrar la respuesta de forma progresiva
+            const contentType = response.headers.get('Content-Type') || '';
+            if (response.ok && response.body && contentType.includes('application/x-ndjson')) {
+                await readStream(response);
+                return;
+            }
+            
             // Capturar el texto de la respuesta para depuración
             const responseText = await response.text();
             let data;
@@ -53,92 +191,13 @@ document.addEventListener('DOMContentLoaded', function() {
             
             if (!response.ok) {
                 // Si hay un error en la respuesta, mostrar detalles completos
-                let errorMessage = `<p class="error">Error del servidor (${response.status}):</p>`;
-                
-                if (data.error) {
-                    errorMessage += `<p>${data.error}</p>`;
-                }
-                
-                if (data.traceback) {
-                    errorMessage += `<details>
-                        <summary>Detalles técnicos</summary>
-                        <pre>${data.traceback}</pre>
-                    </details>`;
-                }
-                
-                // Mostrar estado de las variables de entorno
-                if (data.api_key_set !== undefined) {
-                    errorMessage += `<p>Estado de configuración:</p>
-                    <ul>
-                        <li>API Key de OpenAI: ${data.api_key_set ? '✅ Configurada' : '❌ No configurada'}</li>
-                        <li>URL de Supabase: ${data.supabase_url_set ? '✅ Configurada' : '❌ No configurada'}</li>
-                        <li>Key de Supabase: ${data.supabase_key_set ? '✅ Configurada' : '❌ No configurada'}</li>
-                    </ul>`;
-                }
-                
-                responseContent.innerHTML = errorMessage;
+                renderServerError(response.status, data);
                 return;
             }
             
             // Mostrar respuesta exitosa
-            // Convertir los saltos de línea en <br> y aplicar formato para los párrafos
-            const formattedAnswer = data.answer || data.response || 'No se obtuvo respuesta';
-            const paragraphs = formattedAnswer.split('\n\n').filter(p => p.trim());
-            
-            const answerHtml = `
-                <div class="answer-container">
-                    ${paragraphs.map(p => `<p>${p.replace(/\n/g, '<br>')}</p>`).join('')}
-                </div>
-            `;
-            
-            responseContent.innerHTML = answerHtml;
-            
-            // Mostrar fuentes con mejor formato
-            if (data.sources && data.sources.length > 0) {
-                const sourcesList = document.createElement('div');
-                sourcesList.className = 'sources-list';
-                
-                data.sources.forEach((source, index) => {
-                    const similarity = source.similarity ? Math.round(source.similarity * 100) : null;
-                    const sourceItem = document.createElement('div');
-                    sourceItem.className = 'source-item';
-                    
-                    // Formatear el contenido de la fuente para eliminar espacios innecesarios y saltos de línea
-                    let formattedContent = '';
-                    if (source.content) {
-                        formattedContent = source.content
-                            .substring(0, 300) 
-                            .trim()
-                            .replace(/\s+/g, ' ');
-                            
-                        if (source.content.length > 300) {
-                            formattedContent += '...';
-                        }
-                    } else {
-                        formattedContent = 'Sin contenido';
-                    }
-                    
-                    sourceItem.innerHTML = `
-                        <div class="source-header">
-                            <h4>Fuente ${index + 1}${similarity ? ` <span class="similarity">(${similarity}% similitud)</span>` : ''}</h4>
-                            <div class="source-meta">
-                                ${source.metadata?.filename ? `<span class="filename">${source.metadata.filename}</span>` : ''}
-                                ${source.metadata?.chunk_index ? `<span class="chunk">Fragmento ${source.metadata.chunk_index}</span>` : ''}
-                            </div>
-                        </div>
-                        <div class="source-content">
-                            ${formattedContent}
-                        </div>
-                    `;
-                    sourcesList.appendChild(sourceItem);
-                });
-                
-                // Limpiar el contenido existente y agregar el nuevo
-                sourcesContent.innerHTML = '<h3>Fuentes consultadas</h3>';
-                sourcesContent.appendChild(sourcesList);
-            } else {
-                sourcesContent.innerHTML = '<p class="info-message">No hay fuentes disponibles para esta consulta</p>';
-            }
+            renderAnswer(data.answer || data.response);
+            renderSources(data.sources);
         } catch (error) {
             // Error al realizar la petición
             responseContent.innerHTML = `
@@ -0,0 +1,112 @@
+"""
+Configuración común de las pruebas.
+Las pruebas no acceden a OpenAI ni a Supabase: usan los servidores simulados de
+``benchmarks.fake_services`` y directorios temporales para las cachés en disco.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Añadir la raíz del repositorio al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# La configuración se lee al importar ``app.config.settings``: se fija antes de cargar la aplicación
+_TEST_DIR = tempfile.mkdtemp(prefix="raglec_tests_")
+os.environ.update({
+    "OPENAI_API_KEY": "sk-test",
+    "SUPABASE_KEY": "test-key",
+    "EMBEDDING_CACHE_DIR": os.path.join(_TEST_DIR, "embedding_cache"),
+    "PROFILE_DIR": os.path.join(_TEST_DIR, "profiles"),
+    "QUERY_LOG_PATH": "",
+    "WARM_CACHE_SNAPSHOT": "",
+    "VECTOR_SHARDS": "",
+    "OPENAI_EMBEDDING_RPM": "0",
+    "OPENAI_EMBEDDING_TPM": "0",
+    "OPENAI_CHAT_RPM": "0",
+    "OPENAI_CHAT_TPM": "0"
+})
+
+from benchmarks.fake_services import FakeServiceConfig, FakeServices
+
+# Dimensiones de los embeddings simulados (pequeñas para que las pruebas sean rápidas)
+DIMENSIONS = 64
+
+@pytest.fixture(scope="session")
+def fake_services():
+    """Servidores simulados de OpenAI y PostgREST sin latencia añadida."""
+    services = FakeServices(FakeServiceConfig(
+        embedding_latency="fixed:0",
+        chat_latency="fixed:0",
+        token_latency="fixed:0",
+        rpc_latency="fixed:0",
+        dimensions=DIMENSIONS,
+        documents=5,
+        content_size=200,
+        answer_tokens=10
+    )).start()
+    yield services
+    services.stop()
+
+@pytest.fixture
+def make_rag_system(fake_services, monkeypatch):
+    """Crea sistemas RAG apuntados a los servidores simulados y los cierra al terminar."""
+    from app.query.rag_query import RAGQuerySystem
+
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    systems = []
+
+    def make(**options):
+        options.setdefault("api_key", "sk-test")
+        options.setdefault("supabase_url", fake_services.supabase_url)
+        options.setdefault("supabase_key", "test-key")
+        options.setdefault("vector_backend", "supabase")
+        options.setdefault("vector_shards", "")
+        system = RAGQuerySystem(**options)
+        systems.append(system)
+        return system
+
+    yield make
+    for system in systems:
+        system.close()
+
+@pytest.fixture
+def rag_system(make_rag_system):
+    """Sistema RAG con la configuración por defecto apuntado a los servidores simulados."""
+    return make_rag_system()
+
+@pytest.fixture
+def serve_api(fake_services, monkeypatch):
+    """Sirve por HTTP un endpoint de ``api/`` con el sistema RAG apuntado a los servidores simulados.
+
+    Devuelve una función que recibe el nombre del módulo (``query`` o ``query_batch``) y
+    devuelve el puerto del servidor local.
+    """
+    import importlib.util
+
+    from app.config import settings
+    from app.query.system_registry import rag_system_registry
+    from benchmarks.harness import ROOT_DIR, HandlerServer
+
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    monkeypatch.setattr(settings, "SUPABASE_URL", fake_services.supabase_url)
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "supabase")
+    monkeypatch.setattr(settings, "VECTOR_SHARDS", "")
+    rag_system_registry.invalidate()
+    servers = []
+
+    def serve(name: str) -> int:
+        # Igual que el runtime de Vercel, el endpoint se importa por ruta de fichero
+        spec = importlib.util.spec_from_file_location(f"api_{name}", os.path.join(ROOT_DIR, "api", f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        server = HandlerServer(module.handler).__enter__()
+        servers.append(server)
+        return server.port
+
+    yield serve
+    for server in servers:
+        server.__exit__(None, None, None)
+    rag_system_registry.invalidate()
@@ -0,0 +1,116 @@
+"""Pruebas del control de admisión, los reintentos y el rechazo por saturación."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from app.query import rag_query
+from app.utils.admission import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    AdmissionController,
+    TokenBucket,
+    UpstreamLimiter,
+    UpstreamOverloadedError,
+    parse_retry_after
+)
+from benchmarks.fake_services import FakeServiceConfig, FakeServices
+from conftest import DIMENSIONS
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=60, burst_seconds=2)
+    now = bucket.updated
+    assert bucket.capacity == 2
+    assert bucket.wait_time(2, now) == 0
+    bucket.consume(2)
+    assert bucket.wait_time(1, now) == pytest.approx(1.0)
+    assert bucket.wait_time(1, now + 1.0) == pytest.approx(0.0)
+
+def test_parse_retry_after():
+    assert parse_retry_after({"retry-after-ms": "250"}) == 0.25
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert parse_retry_after({}) is None
+
+def test_interactive_requests_overtake_batch_requests():
+    limiter = UpstreamLimiter("chat", requests_per_minute=1200)
+    limiter.request_bucket.tokens = 0
+    order = []
+
+    async def call(name, priority):
+        await limiter.acquire(priority=priority)
+        order.append(name)
+
+    async def run():
+        batch = [asyncio.ensure_future(call(f"batch{i}", PRIORITY_BATCH)) for i in range(3)]
+        await asyncio.sleep(0)
+        interactive = asyncio.ensure_future(call("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.gather(*batch, interactive)
+
+    asyncio.run(run())
+    assert order[0] == "interactive"
+
+def test_full_queue_is_rejected_and_shed():
+    limiter = UpstreamLimiter("chat", requests_per_minute=60, max_queue=1, max_wait=5)
+    limiter.request_bucket.tokens = 0
+    controller = AdmissionController(limiters={"chat": limiter})
+
+    async def run():
+        waiting = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamOverloadedError) as error:
+            await limiter.acquire()
+        with pytest.raises(UpstreamOverloadedError):
+            controller.check()
+        waiting.cancel()
+        return error.value
+
+    error = asyncio.run(run())
+    assert error.status == 503
+    assert error.retry_after >= 1
+
+def test_transient_errors_are_retried():
+    controller = AdmissionController(limiters={}, max_retries=3, base_delay=0.001, max_delay=0.01)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise httpx.ConnectError("connection refused")
+        return "ok"
+
+    assert asyncio.run(controller.call("chat", flaky)) == "ok"
+    assert len(attempts) == 3
+
+def test_non_transient_errors_are_not_retried():
+    controller = AdmissionController(limiters={}, max_retries=3, base_delay=0.001)
+    attempts = []
+
+    async def broken():
+        attempts.append(1)
+        raise ValueError("respuesta inválida")
+
+    with pytest.raises(ValueError):
+        asyncio.run(controller.call("chat", broken))
+    assert len(attempts) == 1
+
+@pytest.fixture
+def rate_limited_services():
+    services = FakeServices(FakeServiceConfig(
+        dimensions=DIMENSIONS, rate_limit_fraction=1.0, rate_limit_retry_after=30.0
+    )).start()
+    yield services
+    services.stop()
+
+def test_rate_limited_query_reports_retry_after(make_rag_system, rate_limited_services, monkeypatch):
+    monkeypatch.setattr(rag_query, "ADMISSION_ENABLED", True)
+    monkeypatch.setenv("OPENAI_BASE_URL", rate_limited_services.openai_url)
+    rag_system = make_rag_system(supabase_url=rate_limited_services.supabase_url)
+
+    metadata = rag_system.query("Pregunta con límite de peticiones")["metadata"]
+
+    assert metadata["status"] == 429
+    assert metadata["retry_after"] == pytest.approx(30.0)
+    assert metadata["upstream"] == "embeddings"
+    # El límite pausa las llamadas siguientes en lugar de insistir
+    assert rag_system.admission.limiters["embeddings"].get_stats()["paused_for"] > 0
@@ -0,0 +1,90 @@
+"""Pruebas del índice IVF con códigos int8."""
+
+import os
+
+import numpy as np
+import pytest
+
+from app.database.ann_index import IVFIndex, exact_search, quantize, recall_report
+from app.database.local_store import EMBEDDINGS_FILE, LocalVectorStore, write_snapshot
+
+def clustered_vectors(n: int = 600, dimensions: int = 32, clusters: int = 8, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.3 * rng.standard_normal((n, dimensions))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+def rows_from(vectors: np.ndarray):
+    return [{"id": i, "content": f"doc {i}", "metadata": {}, "embedding": vector.tolist()} for i, vector in enumerate(vectors)]
+
+def test_int8_quantization_is_close():
+    vectors = clustered_vectors(50)
+    codes, scales = quantize(vectors)
+    assert codes.dtype == np.int8
+    np.testing.assert_allclose(codes * scales[:, None], vectors, atol=float(scales.max()))
+
+def test_search_with_all_lists_and_rerank_is_exact():
+    vectors = clustered_vectors()
+    index = IVFIndex.build(vectors, n_lists=16, n_iter=5)
+    query = vectors[3] + 0.05
+
+    rows, scores = index.search(query, 10, nprobe=16, exact_vectors=vectors)
+
+    assert rows.tolist() == exact_search(vectors, query, 10).tolist()
+    assert np.all(np.diff(scores) <= 0)
+
+def test_recall_improves_with_nprobe():
+    vectors = clustered_vectors()
+    index = IVFIndex.build(vectors, n_lists=16, n_iter=5)
+    report = recall_report(index, vectors, vectors[:20], k=5, nprobes=(1, 16))
+    assert report[0]["recall"] <= report[1]["recall"]
+    assert report[1]["recall"] == pytest.approx(1.0)
+
+def test_empty_index_builds_saves_and_searches(tmp_path):
+    index = IVFIndex.build(np.zeros((0, 32), dtype=np.float32), n_lists=16)
+    index.save(str(tmp_path))
+    loaded = IVFIndex.load(str(tmp_path))
+
+    rows, scores = loaded.search(np.ones(32, dtype=np.float32), 5)
+    assert rows.size == 0 and scores.size == 0
+
+def test_empty_snapshot_with_ann_backend(tmp_path):
+    snapshot = write_snapshot(str(tmp_path), [], "documents")
+    vectors = np.load(os.path.join(str(tmp_path), EMBEDDINGS_FILE))
+    IVFIndex.build(vectors, snapshot=snapshot).save(str(tmp_path))
+
+    store = LocalVectorStore(str(tmp_path), use_ann=True)
+    assert len(store.search_results(np.ones(32, dtype=np.float32), 0.0, 5)) == 0
+
+def test_interrupted_save_leaves_no_index(tmp_path, monkeypatch):
+    vectors = clustered_vectors(100)
+    IVFIndex.build(vectors, n_lists=4, n_iter=2).save(str(tmp_path))
+    replace = os.replace
+    calls = []
+
+    def failing_replace(src, dst):
+        calls.append(dst)
+        if len(calls) == 3:
+            raise OSError("disco lleno")
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        IVFIndex.build(clustered_vectors(200, seed=1), n_lists=4, n_iter=2).save(str(tmp_path))
+
+    # Nunca arrays nuevos con el manifiesto anterior
+    assert not IVFIndex.exists(str(tmp_path))
+
+def test_stale_index_falls_back_to_exact_search(tmp_path):
+    vectors = clustered_vectors(100)
+    snapshot = write_snapshot(str(tmp_path), rows_from(vectors), "documents")
+    IVFIndex.build(vectors, n_lists=4, n_iter=2, snapshot=snapshot).save(str(tmp_path))
+    assert LocalVectorStore(str(tmp_path), use_ann=True).ann_index is not None
+
+    # Nueva exportación con el mismo número de documentos: el índice queda obsoleto
+    write_snapshot(str(tmp_path), rows_from(vectors[::-1]), "documents")
+    store = LocalVectorStore(str(tmp_path), use_ann=True)
+    assert store.ann_index is None
+    rows, _ = store.search(vectors[0], -1.0, 1)
+    assert rows.tolist() == [99]
@@ -0,0 +1,57 @@
+"""Pruebas del pipeline asíncrono de consultas."""
+
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_services import FakeServiceConfig, FakeServices
+from conftest import DIMENSIONS
+
+@pytest.fixture
+def slow_services():
+    """Servidores simulados con una generación lenta para medir el solapamiento."""
+    services = FakeServices(FakeServiceConfig(
+        embedding_latency="fixed:0",
+        chat_latency="fixed:0.3",
+        rpc_latency="fixed:0",
+        dimensions=DIMENSIONS,
+        documents=3,
+        content_size=100,
+        answer_tokens=5
+    )).start()
+    yield services
+    services.stop()
+
+def test_aquery_returns_answer_sources_and_trace(rag_system):
+    result = rag_system.event_loop.run(rag_system.aquery("¿Qué es un índice?"))
+
+    assert result["answer"]
+    assert result["sources"]
+    stages = [stage["name"] for stage in result["metadata"]["trace"]["stages"]]
+    for stage in ("generate_query_embedding", "retrieve_documents", "prepare_context", "generate_response"):
+        assert stage in stages
+
+def test_concurrent_queries_overlap(make_rag_system, slow_services, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", slow_services.openai_url)
+    rag_system = make_rag_system(supabase_url=slow_services.supabase_url)
+    queries = [f"Pregunta número {i}" for i in range(5)]
+
+    async def run_all():
+        return await asyncio.gather(*(rag_system.aquery(query) for query in queries))
+
+    start = time.perf_counter()
+    results = rag_system.event_loop.run(run_all())
+    elapsed = time.perf_counter() - start
+
+    assert all("error" not in result["metadata"] for result in results)
+    # Cinco generaciones de 0,3 s en serie tardarían al menos 1,5 s
+    assert elapsed < 1.2
+
+def test_sync_query_runs_on_background_loop(rag_system):
+    # La API síncrona puede llamarse desde código que ya tiene un bucle de eventos en marcha
+    async def caller():
+        return rag_system.query("¿Qué es un índice?")
+
+    result = asyncio.run(caller())
+    assert "error" not in result["metadata"]
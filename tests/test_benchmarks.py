@@ -0,0 +1,78 @@
+"""Pruebas del arnés de benchmarks y de los servidores simulados."""
+
+import base64
+import json
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from benchmarks.fake_services import FakeServiceConfig, FakeServices, LatencyModel, fake_embedding
+from benchmarks.harness import compare_results, percentiles, run_level
+
+def post_json(url: str, payload: dict):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+def test_latency_models():
+    assert LatencyModel.parse("fixed:0.05").sample() == 0.05
+    assert 0.02 <= LatencyModel.parse("uniform:0.02:0.08").sample() <= 0.08
+    assert LatencyModel.parse("lognormal:0.05:0.4").sample() > 0
+    with pytest.raises(ValueError):
+        LatencyModel.parse("gamma:1")
+
+def test_fake_embeddings_are_deterministic_in_both_encodings(fake_services):
+    url = f"{fake_services.openai_url}/embeddings"
+    as_float = post_json(url, {"input": ["hola", "adiós"], "dimensions": 16})
+    as_base64 = post_json(url, {"input": ["hola", "adiós"], "dimensions": 16, "encoding_format": "base64"})
+
+    decoded = np.frombuffer(base64.b64decode(as_base64["data"][1]["embedding"]), dtype="<f4")
+    np.testing.assert_allclose(as_float["data"][1]["embedding"], fake_embedding("adiós", 16))
+    np.testing.assert_array_equal(decoded, fake_embedding("adiós", 16))
+
+def test_fake_postgrest_respects_match_count_and_threshold(fake_services):
+    rows = post_json(f"{fake_services.supabase_url}/rest/v1/rpc/match_documents", {
+        "query_embedding": fake_embedding("hola", 8).tolist(),
+        "match_count": 3,
+        "match_threshold": 0.0
+    })
+    assert len(rows) == 3
+    assert all(row["similarity"] > 0 for row in rows)
+    assert [row["similarity"] for row in rows] == sorted((row["similarity"] for row in rows), reverse=True)
+
+def test_fake_openai_simulates_rate_limits():
+    services = FakeServices(FakeServiceConfig(rate_limit_fraction=1.0, rate_limit_retry_after=0.25)).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post_json(f"{services.openai_url}/embeddings", {"input": "hola"})
+        assert error.value.code == 429
+        assert error.value.headers["retry-after-ms"] == "250"
+    finally:
+        services.stop()
+
+def test_percentiles():
+    stats = percentiles([float(i) for i in range(1, 101)])
+    assert stats["p50"] == 50.0
+    assert stats["p95"] == 95.0
+    assert stats["max"] == 100.0
+    assert percentiles([])["p99"] == 0.0
+
+def test_run_level_measures_library_calls(rag_system):
+    def call(query):
+        result = rag_system.query(query)
+        return result["metadata"]["query_time"], None, "error" in result["metadata"]
+
+    level = run_level(call, concurrency=2, requests=4, offset=0)
+    assert level["errors"] == 0
+    assert level["throughput"] > 0
+    assert "retrieve_documents" in level["stages"]
+
+def test_compare_detects_regressions():
+    def run(throughput, p95):
+        return {"runs": [{"mode": "library", "concurrency": 4, "throughput": throughput, "latency": {"p50": p95 / 2, "p95": p95}}]}
+
+    assert compare_results(run(100, 0.2), run(98, 0.21), tolerance=0.1) == []
+    regressions = compare_results(run(100, 0.2), run(70, 0.3), tolerance=0.1)
+    assert len(regressions) == 2
@@ -0,0 +1,64 @@
+"""Pruebas del arranque en frío: importaciones diferidas y camino de consulta sin LangChain."""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from app.utils import tokens
+from benchmarks.harness import ROOT_DIR
+
+HEAVY_MODULES = ("openai", "numpy", "supabase", "langchain", "tiktoken")
+
+PROBE = f"""
+import json, sys
+from benchmarks.cold_start import load_query_handler
+module = load_query_handler()
+after_import = sorted(name for name in {HEAVY_MODULES!r} if name in sys.modules)
+system, _ = module.rag_system_registry.get_system()
+result = system.query("Pregunta de arranque en frío")
+print(json.dumps({{
+    "after_import": after_import,
+    "langchain": "langchain" in sys.modules,
+    "error": result["metadata"].get("error")
+}}))
+"""
+
+def test_endpoint_import_is_lazy_and_query_path_avoids_langchain(fake_services):
+    environment = dict(
+        os.environ,
+        OPENAI_BASE_URL=fake_services.openai_url,
+        SUPABASE_URL=fake_services.supabase_url,
+        VECTOR_BACKEND="supabase"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT_DIR, env=environment, capture_output=True, text=True, timeout=120
+    )
+    assert completed.returncode == 0, completed.stderr
+    probe = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    assert probe["after_import"] == []
+    assert not probe["langchain"]
+    assert probe["error"] is None
+
+def test_token_counting_does_not_wait_for_the_encoding(monkeypatch):
+    model = "modelo-de-prueba-lento"
+    loaded = []
+
+    def slow_load(model_name):
+        time.sleep(0.5)
+        loaded.append(model_name)
+        with tokens._encodings_lock:
+            tokens._encodings[model_name] = None
+            tokens._loading.discard(model_name)
+
+    monkeypatch.setattr(tokens, "load_encoding", slow_load)
+    start = time.perf_counter()
+    estimate = tokens.count_tokens("a" * 400, model)
+    elapsed = time.perf_counter() - start
+
+    # Mientras la codificación se carga en segundo plano se estima a cuatro caracteres por token
+    assert estimate == 100
+    assert elapsed < 0.1
+    assert not loaded
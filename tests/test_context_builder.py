@@ -0,0 +1,56 @@
+"""Pruebas del empaquetado del contexto del prompt."""
+
+from app.database.result_set import ResultSet
+from app.query.context_builder import ContextBuilder
+from benchmarks.fake_services import fake_text
+
+def results(scores, contents=None, fusion_scores=None) -> ResultSet:
+    contents = contents or [fake_text(40, seed) for seed in range(len(scores))]
+    return ResultSet(list(range(len(scores))), contents, list(scores), [{} for _ in scores], fusion_scores=fusion_scores)
+
+def test_near_duplicates_are_dropped():
+    text = fake_text(60, 1)
+    builder = ContextBuilder(max_tokens=5000, score_gap=0)
+    _, selected, stats = builder.build(results([0.9, 0.89, 0.88], [text, text + " final", fake_text(60, 2)]))
+
+    assert list(selected.ids) == [0, 2]
+    assert stats["duplicates_dropped"] == 1
+
+def test_score_gap_cuts_the_tail():
+    builder = ContextBuilder(max_tokens=5000, score_gap=0.15)
+    _, selected, stats = builder.build(results([0.9, 0.85, 0.5, 0.49]))
+
+    assert list(selected.ids) == [0, 1]
+    assert stats["score_cutoff_dropped"] == 2
+
+def test_fused_order_is_not_cut_by_similarity():
+    # Con la fusión RRF el orden no es el de la similitud y hay filas solo léxicas (sin similitud)
+    builder = ContextBuilder(max_tokens=5000, score_gap=0.15)
+    documents = results([0.3, None, 0.9, 0.2], fusion_scores=[0.033, 0.032, 0.031, 0.030])
+
+    _, selected, stats = builder.build(documents)
+
+    assert list(selected.ids) == [0, 1, 2, 3]
+    assert stats["score_cutoff_dropped"] == 0
+
+def test_token_budget_is_respected():
+    builder = ContextBuilder(max_tokens=120, score_gap=0)
+    context, selected, stats = builder.build(results([0.9, 0.8, 0.7, 0.6]))
+
+    assert 0 < len(selected) < 4
+    assert stats["budget_dropped"] == 4 - len(selected)
+    assert stats["context_tokens"] <= 120
+    assert context.count("Documento: ") == len(selected)
+
+def test_first_document_is_truncated_to_budget():
+    builder = ContextBuilder(max_tokens=20, score_gap=0)
+    context, selected, stats = builder.build(results([0.9], [fake_text(400, 3)]))
+
+    assert len(selected) == 1
+    assert stats["context_tokens"] <= 20
+    assert context.startswith("Documento: 1")
+
+def test_rag_metadata_reports_context_packing(rag_system):
+    metadata = rag_system.query("¿Qué es un índice?")["metadata"]
+    assert metadata["documents_used"] <= metadata["documents_retrieved"]
+    assert metadata["context_tokens"] > 0
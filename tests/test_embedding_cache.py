@@ -0,0 +1,87 @@
+"""Pruebas de la caché de embeddings de consultas (memoria y disco)."""
+
+import time
+
+import numpy as np
+
+from app.document_processing.embedding_cache import (
+    DiskEmbeddingCache,
+    EmbeddingCache,
+    MemoryEmbeddingCache,
+    make_cache_key
+)
+from app.document_processing.embeddings import EmbeddingGenerator
+
+MODEL = "text-embedding-3-small"
+
+def vector(seed: int, dimensions: int = 8) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(dimensions).astype(np.float32)
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryEmbeddingCache(max_entries=2, ttl=0)
+    cache.put("a", vector(1))
+    cache.put("b", vector(2))
+    assert cache.get("a") is not None
+    cache.put("c", vector(3))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.get_stats()["evictions"] == 1
+
+def test_memory_cache_expires_entries():
+    cache = MemoryEmbeddingCache(max_entries=4, ttl=0.01)
+    cache.put("a", vector(1))
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.get_stats()["expirations"] == 1
+
+def test_memory_cache_returns_read_only_vectors():
+    cache = MemoryEmbeddingCache(max_entries=4, ttl=0)
+    cache.put("a", vector(1))
+    stored = cache.get("a")
+    assert stored.dtype == np.float32
+    assert not stored.flags.writeable
+
+def test_disk_cache_is_shared_between_instances(tmp_path):
+    writer = DiskEmbeddingCache(str(tmp_path), MODEL)
+    reader = DiskEmbeddingCache(str(tmp_path), MODEL)
+    key = make_cache_key(MODEL, "hola")
+    writer.put(key, vector(1))
+
+    # Una instancia ya abierta (otro proceso) incorpora las entradas nuevas al leer
+    np.testing.assert_array_equal(reader.get(key), vector(1))
+    # Y una instancia nueva las carga del disco
+    np.testing.assert_array_equal(DiskEmbeddingCache(str(tmp_path), MODEL).get(key), vector(1))
+
+def test_disk_cache_compacts_keeping_recent_entries(tmp_path):
+    cache = DiskEmbeddingCache(str(tmp_path), MODEL, max_entries=4)
+    keys = [make_cache_key(MODEL, str(i)) for i in range(5)]
+    for i, key in enumerate(keys):
+        cache.put(key, vector(i))
+
+    assert cache.get_stats()["size"] <= 4
+    assert cache.get(keys[0]) is None
+    np.testing.assert_array_equal(cache.get(keys[-1]), vector(4))
+    reopened = DiskEmbeddingCache(str(tmp_path), MODEL, max_entries=4)
+    np.testing.assert_array_equal(reopened.get(keys[-1]), vector(4))
+
+def test_disk_hits_are_promoted_to_memory(tmp_path):
+    EmbeddingCache(directory=str(tmp_path)).put(MODEL, "hola", vector(1))
+    cache = EmbeddingCache(directory=str(tmp_path))
+
+    np.testing.assert_array_equal(cache.get(MODEL, "hola"), vector(1))
+    cache.get(MODEL, "hola")
+    stats = cache.get_stats()
+    assert stats["memory"]["hits"] == 1
+    assert stats["disk"][MODEL]["hits"] == 1
+
+def test_generator_serves_repeated_queries_from_cache(fake_services, monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    generator = EmbeddingGenerator(api_key="sk-test", cache=EmbeddingCache(directory=str(tmp_path)))
+    requests_before = fake_services.stats.requests.get("/v1/embeddings", 0)
+
+    first = generator.generate_embedding("¿Qué es un índice?")
+    second = generator.generate_embedding("  ¿Qué es un índice?\n")
+
+    np.testing.assert_array_equal(first, second)
+    assert fake_services.stats.requests["/v1/embeddings"] == requests_before + 1
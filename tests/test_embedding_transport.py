@@ -0,0 +1,51 @@
+"""Pruebas del transporte compacto de embeddings (base64, dimensiones reducidas y float32)."""
+
+import base64
+import json
+
+import numpy as np
+
+from app.document_processing.embedding_cache import EmbeddingCache
+from app.document_processing.embeddings import EmbeddingGenerator
+from app.utils import vectors
+from app.utils.vectors import decode_embedding, to_pgvector, zero_embedding
+from benchmarks.fake_services import fake_embedding
+
+def test_decode_base64_and_float_lists_agree():
+    vector = fake_embedding("hola", 32)
+    from_base64 = decode_embedding(base64.b64encode(vector.astype("<f4").tobytes()).decode())
+    from_list = decode_embedding(vector.tolist())
+
+    np.testing.assert_array_equal(from_base64, from_list)
+    assert from_base64.dtype == from_list.dtype == np.float32
+    assert not from_list.flags.writeable
+
+def test_pgvector_literal_is_lossless(monkeypatch):
+    vector = fake_embedding("hola", 32)
+    np.testing.assert_array_equal(np.asarray(json.loads(to_pgvector(vector)), dtype=np.float32), vector)
+    # Sin orjson, el formato de respaldo tampoco pierde precisión
+    monkeypatch.setattr(vectors, "orjson", None)
+    np.testing.assert_array_equal(np.asarray(json.loads(to_pgvector(vector)), dtype=np.float32), vector)
+
+def test_zero_embedding_uses_reduced_dimensions():
+    assert zero_embedding(256).shape == (256,)
+    assert zero_embedding().shape == (vectors.DEFAULT_EMBEDDING_DIMENSIONS,)
+
+def test_generator_requests_reduced_base64_embeddings(fake_services, monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    cache = EmbeddingCache(directory=str(tmp_path))
+    generator = EmbeddingGenerator(api_key="sk-test", cache=cache, dimensions=16, encoding_format="base64")
+
+    embedding = generator.generate_embedding("Pregunta con dimensiones reducidas")
+
+    assert embedding.dtype == np.float32 and embedding.shape == (16,)
+    np.testing.assert_array_equal(embedding, fake_embedding("Pregunta con dimensiones reducidas", 16))
+    # Los embeddings reducidos se guardan aparte de los completos en la caché
+    assert generator.cache_model_name == f"{generator.model_name}-16d"
+    assert cache.get(generator.model_name, "Pregunta con dimensiones reducidas") is None
+
+def test_float_encoding_is_the_default(fake_services, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    generator = EmbeddingGenerator(api_key="sk-test")
+    assert generator.encoding_format == "float"
+    assert generator.generate_embedding("Pregunta en float").dtype == np.float32
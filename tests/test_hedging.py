@@ -0,0 +1,92 @@
+"""Pruebas de las peticiones de respaldo (hedging) de las llamadas idempotentes."""
+
+import asyncio
+
+import pytest
+
+from app.query import rag_query
+from app.utils.hedging import Hedger, LatencyWindow
+
+def test_latency_window_delay_is_a_recent_percentile():
+    window = LatencyWindow(size=10, percentile=90)
+    assert window.delay(min_samples=1) is None
+    for duration in range(1, 11):
+        window.record(duration / 100)
+    assert window.delay(min_samples=5) == pytest.approx(0.09)
+    assert window.delay(min_samples=20) is None
+
+def trained(budget=1.0, **options):
+    hedger = Hedger(percentile=50, min_delay=0.01, min_samples=3, window=10, budget=budget, **options)
+    for _ in range(3):
+        hedger._window("embeddings").record(0.02)
+    return hedger
+
+def factory_for(durations, started, cancelled, failures=()):
+    """Fábrica de llamadas: la copia n tarda ``durations[n]`` y falla si n está en ``failures``."""
+    def factory():
+        index = len(started)
+        started.append(index)
+
+        async def call():
+            try:
+                await asyncio.sleep(durations[index])
+            except asyncio.CancelledError:
+                cancelled.append(index)
+                raise
+            if index in failures:
+                raise RuntimeError(f"fallo {index}")
+            return f"copia {index}"
+        return call()
+    return factory
+
+def test_no_backup_until_enough_samples():
+    hedger = Hedger(percentile=50, min_delay=0.01, min_samples=3, window=10, budget=1.0)
+    started, cancelled = [], []
+    result = asyncio.run(hedger.call("embeddings", factory_for([0.05, 0.0], started, cancelled)))
+    assert result == "copia 0" and started == [0]
+
+def test_slow_call_is_hedged_and_the_backup_wins():
+    hedger = trained()
+    started, cancelled = [], []
+
+    result = asyncio.run(hedger.call("embeddings", factory_for([1.0, 0.0], started, cancelled)))
+
+    assert result == "copia 1"
+    assert started == [0, 1] and cancelled == [0]
+    stats = hedger.get_stats()["embeddings"]
+    assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+
+def test_fast_call_is_not_hedged():
+    hedger = trained()
+    started, cancelled = [], []
+    assert asyncio.run(hedger.call("embeddings", factory_for([0.0], started, cancelled))) == "copia 0"
+    assert started == [0] and hedger.stats["embeddings"]["hedged"] == 0
+
+def test_budget_limits_the_backups():
+    hedger = trained(budget=0.0)
+    started, cancelled = [], []
+
+    result = asyncio.run(hedger.call("embeddings", factory_for([0.1, 0.0], started, cancelled)))
+
+    assert result == "copia 0" and started == [0]
+    assert hedger.stats["embeddings"]["budget_exhausted"] == 1
+
+def test_failed_copy_waits_for_the_other():
+    hedger = trained()
+    started, cancelled = [], []
+    result = asyncio.run(hedger.call("embeddings", factory_for([0.1, 0.0], started, cancelled, failures={1})))
+    assert result == "copia 0"
+
+    started, cancelled = [], []
+    with pytest.raises(RuntimeError):
+        asyncio.run(hedger.call("embeddings", factory_for([0.1, 0.0], started, cancelled, failures={0, 1})))
+
+def test_rag_system_routes_calls_through_the_hedger(make_rag_system, monkeypatch):
+    monkeypatch.setattr(rag_query, "HEDGE_ENABLED", True)
+    system = make_rag_system()
+
+    result = system.query("¿Qué es un espacio vectorial con copias de respaldo?", similarity_threshold=-1.0)
+
+    assert result["sources"]
+    assert system.hedger is not None
+    assert set(system.hedger.get_stats()) >= {"embeddings", "retrieval"}
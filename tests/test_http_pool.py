@@ -0,0 +1,29 @@
+"""Pruebas del pool HTTP compartido por OpenAI y Supabase."""
+
+from app.query import rag_query
+
+def counters(result):
+    return result["metadata"]["trace"].get("counters", {})
+
+def test_warm_queries_reuse_connections(rag_system):
+    rag_system.query("Primera pregunta")
+    second = counters(rag_system.query("Segunda pregunta"))
+
+    # Embedding, búsqueda y generación sobre las conexiones ya abiertas
+    assert second["http_requests"] >= 3
+    assert second.get("http_connections_opened", 0) == 0
+    assert second["http_connections_reused"] == second["http_requests"]
+
+def test_prewarm_opens_connections_before_first_query(make_rag_system, fake_services, monkeypatch):
+    monkeypatch.setattr(rag_query, "HTTP_PREWARM", True)
+    head_requests = fake_services.stats.requests.get("HEAD", 0)
+
+    rag_system = make_rag_system()
+    assert rag_system.prewarm_future.result(timeout=10) == 2
+    assert fake_services.stats.requests["HEAD"] == head_requests + 2
+
+    first = counters(rag_system.query("Pregunta tras el precalentamiento"))
+    assert first.get("http_connections_opened", 0) == 0
+
+def test_prewarm_is_off_by_default(rag_system):
+    assert rag_system.prewarm_future is None
@@ -0,0 +1,138 @@
+"""Pruebas del pipeline de ingesta de documentos."""
+
+import pytest
+
+from app.document_processing.embeddings import EmbeddingGenerator
+from app.document_processing.ingestion import IngestionPipeline
+
+class FakeQuery:
+    """Consulta de PostgREST sobre una tabla en memoria (solo lo que usa la ingesta)."""
+
+    def __init__(self, rows: dict, action: str, payload=None):
+        self.rows = rows
+        self.action = action
+        self.payload = payload
+        self.filters = []
+        self.bounds = None
+
+    def eq(self, column, value):
+        assert column == "metadata->>source"
+        self.filters.append(lambda row: row["metadata"]["source"] == value)
+        return self
+
+    def in_(self, column, values):
+        assert column == "id"
+        self.filters.append(lambda row: row["id"] in set(values))
+        return self
+
+    def order(self, column):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    async def execute(self):
+        if self.action == "upsert":
+            for row in self.payload:
+                self.rows[row["id"]] = row
+            return type("Response", (), {"data": None})()
+        matches = [row for row in sorted(self.rows.values(), key=lambda row: row["id"]) if all(f(row) for f in self.filters)]
+        if self.action == "delete":
+            for row in matches:
+                del self.rows[row["id"]]
+            return type("Response", (), {"data": None})()
+        if self.bounds is not None:
+            matches = matches[self.bounds[0]:self.bounds[1] + 1]
+        return type("Response", (), {"data": [{"id": row["id"]} for row in matches]})()
+
+class FakeTable:
+    def __init__(self, rows: dict):
+        self.rows = rows
+
+    def upsert(self, rows, returning=None):
+        return FakeQuery(self.rows, "upsert", rows)
+
+    def select(self, columns):
+        return FakeQuery(self.rows, "select")
+
+    def delete(self, returning=None):
+        return FakeQuery(self.rows, "delete")
+
+class FakeStore:
+    """Sustituye a SupabaseStore con una tabla de documentos en memoria."""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def get_async_client(self):
+        return self
+
+    def table(self, name):
+        return FakeTable(self.rows)
+
+@pytest.fixture
+def make_pipeline(fake_services, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    store = FakeStore()
+
+    def make(manifest_path=None):
+        return IngestionPipeline(
+            batch_size=4,
+            chunk_size=200,
+            chunk_overlap=20,
+            manifest_path=manifest_path,
+            embedding_generator=EmbeddingGenerator(api_key="sk-test"),
+            supabase_store=store
+        )
+
+    make.store = store
+    return make
+
+def write_document(path, paragraphs: int, prefix: str = "Párrafo"):
+    path.write_text("\n\n".join(f"{prefix} {i}: " + "texto de ejemplo " * 6 for i in range(paragraphs)), encoding="utf-8")
+
+def test_chunks_overlap_and_respect_size(make_pipeline):
+    pipeline = make_pipeline()
+    chunks = list(pipeline.chunk_text(["palabra " * 200]))
+    assert len(chunks) > 1
+    assert all(len(chunk) <= pipeline.chunk_size for chunk in chunks)
+    assert chunks[0][-10:] in chunks[1]
+
+def test_ingestion_is_resumable(make_pipeline, tmp_path):
+    document = tmp_path / "doc.txt"
+    write_document(document, 10)
+    manifest = str(tmp_path / "manifest.json")
+
+    stats = make_pipeline(manifest).run([str(document)])
+    assert stats["chunks_embedded"] == stats["chunks"] > 0
+    assert stats["failed_batches"] == 0
+    rows = dict(make_pipeline.store.rows)
+
+    stats = make_pipeline(manifest).run([str(document)])
+    assert stats["files_skipped"] == 1 and stats["chunks_embedded"] == 0
+    assert make_pipeline.store.rows == rows
+
+def test_reingestion_without_manifest_does_not_duplicate(make_pipeline, tmp_path):
+    document = tmp_path / "doc.txt"
+    write_document(document, 10)
+
+    make_pipeline(str(tmp_path / "a.json")).run([str(document)])
+    count = len(make_pipeline.store.rows)
+    make_pipeline(str(tmp_path / "b.json")).run([str(document)])
+
+    assert len(make_pipeline.store.rows) == count
+
+def test_edited_file_removes_stale_chunks(make_pipeline, tmp_path):
+    document = tmp_path / "doc.txt"
+    manifest = str(tmp_path / "manifest.json")
+    write_document(document, 10)
+    make_pipeline(manifest).run([str(document)])
+
+    write_document(document, 3, prefix="Sección")
+    stats = make_pipeline(manifest).run([str(document)])
+
+    assert stats["chunks_deleted"] > 0
+    contents = [row["content"] for row in make_pipeline.store.rows.values()]
+    assert len(contents) == stats["chunks"]
+    assert all(content.startswith("Sección") or "Sección" in content for content in contents)
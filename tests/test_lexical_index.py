@@ -0,0 +1,104 @@
+"""Pruebas del índice BM25 y de la búsqueda híbrida con fusión por rango recíproco."""
+
+import logging
+
+import pytest
+
+from app.database import sharded_store
+from app.database.lexical_index import (
+    RRF_K,
+    LexicalIndex,
+    append_delta,
+    build_lexical_index,
+    reciprocal_rank_fusion,
+    tokenize
+)
+from app.database.local_store import write_snapshot
+from app.database.result_set import ResultSet
+from app.database.sharded_store import ShardedVectorDatabase
+from app.database.vector_store import VectorDatabase
+from benchmarks.fake_services import fake_embedding
+from conftest import DIMENSIONS
+
+TEXTS = [
+    "El repuesto AB-1234 sustituye a la pieza anterior",
+    "Manual de instalación de la versión v2.1 del controlador",
+    "Introducción a los espacios vectoriales",
+    "Los espacios vectoriales y sus bases",
+    "Teoría de grupos: grupos abelianos y cíclicos"
+]
+
+def snapshot_rows(texts):
+    return [
+        {"id": i, "content": text, "metadata": {"chunk": i}, "embedding": fake_embedding(text, DIMENSIONS).tolist()}
+        for i, text in enumerate(texts)
+    ]
+
+def test_tokenize_keeps_codes_whole_and_by_parts():
+    assert tokenize("Pieza AB-1234, versión v2.1") == ["pieza", "ab-1234", "ab", "1234", "version", "v2.1", "v2", "1"]
+
+def test_build_without_matching_terms_returns_nothing():
+    index = LexicalIndex.build({"content": text} for text in TEXTS)
+    assert (index.manifest["documents"], index.manifest["postings"]) == (len(TEXTS), index.docs.size)
+    assert len(index.search("", 5)) == 0
+    assert len(index.search("inexistente", 5)) == 0
+    assert len(LexicalIndex.build([]).search("hola", 5)) == 0
+
+def test_bm25_ranks_exact_codes_first(tmp_path):
+    directory = str(tmp_path)
+    write_snapshot(directory, snapshot_rows(TEXTS), "documents")
+    assert build_lexical_index(directory)["documents"] == len(TEXTS)
+
+    index = LexicalIndex.load(directory)
+    results = index.search("repuesto AB-1234", 3)
+    assert results.ids == [0]
+    assert results.metadata(0) == {"chunk": 0}
+    assert sorted(index.search("espacios vectoriales", 5).ids) == [2, 3]
+    index.close()
+
+def test_saved_index_applies_pending_changes(tmp_path):
+    directory = str(tmp_path)
+    write_snapshot(directory, snapshot_rows(TEXTS), "documents")
+    build_lexical_index(directory)
+
+    append_delta(directory, [{"id": 10, "content": "El código AB-1234 aparece también aquí", "metadata": None}], deleted_ids=[0])
+    index = LexicalIndex.load(directory)
+    assert len(index) == len(TEXTS)
+    assert index.search("AB-1234", 3).ids == [10]
+    index.close()
+
+def test_rrf_orders_by_fusion_and_keeps_cosine_similarity():
+    vector = ResultSet([1, 2, 3], ["uno", "dos", "tres"], [0.9, 0.8, 0.7], [None] * 3)
+    lexical = ResultSet([3, 4], ["tres", "cuatro"], [12.0, 8.0], [None] * 2)
+
+    fused = reciprocal_rank_fusion([vector, lexical], k=3)
+
+    # El 3 aparece en las dos listas y sube al primer puesto
+    assert fused.ids == [3, 1, 2]
+    assert fused.fusion_scores[0] == pytest.approx(1 / (RRF_K + 3) + 1 / (RRF_K + 1))
+    assert fused.scores == [0.7, 0.9, 0.8]
+    assert fused.to_sources()[0]["fusion_score"] == fused.fusion_scores[0]
+
+    only_lexical = reciprocal_rank_fusion([ResultSet(), lexical], k=2)
+    assert only_lexical.scores == [None, None]
+
+def test_hybrid_search_on_the_local_backend(tmp_path):
+    directory = str(tmp_path)
+    write_snapshot(directory, snapshot_rows(TEXTS), "documents")
+    build_lexical_index(directory)
+    database = VectorDatabase(backend="local", local_index_dir=directory, lexical=True)
+
+    results = database.search_results(fake_embedding("consulta sin relación", DIMENSIONS), -1.0, 3, query_text="AB-1234")
+    vector_only = database.search_results(fake_embedding("consulta sin relación", DIMENSIONS), -1.0, 3)
+
+    assert 0 in results.ids
+    assert results.fusion_scores == sorted(results.fusion_scores, reverse=True)
+    assert vector_only.fusion_scores is None
+
+def test_sharded_search_ignores_lexical_search(fake_services, monkeypatch, caplog):
+    monkeypatch.setattr(sharded_store, "LEXICAL_SEARCH_ENABLED", True)
+    with caplog.at_level(logging.WARNING, logger=sharded_store.__name__):
+        database = ShardedVectorDatabase([{"name": "a"}], url=fake_services.supabase_url, key="test-key", backend="supabase")
+    assert "LEXICAL_SEARCH_ENABLED se ignora" in caplog.text
+    assert database.shards["a"].lexical_index is None
+    database.close()
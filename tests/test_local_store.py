@@ -0,0 +1,66 @@
+"""Pruebas del backend de búsqueda local sobre una instantánea mapeada en memoria."""
+
+import numpy as np
+import pytest
+
+from app.database.local_store import LocalVectorStore, get_local_store, write_snapshot
+from app.database.vector_store import VectorDatabase
+from benchmarks.fake_services import fake_embedding
+from conftest import DIMENSIONS
+
+def snapshot_rows(texts):
+    return [
+        {"id": i, "content": text, "metadata": {"source": f"doc{i}.pdf", "chunk": i}, "embedding": fake_embedding(text, DIMENSIONS).tolist()}
+        for i, text in enumerate(texts)
+    ]
+
+TEXTS = [f"Fragmento número {i} sobre índices vectoriales" for i in range(20)]
+
+def test_search_matches_exact_cosine_ranking(tmp_path):
+    write_snapshot(str(tmp_path), snapshot_rows(TEXTS), "documents")
+    store = LocalVectorStore(str(tmp_path))
+    query = fake_embedding(TEXTS[7], DIMENSIONS)
+
+    results = store.search_results(query, similarity_threshold=-1.0, max_documents=5)
+
+    matrix = np.vstack([fake_embedding(text, DIMENSIONS) for text in TEXTS])
+    expected = np.argsort(-(matrix @ query), kind="stable")[:5]
+    assert list(results.ids) == expected.tolist()
+    assert results.ids[0] == 7
+    assert results.scores[0] == pytest.approx(1.0, abs=1e-5)
+    assert results.to_sources()[0]["metadata"]["source"] == "doc7.pdf"
+
+def test_threshold_is_strict(tmp_path):
+    write_snapshot(str(tmp_path), snapshot_rows(TEXTS), "documents")
+    store = LocalVectorStore(str(tmp_path))
+    results = store.search_results(fake_embedding(TEXTS[0], DIMENSIONS), similarity_threshold=0.99, max_documents=5)
+    assert list(results.ids) == [0]
+
+def test_dimension_mismatch_is_reported(tmp_path):
+    write_snapshot(str(tmp_path), snapshot_rows(TEXTS), "documents")
+    store = LocalVectorStore(str(tmp_path))
+    with pytest.raises(ValueError, match="EMBEDDING_DIMENSIONS"):
+        store.search(np.ones(DIMENSIONS * 2, dtype=np.float32), 0.0, 5)
+
+def test_re_export_is_picked_up_by_warm_instance(tmp_path):
+    directory = str(tmp_path)
+    write_snapshot(directory, snapshot_rows(TEXTS[:5]), "documents")
+    database = VectorDatabase(backend="local", local_index_dir=directory, lexical=False)
+    assert len(database.local_store) == 5
+    assert get_local_store(directory) is database.local_store
+
+    write_snapshot(directory, snapshot_rows(TEXTS), "documents")
+    assert len(database.local_store) == 20
+    results = database.search_results(fake_embedding(TEXTS[15], DIMENSIONS), 0.5, 3)
+    assert results.ids[0] == 15
+
+def test_rag_system_queries_local_backend(make_rag_system, tmp_path):
+    question = "¿Qué es un índice vectorial?"
+    # El primer fragmento tiene el mismo embedding simulado que la pregunta
+    write_snapshot(str(tmp_path), snapshot_rows([question] + TEXTS), "documents")
+    rag_system = make_rag_system(vector_backend="local", local_index_dir=str(tmp_path))
+
+    result = rag_system.query(question)
+
+    assert "error" not in result["metadata"]
+    assert result["sources"][0]["content"] == question
@@ -0,0 +1,72 @@
+"""Pruebas de los histogramas de latencia, las trazas por solicitud y /api/metrics."""
+
+import http.client
+import json
+import random
+
+import pytest
+
+from app.utils.performance_metrics import LatencyHistogram, PerformanceTracker
+
+def test_histogram_percentiles_have_bounded_error():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-3, 1) for _ in range(10000)]
+    histogram = LatencyHistogram()
+    for value in values:
+        histogram.record(value)
+
+    ordered = sorted(values)
+    for percentile in (50, 95, 99):
+        exact = ordered[int(len(ordered) * percentile / 100) - 1]
+        assert histogram.percentile(percentile) == pytest.approx(exact, rel=0.05)
+    assert histogram.count == len(values)
+    assert histogram.to_dict()["max_time"] == max(values)
+
+def test_histogram_memory_is_constant():
+    histogram = LatencyHistogram()
+    buckets = len(histogram.counts)
+    for i in range(20000):
+        histogram.record(i * 1e-3)
+    assert len(histogram.counts) == buckets
+
+def test_trace_collects_stages_of_the_active_request():
+    tracker = PerformanceTracker()
+    with tracker.trace() as trace:
+        with tracker.track("embedding"):
+            pass
+        with tracker.track("search"):
+            pass
+    with tracker.track("outside"):
+        pass
+
+    assert [stage["name"] for stage in trace.to_dict()["stages"]] == ["embedding", "search"]
+    assert set(tracker.get_metrics()) == {"embedding", "search", "outside"}
+
+def test_prometheus_export():
+    tracker = PerformanceTracker()
+    tracker.record("search", 0.25)
+    tracker.increment("cache_hits", tier="memory")
+    tracker.set_gauge("queue_depth", 3, upstream="chat")
+
+    text = tracker.to_prometheus()
+
+    assert 'raglec_operation_duration_seconds{operation="search",quantile="0.95"} 0.250000' in text
+    assert 'raglec_operation_duration_seconds_count{operation="search"} 1' in text
+    assert 'raglec_cache_hits_total{tier="memory"} 1' in text
+    assert 'raglec_queue_depth{upstream="chat"} 3' in text
+
+def test_metrics_endpoint_exposes_query_stages(serve_api):
+    port = serve_api("query")
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("POST", "/api/query", body=json.dumps({"query": "¿Qué es un índice?"}), headers={"Content-Type": "application/json"})
+        connection.getresponse().read()
+        connection.request("GET", "/api/metrics")
+        response = connection.getresponse()
+        body = response.read().decode()
+    finally:
+        connection.close()
+
+    assert response.status == 200
+    assert response.getheader("Content-Type").startswith("text/plain")
+    assert 'operation="retrieve_documents"' in body
@@ -0,0 +1,95 @@
+"""Pruebas de la agregación del registro de consultas y del precalentamiento de las cachés."""
+
+import json
+import uuid
+
+import numpy as np
+import pytest
+
+from app.document_processing.embedding_cache import EmbeddingCache
+from app.document_processing.embeddings import EmbeddingGenerator
+from app.query import rag_query
+from app.query.prewarm import load_warm_snapshot, prewarm, save_warm_snapshot
+from app.query.query_log import aggregate_queries, read_query_log
+from app.query.result_cache import SemanticResultCache
+from benchmarks.fake_services import fake_embedding
+from conftest import DIMENSIONS
+
+def entry(query, query_time, cached=False, threshold=0.5, error=False):
+    return {
+        "query": query,
+        "threshold": threshold,
+        "max_sources": 5,
+        "shards": None,
+        "cached": cached,
+        "error": error,
+        "query_time": query_time,
+        "stages": {"embedding": query_time / 2}
+    }
+
+ENTRIES = [
+    entry("¿Qué es un grupo?", 1.0),
+    entry("¿qué es un  grupo?", 3.0),
+    entry("¿Qué es un grupo?", 0.1, cached=True),
+    entry("¿Qué es un anillo?", 10.0),
+    entry("¿Qué es un grupo?", 2.0, threshold=0.7)
+]
+
+def test_aggregate_groups_by_normalized_query_and_parameters():
+    summary = aggregate_queries(ENTRIES, top=10)
+
+    top = summary[0]
+    assert top["query"] == "¿Qué es un grupo?"
+    assert (top["count"], top["cached"], top["threshold"]) == (3, 1, 0.5)
+    # Solo las consultas que ejecutaron el pipeline cuentan como coste
+    assert top["cost"] == pytest.approx(4.0)
+    assert top["p95_time"] == pytest.approx(3.0)
+    assert top["stages"] == {"embedding": pytest.approx(4.1 / 2 / 3)}
+    assert len(summary) == 3
+
+def test_aggregate_ranks_by_cost_and_validates_the_ranking():
+    assert aggregate_queries(ENTRIES, top=1, by="cost")[0]["query"] == "¿Qué es un anillo?"
+    with pytest.raises(ValueError):
+        aggregate_queries(ENTRIES, by="latencia")
+
+def test_read_query_log_skips_corrupt_lines(tmp_path):
+    path = tmp_path / "queries.jsonl"
+    path.write_text(json.dumps(ENTRIES[0]) + "\n{roto\n" + json.dumps({"query": ""}) + "\n", encoding="utf-8")
+    assert list(read_query_log([str(path)])) == [ENTRIES[0]]
+
+def test_snapshot_round_trip_fills_both_caches(tmp_path):
+    path = str(tmp_path / "warm.npz")
+    generator = EmbeddingGenerator(api_key="sk-test", cache=EmbeddingCache(directory=str(tmp_path / "cache")))
+    embedding = fake_embedding("¿Qué es un grupo?", DIMENSIONS)
+    scope = ("documents", 0.5, 5, None)
+    result = {"answer": "Un conjunto con una operación.", "sources": [], "metadata": {"query_time": 1.2, "model": "x"}}
+
+    assert save_warm_snapshot(path, generator.cache_model_name, [("¿Qué es un grupo?", embedding, scope, result)]) == 1
+
+    result_cache = SemanticResultCache()
+    assert load_warm_snapshot(path, generator, result_cache) == 1
+    assert generator.cache.get(generator.cache_model_name, "¿Qué es un grupo?") is not None
+    cached, similarity = result_cache.get(embedding, scope)
+    assert cached["answer"] == result["answer"] and similarity == pytest.approx(1.0)
+    # Los metadatos propios de la ejecución no se guardan
+    assert "query_time" not in cached["metadata"]
+    # Cada instantánea se carga una sola vez por proceso
+    assert load_warm_snapshot(path, generator, SemanticResultCache()) == 0
+
+def test_snapshot_from_another_model_is_ignored(tmp_path):
+    path = str(tmp_path / "warm.npz")
+    generator = EmbeddingGenerator(api_key="sk-test", cache=EmbeddingCache(directory=str(tmp_path / "cache")))
+    save_warm_snapshot(path, "otro-modelo", [("hola", fake_embedding("hola", DIMENSIONS), ("documents", 0.5, 5, None), {"metadata": {}})])
+    assert load_warm_snapshot(path, generator, SemanticResultCache()) == 0
+
+def test_prewarm_runs_the_top_queries_and_saves_a_snapshot(make_rag_system, monkeypatch, tmp_path):
+    monkeypatch.setattr(rag_query, "RAGQuerySystem", lambda: make_rag_system())
+    queries = [f"¿Qué es la pregunta frecuente {uuid.uuid4().hex}?" for _ in range(3)]
+    summary = aggregate_queries([entry(query, 1.0, threshold=-1.0) for query in queries])
+    path = str(tmp_path / "warm.npz")
+
+    report = prewarm(summary, concurrency=2, snapshot=path)
+
+    assert (report["queries"], report["failed"], report["saved"]) == (3, 0, 3)
+    with np.load(path) as snapshot:
+        assert snapshot["embeddings"].shape == (3, DIMENSIONS)
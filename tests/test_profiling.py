@@ -0,0 +1,60 @@
+"""Pruebas del perfilado de consultas bajo demanda y por muestreo."""
+
+import json
+import os
+
+from app.utils import profiling
+from app.utils.performance_metrics import RequestTrace, performance_tracker
+from app.utils.profiling import RequestProfiler, get_request_profiler
+
+def test_profiler_is_disabled_by_default(monkeypatch):
+    monkeypatch.setattr(profiling, "_request_profiler", None)
+    assert get_request_profiler() is None
+
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 0.25)
+    profiler = get_request_profiler()
+    assert profiler.sample_rate == 0.25
+    assert get_request_profiler() is profiler
+
+def test_sampling_rate(monkeypatch, tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), sample_rate=0.1)
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.05)
+    assert profiler.should_profile()
+    monkeypatch.setattr(profiling.random, "random", lambda: 0.5)
+    assert not profiler.should_profile()
+    assert RequestProfiler(directory=str(tmp_path), sample_rate=1.0).should_profile()
+
+def test_profile_writes_report_and_measures_cpu(tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), memory=True, interval=0.001)
+
+    with performance_tracker.trace() as trace, profiler.profile(trace, "¿Qué es un grupo?") as profile:
+        with performance_tracker.track("retrieval"):
+            sum(i * i for i in range(200000))
+
+    assert set(profile.artifacts) == {"report", "collapsed", "pstats"}
+    assert all(os.path.exists(path) for path in profile.artifacts.values())
+    with open(profile.artifacts["report"], encoding="utf-8") as f:
+        report = json.load(f)
+    assert report["query"] == "¿Qué es un grupo?"
+    assert report["functions"] and report["cpu_time"] > 0
+    assert "cpu_time" in report["stages"][0]
+    assert profiler.get_stats()["profiled"] == 1
+
+def test_only_one_query_is_profiled_at_a_time(tmp_path):
+    profiler = RequestProfiler(directory=str(tmp_path), interval=0.01)
+    with profiler.profile(RequestTrace(), "primera") as first:
+        with profiler.profile(RequestTrace(), "segunda") as second:
+            assert first is not None and second is None
+    assert (profiler.profiled, profiler.skipped) == (1, 1)
+
+def test_rag_query_reports_profile_artifacts(rag_system, tmp_path):
+    rag_system.profiler = RequestProfiler(directory=str(tmp_path), interval=0.001)
+
+    result = rag_system.query("¿Qué es un espacio métrico perfilado?", similarity_threshold=-1.0)
+
+    artifacts = result["metadata"]["profile"]
+    assert os.path.dirname(artifacts["report"]) == str(tmp_path)
+    assert all(os.path.exists(path) for path in artifacts.values())
+    # Sin perfilador no hay artefactos ni coste añadido
+    rag_system.profiler = None
+    assert "profile" not in rag_system.query("¿Qué es un espacio métrico?", similarity_threshold=-1.0)["metadata"]
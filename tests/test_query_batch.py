@@ -0,0 +1,56 @@
+"""Pruebas de las consultas en lote."""
+
+import http.client
+import json
+import uuid
+
+from app.query.query_log import QueryLog, read_query_log
+
+def unique_queries(count: int):
+    # Textos nuevos para que la caché de embeddings compartida no evite la llamada
+    marker = uuid.uuid4().hex[:8]
+    return [f"Pregunta {i} del lote {marker}" for i in range(count)]
+
+def test_batch_uses_one_embeddings_call(rag_system, fake_services):
+    queries = unique_queries(4)
+    embedding_requests = fake_services.stats.requests.get("/v1/embeddings", 0)
+
+    batch = rag_system.query_batch(queries, concurrency=2)
+
+    assert fake_services.stats.requests["/v1/embeddings"] == embedding_requests + 1
+    assert len(batch["results"]) == 4
+    assert all(result["answer"] for result in batch["results"])
+    assert batch["metadata"]["queries"] == 4
+    assert batch["metadata"]["failed"] == 0
+
+def test_batch_entries_are_written_to_query_log(rag_system, tmp_path):
+    log_path = str(tmp_path / "queries.jsonl")
+    rag_system.query_log = QueryLog(log_path, flush_interval=0.01)
+    queries = unique_queries(2)
+
+    rag_system.query_batch(queries)
+    rag_system.query_log.close()
+
+    entries = list(read_query_log([log_path]))
+    assert sorted(entry["query"] for entry in entries) == sorted(queries)
+    assert all(entry["mode"] == "batch" for entry in entries)
+
+def post_batch(port: int, payload: dict):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("POST", "/api/query/batch", body=json.dumps(payload), headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+def test_batch_handler(serve_api):
+    port = serve_api("query_batch")
+
+    status, body = post_batch(port, {"queries": unique_queries(3), "source_mode": "ids"})
+    assert status == 200
+    assert len(body["results"]) == 3
+    assert "content" not in body["results"][0]["sources"][0]
+
+    status, body = post_batch(port, {"queries": []})
+    assert status == 400
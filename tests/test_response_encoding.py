@@ -0,0 +1,100 @@
+"""Pruebas de la codificación negociada de las respuestas de /api/query."""
+
+import gzip
+import http.client
+import json
+
+import pytest
+
+from app.utils import response_encoding
+from app.utils.response_encoding import (
+    compute_etag,
+    encode_body,
+    etag_matches,
+    negotiate_encoding,
+    shape_result,
+    shape_sources
+)
+
+SOURCES = [
+    {"content": "a" * 500, "metadata": {"filename": "uno.txt", "content_hash": "h1"}, "similarity": 0.9},
+    {"content": "corto", "metadata": {"filename": "dos.txt"}, "similarity": 0.8, "fusion_score": 0.03}
+]
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("*", response_encoding.available_encodings()[0]),
+    ("br;q=0.5, gzip;q=0.8", "gzip")
+])
+def test_negotiate_encoding(header, expected):
+    assert negotiate_encoding(header) == expected
+
+def test_small_bodies_are_not_compressed():
+    body, encoding = encode_body({"answer": "hola"}, "gzip", "test")
+    assert encoding is None
+    assert json.loads(body) == {"answer": "hola"}
+
+def test_large_bodies_are_compressed():
+    payload = {"answer": "texto " * 1000}
+    body, encoding = encode_body(payload, "gzip", "test")
+    assert encoding == "gzip"
+    assert json.loads(gzip.decompress(body)) == payload
+
+def test_source_modes():
+    snippets = shape_sources(SOURCES, "snippet", snippet_chars=10)
+    assert snippets[0] == {"id": "h1", "content": "a" * 10, "truncated": True, "metadata": SOURCES[0]["metadata"], "similarity": 0.9}
+    assert not snippets[1]["truncated"]
+
+    ids = shape_sources(SOURCES, "ids")
+    assert ids[0] == {"id": "h1", "similarity": 0.9}
+    assert ids[1]["fusion_score"] == 0.03
+    assert shape_sources(iter(SOURCES), "ids") == ids
+
+def test_shape_result_hides_stack_and_keeps_original():
+    result = {"answer": "x", "sources": SOURCES, "metadata": {"error": "fallo", "error_stack": "traza"}}
+    shaped = shape_result(result, "ids")
+    assert "error_stack" not in shaped["metadata"]
+    assert "error_stack" in shape_result(result, debug=True)["metadata"]
+    assert result["sources"] is SOURCES and "error_stack" in result["metadata"]
+
+def test_etag_ignores_metadata():
+    first = {"answer": "x", "sources": SOURCES, "metadata": {"query_time": 0.1}}
+    second = {"answer": "x", "sources": SOURCES, "metadata": {"query_time": 0.2}}
+    etag = compute_etag(first)
+    assert etag == compute_etag(second)
+    assert etag != compute_etag(dict(first, answer="y"))
+    assert etag_matches(f'W/{etag}, "otro"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"otro"', etag)
+
+def test_handler_negotiates_encoding_and_answers_304(serve_api):
+    port = serve_api("query")
+    body = json.dumps({"query": "¿Qué es un índice?", "source_mode": "snippet", "snippet_chars": 40})
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        connection.request("POST", "/api/query", body=body, headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"})
+        response = connection.getresponse()
+        payload = response.read()
+        if response.getheader("Content-Encoding") == "gzip":
+            payload = gzip.decompress(payload)
+        result = json.loads(payload)
+        etag = response.getheader("ETag")
+
+        assert response.status == 200
+        assert all(len(source["content"]) <= 40 for source in result["sources"])
+        assert etag
+
+        connection.request("POST", "/api/query", body=body, headers={"Content-Type": "application/json", "If-None-Match": etag})
+        response = connection.getresponse()
+        assert response.read() == b""
+        assert response.status == 304
+
+        connection.request("POST", "/api/query", body=json.dumps({"query": "x", "source_mode": "otro"}), headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 400
+    finally:
+        connection.close()
@@ -0,0 +1,75 @@
+"""Pruebas de la caché semántica de respuestas."""
+
+import time
+
+import numpy as np
+
+from app.query.result_cache import SemanticResultCache
+
+SCOPE = ("documents", 0.5, 5)
+
+def unit(*values) -> np.ndarray:
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def test_near_duplicate_question_is_a_hit():
+    cache = SemanticResultCache(capacity=4, similarity_threshold=0.95, ttl=0)
+    cache.put(unit(1, 0, 0), SCOPE, {"answer": "respuesta"})
+
+    result, similarity = cache.get(unit(1, 0.05, 0), SCOPE)
+    assert result == {"answer": "respuesta"}
+    assert similarity > 0.95
+    assert cache.get(unit(0, 1, 0), SCOPE) is None
+
+def test_scope_must_match():
+    cache = SemanticResultCache(capacity=4, similarity_threshold=0.95, ttl=0)
+    cache.put(unit(1, 0, 0), SCOPE, {"answer": "respuesta"})
+    assert cache.get(unit(1, 0, 0), ("documents", 0.5, 10)) is None
+    assert cache.get(unit(1, 0, 0), ("otra", 0.5, 5)) is None
+
+def test_results_are_copied():
+    cache = SemanticResultCache(capacity=4, similarity_threshold=0.95, ttl=0)
+    stored = {"answer": "respuesta", "metadata": {}}
+    cache.put(unit(1, 0, 0), SCOPE, stored)
+    stored["metadata"]["changed"] = True
+
+    result, _ = cache.get(unit(1, 0, 0), SCOPE)
+    result["metadata"]["cached"] = True
+    assert cache.get(unit(1, 0, 0), SCOPE)[0] == {"answer": "respuesta", "metadata": {}}
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticResultCache(capacity=2, similarity_threshold=0.95, ttl=0)
+    cache.put(unit(1, 0, 0), SCOPE, {"answer": "x"})
+    cache.put(unit(0, 1, 0), SCOPE, {"answer": "y"})
+    assert cache.get(unit(1, 0, 0), SCOPE) is not None
+    cache.put(unit(0, 0, 1), SCOPE, {"answer": "z"})
+
+    assert cache.get(unit(0, 1, 0), SCOPE) is None
+    assert cache.get(unit(1, 0, 0), SCOPE) is not None
+    assert cache.get_stats()["evictions"] == 1
+
+def test_entries_expire_and_can_be_invalidated():
+    cache = SemanticResultCache(capacity=4, similarity_threshold=0.95, ttl=0.01)
+    cache.put(unit(1, 0, 0), SCOPE, {"answer": "x"})
+    time.sleep(0.02)
+    assert cache.get(unit(1, 0, 0), SCOPE) is None
+    assert cache.get_stats()["expirations"] == 1
+
+    cache.ttl = 0
+    cache.put(unit(1, 0, 0), SCOPE, {"answer": "x"})
+    cache.put(unit(0, 1, 0), ("otra", 0.5, 5), {"answer": "y"})
+    cache.invalidate("documents")
+    assert cache.get(unit(1, 0, 0), SCOPE) is None
+    assert cache.get(unit(0, 1, 0), ("otra", 0.5, 5)) is not None
+
+def test_repeated_question_skips_generation(rag_system, fake_services):
+    rag_system.result_cache = SemanticResultCache(capacity=8, similarity_threshold=0.95, ttl=0)
+
+    first = rag_system.query("¿Cómo se construye el índice?")
+    chat_requests = fake_services.stats.requests["/v1/chat/completions"]
+    second = rag_system.query("¿Cómo se construye el índice?")
+
+    assert not first["metadata"]["cached"]
+    assert second["metadata"]["cached"]
+    assert second["answer"] == first["answer"]
+    assert fake_services.stats.requests["/v1/chat/completions"] == chat_requests
@@ -0,0 +1,74 @@
+"""Pruebas de los resultados columnares con decodificación perezosa de metadatos."""
+
+import json
+
+from app.database.document import Document
+from app.database.result_set import ResultSet, decode_metadata
+from benchmarks.fake_services import fake_embedding
+from conftest import DIMENSIONS
+
+ROWS = [
+    {"id": 1, "content": "uno", "similarity": 0.9, "metadata": json.dumps({"filename": "a.txt"})},
+    {"id": 2, "content": "dos", "similarity": 0.8, "metadata": {"filename": "b.txt"}},
+    {"id": 3, "content": "tres", "similarity": 0.7, "metadata": "{no es json"},
+    {"id": 4, "content": None, "similarity": None, "metadata": None}
+]
+
+def test_decode_metadata_tolerates_invalid_values():
+    assert decode_metadata('{"a": 1}') == {"a": 1}
+    assert decode_metadata(b'{"a": 1}') == {"a": 1}
+    assert decode_metadata("{no es json") == {}
+    assert decode_metadata("[1, 2]") == {}
+    assert decode_metadata(None) == {}
+
+def test_metadata_is_decoded_only_on_access():
+    results = ResultSet.from_rows(ROWS)
+
+    assert len(results) == 4
+    assert results._decoded == [False, True, False, False]
+    assert results.metadata(0) == {"filename": "a.txt"}
+    assert results._decoded == [True, True, False, False]
+    assert results.metadata(2) == {}
+    assert results.contents[3] == "" and results.scores[3] == 0.0
+
+def test_select_keeps_order_and_undecoded_metadata():
+    results = ResultSet.from_rows(ROWS)
+    results.fanout = {"partial": False}
+
+    selected = results.select([2, 0])
+
+    assert selected.ids == [3, 1]
+    assert selected._decoded == [False, False]
+    assert selected.fanout is results.fanout
+    assert selected.metadata(1) == {"filename": "a.txt"}
+    # Decodificar en el subconjunto no toca el original
+    assert results._decoded[0] is False
+
+def test_to_sources_and_documents():
+    results = ResultSet.from_rows(ROWS[:2])
+    assert results.to_sources() == [
+        {"content": "uno", "metadata": {"filename": "a.txt"}, "similarity": 0.9},
+        {"content": "dos", "metadata": {"filename": "b.txt"}, "similarity": 0.8}
+    ]
+    assert list(results) == [
+        (Document("uno", {"filename": "a.txt"}), 0.9),
+        (Document("dos", {"filename": "b.txt"}), 0.8)
+    ]
+
+def test_to_sources_adds_shard_and_fusion_columns():
+    results = ResultSet([1], ["uno"], [0.5], [None], shards=["norte"], fusion_scores=[0.03])
+    assert results.to_sources() == [
+        {"content": "uno", "metadata": {}, "similarity": 0.5, "shard": "norte", "fusion_score": 0.03}
+    ]
+
+def test_vector_database_returns_result_sets(rag_system):
+    embedding = fake_embedding("¿Qué es la teoría de números?", DIMENSIONS)
+    database = rag_system.vector_db
+
+    results = database.search_results(embedding, similarity_threshold=-1.0, max_documents=3)
+    documents = database.similarity_search_with_score(embedding, similarity_threshold=-1.0, max_documents=3)
+
+    assert isinstance(results, ResultSet) and len(results) == 3
+    assert results.scores == sorted(results.scores, reverse=True)
+    assert [(doc.page_content, score) for doc, score in documents] == list(zip(results.contents, results.scores))
+    assert all(isinstance(doc.metadata, dict) and doc.metadata for doc, _ in documents)
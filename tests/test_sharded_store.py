@@ -0,0 +1,113 @@
+"""Pruebas de la búsqueda repartida entre shards y de la mezcla del top-k global."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from app.database.result_set import ResultSet
+from app.database.sharded_store import (
+    ShardedVectorDatabase,
+    ShardsUnavailableError,
+    merge_results,
+    parse_shards
+)
+from benchmarks.fake_services import fake_embedding
+from conftest import DIMENSIONS
+
+def rows(prefix, scores):
+    return ResultSet(
+        [f"{prefix}{i}" for i in range(len(scores))],
+        [f"{prefix} {i}" for i in range(len(scores))],
+        list(scores),
+        [json.dumps({"shard": prefix})] * len(scores)
+    )
+
+def test_parse_shards_validates_the_configuration():
+    assert parse_shards("") == []
+    assert parse_shards('[{"name": "es", "collection": "documents_es"}]') == [
+        {"name": "es", "collection": "documents_es"}
+    ]
+    for spec in ("{", '{"name": "es"}', '[{"collection": "x"}]', '[{"name": "a"}, {"name": "a"}]', '[{"name": "a", "tabla": "x"}]'):
+        with pytest.raises(ValueError):
+            parse_shards(spec)
+
+def test_merge_results_keeps_the_global_top_k():
+    merged = merge_results([("a", rows("a", [0.9, 0.5, 0.1])), ("b", rows("b", [0.8, 0.7]))], 3)
+
+    assert merged.scores == [0.9, 0.8, 0.7]
+    assert merged.shards == ["a", "b", "b"]
+    assert merged.ids == ["a0", "b0", "b1"]
+    # Los metadatos siguen sin decodificar hasta que se usan
+    assert merged._decoded == [False, False, False]
+    assert merged.metadata(1) == {"shard": "b"}
+    assert len(merge_results([("a", rows("a", [0.9]))], 0)) == 0
+
+@pytest.fixture
+def sharded(fake_services):
+    database = ShardedVectorDatabase(
+        [{"name": "norte"}, {"name": "sur", "collection": "documents_sur"}],
+        timeout=0.3,
+        url=fake_services.supabase_url,
+        key="test-key",
+        backend="supabase"
+    )
+    yield database
+    database.close()
+
+def test_fanout_merges_every_shard(sharded):
+    results = sharded.search_results(fake_embedding("consulta", DIMENSIONS), -1.0, 4)
+
+    assert len(results) == 4
+    assert set(results.shards) == {"norte", "sur"}
+    assert results.scores == sorted(results.scores, reverse=True)
+    assert results.fanout == {"queried": ["norte", "sur"], "failed": {}, "partial": False}
+
+def test_subset_of_shards(sharded):
+    assert sharded.resolve(["sur", "norte"]) == ("norte", "sur")
+    results = sharded.search_results(fake_embedding("consulta", DIMENSIONS), -1.0, 3, shards=["sur"])
+    assert set(results.shards) == {"sur"}
+    with pytest.raises(ValueError):
+        sharded.resolve(["oeste"])
+
+def test_slow_shard_returns_partial_results(sharded, monkeypatch):
+    def slow_search(*args):
+        time.sleep(1.0)
+        return rows("lento", [1.0])
+
+    async def aslow_search(*args):
+        await asyncio.sleep(1.0)
+        return rows("lento", [1.0])
+
+    monkeypatch.setattr(sharded.shards["sur"], "search_results", slow_search)
+    monkeypatch.setattr(sharded.shards["sur"], "asearch_results", aslow_search)
+    embedding = fake_embedding("consulta", DIMENSIONS)
+
+    for results in (
+        sharded.search_results(embedding, -1.0, 3),
+        asyncio.run(sharded.asearch_results(embedding, -1.0, 3))
+    ):
+        assert set(results.shards) == {"norte"}
+        assert results.fanout["failed"] == {"sur": "timeout"}
+        assert results.fanout["partial"] is True
+
+def test_all_shards_failing_raises(sharded, monkeypatch):
+    def failing_search(*args):
+        raise RuntimeError("caído")
+
+    for database in sharded.shards.values():
+        monkeypatch.setattr(database, "search_results", failing_search)
+    with pytest.raises(ShardsUnavailableError):
+        sharded.search_results(fake_embedding("consulta", DIMENSIONS), -1.0, 3)
+
+def test_rag_query_reports_the_fanout(make_rag_system):
+    system = make_rag_system(vector_shards=json.dumps([{"name": "norte"}, {"name": "sur"}]))
+
+    result = system.query("¿Qué es un grupo abeliano?", similarity_threshold=-1.0, max_sources=3, shards=["norte"])
+
+    assert result["metadata"]["partial"] is False
+    assert result["metadata"]["shards"]["queried"] == ["norte"]
+    assert {source["shard"] for source in result["sources"]} == {"norte"}
+    with pytest.raises(ValueError):
+        system.query("¿Qué es un grupo abeliano?", shards=["oeste"])
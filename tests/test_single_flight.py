@@ -0,0 +1,104 @@
+"""Pruebas de la agrupación de consultas idénticas en curso."""
+
+import asyncio
+
+from app.query import rag_query
+from app.query.single_flight import SingleFlight
+
+def test_key_normalizes_text():
+    assert SingleFlight.key("  ¿Qué ES  un índice? ", 0.1, 5) == SingleFlight.key("¿qué es un índice?", 0.1, 5)
+    assert SingleFlight.key("hola", 0.1, 5) != SingleFlight.key("hola", 0.1, 10)
+
+def test_identical_calls_share_one_execution():
+    single_flight = SingleFlight()
+    calls = []
+
+    async def query():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return {"answer": "respuesta", "metadata": {}}
+
+    async def run():
+        return await asyncio.gather(*(single_flight.run("clave", query) for _ in range(3)))
+
+    results = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert [coalesced for _, coalesced in results] == [False, True, True]
+    assert single_flight.in_flight() == 0
+
+def test_followers_get_independent_copies():
+    single_flight = SingleFlight()
+    shared = {"answer": "respuesta", "sources": [{"content": "x"}], "metadata": {}}
+
+    async def query():
+        await asyncio.sleep(0.01)
+        return shared
+
+    async def run():
+        return await asyncio.gather(*(single_flight.run("clave", query) for _ in range(3)))
+
+    results = [result for result, _ in asyncio.run(run())]
+
+    # Quien modifica su resultado (p. ej. ``metadata["coalesced"]``) no afecta a los demás
+    results[1]["metadata"]["coalesced"] = True
+    results[1]["sources"][0]["content"] = "cambiado"
+    assert results[0]["metadata"] == {} and results[2]["metadata"] == {}
+    assert results[0]["sources"][0]["content"] == "x"
+    assert all(result is not shared for result in results)
+
+def test_cancelling_leader_does_not_cancel_followers():
+    single_flight = SingleFlight()
+
+    async def query():
+        await asyncio.sleep(0.05)
+        return {"answer": "respuesta"}
+
+    async def run():
+        leader = asyncio.ensure_future(single_flight.run("clave", query))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(single_flight.run("clave", query))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    result, coalesced = asyncio.run(run())
+    assert result == {"answer": "respuesta"} and coalesced
+
+def test_stream_subscribers_share_events():
+    single_flight = SingleFlight()
+    produced = []
+
+    async def events():
+        produced.append(1)
+        for i in range(3):
+            await asyncio.sleep(0.01)
+            yield {"type": "token", "content": str(i)}
+        yield {"type": "done", "metadata": {}}
+
+    async def consume():
+        return [event async for event in single_flight.stream("clave", events)]
+
+    async def run():
+        return await asyncio.gather(consume(), consume())
+
+    leader, follower = asyncio.run(run())
+
+    assert len(produced) == 1
+    assert [event.get("content") for event in leader] == [event.get("content") for event in follower]
+    assert "coalesced" not in leader[-1]["metadata"]
+    assert follower[-1]["metadata"]["coalesced"] is True
+
+def test_concurrent_identical_queries_call_chat_once(make_rag_system, fake_services, monkeypatch):
+    monkeypatch.setattr(rag_query, "SINGLE_FLIGHT_ENABLED", True)
+    rag_system = make_rag_system()
+    chat_requests = fake_services.stats.requests.get("/v1/chat/completions", 0)
+
+    async def run():
+        return await asyncio.gather(*(rag_system.aquery("Pregunta repetida a la vez") for _ in range(4)))
+
+    results = rag_system.event_loop.run(run())
+
+    assert fake_services.stats.requests["/v1/chat/completions"] == chat_requests + 1
+    assert sum(bool(result["metadata"].get("coalesced")) for result in results) == 3
+    assert len({result["answer"] for result in results}) == 1
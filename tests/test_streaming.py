@@ -0,0 +1,47 @@
+"""Pruebas de las respuestas en streaming (NDJSON) de extremo a extremo."""
+
+import http.client
+import json
+
+def post(port: int, payload: dict, headers: dict = None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    connection.request("POST", "/api/query", body=json.dumps(payload), headers=dict(headers or {}, **{"Content-Type": "application/json"}))
+    return connection, connection.getresponse()
+
+def test_query_stream_yields_sources_tokens_and_done(rag_system):
+    events = list(rag_system.query_stream("¿Qué es un índice?"))
+
+    assert events[0]["type"] == "sources"
+    assert events[0]["sources"]
+    tokens = [event["content"] for event in events if event["type"] == "token"]
+    assert len(tokens) > 1
+    assert events[-1]["type"] == "done"
+    assert events[-1]["metadata"]["time_to_first_token"] <= events[-1]["metadata"]["query_time"]
+
+def test_streamed_answer_matches_complete_answer(rag_system):
+    events = list(rag_system.query_stream("¿Qué es un índice?"))
+    streamed = "".join(event["content"] for event in events if event["type"] == "token")
+    assert streamed == rag_system.query("¿Qué es un índice?")["answer"]
+
+def test_handler_streams_ndjson(serve_api):
+    port = serve_api("query")
+    connection, response = post(port, {"query": "¿Qué es un índice?", "stream": True})
+    try:
+        assert response.status == 200
+        assert response.getheader("Content-Type") == "application/x-ndjson"
+        events = [json.loads(line) for line in response]
+    finally:
+        connection.close()
+
+    assert [events[0]["type"], events[-1]["type"]] == ["sources", "done"]
+    assert any(event["type"] == "token" for event in events)
+    assert "warm_start" in events[-1]["metadata"]
+
+def test_handler_streams_when_accept_requests_ndjson(serve_api):
+    port = serve_api("query")
+    connection, response = post(port, {"query": "¿Qué es un índice?"}, {"Accept": "application/x-ndjson"})
+    try:
+        assert response.getheader("Content-Type") == "application/x-ndjson"
+        assert json.loads(response.readline())["type"] == "sources"
+    finally:
+        connection.close()
@@ -0,0 +1,98 @@
+"""Pruebas del registro que reutiliza el sistema RAG entre solicitudes."""
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.query.system_registry import RAGSystemRegistry
+
+class FakeSystem:
+    """Sistema RAG mínimo que registra cuándo se cierra."""
+
+    def __init__(self):
+        self.healthy = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = RAGSystemRegistry()
+    built = []
+
+    def build():
+        system = FakeSystem()
+        built.append(system)
+        registry.builds += 1
+        return system
+
+    monkeypatch.setattr(registry, "_build", build)
+    registry.built = built
+    return registry
+
+def test_warm_start_reuses_system(registry):
+    with registry.acquire() as (first, warm_start):
+        assert not warm_start
+    with registry.acquire() as (second, warm_start):
+        assert warm_start
+    assert first is second
+    assert registry.builds == 1
+
+def test_unhealthy_system_is_rebuilt(registry):
+    with registry.acquire() as (first, _):
+        first.healthy = False
+    with registry.acquire() as (second, warm_start):
+        assert not warm_start
+    assert second is not first
+    assert first.closed and not second.closed
+
+def test_swap_during_query_keeps_old_system_open(registry):
+    with registry.acquire() as (old_system, _):
+        # Otra solicitud detecta un error de conexión y provoca la reconstrucción
+        old_system.healthy = False
+        with registry.acquire() as (new_system, _):
+            assert new_system is not old_system
+            assert not old_system.closed
+        assert not old_system.closed
+    assert old_system.closed
+    assert not new_system.closed
+
+def test_invalidate_waits_for_last_lease(registry):
+    with registry.acquire() as (system, _):
+        with registry.acquire():
+            registry.invalidate()
+        assert not system.closed
+    assert system.closed
+
+    system, warm_start = registry.get_system()
+    assert not warm_start
+    assert registry.builds == 2
+
+def test_registry_builds_from_settings(fake_services, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", fake_services.openai_url)
+    monkeypatch.setattr(settings, "SUPABASE_URL", fake_services.supabase_url)
+    monkeypatch.setattr(settings, "VECTOR_BACKEND", "supabase")
+    registry = RAGSystemRegistry()
+    try:
+        with registry.acquire() as (system, warm_start):
+            assert not warm_start
+            result = system.query("¿Qué es un índice?")
+        assert result["answer"]
+        assert "error" not in result["metadata"]
+        with registry.acquire() as (again, warm_start):
+            assert warm_start and again is system
+    finally:
+        registry.invalidate()
+
+@pytest.mark.parametrize("error, healthy", [
+    (ValueError("respuesta inválida"), True),
+    (httpx.ConnectError("connection refused"), False),
+    (httpx.ReadTimeout("timed out"), False),
+    (ConnectionError("sin conexión"), False)
+])
+def test_connection_errors_mark_system_unhealthy(rag_system, error, healthy):
+    wrapped = ValueError("Error al buscar documentos")
+    wrapped.__cause__ = error
+    rag_system._check_connection_error(wrapped)
+    assert rag_system.healthy is healthy